@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Synthetic tagged-library generator for the benchmark suite
+
+Builds small but structurally valid audio files without any encoder:
+- MP3: silent MPEG-1 Layer III frames (32 kbps) with ID3v2 tags
+- FLAC: STREAMINFO + constant-subframe (silent) frames with Vorbis comments
+- WAV: 8-bit mono PCM silence with an ID3 chunk
+- OGG: Ogg pages carrying Vorbis identification/comment headers; the final
+  granule position gives the duration (not decodable, metadata only)
+
+Files are laid out as <root>/Artist NNN/Album NN/NN - Title.ext so both
+MusicPlayer.add_folder (per album) and recursive scans can be exercised.
+"""
+
+import os
+import sys
+import json
+import wave
+import random
+import struct
+import argparse
+from multiprocessing import Pool
+
+FORMATS = ('mp3', 'flac', 'ogg', 'wav')
+MANIFEST = 'library.json'
+
+GENRES = ['Rock', 'Jazz', 'Electronic', 'Classical', 'Hip-Hop', 'Folk', 'Ambient', 'Metal']
+WORDS = ['Blue', 'Night', 'River', 'Echo', 'Silver', 'Dream', 'Fire', 'Glass', 'Storm',
+         'Velvet', 'Neon', 'Ghost', 'Golden', 'Paper', 'Wild', 'Quiet', 'Ocean', 'Static']
+
+TRACKS_PER_ALBUM = 12
+ALBUMS_PER_ARTIST = 4
+
+
+# ------------------ checksums ------------------
+def _crc8(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def _crc16(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+    return crc
+
+
+def _make_ogg_crc_table():
+    table = []
+    for i in range(256):
+        r = i << 24
+        for _ in range(8):
+            r = ((r << 1) ^ 0x04C11DB7) & 0xFFFFFFFF if r & 0x80000000 else (r << 1) & 0xFFFFFFFF
+        table.append(r)
+    return table
+
+
+_OGG_CRC_TABLE = _make_ogg_crc_table()
+
+
+def _ogg_crc(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _OGG_CRC_TABLE[((crc >> 24) & 0xFF) ^ byte]
+    return crc
+
+
+# ------------------ writers ------------------
+MP3_FRAME_HEADER = b'\xff\xfb\x10\xc0'  # MPEG-1 Layer III, 32 kbps, 44.1 kHz, mono
+MP3_FRAME_SIZE = 144 * 32000 // 44100
+MP3_FRAME_SAMPLES = 1152
+
+
+def write_mp3(path, seconds, tags):
+    """Write silent MP3 frames and an ID3v2 tag"""
+    from mutagen.id3 import ID3, TIT2, TPE1, TALB, TRCK, TPOS, TCON, TDRC
+
+    frames = max(1, int(seconds * 44100 / MP3_FRAME_SAMPLES))
+    frame = MP3_FRAME_HEADER + b'\0' * (MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+    with open(path, 'wb') as f:
+        f.write(frame * frames)
+
+    id3 = ID3()
+    id3.add(TIT2(encoding=3, text=tags['title']))
+    id3.add(TPE1(encoding=3, text=tags['artist']))
+    id3.add(TALB(encoding=3, text=tags['album']))
+    id3.add(TRCK(encoding=3, text=str(tags['tracknumber'])))
+    id3.add(TPOS(encoding=3, text=str(tags['discnumber'])))
+    id3.add(TCON(encoding=3, text=tags['genre']))
+    id3.add(TDRC(encoding=3, text=str(tags['date'])))
+    id3.save(path)
+
+
+def _flac_frame_number(n: int) -> bytes:
+    """UTF-8 style coding of the frame number (up to 31 bits)"""
+    if n < 0x80:
+        return bytes([n])
+    for length, first in ((2, 0xC0), (3, 0xE0), (4, 0xF0), (5, 0xF8), (6, 0xFC)):
+        if n < 1 << (5 * length + 1):
+            out = []
+            for _ in range(length - 1):
+                out.append(0x80 | (n & 0x3F))
+                n >>= 6
+            out.append(first | n)
+            return bytes(reversed(out))
+    raise ValueError("Frame number too large")
+
+
+def write_flac(path, seconds, tags, sample_rate=44100, block_size=4096):
+    """Write a silent mono 16-bit FLAC stream and Vorbis comments"""
+    from mutagen.flac import FLAC
+
+    total = max(1, int(seconds * sample_rate))
+    info = bytearray()
+    info += struct.pack('>HH', block_size, block_size)
+    info += b'\0\0\0\0\0\0'  # min/max frame size unknown
+    # 20 bits rate, 3 bits channels-1, 5 bits bps-1, 36 bits total samples
+    packed = (sample_rate << 44) | (0 << 41) | (15 << 36) | total
+    info += packed.to_bytes(8, 'big')
+    info += b'\0' * 16  # MD5 unknown
+    streaminfo = bytes([0x80]) + len(info).to_bytes(3, 'big') + bytes(info)  # last block
+
+    frames = []
+    number = 0
+    remaining = total
+    while remaining > 0:
+        size = min(block_size, remaining)
+        header = b'\xff\xf8' + bytes([0x79, 0x08]) + _flac_frame_number(number) + struct.pack('>H', size - 1)
+        header += bytes([_crc8(header)])
+        body = header + b'\x00' + b'\x00\x00'  # constant subframe, value 0
+        frames.append(body + struct.pack('>H', _crc16(body)))
+        remaining -= size
+        number += 1
+
+    with open(path, 'wb') as f:
+        f.write(b'fLaC' + streaminfo + b''.join(frames))
+
+    audio = FLAC(path)
+    for key, value in tags.items():
+        audio[key] = str(value)
+    audio.save()
+
+
+def write_wav(path, seconds, tags, sample_rate=8000):
+    """Write 8-bit mono PCM silence with an ID3 chunk"""
+    from mutagen.wave import WAVE
+    from mutagen.id3 import TIT2, TPE1, TALB, TRCK
+
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(1)
+        w.setframerate(sample_rate)
+        # Keep the data chunk even sized so the ID3 chunk follows without a pad byte
+        w.writeframes(b'\x80' * max(2, int(seconds * sample_rate) & ~1))
+
+    audio = WAVE(path)
+    audio.add_tags()
+    audio.tags.add(TIT2(encoding=3, text=tags['title']))
+    audio.tags.add(TPE1(encoding=3, text=tags['artist']))
+    audio.tags.add(TALB(encoding=3, text=tags['album']))
+    audio.tags.add(TRCK(encoding=3, text=str(tags['tracknumber'])))
+    audio.save()
+
+
+def _ogg_page(packet_data: bytes, lacing: list, granule: int, serial: int, seq: int, flags: int) -> bytes:
+    header = struct.pack('<4sBBqIIIB', b'OggS', 0, flags, granule, serial, seq, 0, len(lacing))
+    page = bytearray(header + bytes(lacing) + packet_data)
+    struct.pack_into('<I', page, 22, _ogg_crc(bytes(page)))
+    return bytes(page)
+
+
+def _lacing(packet: bytes) -> list:
+    values = [255] * (len(packet) // 255)
+    values.append(len(packet) % 255)
+    return values
+
+
+def write_ogg(path, seconds, tags, sample_rate=44100, serial=0x4C4D):
+    """Write Vorbis headers in Ogg pages with a final granule position"""
+    ident = (b'\x01vorbis' + struct.pack('<IBIiii', 0, 1, sample_rate, 0, 64000, 0)
+             + bytes([0xB8, 0x01]))
+    vendor = b'lmusic-player benchmark'
+    comments = [f"{k.upper()}={v}".encode('utf-8') for k, v in tags.items()]
+    comment = b'\x03vorbis' + struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', len(comments))
+    for c in comments:
+        comment += struct.pack('<I', len(c)) + c
+    comment += b'\x01'
+    setup = b'\x05vorbis' + b'\x00' * 8
+    audio = b'\x00' * 16
+
+    pages = [
+        _ogg_page(ident, _lacing(ident), 0, serial, 0, 0x02),
+        _ogg_page(comment + setup, _lacing(comment) + _lacing(setup), 0, serial, 1, 0),
+        _ogg_page(audio, _lacing(audio), max(1, int(seconds * sample_rate)), serial, 2, 0x04),
+    ]
+    with open(path, 'wb') as f:
+        f.write(b''.join(pages))
+
+
+WRITERS = {
+    'mp3': write_mp3,
+    'flac': write_flac,
+    'ogg': write_ogg,
+    'wav': write_wav,
+}
+
+
+# ------------------ library layout ------------------
+def track_spec(i: int, formats=FORMATS, seed: int = 0):
+    """Deterministic (relative path, format, seconds, tags) for track i"""
+    rng = random.Random(seed * 1000003 + i)
+    fmt = formats[i % len(formats)]
+    album_no = i // TRACKS_PER_ALBUM
+    artist_no = album_no // ALBUMS_PER_ARTIST
+    track_no = i % TRACKS_PER_ALBUM + 1
+    title = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}"
+    artist = f"Artist {artist_no:03d}"
+    album = f"Album {album_no % ALBUMS_PER_ARTIST + 1:02d}"
+    tags = {
+        'title': title,
+        'artist': artist,
+        'album': album,
+        'tracknumber': track_no,
+        'discnumber': 1,
+        'genre': GENRES[artist_no % len(GENRES)],
+        'date': 1970 + artist_no % 50,
+    }
+    rel = os.path.join(artist, album, f"{track_no:02d} - {title}.{fmt}")
+    seconds = 0.5 + rng.random() * 1.5
+    return rel, fmt, seconds, tags
+
+
+def _write_one(args):
+    root, i, formats, seed = args
+    rel, fmt, seconds, tags = track_spec(i, formats, seed)
+    path = os.path.join(root, rel)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        WRITERS[fmt](path, seconds, tags)
+    return rel
+
+
+def generate_library(root: str, count: int, formats=FORMATS, seed: int = 0, workers: int = None):
+    """Generate (or reuse) a library of count files under root; returns absolute paths"""
+    formats = tuple(formats)
+    manifest_path = os.path.join(root, MANIFEST)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if (manifest.get('count') == count and tuple(manifest.get('formats', ())) == formats
+                and manifest.get('seed') == seed):
+            return [os.path.join(root, rel) for rel in manifest['files']]
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(root, exist_ok=True)
+    jobs = [(root, i, formats, seed) for i in range(count)]
+    if workers == 1 or count < 200:
+        files = [_write_one(job) for job in jobs]
+    else:
+        with Pool(workers) as pool:
+            files = pool.map(_write_one, jobs, chunksize=64)
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'count': count, 'formats': list(formats), 'seed': seed, 'files': files}, f)
+    return [os.path.join(root, rel) for rel in files]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic tagged music library')
+    parser.add_argument('root', help='output directory')
+    parser.add_argument('-n', '--count', type=int, default=1000, help='number of files')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='comma separated formats')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"Unsupported formats: {', '.join(sorted(unknown))}")
+    files = generate_library(args.root, args.count, formats, args.seed, args.workers)
+    print(f"{len(files)} files in {args.root}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for Python Music Player
+
+Times the hot paths of MusicPlayer and the UIs against synthetic
+libraries (see libgen.py) and emits machine-readable JSON results that
+can be compared with a stored baseline:
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 -o results.json
+    python benchmarks/run_benchmarks.py --sizes 1000 --baseline results.json
+
+Exit status is 1 when any benchmark regresses past --tolerance.
+"""
+
+import os
+import sys
+import gc
+import json
+import logging
+import time
+import tempfile
+import platform
+import argparse
+import statistics
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import libgen
+import session
+from player import MusicPlayer
+from journal import SessionJournal
+
+RESULTS_VERSION = 1
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark: fn(files, workdir) -> callable run once per repeat"""
+    def decorator(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return decorator
+
+
+def _player():
+    return MusicPlayer()
+
+
+@benchmark('add_files')
+def bench_add_files(files, workdir):
+    def run():
+        player = _player()
+        player.add_files(files)
+        assert len(player.playlist) == len(files)
+    return run
+
+
+@benchmark('add_folder')
+def bench_add_folder(files, workdir):
+    folders = sorted({os.path.dirname(f) for f in files})
+
+    def run():
+        player = _player()
+        for folder in folders:
+            player.add_folder(folder)
+    return run
+
+
+@benchmark('add_folder_twice')
+def bench_add_folder_twice(files, workdir):
+    folders = sorted({os.path.dirname(f) for f in files})
+
+    def run():
+        player = _player()
+        player.skip_duplicates = True
+        for _ in range(2):
+            for folder in folders:
+                player.add_folder(folder)
+        assert len(player.playlist) == len(files)
+    return run
+
+
+@benchmark('metadata_length')
+def bench_metadata_length(files, workdir):
+    def run():
+        player = _player()  # cold duration cache
+        for f in files:
+            player.get_song_length(f)
+    return run
+
+
+@benchmark('metadata_tags')
+def bench_metadata_tags(files, workdir):
+    player = _player()
+    player.playlist = list(files)
+
+    def run():
+        for i in range(len(files)):
+            player.current_index = i
+            player.get_current_song_info()
+    return run
+
+
+@benchmark('playlist_refresh')
+def bench_playlist_refresh(files, workdir):
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        return None  # no display available
+    from ui import MusicPlayerApp
+
+    player = _player()
+    player.playlist = list(files)
+    for f in files:
+        player.get_song_length(f)  # warm cache, measure the view only
+    tree = ttk.Treeview(root, columns=('name', 'duration'), show='headings')
+    view = SimpleNamespace(player=player, playlist_tree=tree)
+
+    def run():
+        MusicPlayerApp.update_playlist_display(view)
+        root.update_idletasks()
+    return run
+
+
+@benchmark('session_restore')
+def bench_session_restore(files, workdir):
+    session_path = os.path.join(workdir, 'session.bin')
+    journal_path = os.path.join(workdir, 'session.journal')
+    durations = {f: 120 for f in files}
+    session.save_session(session_path, files, len(files) // 2, 10.0, durations)
+
+    def run():
+        player = _player()
+        SessionJournal(journal_path, session_path).restore_player(player)
+        assert len(player.playlist) == len(files)
+    return run
+
+
+def time_call(fn, repeat):
+    """Run fn repeat times and return wall-clock durations in seconds"""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_suite(sizes, formats, repeat, library_dir, selected=None, workers=None, log=print):
+    results = []
+    for size in sizes:
+        root = os.path.join(library_dir, f"{'-'.join(formats)}-{size}")
+        log(f"Preparing library of {size} files in {root}")
+        files = libgen.generate_library(root, size, formats, workers=workers)
+        with tempfile.TemporaryDirectory() as workdir:
+            for name, factory in BENCHMARKS.items():
+                if selected and name not in selected:
+                    continue
+                fn = factory(files, workdir)
+                if fn is None:
+                    log(f"  {name:<18} skipped")
+                    continue
+                timings = time_call(fn, repeat)
+                median = statistics.median(timings)
+                results.append({
+                    'name': name,
+                    'size': size,
+                    'median_s': median,
+                    'min_s': min(timings),
+                    'max_s': max(timings),
+                    'per_item_us': median / size * 1e6,
+                    'runs': timings,
+                })
+                log(f"  {name:<18} {median * 1000:10.2f} ms  ({median / size * 1e6:.1f} us/item)")
+    return {
+        'version': RESULTS_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'formats': list(formats),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Return rows of (key, baseline, current, ratio, regressed)"""
+    base = {f"{r['name']}@{r['size']}": r['median_s'] for r in baseline.get('results', [])}
+    rows = []
+    for r in current['results']:
+        key = f"{r['name']}@{r['size']}"
+        if key not in base or base[key] <= 0:
+            continue
+        ratio = r['median_s'] / base[key]
+        rows.append((key, base[key], r['median_s'], ratio, ratio > 1.0 + tolerance))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run lmusic-player benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000], help='library sizes (1k to 100k)')
+    parser.add_argument('--formats', default=','.join(libgen.FORMATS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help='run a subset')
+    parser.add_argument('--library-dir', default=os.path.join(tempfile.gettempdir(), 'lmusic-bench'),
+                        help='where generated libraries are cached')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='library generation workers')
+    parser.add_argument('-o', '--output', help='write JSON results to this file')
+    parser.add_argument('--baseline', help='compare against stored JSON results')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown ratio (0.2 = 20%%)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='keep player logging enabled')
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        # Player logs every add/skip; keep benchmark output readable
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+    log = (lambda msg: print(msg, file=sys.stderr))
+    results = run_suite(args.sizes, formats, args.repeat, args.library_dir, args.only, args.workers, log)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressed = False
+        for key, base, cur, ratio, bad in compare(results, baseline, args.tolerance):
+            flag = 'REGRESSION' if bad else 'ok'
+            log(f"{key:<28} {base * 1000:10.2f} -> {cur * 1000:10.2f} ms  x{ratio:.2f}  {flag}")
+            regressed = regressed or bad
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Command-line library tools for Python Music Player
+
+    python lmusic.py scan ~/Music
+    python lmusic.py stats
+    python lmusic.py playlist build "genre:jazz order by year" -o jazz.m3u
+
+Run `python lmusic.py --help` for all commands.
+"""
+
+import sys
+import os
+
+# Add src directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,15 +9,23 @@ import os
 # Add src directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from ui import MusicPlayerApp
-try:
-    from modern_ui import ModernMusicPlayerApp
-except Exception:
-    ModernMusicPlayerApp = None
 
 def main():
-    """Main function to start the music player"""
+    """Main function to start the music player
+
+    `main.py --tui [files or folders...]` starts the terminal front-end.
+    """
     try:
+        if sys.argv[1:2] == ['--tui']:
+            # Imported here so the terminal front-end never loads Tk
+            from tui import main as run_tui
+            run_tui(sys.argv[2:])
+            return
+        from ui import MusicPlayerApp
+        try:
+            from modern_ui import ModernMusicPlayerApp
+        except Exception:
+            ModernMusicPlayerApp = None
         # prefer modern UI if available
         if ModernMusicPlayerApp:
             app = ModernMusicPlayerApp()
@@ -12,6 +12,7 @@ setup(
     entry_points={
         'console_scripts': [
             'pymusic=main:main',
+            'lmusic=lmusic:main',
         ],
     },
 )
\ No newline at end of file
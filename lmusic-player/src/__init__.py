@@ -1,6 +1,15 @@
 """Python Music Player package initialization"""
 
+import os as _os
+import sys as _sys
+
 __all__ = ['config', 'player', 'ui', 'utils']
 __version__ = "1.0.0"
 __author__ = "Python Music Player Team"
-__description__ = "A feature-rich music player for Linux/Fedora"
\ No newline at end of file
+__description__ = "A feature-rich music player for Linux/Fedora"
+
+# Modules import each other by bare name (main.py and the tests put this
+# directory on sys.path); do the same when loaded as the `src` package
+_SRC_DIR = _os.path.dirname(_os.path.abspath(__file__))
+if _SRC_DIR not in _sys.path:
+    _sys.path.append(_SRC_DIR)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Tempo (BPM) and musical key detection
+
+- BPM: spectral-flux onset curve from a log-mel spectrogram, then the
+  autocorrelation peak in 60-200 BPM (features.estimate_tempo)
+- Key: a chromagram folds STFT power from 65 Hz - 2.1 kHz onto the 12
+  pitch classes; its average is correlated with the Krumhansl-Kessler
+  major and minor profiles in all 12 transpositions and the best of the
+  24 candidates wins
+
+Keys are stored in short notation ("C", "F#m") and sort on the Camelot
+wheel, so harmonically compatible keys end up next to each other.
+
+analyze_batch() runs on all cores (features.map_processes) and records
+every result in an AnalysisCheckpoint, so an interrupted run resumes
+where it stopped; results are keyed by file mtime so edited files are
+analysed again.
+"""
+
+import os
+import json
+import time
+import logging
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import utils
+import features
+
+logger = logging.getLogger(__name__)
+
+PITCH_CLASSES = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
+# Krumhansl-Kessler key profiles, tonic first
+MAJOR_PROFILE = (6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88)
+MINOR_PROFILE = (6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17)
+
+CHROMA_FRAME = 4096
+CHROMA_HOP = 2048
+CHROMA_MIN_HZ = 65.0
+CHROMA_MAX_HZ = 2100.0
+
+# Library columns written by the analysis
+FIELDS = {'bpm': True, 'key': False}  # name -> numeric
+
+
+def key_name(tonic: int, minor: bool) -> str:
+    return PITCH_CLASSES[tonic % 12] + ('m' if minor else '')
+
+
+def camelot(key: str) -> Optional[str]:
+    """Camelot wheel code ('8A' for Am, '8B' for C), None for unknown keys"""
+    if not key:
+        return None
+    minor = key.endswith('m')
+    name = key[:-1] if minor else key
+    if name not in PITCH_CLASSES:
+        return None
+    tonic = PITCH_CLASSES.index(name)
+    # Majors step round the wheel by fifths from C = 8B; minors share the
+    # number of their relative major (three semitones up)
+    if minor:
+        tonic = (tonic + 3) % 12
+    number = (7 * tonic) % 12 + 8
+    number = number - 12 if number > 12 else number
+    return f"{number}{'A' if minor else 'B'}"
+
+
+@lru_cache(maxsize=None)
+def _chroma_map(rate: int = features.SAMPLE_RATE, frame_size: int = CHROMA_FRAME):
+    """(bins, 12) matrix folding STFT bins in the pitched range onto pitch classes"""
+    freqs = np.linspace(0.0, rate / 2.0, frame_size // 2 + 1)
+    mapping = np.zeros((len(freqs), 12), dtype=np.float32)
+    pitched = (freqs >= CHROMA_MIN_HZ) & (freqs <= CHROMA_MAX_HZ)
+    midi = np.round(69 + 12 * np.log2(freqs[pitched] / 440.0)).astype(int)
+    mapping[np.nonzero(pitched)[0], midi % 12] = 1.0
+    return mapping
+
+
+@lru_cache(maxsize=None)
+def _profiles():
+    """(24, 12) z-scored profiles: rows 0-11 major keys, 12-23 minor keys"""
+    rows = []
+    for profile in (MAJOR_PROFILE, MINOR_PROFILE):
+        base = np.asarray(profile, dtype=np.float64)
+        for tonic in range(12):
+            rows.append(np.roll(base, tonic))
+    rows = np.asarray(rows)
+    rows -= rows.mean(axis=1, keepdims=True)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def chromagram(samples, rate: int = features.SAMPLE_RATE):
+    """Per-frame pitch-class energy, shape (frames, 12), each frame max-normalized"""
+    power = features.power_spectrogram(samples, CHROMA_FRAME, CHROMA_HOP)
+    chroma = power @ _chroma_map(rate)
+    peak = chroma.max(axis=1, keepdims=True)
+    return chroma / np.maximum(peak, 1e-10)
+
+
+def estimate_key(samples, rate: int = features.SAMPLE_RATE) -> Optional[str]:
+    """Most likely key ("A", "F#m"), or None for silence / unpitched audio"""
+    chroma = chromagram(samples, rate)
+    if not len(chroma) or not chroma.any():
+        return None
+    profile = chroma.mean(axis=0).astype(np.float64)
+    profile -= profile.mean()
+    norm = np.linalg.norm(profile)
+    if norm < 1e-9:
+        return None
+    scores = _profiles() @ (profile / norm)
+    best = int(np.argmax(scores))
+    return key_name(best % 12, best >= 12)
+
+
+def estimate_bpm(samples, rate: int = features.SAMPLE_RATE) -> Optional[float]:
+    power = features.power_spectrogram(samples)
+    log_mel = np.log(power @ features.mel_filterbank(rate) + 1e-10)
+    bpm = features.estimate_tempo(features.onset_strength(log_mel), rate)
+    return round(bpm, 1) if bpm > 0 else None
+
+
+def analyze_track(file_path: str, max_seconds: float = 90.0) -> Dict:
+    """{'bpm': float or None, 'key': str or None} for one track"""
+    samples = features.load_samples(file_path, features.SAMPLE_RATE, max_seconds)
+    return {'bpm': estimate_bpm(samples), 'key': estimate_key(samples)}
+
+
+# ------------------ batch analysis ------------------
+def _analyze_chunk(paths: List[str], max_seconds: float) -> List:
+    """Worker entry point: [(path, mtime, result or None)]"""
+    results = []
+    for path in paths:
+        try:
+            mtime = int(os.stat(path).st_mtime)
+            results.append((path, mtime, analyze_track(path, max_seconds)))
+        except Exception as e:
+            logger.debug(f"Could not analyse {os.path.basename(path)}: {e}")
+            results.append((path, None, None))
+    return results
+
+
+class AnalysisCheckpoint:
+    """Results of finished tracks, flushed to disk periodically during a batch run"""
+
+    def __init__(self, file_path: str, flush_interval: float = 5.0):
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.results: Dict[str, Dict] = {}
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                self.results = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable analysis checkpoint {file_path}: {e}")
+
+    def get(self, path: str) -> Optional[Dict]:
+        """Stored result if the file has not changed since it was analysed"""
+        entry = self.results.get(path)
+        if entry is None:
+            return None
+        try:
+            if int(os.stat(path).st_mtime) != entry.get('mtime'):
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def record(self, path: str, mtime: int, result: Dict):
+        self.results[path] = dict(result, mtime=mtime)
+        self._dirty = True
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._dirty:
+            return
+        try:
+            data = json.dumps(self.results, ensure_ascii=False, separators=(',', ':'))
+            utils.atomic_write(self.file_path, data.encode('utf-8'))
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Could not write analysis checkpoint {self.file_path}: {e}")
+        self._last_flush = time.monotonic()
+
+
+def analyze_batch(paths: Iterable[str], checkpoint: Optional[AnalysisCheckpoint] = None,
+                  workers: Optional[int] = None, chunk_size: int = 4, max_seconds: float = 90.0,
+                  cancelled: Optional[Callable[[], bool]] = None) -> Iterator[Dict[str, Dict]]:
+    """Analyse tracks on all cores; yields {path: {'bpm', 'key'}} batches
+
+    Tracks already in the checkpoint (and unchanged) come first without
+    being decoded again. Unreadable tracks are left out.
+    """
+    if np is None:
+        raise RuntimeError("NumPy is required for audio analysis")
+    todo = []
+    cached = {}
+    for path in paths:
+        entry = checkpoint.get(path) if checkpoint is not None else None
+        if entry is not None:
+            cached[path] = {'bpm': entry.get('bpm'), 'key': entry.get('key')}
+        else:
+            todo.append(path)
+    if cached:
+        yield cached
+    try:
+        for results in features.map_processes(_analyze_chunk, todo, workers, chunk_size,
+                                              cancelled, (max_seconds,)):
+            batch = {}
+            for path, mtime, result in results:
+                if result is None:
+                    continue
+                batch[path] = result
+                if checkpoint is not None:
+                    checkpoint.record(path, mtime, result)
+            if batch:
+                yield batch
+    finally:
+        if checkpoint is not None:
+            checkpoint.flush()
+
+
+def register_fields(library):
+    """Add the bpm and key columns to a Library"""
+    for name, numeric in FIELDS.items():
+        library.add_field(name, numeric=numeric)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Asyncio facade for MusicPlayer
+
+AsyncMusicPlayer wraps a MusicPlayer so it can be embedded in asyncio
+services. Player commands are awaitable and serialized per player with an
+asyncio.Lock, while the blocking parts (mixer loads, tag reads) run on a
+thread pool shared by all facades in the process, so hundreds of
+simulated players can be driven from one event loop.
+
+The pygame mixer is shared by every player in the process, so closing a
+facade stops its player but leaves the mixer open; the application quits
+it (pygame.mixer.quit()) after the last facade has closed.
+
+State changes are published as PlayerEvent objects to every subscriber:
+
+    player = AsyncMusicPlayer()
+    await player.start()
+    async for event in player.events():
+        print(event.type, event.data)
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Optional
+
+import metrics
+from events import PlaybackEnded, SongChanged, inline
+from player import MusicPlayer
+
+logger = logging.getLogger(__name__)
+
+# Event types
+SONG_CHANGE = 'song_change'
+PLAYBACK_END = 'playback_end'
+STATE = 'state'
+VOLUME = 'volume'
+PLAYLIST = 'playlist'
+
+_shared_executor = None
+
+
+def shared_executor() -> ThreadPoolExecutor:
+    """Process-wide pool for blocking player work"""
+    global _shared_executor
+    if _shared_executor is None:
+        _shared_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='async-player')
+    return _shared_executor
+
+
+class PlayerEvent:
+    """A state change published by AsyncMusicPlayer"""
+
+    __slots__ = ('type', 'data', 'timestamp')
+
+    def __init__(self, type: str, data: Any = None):
+        self.type = type
+        self.data = data
+        self.timestamp = time.time()
+
+    def __repr__(self):
+        return f"PlayerEvent({self.type!r}, {self.data!r})"
+
+
+class AsyncMusicPlayer:
+    """Awaitable wrapper around a MusicPlayer"""
+
+    def __init__(self, player: Optional[MusicPlayer] = None, executor=None,
+                 poll_interval: float = 0.1, queue_size: int = 256):
+        self.player = player or MusicPlayer()
+        self.executor = executor or shared_executor()
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._loop = None
+        self._lock = asyncio.Lock()
+        self._subscribers = set()
+        self._poll_task = None
+
+        # Player calls already run on the executor, so events are taken there
+        # (tags included) and _publish() hops onto the loop
+        events = self.player.events
+        self._subscriptions = [
+            events.subscribe(SongChanged, self._on_song_change, dispatcher=inline, name='async_player_song_change'),
+            events.subscribe(PlaybackEnded, self._on_playback_end, dispatcher=inline,
+                             name='async_player_playback_end'),
+        ]
+
+    # ------------------ lifecycle ------------------
+    async def start(self):
+        """Bind to the running loop and start watching for end-of-track events"""
+        self._loop = asyncio.get_running_loop()
+        if self._poll_task is None:
+            self._poll_task = asyncio.create_task(self._poll_events())
+
+    async def close(self):
+        """Stop polling, end all event iterators and shut the player down (not the mixer)"""
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+        for q in list(self._subscribers):
+            self._offer(q, None)
+        for subscription in self._subscriptions:
+            self.player.events.unsubscribe(subscription)
+        await self._run(functools.partial(self.player.shutdown, quit_mixer=False))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # ------------------ commands ------------------
+    async def _run(self, fn, *args):
+        """Run a blocking player call on the executor, one command at a time"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        async with self._lock:
+            try:
+                return await self._loop.run_in_executor(self.executor, fn, *args)
+            finally:
+                # Includes time queued behind other commands and executor work
+                metrics.observe('async_player_command_seconds', time.perf_counter() - start)
+
+    async def play(self, index: Optional[int] = None, fade_ms: int = 0, start_pos: float = 0.0) -> bool:
+        result = await self._run(self.player.play, index, fade_ms, start_pos)
+        self._publish(STATE, self.state())
+        return result
+
+    async def seek(self, position: float) -> bool:
+        """Restart the current track at position (seconds)"""
+        return await self.play(self.player.current_index, 0, max(0.0, position))
+
+    async def next(self) -> bool:
+        result = await self._run(self.player.next)
+        self._publish(STATE, self.state())
+        return result
+
+    async def previous(self) -> bool:
+        result = await self._run(self.player.previous)
+        self._publish(STATE, self.state())
+        return result
+
+    async def pause(self):
+        await self._run(self.player.pause)
+        self._publish(STATE, self.state())
+
+    async def unpause(self):
+        await self._run(self.player.unpause)
+        self._publish(STATE, self.state())
+
+    async def stop(self):
+        await self._run(self.player.stop)
+        self._publish(STATE, self.state())
+
+    async def set_volume(self, volume: float):
+        await self._run(self.player.set_volume, volume)
+        self._publish(VOLUME, self.player.volume)
+
+    async def add_files(self, file_paths) -> int:
+        count = await self._run(self.player.add_files, list(file_paths))
+        self._publish(PLAYLIST, len(self.player.playlist))
+        return count
+
+    async def add_folder(self, folder_path: str) -> int:
+        count = await self._run(self.player.add_folder, folder_path)
+        self._publish(PLAYLIST, len(self.player.playlist))
+        return count
+
+    async def load_playlist(self, file_paths) -> int:
+        count = await self._run(self.player.load_playlist, list(file_paths))
+        self._publish(PLAYLIST, len(self.player.playlist))
+        return count
+
+    # ------------------ metadata (not serialized with commands) ------------------
+    async def get_song_length(self, file_path: str) -> int:
+        loop = self._loop or asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.player.get_song_length, file_path)
+
+    async def song_info(self):
+        loop = self._loop or asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.player.get_current_song_info)
+
+    def state(self) -> dict:
+        """Cheap snapshot of playback state (no I/O)"""
+        p = self.player
+        return {
+            'index': p.current_index,
+            'playing': p.is_playing,
+            'paused': p.paused,
+            'volume': p.volume,
+            'length': p.song_length,
+        }
+
+    # ------------------ events ------------------
+    async def events(self) -> AsyncIterator[PlayerEvent]:
+        """Async iterator of PlayerEvents; ends when the player is closed"""
+        q = asyncio.Queue(self.queue_size)
+        self._subscribers.add(q)
+        try:
+            while True:
+                event = await q.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._subscribers.discard(q)
+
+    def _offer(self, q: asyncio.Queue, event):
+        """Enqueue without blocking; slow subscribers lose their oldest events"""
+        if q.full():
+            try:
+                q.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        q.put_nowait(event)
+
+    def _publish(self, type: str, data: Any = None):
+        """Publish an event; safe to call from executor threads"""
+        event = PlayerEvent(type, data)
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            for q in list(self._subscribers):
+                self._offer(q, event)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._publish_local, event)
+
+    def _publish_local(self, event: PlayerEvent):
+        for q in list(self._subscribers):
+            self._offer(q, event)
+
+    def _on_song_change(self, event):
+        self._publish(SONG_CHANGE, event.info)
+
+    def _on_playback_end(self, event):
+        self._publish(PLAYBACK_END)
+
+    async def _poll_events(self):
+        """Replace MusicPlayer.check_events polling by the UI with a loop task"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                # Serialized with commands on the executor; it may stop or advance the track
+                ended = await self._run(self.player.check_events)
+            except Exception as e:
+                logger.warning(f"Event poll failed: {e}")
+                ended = False
+            if ended:
+                # Mirror the UIs: advance to the next track when one ends
+                await self.next()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Mixer output settings, adaptive buffer sizing and command latency
+
+The mixer's device buffer decides how long play, pause and volume take to
+be heard: SDL mixes one buffer per audio callback, so a change waits for
+the next callback and then for that buffer to play out. At 44.1 kHz the
+old fixed 4096 frames is ~93 ms each way; 512 frames is ~12 ms but leaves
+the audio thread little slack before the device runs dry.
+
+- Profiles: 'low_latency' (512 frames), 'balanced' (2048) and
+  'high_quality' (4096, dropout-proof on loaded machines). All mix 16-bit
+  stereo at 44.1 kHz, the format the transcode cache writes and the
+  memory-mapped WAV path needs; any field can be overridden from config
+- While audio plays (and monitor is set), a probe thread replays a one-frame silent Sound on a
+  reserved channel as soon as the mixer has consumed it, which traces the
+  callback cadence. Callbacks further apart than UNDERRUN_PERIODS buffers
+  mean the device ran dry (polls that were late themselves are ignored).
+  The thread calls into the mixer, so only front-ends that own it enable
+  monitor; quit the mixer through close() (MusicPlayer.shutdown())
+- With adaptive sizing, UNDERRUN_LIMIT underruns within UNDERRUN_WINDOW
+  seconds double the buffer (up to MAX_BUFFER). Reopening the mixer cuts
+  off what is playing, so MusicPlayer applies it at the next track change
+- mark(command) times a command: the first callback after it plus one
+  buffer of device output, recorded as audio_<command>_latency_seconds
+"""
+
+import time
+import logging
+import statistics
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+import pygame
+
+import metrics
+from pcm_stream import PROBE_CHANNEL, RESERVED_CHANNELS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = 'low_latency'
+MAX_BUFFER = 8192
+# Callback gap (in buffer periods) that counts as an underrun
+UNDERRUN_PERIODS = 2.5
+UNDERRUN_LIMIT = 3
+UNDERRUN_WINDOW = 30.0
+# Latency samples kept per command for latency()
+LATENCY_SAMPLES = 64
+MAX_PENDING_MARKS = 32
+
+
+class AudioSettings:
+    """Arguments for pygame.mixer.init"""
+
+    __slots__ = ('frequency', 'size', 'channels', 'buffer')
+
+    def __init__(self, frequency: int = 44100, size: int = -16, channels: int = 2, buffer: int = 512):
+        self.frequency = frequency
+        self.size = size
+        self.channels = channels
+        self.buffer = buffer
+
+    @property
+    def buffer_seconds(self) -> float:
+        """Length of one device buffer (one mixer callback)"""
+        return self.buffer / self.frequency
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.channels * abs(self.size) // 8
+
+    def replace(self, **changes) -> 'AudioSettings':
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update((k, v) for k, v in changes.items() if v is not None)
+        return AudioSettings(**fields)
+
+    def __eq__(self, other):
+        return isinstance(other, AudioSettings) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return (f"AudioSettings({self.frequency} Hz, {self.size}-bit, {self.channels} ch, "
+                f"{self.buffer} frames = {self.buffer_seconds * 1000:.1f} ms)")
+
+
+PROFILES = {
+    'low_latency': AudioSettings(buffer=512),
+    'balanced': AudioSettings(buffer=2048),
+    'high_quality': AudioSettings(buffer=4096),
+}
+
+
+def settings_for(profile: str, **overrides) -> AudioSettings:
+    """Settings of a named profile with overrides (None keeps the profile's value)"""
+    if profile not in PROFILES:
+        logger.warning(f"Unknown audio profile {profile!r}; using {DEFAULT_PROFILE}")
+        profile = DEFAULT_PROFILE
+    return PROFILES[profile].replace(**overrides)
+
+
+def settings_from_config(config: Dict) -> AudioSettings:
+    return settings_for(config.get('audio_profile', DEFAULT_PROFILE),
+                        frequency=config.get('audio_frequency'),
+                        buffer=config.get('audio_buffer'))
+
+
+class AudioOutput:
+    """Opens the mixer and watches its callbacks for underruns and latency"""
+
+    def __init__(self, settings: Optional[AudioSettings] = None, adaptive: bool = True, monitor: bool = False):
+        self.requested = settings or PROFILES[DEFAULT_PROFILE]
+        # What the mixer was opened with (format as granted by SDL); None until open()
+        self.settings: Optional[AudioSettings] = None
+        self.adaptive = adaptive
+        # Run the probe thread while audio plays (needed for underruns and latency)
+        self.monitor = monitor
+        self.underruns = 0
+        self._recent = deque()  # times of recent underruns
+        self._backoff: Optional[AudioSettings] = None
+        self._latencies: Dict[str, deque] = {}
+        self._marks = []  # (command, perf_counter time) waiting for a callback
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._probe = None  # (channel, sound)
+        self._armed = False
+        self._last: Optional[float] = None  # when the probe was last seen consumed
+
+    # ------------------ mixer ------------------
+    def open(self, settings: Optional[AudioSettings] = None, reopen: bool = False):
+        """Initialize the mixer; raises pygame.error
+
+        An already initialized mixer is adopted as it is unless reopen is set.
+        """
+        settings = settings or self.requested
+        with self._lock:
+            self._probe = None
+            self._last = None
+            if reopen:
+                pygame.mixer.quit()
+            pygame.mixer.init(frequency=settings.frequency, size=settings.size,
+                              channels=settings.channels, buffer=settings.buffer)
+            frequency, size, channels = pygame.mixer.get_init()
+            self.settings = settings.replace(frequency=frequency, size=size, channels=channels)
+        metrics.set_gauge('audio_buffer_frames', self.settings.buffer)
+        metrics.set_gauge('audio_buffer_seconds', self.settings.buffer_seconds)
+        logger.info(f"Audio output: {self.settings}")
+
+    @property
+    def pending_backoff(self) -> bool:
+        return self._backoff is not None
+
+    def apply_backoff(self) -> bool:
+        """Reopen the mixer with the larger buffer chosen after underruns; True if it was"""
+        backoff, self._backoff = self._backoff, None
+        if backoff is None:
+            return False
+        previous = self.settings
+        self._recent.clear()
+        try:
+            self.open(backoff, reopen=True)
+        except pygame.error as e:
+            logger.error(f"Could not reopen audio output with {backoff}: {e}")
+            try:
+                self.open(previous, reopen=True)
+            except pygame.error:
+                self.settings = None
+            return False
+        metrics.inc('audio_buffer_backoffs_total')
+        return True
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._probe = None
+            self.settings = None
+            try:
+                pygame.mixer.quit()
+            except Exception:
+                pass
+
+    # ------------------ probe ------------------
+    def start(self):
+        """Start watching callbacks (no-op unless monitoring, without a mixer or when running)"""
+        if not self.monitor or self.settings is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._halt.clear()
+        self._armed = False
+        self._last = None
+        self._thread = threading.Thread(target=self._run, name='audio-probe', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._halt.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+        with self._lock:
+            self._marks.clear()
+
+    def _interval(self) -> float:
+        settings = self.settings
+        return max(0.001, settings.buffer_seconds / 4) if settings is not None else 0.05
+
+    def _run(self):
+        previous = time.perf_counter()
+        while not self._halt.wait(self._interval()):
+            now = time.perf_counter()
+            # A poll that was itself held up (GIL, scheduler) cannot date the callback
+            on_time = now - previous <= 2 * self._interval() + 0.005
+            try:
+                with self._lock:
+                    if self.settings is None or not pygame.mixer.get_init():
+                        break
+                    self._poll(now, previous if on_time else None)
+            except pygame.error:
+                # Mixer shut down underneath (reopening holds the lock)
+                break
+            previous = now
+
+    def _poll(self, now: float, previous: Optional[float]):
+        if self._probe is None:
+            if pygame.mixer.get_num_channels() < RESERVED_CHANNELS:
+                pygame.mixer.set_num_channels(RESERVED_CHANNELS)
+            pygame.mixer.set_reserved(RESERVED_CHANNELS)
+            sound = pygame.mixer.Sound(buffer=bytes(self.settings.frame_bytes))
+            sound.set_volume(0.0)
+            self._probe = (pygame.mixer.Channel(PROBE_CHANNEL), sound)
+            self._armed = False
+        channel, sound = self._probe
+        if channel.get_busy():
+            return
+        if self._armed:
+            self._consumed(now, previous)
+        channel.play(sound)
+        self._armed = True
+
+    def _consumed(self, now: float, previous: Optional[float]):
+        """The probe was mixed by a callback after previous and at or before now
+
+        previous is None when this poll came late, so the callback time is unknown.
+        """
+        period = self.settings.buffer_seconds
+        if previous is None:
+            self._last = None
+            self._marks.clear()
+            return
+        if self._last is not None and now - self._last > UNDERRUN_PERIODS * period + (now - previous):
+            self._underrun(now, now - self._last)
+        self._last = now
+        # Dated halfway between the polls; commands issued before then were picked up by it
+        callback = (previous + now) / 2
+        pending = []
+        for command, issued in self._marks:
+            if issued <= callback:
+                self._record(command, callback - issued + period)
+            else:
+                pending.append((command, issued))
+        self._marks = pending
+
+    def _underrun(self, now: float, gap: float):
+        period = self.settings.buffer_seconds
+        self.underruns += 1
+        metrics.inc('audio_underruns_total')
+        metrics.observe('audio_callback_gap_seconds', gap)
+        logger.debug(f"Audio underrun: no callback for {gap * 1000:.1f} ms ({period * 1000:.1f} ms buffer)")
+        recent = self._recent
+        recent.append(now)
+        while recent and now - recent[0] > UNDERRUN_WINDOW:
+            recent.popleft()
+        if (self.adaptive and self._backoff is None and len(recent) >= UNDERRUN_LIMIT
+                and self.settings.buffer < MAX_BUFFER):
+            self._backoff = self.settings.replace(buffer=min(MAX_BUFFER, self.settings.buffer * 2))
+            logger.warning(f"{len(recent)} audio underruns in {UNDERRUN_WINDOW:.0f} s; "
+                           f"buffer grows to {self._backoff.buffer} frames at the next track")
+
+    # ------------------ latency ------------------
+    def mark(self, command: str):
+        """Note that command was just sent to the mixer; timed at the next callback"""
+        if self._thread is None:
+            return
+        with self._lock:
+            if len(self._marks) < MAX_PENDING_MARKS:
+                self._marks.append((command, time.perf_counter()))
+
+    def _record(self, command: str, seconds: float):
+        metrics.observe(f'audio_{command}_latency_seconds', seconds)
+        samples = self._latencies.get(command)
+        if samples is None:
+            samples = self._latencies[command] = deque(maxlen=LATENCY_SAMPLES)
+        samples.append(seconds)
+
+    def latency(self, command: Optional[str] = None) -> Optional[float]:
+        """Median measured command-to-audio latency in seconds (all commands by default)"""
+        if command is not None:
+            samples = list(self._latencies.get(command, ()))
+        else:
+            samples = [s for recent in self._latencies.values() for s in recent]
+        return statistics.median(samples) if samples else None
+
+    def report(self) -> Dict:
+        """Output settings, underruns and median latency per command"""
+        settings = self.settings
+        return {
+            'buffer_frames': settings.buffer if settings else None,
+            'buffer_ms': settings.buffer_seconds * 1000 if settings else None,
+            'underruns': self.underruns,
+            'pending_buffer_frames': self._backoff.buffer if self._backoff else None,
+            'latency_ms': {command: statistics.median(samples) * 1000
+                           for command, samples in self._latencies.items() if samples},
+        }
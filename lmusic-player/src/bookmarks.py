@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Per-track resume positions for audiobooks and long mixes
+
+BookmarkStore remembers where playback of each long track stopped, so
+play() can carry on from there. Positions are kept out of config.json in
+a small binary table:
+
+    header  magic, version, count
+    keys    count x uint64 path hashes (blake2b), sorted
+    values  count x float32 positions in seconds
+
+Nothing is read at startup: the table is memory-mapped on the first
+lookup and searched by bisection, so thousands of bookmarks cost one
+mmap and a few page reads. Updates go to an in-memory overlay and are
+merged into a new table (atomic rename) at most every flush_interval, on
+the shared JobExecutor's io pool when one is given, and on close().
+
+- Tracks shorter than min_length are never bookmarked
+- Positions within the first min_position seconds or the last
+  end_margin seconds clear the bookmark (the track starts from the top)
+- update() is throttled to one recorded position per interval; pass
+  force=True when playback pauses or moves to another track
+"""
+
+import os
+import sys
+import mmap
+import time
+import struct
+import bisect
+import hashlib
+import logging
+import threading
+from array import array
+from typing import Dict, Optional
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LMBM'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+
+_NATIVE_LITTLE = sys.byteorder == 'little'
+
+
+def path_key(path: str) -> int:
+    """64-bit key for a path"""
+    return int.from_bytes(hashlib.blake2b(os.fsencode(path), digest_size=8).digest(), 'little')
+
+
+def encode_bookmarks(entries: Dict[int, float]) -> bytes:
+    """Serialize {key: position} into the table format"""
+    keys = array('Q', sorted(entries))
+    values = array('f', (entries[k] for k in keys))
+    if not _NATIVE_LITTLE:
+        keys.byteswap()
+        values.byteswap()
+    return HEADER.pack(MAGIC, VERSION, len(keys)) + keys.tobytes() + values.tobytes()
+
+
+class _Table:
+    """Read-only sorted key/value arrays over a mapped bookmark file"""
+
+    def __init__(self, buf, mapping=None):
+        if len(buf) < HEADER.size:
+            raise ValueError("Bookmark table is truncated")
+        magic, version, count = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a bookmark table")
+        values_start = HEADER.size + count * 8
+        if len(buf) < values_start + count * 4:
+            raise ValueError("Bookmark table is truncated")
+        self._mapping = mapping
+        self.count = count
+        self.keys = self._view(buf, 'Q', HEADER.size, count)
+        self.values = self._view(buf, 'f', values_start, count)
+
+    @staticmethod
+    def _view(buf, typecode, start, count):
+        raw = memoryview(buf)[start:start + count * array(typecode).itemsize]
+        if _NATIVE_LITTLE:
+            return raw.cast(typecode)
+        arr = array(typecode)
+        arr.frombytes(raw)
+        arr.byteswap()
+        return memoryview(arr)
+
+    def get(self, key: int) -> Optional[float]:
+        i = bisect.bisect_left(self.keys, key)
+        if i < self.count and self.keys[i] == key:
+            return float(self.values[i])
+        return None
+
+    def items(self) -> Dict[int, float]:
+        return dict(zip(self.keys.tolist(), self.values.tolist()))
+
+    def close(self):
+        for view in (self.keys, self.values):
+            view.release()
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+
+class BookmarkStore:
+    """Resume positions by path, backed by a lazily mapped binary table"""
+
+    def __init__(self, file_path: str, jobs=None, min_length: float = 600.0, min_position: float = 10.0,
+                 end_margin: float = 30.0, interval: float = 5.0, flush_interval: float = 30.0):
+        self.file_path = file_path
+        self.jobs = jobs
+        self.min_length = min_length
+        self.min_position = min_position
+        self.end_margin = end_margin
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._table = None
+        self._loaded = False
+        # key -> position, or None for a cleared bookmark, not yet written
+        self._dirty: Dict[int, Optional[float]] = {}
+        self._last_update = 0.0
+        self._last_flush = time.monotonic()
+
+    def _load(self):
+        """Map the table on first use (callers hold _lock)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.file_path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Missing or empty file: no bookmarks yet
+            return
+        try:
+            self._table = _Table(mapping, mapping)
+        except ValueError as e:
+            logger.warning(f"Ignoring bookmark file {self.file_path}: {e}")
+            mapping.close()
+
+    # ------------------ lookups ------------------
+    def get(self, path: str) -> Optional[float]:
+        """Resume position for path in seconds, or None"""
+        key = path_key(path)
+        with self._lock:
+            if key in self._dirty:
+                return self._dirty[key]
+            self._load()
+            return self._table.get(key) if self._table is not None else None
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            entries = self._table.items() if self._table is not None else {}
+            entries.update(self._dirty)
+        return sum(1 for position in entries.values() if position is not None)
+
+    # ------------------ recording ------------------
+    def update(self, path: str, position: float, length: float, force: bool = False) -> bool:
+        """Record the position reached in path; True when it was recorded (not throttled)"""
+        if not length or length < self.min_length:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_update < self.interval:
+            return False
+        self._last_update = now
+        if position < self.min_position or length - position < self.end_margin:
+            self._set(path_key(path), None)
+        else:
+            self._set(path_key(path), float(position))
+        return True
+
+    def clear(self, path: str):
+        """Forget path's position (played to the end)"""
+        self._set(path_key(path), None)
+
+    def _set(self, key: int, position: Optional[float]):
+        with self._lock:
+            self._dirty[key] = position
+        if self.jobs is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+            self._last_flush = time.monotonic()
+            try:
+                self.jobs.submit(self.flush, key=('bookmarks', self.file_path), pool='io', group='bookmarks')
+            except RuntimeError:
+                # Executor already shut down; close() writes what is left
+                pass
+
+    # ------------------ writing ------------------
+    def flush(self):
+        """Merge pending updates into a new table file"""
+        with self._io_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._load()
+                dirty = dict(self._dirty)
+                entries = self._table.items() if self._table is not None else {}
+            for key, position in dirty.items():
+                if position is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = position
+            try:
+                utils.atomic_write(self.file_path, encode_bookmarks(entries))
+            except Exception as e:
+                # The overlay keeps the updates for the next attempt
+                logger.error(f"Could not save bookmarks to {self.file_path}: {e}")
+                return
+            with self._lock:
+                for key, position in dirty.items():
+                    # Updates made while writing stay in the overlay
+                    if key in self._dirty and self._dirty[key] == position:
+                        del self._dirty[key]
+                if self._table is not None:
+                    self._table.close()
+                    self._table = None
+                # Remapped from the new file on the next lookup
+                self._loaded = False
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._table is not None:
+                self._table.close()
+                self._table = None
+            self._loaded = False
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Command-line tools for the track library (the `lmusic` command)
+
+    lmusic scan ~/Music              add new and changed files, one line each
+    lmusic stats [-q QUERY]          track count, total duration and size
+    lmusic dupes                     groups of byte-identical files
+    lmusic verify [--quick]          missing, changed and unreadable tracks
+    lmusic export [--format csv]     the library as M3U, CSV or JSON lines
+    lmusic playlist build QUERY      an M3U playlist from a smart playlist query
+
+Results are printed as they are found, one per line on stdout; summaries
+and warnings go to stderr, so the output can be piped or used from cron.
+Exit status is 0 on success, 1 when verify finds problems and 2 for
+usage errors such as a bad query.
+
+Scanning is incremental: files whose size and mtime match the stored
+record are never opened, so a warm rescan of a large tree costs one
+scandir walk. Tags of new and changed files are read on worker processes
+(jobs.map_processes); duplicate and verify checks hash and probe files on
+worker threads.
+"""
+
+import os
+import sys
+import csv
+import json
+import hashlib
+import logging
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cue
+import utils
+from config import LIBRARY_FILE
+from library import Library, read_metadata
+from smart_playlist import QueryError, compile_query, save_smart_playlist
+
+try:
+    from mutagen import File
+except ImportError:
+    File = None
+
+logger = logging.getLogger(__name__)
+
+# Files this small are read in-process; spawning workers would cost more
+_INLINE_READS = 64
+_READ_CHUNK = 64
+_HASH_BLOCK = 1 << 20
+_PARTIAL_BYTES = 64 * 1024
+
+
+# ------------------ workers ------------------
+def _read_chunk(paths: List[str]) -> List[Tuple[str, Optional[Dict], Optional[str]]]:
+    """(path, metadata, error) for each path (runs on worker processes)"""
+    results = []
+    for path in paths:
+        try:
+            results.append((path, read_metadata(path), None))
+        except Exception as e:
+            results.append((path, None, str(e)))
+    return results
+
+
+def _probe_chunk(paths: List[str]) -> List[Tuple[str, Optional[str]]]:
+    """(path, problem or None) after opening each file with mutagen (worker processes)"""
+    results = []
+    for path in paths:
+        try:
+            audio = File(path)
+            if audio is None:
+                problem = "unrecognized format"
+            elif not getattr(audio.info, 'length', 0):
+                problem = "no audio stream"
+            else:
+                problem = None
+        except Exception as e:
+            problem = str(e) or type(e).__name__
+        results.append((path, problem))
+    return results
+
+
+def _map_chunks(chunk_fn, items: List[str], workers: Optional[int]) -> Iterator[list]:
+    """chunk_fn over items, on worker processes unless the job is small"""
+    if not items:
+        return
+    if workers == 1 or len(items) <= _INLINE_READS:
+        yield chunk_fn(items)
+        return
+    # Imported here: worker processes pull in the audio stack
+    from jobs import map_processes
+    yield from map_processes(chunk_fn, items, workers, _READ_CHUNK)
+
+
+def _file_digest(path: str, partial: bool) -> Optional[bytes]:
+    """blake2b of the first and last 64 KiB (partial) or of the whole file"""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, 'rb') as f:
+            if partial:
+                digest.update(f.read(_PARTIAL_BYTES))
+                size = os.fstat(f.fileno()).st_size
+                if size > 2 * _PARTIAL_BYTES:
+                    f.seek(-_PARTIAL_BYTES, os.SEEK_END)
+                    digest.update(f.read(_PARTIAL_BYTES))
+            else:
+                for block in iter(lambda: f.read(_HASH_BLOCK), b''):
+                    digest.update(block)
+    except OSError as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return None
+    return digest.digest()
+
+
+def _identical_groups(paths: List[str]) -> List[List[str]]:
+    """Split same-size files into groups of identical content (worker threads)"""
+    groups = [paths]
+    for partial in (True, False):
+        refined = []
+        for group in groups:
+            by_digest = defaultdict(list)
+            for path in group:
+                digest = _file_digest(path, partial)
+                if digest is not None:
+                    by_digest[digest].append(path)
+            refined.extend(g for g in by_digest.values() if len(g) > 1)
+        groups = refined
+    return groups
+
+
+# ------------------ helpers ------------------
+def walk_tracks(root: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """(path, stat) for audio files under root; CUE rips yield one entry per track"""
+    stack = [os.path.abspath(root)]
+    while stack:
+        folder = stack.pop()
+        files, sheets = [], []
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith('.cue'):
+                            sheets.append(entry.path)
+                        elif utils.is_audio_file(entry.name):
+                            files.append(entry)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.warning(f"Could not scan {folder}: {e}")
+            continue
+
+        covered = set()
+        for sheet in sheets:
+            entries = cue.expand(sheet)
+            if not entries:
+                continue
+            covered.update(track.audio_path for track in cue.load_cue(sheet))
+            try:
+                st = os.stat(sheet)
+            except OSError:
+                continue
+            for path in entries:
+                yield path, st
+        for entry in files:
+            if entry.path in covered:
+                continue
+            try:
+                yield entry.path, entry.stat()
+            except OSError:
+                continue
+
+
+def _under(path: str, roots: List[str]) -> bool:
+    source = cue.source_path(path)
+    return any(source == root or source.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+
+
+def _selected_ids(library: Library, query: Optional[str]) -> List[int]:
+    """Track ids matching query (all tracks in id order when None); raises QueryError"""
+    if not query:
+        return sorted(library.ids())
+    return [library.id_of(path) for path in compile_query(query, library).evaluate(library)]
+
+
+def _stored_size(library: Library, track_id: int, counted: set) -> int:
+    """Bytes on disk for a track; a CUE rip's audio file is counted once"""
+    path = library.paths[track_id]
+    track = cue.resolve(path) if cue.is_virtual(path) else None
+    if track is None:
+        return library.value(track_id, 'size') or 0
+    if track.audio_path in counted:
+        return 0
+    counted.add(track.audio_path)
+    try:
+        return os.path.getsize(track.audio_path)
+    except OSError:
+        return 0
+
+
+def _emit(line: str):
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+
+def _status(message: str):
+    print(message, file=sys.stderr)
+
+
+# ------------------ commands ------------------
+def cmd_scan(args) -> int:
+    library = Library.load(args.library)
+    roots = [os.path.abspath(root) for root in args.roots]
+    seen = set()
+    stale = []
+    for root in roots:
+        for path, st in walk_tracks(root):
+            seen.add(path)
+            if not library.is_current(path, st):
+                stale.append(path)
+
+    added = changed = failed = removed = 0
+    with library.batch():
+        for results in _map_chunks(_read_chunk, stale, args.jobs):
+            for path, meta, error in results:
+                if error is not None:
+                    failed += 1
+                    _emit(f"! {path}: {error}")
+                    continue
+                if path in library:
+                    changed += 1
+                    _emit(f"~ {path}")
+                else:
+                    added += 1
+                    _emit(f"+ {path}")
+                library.add(path, **meta)
+        if args.prune:
+            for path in [p for p in library.paths if p is not None and p not in seen and _under(p, roots)]:
+                library.remove(path)
+                removed += 1
+                _emit(f"- {path}")
+
+    if added or changed or removed:
+        if not library.save(args.library):
+            return 1
+    _status(f"{len(seen)} tracks: {added} added, {changed} updated, {removed} removed, {failed} unreadable")
+    return 0
+
+
+def cmd_stats(args) -> int:
+    library = Library.load(args.library)
+    ids = _selected_ids(library, args.query)
+    lengths = library.column('length')
+    artists = library.lowered('artist')
+    albums = library.lowered('album')
+    total_length = sum(lengths[i] or 0 for i in ids)
+    counted = set()
+    total_size = sum(_stored_size(library, i, counted) for i in ids)
+    formats = defaultdict(int)
+    for i in ids:
+        ext = os.path.splitext(cue.source_path(library.paths[i]))[1].lstrip('.').lower()
+        formats[ext or '?'] += 1
+
+    _emit(f"Tracks:    {len(ids)}")
+    _emit(f"Artists:   {len({artists[i] for i in ids if artists[i]})}")
+    _emit(f"Albums:    {len({albums[i] for i in ids if albums[i]})}")
+    _emit(f"Duration:  {utils.get_human_readable_time(int(total_length))}")
+    _emit(f"Size:      {utils.format_file_size(total_size)}")
+    if formats:
+        breakdown = ', '.join(f"{ext} {n}" for ext, n in sorted(formats.items(), key=lambda kv: -kv[1]))
+        _emit(f"Formats:   {breakdown}")
+    return 0
+
+
+def cmd_dupes(args) -> int:
+    library = Library.load(args.library)
+    sizes = library.column('size')
+    by_size = defaultdict(list)
+    for i in _selected_ids(library, args.query):
+        path = library.paths[i]
+        # Virtual CUE tracks share their sheet; only real files are compared
+        if sizes[i] and not cue.is_virtual(path):
+            by_size[sizes[i]].append(path)
+    candidates = [paths for paths in by_size.values() if len(paths) > 1]
+
+    groups = wasted = 0
+    with ThreadPoolExecutor(max_workers=args.jobs or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        futures = {pool.submit(_identical_groups, paths): size
+                   for paths in candidates for size in (sizes[library.id_of(paths[0])],)}
+        for future in as_completed(futures):
+            for group in future.result():
+                if groups:
+                    _emit('')
+                for path in sorted(group):
+                    _emit(path)
+                groups += 1
+                wasted += futures[future] * (len(group) - 1)
+    _status(f"{groups} duplicate groups, {utils.format_file_size(wasted)} reclaimable")
+    return 0
+
+
+def cmd_verify(args) -> int:
+    library = Library.load(args.library)
+    problems = 0
+    probe = []
+    for i in _selected_ids(library, args.query):
+        path = library.paths[i]
+        source = cue.source_path(path)
+        try:
+            st = os.stat(source)
+        except OSError:
+            problems += 1
+            _emit(f"MISSING {path}")
+            continue
+        if cue.is_virtual(path):
+            track = cue.resolve(path)
+            if track is None or not os.path.isfile(track.audio_path):
+                problems += 1
+                _emit(f"MISSING {path}")
+                continue
+        if not library.is_current(path, st):
+            problems += 1
+            _emit(f"CHANGED {path}")
+        if not args.quick:
+            probe.append(cue.audio_path(path))
+
+    if probe and File is None:
+        _status("mutagen is not installed; skipping the readability check")
+        probe = []
+    for results in _map_chunks(_probe_chunk, sorted(set(probe)), args.jobs):
+        for path, problem in results:
+            if problem is not None:
+                problems += 1
+                _emit(f"UNREADABLE {path}: {problem}")
+    _status(f"{len(library)} tracks checked, {problems} problems")
+    return 1 if problems else 0
+
+
+def cmd_export(args) -> int:
+    library = Library.load(args.library)
+    ids = _selected_ids(library, args.query)
+    if args.format == 'm3u':
+        _write_m3u(sys.stdout, [library.paths[i] for i in ids])
+        return 0
+    fields = library.column_names()
+    columns = [library.column(f) for f in fields]
+    if args.format == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(fields)
+        for i in ids:
+            writer.writerow(['' if col[i] is None else col[i] for col in columns])
+    else:
+        for i in ids:
+            record = {f: col[i] for f, col in zip(fields, columns) if col[i] is not None}
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return 0
+
+
+def _write_m3u(stream, paths: List[str]):
+    """The same layout the player saves: a header and one path per line"""
+    stream.write('#EXTM3U\n')
+    for path in paths:
+        stream.write(f"{path}\n")
+
+
+def cmd_playlist_build(args) -> int:
+    library = Library.load(args.library)
+    query = compile_query(args.query, library)
+    if args.smart:
+        if not args.output:
+            raise QueryError("--smart needs an output file (-o)")
+        save_smart_playlist(args.output, args.name or query.text, query.text)
+        _status(f"Saved smart playlist '{args.name or query.text}' to {args.output}")
+        return 0
+    paths = query.evaluate(library)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            _write_m3u(f, paths)
+        _status(f"Wrote {len(paths)} tracks to {args.output}")
+    else:
+        _write_m3u(sys.stdout, paths)
+    return 0
+
+
+# ------------------ entry point ------------------
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='lmusic', description="Batch tools for the music library")
+    parser.add_argument('--library', default=LIBRARY_FILE, help="library file (default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="worker count (default: one per CPU; 1 disables workers)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log debug details to stderr")
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+
+    scan = commands.add_parser('scan', help="add new and changed audio files under folders")
+    scan.add_argument('roots', nargs='+', metavar='FOLDER')
+    scan.add_argument('--prune', action='store_true', help="drop tracks under FOLDER that no longer exist")
+    scan.set_defaults(handler=cmd_scan)
+
+    for name, handler, text in (('stats', cmd_stats, "summarize the library"),
+                                ('dupes', cmd_dupes, "list byte-identical files"),
+                                ('verify', cmd_verify, "check tracks still exist and can be read"),
+                                ('export', cmd_export, "write the library to stdout")):
+        sub = commands.add_parser(name, help=text)
+        sub.add_argument('-q', '--query', help="only tracks matching a smart playlist query")
+        sub.set_defaults(handler=handler)
+        if name == 'verify':
+            sub.add_argument('--quick', action='store_true', help="only compare sizes and mtimes")
+        elif name == 'export':
+            sub.add_argument('--format', choices=('m3u', 'csv', 'jsonl'), default='m3u')
+
+    playlist = commands.add_parser('playlist', help="playlist tools")
+    playlist_commands = playlist.add_subparsers(dest='playlist_command', metavar='COMMAND')
+    playlist_commands.required = True
+    build = playlist_commands.add_parser('build', help="build a playlist from a query")
+    build.add_argument('query', help="e.g. \"genre:jazz year>=1960 order by year\"")
+    build.add_argument('-o', '--output', help="playlist file (default: M3U on stdout)")
+    build.add_argument('--smart', action='store_true', help="save the query itself so the playlist stays live")
+    build.add_argument('--name', help="smart playlist name (default: the query)")
+    build.set_defaults(handler=cmd_playlist_build)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format='%(levelname)s: %(message)s', stream=sys.stderr)
+    try:
+        return args.handler(args)
+    except QueryError as e:
+        _status(f"lmusic: {e}")
+        return 2
+    except KeyboardInterrupt:
+        return 130
+    except BrokenPipeError:
+        # Output piped into head(1) and the like; not an error
+        try:
+            sys.stdout = open(os.devnull, 'w')
+        except OSError:
+            pass
+        return 0
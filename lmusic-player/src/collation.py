@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Precomputed sort keys for playlist columns
+
+Sorting a playlist by a Treeview column compares collation keys rather
+than display strings:
+
+- text is case-folded and transformed with locale.strxfrm, so accented
+  and non-ASCII names sort the way the user's locale expects
+- runs of digits compare as numbers ("Track 2" before "Track 10")
+- the artist column sorts by artist, then album, disc, track and title
+- musical keys sort in Camelot wheel order
+- tracks missing a value sort after all tracks that have one, in either
+  direction
+
+Keys are built once per (column, track) and kept until the library
+reports that the track changed, so re-sorting a large playlist is one
+dictionary lookup per row followed by a sort of the stored keys.
+"""
+
+import os
+import re
+import locale
+import logging
+from typing import Callable, Dict, List, Optional, Sequence
+
+from analysis import camelot
+
+logger = logging.getLogger(__name__)
+
+_DIGITS = re.compile(r'(\d+)')
+# Sort after any real text / number
+_MISSING_TEXT = ('\U0010ffff',)
+_MISSING_NUMBER = float('inf')
+_MISSING = (_MISSING_TEXT, _MISSING_NUMBER)
+
+_locale_ready = False
+
+
+def _init_locale():
+    """Collate with the user's locale (once; falls back to code point order)"""
+    global _locale_ready
+    if _locale_ready:
+        return
+    _locale_ready = True
+    try:
+        locale.setlocale(locale.LC_COLLATE, '')
+    except locale.Error as e:
+        logger.debug(f"Using default collation: {e}")
+
+
+def natural_key(text: str) -> tuple:
+    """Locale-aware, case-insensitive key that orders digit runs numerically
+
+    Text and number parts alternate, starting with text, so any two keys
+    compare element by element without mixing types.
+    """
+    _init_locale()
+    parts = _DIGITS.split(text.casefold())
+    for i in range(0, len(parts), 2):
+        parts[i] = locale.strxfrm(parts[i])
+    for i in range(1, len(parts), 2):
+        parts[i] = int(parts[i])
+    return tuple(parts)
+
+
+def _text(value) -> tuple:
+    if value is None or value == '':
+        return _MISSING_TEXT
+    return natural_key(str(value))
+
+
+def _number(value):
+    return _MISSING_NUMBER if value is None else value
+
+
+def _file_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _file_key(path: str, record: Optional[Dict]) -> tuple:
+    return natural_key(os.path.basename(path))
+
+
+def _title_key(path: str, record: Optional[Dict]) -> tuple:
+    return natural_key((record or {}).get('title') or _file_name(path))
+
+
+def _artist_key(path: str, record: Optional[Dict]) -> tuple:
+    record = record or {}
+    return (_text(record.get('artist')), _text(record.get('album')),
+            _number(record.get('disc')), _number(record.get('track')),
+            _title_key(path, record))
+
+
+def _length_key(path: str, record: Optional[Dict]) -> tuple:
+    length = (record or {}).get('length')
+    return (_number(length or None), _title_key(path, record))
+
+
+def _bpm_key(path: str, record: Optional[Dict]) -> tuple:
+    return (_number((record or {}).get('bpm')), _title_key(path, record))
+
+
+def _camelot_key(path: str, record: Optional[Dict]) -> tuple:
+    """Musical keys in Camelot wheel order (1A, 1B, 2A, ...) so compatible keys are adjacent"""
+    code = camelot((record or {}).get('key'))
+    if code is None:
+        return (_MISSING_NUMBER, '', _title_key(path, record))
+    return (int(code[:-1]), code[-1], _title_key(path, record))
+
+
+# column -> key(path, library record or None)
+COLUMN_KEYS: Dict[str, Callable] = {
+    'file': _file_key,
+    'title': _title_key,
+    'artist': _artist_key,
+    'length': _length_key,
+    'bpm': _bpm_key,
+    'key': _camelot_key,
+}
+
+
+class SortKeyCache:
+    """Per-track sort keys for each column, invalidated by library changes"""
+
+    def __init__(self, library=None):
+        self.library = library
+        self._keys: Dict[str, Dict[str, tuple]] = {}
+        if library is not None:
+            library.subscribe(self.invalidate)
+
+    def invalidate(self, paths=None):
+        """Forget keys for paths (all keys when None)"""
+        if paths is None:
+            self._keys.clear()
+            return
+        for keys in self._keys.values():
+            for path in paths:
+                keys.pop(path, None)
+
+    def close(self):
+        if self.library is not None:
+            self.library.unsubscribe(self.invalidate)
+
+    def keys(self, paths: Sequence[str], column: str) -> List[tuple]:
+        """Sort keys for paths, computing only those not cached yet"""
+        make_key = COLUMN_KEYS[column]
+        cache = self._keys.setdefault(column, {})
+        library = self.library
+        keys = []
+        append = keys.append
+        for path in paths:
+            key = cache.get(path)
+            if key is None:
+                record = library.get(path) if library is not None else None
+                key = cache[path] = make_key(path, record)
+            append(key)
+        return keys
+
+    def sort_order(self, paths: Sequence[str], column: str, descending: bool = False) -> List[int]:
+        """Indexes of paths in sorted order (stable; ties keep playlist order)
+
+        Tracks without the column's primary value stay last when descending.
+        """
+        keys = self.keys(paths, column)
+        present = [i for i, key in enumerate(keys) if key[0] not in _MISSING]
+        missing = [i for i, key in enumerate(keys) if key[0] in _MISSING]
+        present.sort(key=keys.__getitem__, reverse=descending)
+        missing.sort(key=keys.__getitem__, reverse=descending)
+        return present + missing
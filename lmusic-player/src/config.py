@@ -14,6 +14,21 @@ ICONS_DIR = os.path.join(ASSETS_DIR, 'icons')
 # Default config file path
 CONFIG_FILE = os.path.join(BASE_DIR, 'config.json')
 
+# Runtime state (session snapshot, caches) lives apart from user settings
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+SESSION_FILE = os.path.join(DATA_DIR, 'session.bin')
+JOURNAL_FILE = os.path.join(DATA_DIR, 'session.journal')
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+STALL_LOG_FILE = os.path.join(DATA_DIR, 'stalls.log')
+TRANSCODE_DIR = os.path.join(DATA_DIR, 'transcode')
+LIBRARY_FILE = os.path.join(DATA_DIR, 'library.json')
+HISTORY_FILE = os.path.join(DATA_DIR, 'history.log')
+FEATURES_FILE = os.path.join(DATA_DIR, 'features.npz')
+ANALYSIS_CHECKPOINT_FILE = os.path.join(DATA_DIR, 'analysis.json')
+SILENCE_FILE = os.path.join(DATA_DIR, 'silence.json')
+BOOKMARKS_FILE = os.path.join(DATA_DIR, 'bookmarks.bin')
+TUI_LOG_FILE = os.path.join(DATA_DIR, 'tui.log')
+
 # Application identity
 APP_NAME = 'lmusic-player'
 # Default visual theme (kept simple)
@@ -26,6 +41,30 @@ DEFAULT_CONFIG = {
     'last_index': 0,
     'resume_on_start': False,
     'theme': DEFAULT_THEME,
+    # Event-loop watchdog: callbacks blocking longer than this are reported
+    'stall_threshold_ms': 250,
+    # Disk quota for decoded copies of .m4a and non-44.1 kHz FLAC tracks
+    'transcode_cache_mb': 2048,
+    # Append similar tracks when the playlist runs out instead of wrapping around
+    'autoplay_similar': False,
+    # Start and end tracks at their audible audio, skipping leading/trailing silence
+    'trim_silence': True,
+    # Resume tracks at least this long (audiobooks, mixes) where they were left
+    'resume_tracks': True,
+    'resume_min_minutes': 10,
+    # Serve the library over HTTP to other machines on the LAN
+    'http_server': False,
+    'http_host': '0.0.0.0',
+    'http_port': 8765,
+    # Adding a file or folder that is already queued does not queue it again
+    'skip_duplicates': True,
+    # Mixer output: 'low_latency' (~12 ms buffer), 'balanced' or 'high_quality' (~93 ms);
+    # audio_buffer (frames) and audio_frequency override the profile's values
+    'audio_profile': 'low_latency',
+    'audio_buffer': None,
+    'audio_frequency': None,
+    # Double the buffer (at the next track) when the device keeps running dry
+    'audio_adaptive_buffer': True,
 }
 import os
 
@@ -56,5 +95,5 @@ DEFAULT_SETTINGS = {
 }
 
 # Create necessary directories
-for directory in [ASSETS_DIR, PLAYLISTS_DIR, ICONS_DIR]:
+for directory in [ASSETS_DIR, PLAYLISTS_DIR, ICONS_DIR, DATA_DIR]:
     os.makedirs(directory, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+CUE sheets: virtual tracks inside single-file album rips
+
+An album ripped to one FLAC (or WAV, APE...) plus a .cue sheet is
+expanded into one playlist entry per track. Entries stay plain strings so
+the journal and session snapshot need no changes; a virtual track is
+written as the cue sheet's path, '#' and the track number:
+
+    /music/Album/album.cue#3
+
+resolve() turns such an entry into a CueTrack (audio file, start and end
+offsets in seconds, title, performer). Parsed sheets are cached by path
+and mtime.
+
+- A track starts at its INDEX 01 and ends where the next track on the
+  same FILE starts, so pregaps (INDEX 00) stay with the previous track
+  and consecutive tracks cover the file without gaps
+- The last track on a file has no end (it plays to the end of the file)
+- Sheets are read as UTF-8 (with or without BOM), falling back to cp1252
+"""
+
+import os
+import re
+import shlex
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FRAMES_PER_SECOND = 75
+_VIRTUAL = re.compile(r'^(.*\.cue)#(\d+)$', re.IGNORECASE)
+_TIMESTAMP = re.compile(r'^(\d+):(\d{1,2}):(\d{1,2})$')
+
+
+class CueTrack:
+    """One track of a cue sheet: a span of an audio file"""
+
+    __slots__ = ('number', 'audio_path', 'start', 'end', 'title', 'performer', 'album', 'genre', 'year')
+
+    def __init__(self, number: int, audio_path: str, start: float, end: Optional[float] = None,
+                 title: str = '', performer: str = '', album: str = '', genre: str = '',
+                 year: Optional[int] = None):
+        self.number = number
+        self.audio_path = audio_path
+        self.start = start
+        self.end = end
+        self.title = title
+        self.performer = performer
+        self.album = album
+        self.genre = genre
+        self.year = year
+
+    def length(self, file_length: float = 0.0) -> float:
+        """Duration in seconds; the last track needs the audio file's length"""
+        end = self.end if self.end is not None else file_length
+        return max(0.0, end - self.start)
+
+    def __repr__(self):
+        return f"CueTrack({self.number}, {self.start:.2f}-{self.end}, {self.title!r})"
+
+
+def parse_timestamp(text: str) -> float:
+    """'mm:ss:ff' (75 frames per second) -> seconds"""
+    match = _TIMESTAMP.match(text.strip())
+    if match is None:
+        raise ValueError(f"Bad cue timestamp {text!r}")
+    minutes, seconds, frames = (int(g) for g in match.groups())
+    return minutes * 60 + seconds + frames / FRAMES_PER_SECOND
+
+
+def _split(line: str) -> List[str]:
+    try:
+        return shlex.split(line, posix=True)
+    except ValueError:
+        # Unbalanced quotes: keep the rest of the line as one value
+        command, _, rest = line.partition(' ')
+        return [command, rest.strip().strip('"')]
+
+
+def parse_cue(text: str, cue_path: str) -> List[CueTrack]:
+    """Tracks of a cue sheet in order; FILE names are resolved next to the sheet"""
+    base = os.path.dirname(os.path.abspath(cue_path))
+    album = {'title': '', 'performer': '', 'genre': '', 'year': None}
+    tracks: List[CueTrack] = []
+    audio_path = None
+    current = None
+    for raw in text.splitlines():
+        words = _split(raw.strip())
+        if not words:
+            continue
+        command = words[0].upper()
+        args = words[1:]
+        if command == 'FILE' and args:
+            audio_path = os.path.join(base, args[0])
+            current = None
+        elif command == 'TRACK' and args and audio_path is not None:
+            current = None
+            if len(args) < 2 or args[1].upper() == 'AUDIO':
+                try:
+                    current = CueTrack(int(args[0]), audio_path, -1.0)
+                except ValueError:
+                    continue
+                tracks.append(current)
+        elif command == 'INDEX' and len(args) >= 2 and current is not None:
+            try:
+                if int(args[0]) == 1:
+                    current.start = parse_timestamp(args[1])
+            except ValueError:
+                continue
+        elif command in ('TITLE', 'PERFORMER') and args:
+            if current is not None:
+                setattr(current, command.lower(), args[0])
+            elif not tracks:
+                album[command.lower()] = args[0]
+        elif command == 'REM' and len(args) >= 2 and not tracks:
+            key = args[0].upper()
+            if key == 'GENRE':
+                album['genre'] = ' '.join(args[1:])
+            elif key == 'DATE' and args[1][:4].isdigit():
+                album['year'] = int(args[1][:4])
+    tracks = [t for t in tracks if t.start >= 0]
+    for i, track in enumerate(tracks):
+        track.album = album['title']
+        track.genre = album['genre']
+        track.year = album['year']
+        track.performer = track.performer or album['performer']
+        track.title = track.title or f"Track {track.number:02d}"
+        following = tracks[i + 1] if i + 1 < len(tracks) else None
+        if following is not None and following.audio_path == track.audio_path:
+            track.end = following.start
+    return tracks
+
+
+def read_cue_text(cue_path: str) -> str:
+    with open(cue_path, 'rb') as f:
+        data = f.read()
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1252', 'replace')
+
+
+_cache: Dict[str, Tuple[float, List[CueTrack]]] = {}
+_cache_lock = threading.Lock()
+
+
+def load_cue(cue_path: str) -> List[CueTrack]:
+    """Parsed tracks of cue_path, cached until the file changes"""
+    try:
+        mtime = os.stat(cue_path).st_mtime
+    except OSError:
+        return []
+    with _cache_lock:
+        cached = _cache.get(cue_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        tracks = parse_cue(read_cue_text(cue_path), cue_path)
+    except OSError as e:
+        logger.warning(f"Could not read cue sheet {cue_path}: {e}")
+        tracks = []
+    with _cache_lock:
+        _cache[cue_path] = (mtime, tracks)
+    return tracks
+
+
+# ------------------ virtual playlist entries ------------------
+def virtual_path(cue_path: str, number: int) -> str:
+    return f"{cue_path}#{number}"
+
+
+def is_virtual(path: str) -> bool:
+    return isinstance(path, str) and _VIRTUAL.match(path) is not None
+
+
+def split_virtual(path: str) -> Optional[Tuple[str, int]]:
+    """(cue path, track number) of a virtual entry, else None"""
+    match = _VIRTUAL.match(path) if isinstance(path, str) else None
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def resolve(path: str) -> Optional[CueTrack]:
+    """The CueTrack a virtual entry refers to (None if the sheet or track is gone)"""
+    parts = split_virtual(path)
+    if parts is None:
+        return None
+    for track in load_cue(parts[0]):
+        if track.number == parts[1]:
+            return track
+    return None
+
+
+def source_path(path: str) -> str:
+    """The file backing an entry: the cue sheet for virtual tracks, else path itself"""
+    parts = split_virtual(path)
+    return parts[0] if parts is not None else path
+
+
+def audio_path(path: str) -> str:
+    """The audio file an entry plays: the ripped file for virtual tracks, else path itself"""
+    track = resolve(path)
+    return track.audio_path if track is not None else path
+
+
+def expand(cue_path: str) -> List[str]:
+    """Virtual entries for every track of a sheet whose audio file exists"""
+    return [virtual_path(cue_path, t.number) for t in load_cue(cue_path) if os.path.isfile(t.audio_path)]
+
+
+def sheet_for(audio_path: str) -> Optional[str]:
+    """The cue sheet describing audio_path ('album.cue' or 'album.flac.cue' beside it)"""
+    stem = os.path.splitext(audio_path)[0]
+    target = os.path.abspath(audio_path)
+    for candidate in (stem + '.cue', audio_path + '.cue'):
+        if os.path.isfile(candidate):
+            if any(os.path.abspath(t.audio_path) == target for t in load_cue(candidate)):
+                return candidate
+    return None
+
+
+def display_name(path: str) -> str:
+    """'03. Title' for virtual tracks, the file name otherwise"""
+    track = resolve(path)
+    if track is None:
+        return os.path.basename(path)
+    return f"{track.number:02d}. {track.title}"
+
+
+def contiguous(track: CueTrack, following: Optional[CueTrack]) -> bool:
+    """True when following starts exactly where track ends in the same file"""
+    return (following is not None and track.end is not None
+            and following.audio_path == track.audio_path and abs(following.start - track.end) < 1e-6)
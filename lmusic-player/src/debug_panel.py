@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Debug panel showing player metrics, shared by both UIs
+"""
+
+import os
+import tkinter as tk
+from tkinter import messagebox
+
+import metrics
+from config import METRICS_DIR
+
+
+class DebugPanel:
+    """Toplevel window listing counters/histograms with export and profiler controls"""
+
+    REFRESH_MS = 1000
+
+    def __init__(self, root, registry=None, profiler=None, watchdog=None):
+        self.registry = registry or metrics.REGISTRY
+        self.profiler = profiler
+        self.watchdog = watchdog
+        self.window = tk.Toplevel(root)
+        self.window.title('Debug Metrics')
+        self.window.geometry('760x420')
+
+        self.text = tk.Text(self.window, font=('Courier', 9), wrap='none')
+        self.text.pack(fill='both', expand=True, padx=8, pady=(8, 4))
+
+        buttons = tk.Frame(self.window)
+        buttons.pack(fill='x', padx=8, pady=(0, 8))
+        tk.Button(buttons, text='Export JSON', command=lambda: self.export('json')).pack(side='left', padx=3)
+        tk.Button(buttons, text='Export Prometheus', command=lambda: self.export('prometheus')).pack(side='left', padx=3)
+        tk.Button(buttons, text='Reset', command=self.reset).pack(side='left', padx=3)
+
+        self.profiler_mode = tk.StringVar(value=profiler.mode if profiler else 'sampling')
+        tk.Radiobutton(buttons, text='Sampling', variable=self.profiler_mode, value='sampling').pack(side='right')
+        tk.Radiobutton(buttons, text='cProfile', variable=self.profiler_mode, value='cprofile').pack(side='right')
+        self.profile_btn = tk.Button(buttons, text='Start Profiler', command=self.toggle_profiler)
+        self.profile_btn.pack(side='right', padx=3)
+        if profiler is not None and profiler.running:
+            self.profile_btn.config(text='Stop Profiler')
+
+        self.refresh()
+
+    def render(self) -> str:
+        lines = [f"{'metric':<40} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+        for name, data in self.registry.snapshot().items():
+            if data['type'] == 'counter':
+                lines.append(f"{name:<40} {data['value']:>8}")
+            elif data['type'] == 'gauge':
+                lines.append(f"{name:<40} {data['value']:>8.3g}")
+            else:
+                lines.append(f"{name:<40} {data['count']:>8} {data['p50'] * 1000:>9.2f} "
+                             f"{data['p95'] * 1000:>9.2f} {data['max'] * 1000:>9.2f}")
+        if self.profiler is not None and self.profiler.mode == 'sampling' and self.profiler.samples:
+            lines.append('')
+            lines.append('Top sampled functions:')
+            for func, n in self.profiler.top(10):
+                lines.append(f"  {func:<60} {n:>6}")
+        if self.watchdog is not None and self.watchdog.reports:
+            lines.append('')
+            lines.append('Recent event-loop stalls:')
+            for report in reversed(self.watchdog.recent(5)):
+                lines.append(f"  {report.duration * 1000:7.0f} ms  {report.culprit}")
+        return '\n'.join(lines)
+
+    def refresh(self):
+        try:
+            if not self.window.winfo_exists():
+                return
+            top = self.text.yview()[0]
+            self.text.delete('1.0', 'end')
+            self.text.insert('1.0', self.render())
+            self.text.yview_moveto(top)
+            self.window.after(self.REFRESH_MS, self.refresh)
+        except tk.TclError:
+            pass
+
+    def export(self, fmt: str):
+        ext = 'prom' if fmt == 'prometheus' else 'json'
+        path = os.path.join(METRICS_DIR, f"metrics.{ext}")
+        if self.registry.export(path, fmt):
+            messagebox.showinfo('Metrics', f'Exported to {path}', parent=self.window)
+        else:
+            messagebox.showerror('Metrics', 'Could not export metrics', parent=self.window)
+
+    def reset(self):
+        self.registry.reset()
+        self.refresh()
+
+    def toggle_profiler(self):
+        if self.profiler is None or (not self.profiler.running and self.profiler.mode != self.profiler_mode.get()):
+            self.profiler = metrics.Profiler(self.profiler_mode.get())
+        if self.profiler.toggle():
+            self.profile_btn.config(text='Stop Profiler')
+            return
+        self.profile_btn.config(text='Start Profiler')
+        ext = 'pstats' if self.profiler.mode == 'cprofile' else 'collapsed'
+        path = os.path.join(METRICS_DIR, f"profile.{ext}")
+        if self.profiler.dump(path):
+            messagebox.showinfo('Profiler', f'Profile written to {path}', parent=self.window)
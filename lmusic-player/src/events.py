@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Publish/subscribe event bus for player notifications
+
+MusicPlayer publishes typed events on player.events instead of calling a
+single UI callback inline, so any number of front-ends and services can
+listen and none of them holds up playback:
+
+    player.events.subscribe(SongChanged, self._on_song_change,
+                            dispatcher=self.dispatcher.post, name='ui_song_change')
+
+- publish() only queues: each subscription hands delivery to its
+  dispatcher (TkDispatcher.post for Tk widgets, inline for code that
+  already runs on the polling thread) or, by default, to a small thread
+  pool shared by every bus in the process
+- Delivery is serialized per subscription and keeps publish order
+- Events whose class sets coalesce = True replace an undelivered event of
+  the same type, so a subscriber that falls behind jumps to the latest
+  song instead of replaying every skip
+- Subscribing to a base class receives its subclasses (Event: everything)
+- Per subscriber histograms event_<name>_latency_seconds (publish to
+  handler start) and event_<name>_handler_seconds; a failing handler is
+  logged and never affects other subscribers
+"""
+
+import re
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_shared_executor = None
+_executor_lock = threading.Lock()
+
+
+def shared_executor() -> ThreadPoolExecutor:
+    """Process-wide pool delivering to subscriptions without a dispatcher"""
+    global _shared_executor
+    with _executor_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='events')
+    return _shared_executor
+
+
+def _background(callback, *args):
+    shared_executor().submit(callback, *args)
+
+
+def inline(callback, *args):
+    """Dispatcher delivering on the publishing thread (before publish() returns)"""
+    callback(*args)
+
+
+class Event:
+    """Base class of bus events"""
+
+    __slots__ = ('timestamp',)
+
+    # Replace an undelivered event of the same type instead of queueing behind it
+    coalesce = False
+
+    def __init__(self):
+        self.timestamp = time.perf_counter()
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if not name.startswith('_'))
+        return f"{type(self).__name__}({fields})"
+
+
+class SongChanged(Event):
+    """A new track became current (play(), next(), a gapless CUE advance)
+
+    info is the player's song info dict, read on first access so tag
+    reading happens on the subscriber's thread rather than inside play().
+    """
+
+    __slots__ = ('index', 'path', '_player', '_info')
+    coalesce = True
+
+    def __init__(self, index: int, path: str, player=None, info: Optional[dict] = None):
+        super().__init__()
+        self.index = index
+        self.path = path
+        self._player = player
+        self._info = info
+
+    @property
+    def info(self) -> Optional[dict]:
+        # Two subscribers racing here both read the tags; the results are equal
+        if self._info is None and self._player is not None:
+            self._info = self._player.song_info(self.path)
+        return self._info
+
+
+class PlaybackEnded(Event):
+    """The current track finished playing on its own"""
+
+    __slots__ = ('index', 'path')
+
+    def __init__(self, index: int, path: Optional[str]):
+        super().__init__()
+        self.index = index
+        self.path = path
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r'[^0-9a-zA-Z]+', '_', name).strip('_').lower() or 'subscriber'
+
+
+class Subscription:
+    """Handle returned by EventBus.subscribe()"""
+
+    __slots__ = ('event_type', 'callback', 'dispatcher', 'name', 'active',
+                 '_pending', '_scheduled', '_latency_metric', '_handler_metric')
+
+    def __init__(self, event_type, callback, dispatcher, name):
+        self.event_type = event_type
+        self.callback = callback
+        self.dispatcher = dispatcher
+        self.name = name
+        self.active = True
+        self._pending: List[Event] = []
+        self._scheduled = False
+        metric = _metric_name(name)
+        self._latency_metric = f'event_{metric}_latency_seconds'
+        self._handler_metric = f'event_{metric}_handler_seconds'
+
+
+class EventBus:
+    """Typed events fanned out to subscribers without blocking the publisher"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = ()
+
+    def subscribe(self, event_type, callback: Callable[[Event], None],
+                  dispatcher: Optional[Callable] = None, name: Optional[str] = None) -> Subscription:
+        """Call callback(event) for every event_type (or subclass) published
+
+        dispatcher(fn, *args) decides where delivery runs; None uses the
+        shared background pool.
+        """
+        if name is None:
+            name = getattr(callback, '__qualname__', None) or type(callback).__name__
+        subscription = Subscription(event_type, callback, dispatcher or _background, name)
+        with self._lock:
+            self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Stop delivery; events already queued for it are dropped"""
+        with self._lock:
+            subscription.active = False
+            subscription._pending.clear()
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def publish(self, event: Event):
+        """Queue event for every matching subscriber (thread-safe, never blocks on handlers)"""
+        metrics.inc('events_published_total')
+        for subscription in self._subscriptions:
+            if isinstance(event, subscription.event_type):
+                self._enqueue(subscription, event)
+
+    def _enqueue(self, subscription: Subscription, event: Event):
+        with self._lock:
+            pending = subscription._pending
+            if event.coalesce:
+                kind = type(event)
+                for i, queued in enumerate(pending):
+                    if type(queued) is kind:
+                        # The newer event goes to the back so order stays causal
+                        del pending[i]
+                        metrics.inc('events_coalesced_total')
+                        break
+            pending.append(event)
+            if subscription._scheduled:
+                return
+            subscription._scheduled = True
+        try:
+            subscription.dispatcher(self._deliver, subscription)
+        except Exception as e:
+            # e.g. the Tk dispatcher or the pool is gone during shutdown
+            logger.warning(f"Could not dispatch events to {subscription.name}: {e}")
+            with self._lock:
+                subscription._pending.clear()
+                subscription._scheduled = False
+
+    def _deliver(self, subscription: Subscription):
+        """Run the subscription's queued events in order until none are left"""
+        while True:
+            with self._lock:
+                if not subscription._pending or not subscription.active:
+                    subscription._scheduled = False
+                    return
+                event = subscription._pending.pop(0)
+            start = time.perf_counter()
+            metrics.observe(subscription._latency_metric, start - event.timestamp)
+            try:
+                subscription.callback(event)
+            except Exception as e:
+                logger.warning(f"Event subscriber {subscription.name} failed on {type(event).__name__}: {e}")
+            metrics.observe(subscription._handler_metric, time.perf_counter() - start)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Audio feature extraction for similarity search
+
+extract_features() turns a track into a short float32 vector summarising
+its timbre and rhythm:
+
+- spectral centroid (mean, std) and roll-off, zero-crossing rate and
+  loudness (RMS mean, std)
+- tempo estimated from the autocorrelation of a spectral-flux onset curve
+- mean and standard deviation of 13 MFCCs
+
+Everything after decoding is vectorized NumPy over the whole
+spectrogram. Only a window from the middle of the track (max_seconds) is
+analysed, so long tracks cost the same as short ones.
+
+extract_batch() spreads tracks over worker processes (the work is CPU
+bound and holds the GIL), yielding results as chunks finish.
+
+Decoding: PCM WAV files are read directly; other formats go through
+ffmpeg when it is on PATH, else pygame.mixer.Sound (initialized with the
+dummy audio driver inside worker processes).
+"""
+
+import os
+import mmap
+import shutil
+import logging
+import subprocess
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from jobs import map_processes
+from pcm_stream import parse_wav
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 22050
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+N_MELS = 40
+N_MFCC = 13
+# Tempo search range (BPM)
+MIN_BPM = 60.0
+MAX_BPM = 200.0
+
+FEATURE_NAMES = (
+    ('centroid_mean', 'centroid_std', 'rolloff_mean', 'zcr_mean', 'rms_mean', 'rms_std', 'tempo')
+    + tuple(f"mfcc{i}_mean" for i in range(N_MFCC))
+    + tuple(f"mfcc{i}_std" for i in range(N_MFCC))
+)
+FEATURE_DIM = len(FEATURE_NAMES)
+
+FFMPEG = shutil.which('ffmpeg')
+
+
+def available() -> bool:
+    """True when NumPy is installed (feature extraction needs it)"""
+    return np is not None
+
+
+# ------------------ decoding ------------------
+def _resample(samples, src_rate: int, dst_rate: int):
+    """Linear-interpolation resample (adequate for feature statistics)"""
+    if src_rate == dst_rate or not len(samples):
+        return samples
+    count = int(len(samples) * dst_rate / src_rate)
+    positions = np.arange(count, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def _to_mono(samples, channels: int):
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples.astype(np.float32, copy=False)
+
+
+def decode_wav(file_path: str, rate: int = SAMPLE_RATE):
+    """Mono float32 samples of an 8/16/32-bit PCM WAV at rate"""
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        info = parse_wav(buf)
+        dtype = {1: np.uint8, 2: np.int16, 4: np.int32}.get(info.sample_width)
+        if dtype is None:
+            raise ValueError(f"Unsupported sample width {info.sample_width}")
+        count = info.data_size // info.sample_width
+        raw = np.frombuffer(buf, dtype=dtype, count=count, offset=info.data_offset).astype(np.float32)
+    if dtype is np.uint8:
+        raw = (raw - 128.0) / 128.0
+    else:
+        raw /= float(np.iinfo(dtype).max)
+    return _resample(_to_mono(raw, info.channels), info.rate, rate)
+
+
+def decode_ffmpeg(file_path: str, rate: int = SAMPLE_RATE):
+    cmd = [FFMPEG, '-v', 'error', '-nostdin', '-i', file_path, '-vn',
+           '-ac', '1', '-ar', str(rate), '-f', 'f32le', '-']
+    out = subprocess.run(cmd, check=True, capture_output=True, timeout=600).stdout
+    return np.frombuffer(out, dtype='<f4').copy()
+
+
+def decode_pygame(file_path: str, rate: int = SAMPLE_RATE):
+    import pygame
+    if not pygame.mixer.get_init():
+        # Worker processes have no audio device and need none
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+        pygame.mixer.init(frequency=rate, size=-16, channels=1)
+    freq, size, channels = pygame.mixer.get_init()
+    dtype = {8: np.int8, 16: np.int16, 32: np.float32}[abs(size)]
+    raw = np.frombuffer(pygame.mixer.Sound(file_path).get_raw(), dtype=dtype).astype(np.float32)
+    if dtype is not np.float32:
+        raw /= float(np.iinfo(dtype).max)
+    return _resample(_to_mono(raw, channels), freq, rate)
+
+
+def load_samples(file_path: str, rate: int = SAMPLE_RATE, max_seconds: Optional[float] = 60.0):
+    """Mono float32 samples at rate; the middle max_seconds of the track"""
+    samples = None
+    if file_path.lower().endswith('.wav'):
+        try:
+            samples = decode_wav(file_path, rate)
+        except ValueError:
+            samples = None
+    if samples is None:
+        samples = decode_ffmpeg(file_path, rate) if FFMPEG else decode_pygame(file_path, rate)
+    if max_seconds is not None:
+        window = int(max_seconds * rate)
+        if len(samples) > window:
+            start = (len(samples) - window) // 2
+            samples = samples[start:start + window]
+    return samples
+
+
+# ------------------ spectral analysis ------------------
+@lru_cache(maxsize=None)
+def _window(size: int):
+    return np.hanning(size).astype(np.float32)
+
+
+def frames(samples, frame_size: int = FRAME_SIZE, hop: int = HOP_SIZE):
+    """Overlapping frames as a strided view (no copy); short input is zero padded"""
+    if len(samples) < frame_size:
+        samples = np.pad(samples, (0, frame_size - len(samples)))
+    return np.lib.stride_tricks.sliding_window_view(samples, frame_size)[::hop]
+
+
+def power_spectrogram(samples, frame_size: int = FRAME_SIZE, hop: int = HOP_SIZE):
+    """|STFT|^2 as float32, shape (frames, frame_size // 2 + 1)"""
+    spectrum = np.fft.rfft(frames(samples, frame_size, hop) * _window(frame_size), axis=1)
+    return (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def mel_filterbank(rate: int = SAMPLE_RATE, frame_size: int = FRAME_SIZE, n_mels: int = N_MELS):
+    """Triangular mel filters, shape (frame_size // 2 + 1, n_mels)"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    bins = frame_size // 2 + 1
+    freqs = np.linspace(0.0, rate / 2.0, bins)
+    edges = mel_to_hz(np.linspace(hz_to_mel(0.0), hz_to_mel(rate / 2.0), n_mels + 2))
+    lower, center, upper = edges[:-2], edges[1:-1], edges[2:]
+    rising = (freqs[:, None] - lower) / (center - lower)
+    falling = (upper - freqs[:, None]) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(n_in: int = N_MELS, n_out: int = N_MFCC):
+    """Orthonormal DCT-II basis, shape (n_in, n_out)"""
+    n = np.arange(n_in)[:, None]
+    k = np.arange(n_out)[None, :]
+    basis = np.cos(np.pi / n_in * (n + 0.5) * k) * np.sqrt(2.0 / n_in)
+    basis[:, 0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+
+def onset_strength(log_mel):
+    """Spectral flux: summed positive change of the log-mel spectrum per frame"""
+    if len(log_mel) < 2:
+        return np.zeros(len(log_mel), dtype=np.float32)
+    flux = np.maximum(0.0, np.diff(log_mel, axis=0)).sum(axis=1)
+    return np.concatenate(([0.0], flux)).astype(np.float32)
+
+
+def estimate_tempo(onset, rate: int = SAMPLE_RATE, hop: int = HOP_SIZE,
+                   min_bpm: float = MIN_BPM, max_bpm: float = MAX_BPM) -> float:
+    """BPM from the autocorrelation of an onset curve (0.0 when there is no pulse)
+
+    Lags are weighted towards 120 BPM so the estimate prefers the beat
+    over its halves and doubles.
+    """
+    onset = onset - onset.mean()
+    if len(onset) < 4 or not onset.any():
+        return 0.0
+    size = 1 << (2 * len(onset) - 1).bit_length()
+    spectrum = np.fft.rfft(onset, size)
+    acf = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, size)[:len(onset)]
+    frame_rate = rate / hop
+    lo = max(1, int(frame_rate * 60.0 / max_bpm))
+    hi = min(len(acf) - 2, int(np.ceil(frame_rate * 60.0 / min_bpm)))
+    if hi <= lo:
+        return 0.0
+    lags = np.arange(lo, hi + 1)
+    bpms = 60.0 * frame_rate / lags
+    weight = np.exp(-0.5 * (np.log2(bpms / 120.0) / 1.0) ** 2)
+    scores = acf[lo:hi + 1] * weight
+    best = int(np.argmax(scores))
+    if scores[best] <= 0:
+        return 0.0
+    # Parabolic interpolation around the peak for sub-frame lag precision
+    lag = float(lags[best])
+    if 0 < best < len(scores) - 1:
+        a, b, c = scores[best - 1], scores[best], scores[best + 1]
+        denom = a - 2 * b + c
+        if denom:
+            lag += 0.5 * (a - c) / denom
+    return 60.0 * frame_rate / lag
+
+
+def features_from_samples(samples, rate: int = SAMPLE_RATE):
+    """Feature vector (float32, FEATURE_DIM) for mono samples"""
+    power = power_spectrogram(samples)
+    freqs = np.linspace(0.0, rate / 2.0, power.shape[1], dtype=np.float32)
+    total = power.sum(axis=1) + 1e-10
+    centroid = (power @ freqs) / total / (rate / 2.0)
+    cumulative = np.cumsum(power, axis=1)
+    rolloff = (cumulative < 0.85 * cumulative[:, -1:]).sum(axis=1) / power.shape[1]
+
+    framed = frames(samples)
+    signs = np.signbit(framed)
+    zcr = (signs[:, 1:] != signs[:, :-1]).mean(axis=1)
+    rms = np.sqrt((framed.astype(np.float32) ** 2).mean(axis=1))
+
+    log_mel = np.log(power @ mel_filterbank(rate) + 1e-10)
+    mfcc = log_mel @ _dct_matrix()
+    tempo = estimate_tempo(onset_strength(log_mel), rate)
+
+    vector = np.concatenate((
+        [centroid.mean(), centroid.std(), rolloff.mean(), zcr.mean(), rms.mean(), rms.std(),
+         tempo / MAX_BPM],
+        mfcc.mean(axis=0), mfcc.std(axis=0),
+    ))
+    return np.nan_to_num(vector).astype(np.float32)
+
+
+def extract_features(file_path: str, max_seconds: float = 60.0):
+    """Feature vector for one track; raises on unreadable files"""
+    return features_from_samples(load_samples(file_path, SAMPLE_RATE, max_seconds))
+
+
+# ------------------ batch extraction ------------------
+def _extract_chunk(paths: List[str], max_seconds: float) -> List[Tuple[str, Optional[bytes]]]:
+    """Worker entry point; vectors travel back as raw bytes"""
+    results = []
+    for path in paths:
+        try:
+            results.append((path, extract_features(path, max_seconds).tobytes()))
+        except Exception as e:
+            logger.debug(f"Could not analyse {os.path.basename(path)}: {e}")
+            results.append((path, None))
+    return results
+
+
+def extract_batch(paths: Iterable[str], workers: Optional[int] = None, chunk_size: int = 8,
+                  max_seconds: float = 60.0, cancelled: Optional[Callable[[], bool]] = None
+                  ) -> Iterator[Dict[str, Optional["np.ndarray"]]]:
+    """Extract features on worker processes; yields {path: vector or None} per finished chunk"""
+    if np is None:
+        raise RuntimeError("NumPy is required for audio analysis")
+    for results in map_processes(_extract_chunk, paths, workers, chunk_size, cancelled, (max_seconds,)):
+        yield {path: (np.frombuffer(data, dtype=np.float32) if data is not None else None)
+               for path, data in results}
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Play history and listening statistics
+
+PlayHistory appends one small binary record per playback event (track
+started, completed, skipped, seeked) to a log next to the session files,
+and keeps running aggregates in memory:
+
+- per track: plays, completions, skips, seeks, seconds listened and when
+  it was last played (TrackStats)
+- per day: the same counters per track, so "top 100 this month" sums at
+  most 31 small buckets instead of scanning years of events
+
+Raw events older than keep_days are folded into per-day rows by a
+background compaction, which rewrites the log while recording continues;
+records appended in the meantime are copied over before the swap.
+
+Log layout (little endian):
+    header   magic, version
+    records  type (uint8), payload length (uint32), payload, crc32 (uint32)
+
+Tracks are numbered by PATH records, so events carry a uint32 track id
+instead of the path.
+"""
+
+import os
+import time
+import heapq
+import struct
+import zlib
+import logging
+import threading
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LMPH'
+VERSION = 1
+HEADER = struct.Struct('<4sH')
+RECORD = struct.Struct('<BI')
+CRC = struct.Struct('<I')
+
+# Record types
+REC_PATH = 1
+REC_START = 2
+REC_COMPLETE = 3
+REC_SKIP = 4
+REC_SEEK = 5
+REC_DAY = 6
+
+_EVENT = struct.Struct('<Idf')  # track id, timestamp, position / seconds listened
+_DAY = struct.Struct('<IIHHHHfd')  # track id, day ordinal, starts, completions, skips, seeks, listened, last
+
+# Counter slots in per-day rows
+_STARTS, _COMPLETES, _SKIPS, _SEEKS, _LISTENED, _LAST = range(6)
+
+
+def _day(timestamp: float) -> int:
+    """Local calendar day of a timestamp as a date ordinal"""
+    return date.fromtimestamp(timestamp).toordinal()
+
+
+def _encode_record(rec_type: int, payload: bytes) -> bytes:
+    head = RECORD.pack(rec_type, len(payload))
+    return head + payload + CRC.pack(zlib.crc32(head + payload))
+
+
+class TrackStats:
+    """Aggregated listening statistics for one track"""
+
+    __slots__ = ('plays', 'completions', 'skips', 'seeks', 'listened', 'last_played')
+
+    def __init__(self):
+        self.plays = 0
+        self.completions = 0
+        self.skips = 0
+        self.seeks = 0
+        self.listened = 0.0
+        self.last_played = 0.0
+
+    @property
+    def skip_rate(self) -> float:
+        """Fraction of plays that were skipped before the end"""
+        return self.skips / self.plays if self.plays else 0.0
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class PlayHistory:
+    """Append-only play event log with per-track and per-day aggregates"""
+
+    def __init__(self, log_path: str, keep_days: int = 31, compact_events: int = 20000):
+        self.log_path = log_path
+        self.keep_days = keep_days
+        self.compact_events = compact_events
+
+        self.paths: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._stats: Dict[int, TrackStats] = {}
+        self._days: Dict[int, Dict[int, list]] = {}  # day -> track id -> counters
+        self._events: List[Tuple[int, int, float, float]] = []  # raw events not yet folded
+        self._listeners: List[Callable] = []
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._compacting = None
+        self._load()
+        self._next_compact = len(self._events) + compact_events
+
+    # ------------------ loading ------------------
+    def _load(self):
+        try:
+            with open(self.log_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        except Exception as e:
+            logger.warning(f"Could not read play history {self.log_path}: {e}")
+            data = b''
+
+        valid = 0
+        if len(data) >= HEADER.size:
+            magic, version = HEADER.unpack_from(data, 0)
+            if magic == MAGIC and version == VERSION:
+                valid = self._replay(data)
+            else:
+                logger.warning(f"Ignoring unrecognised play history {self.log_path}")
+        self._open(valid)
+
+    def _replay(self, data: bytes) -> int:
+        """Apply every intact record; returns the offset after the last one"""
+        pos = HEADER.size
+        while pos + RECORD.size <= len(data):
+            rec_type, length = RECORD.unpack_from(data, pos)
+            end = pos + RECORD.size + length
+            if end + CRC.size > len(data):
+                break
+            (crc,) = CRC.unpack_from(data, end)
+            if crc != zlib.crc32(data[pos:end]):
+                logger.warning(f"Play history checksum mismatch at offset {pos}; discarding tail")
+                break
+            payload = data[pos + RECORD.size:end]
+            try:
+                if rec_type == REC_PATH:
+                    self._intern(os.fsdecode(payload))
+                elif rec_type == REC_DAY:
+                    self._apply_day(*_DAY.unpack(payload))
+                else:
+                    track_id, timestamp, value = _EVENT.unpack(payload)
+                    self._apply_event(rec_type, track_id, timestamp, value)
+            except struct.error:
+                logger.warning(f"Skipping malformed play history record of type {rec_type}")
+            pos = end + CRC.size
+        return pos
+
+    def _open(self, valid: int):
+        """Open the log for appending, dropping any torn tail past valid"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        if valid:
+            self._file = open(self.log_path, 'r+b')
+            self._file.truncate(valid)
+            self._file.seek(valid)
+            self._size = valid
+        else:
+            self._file = open(self.log_path, 'wb')
+            self._file.write(HEADER.pack(MAGIC, VERSION))
+            for path in self.paths:
+                self._file.write(_encode_record(REC_PATH, os.fsencode(path)))
+            self._file.flush()
+            self._size = self._file.tell()
+
+    # ------------------ aggregation ------------------
+    def _intern(self, path: str) -> Tuple[int, bool]:
+        track_id = self._ids.get(path)
+        if track_id is not None:
+            return track_id, False
+        track_id = len(self.paths)
+        self.paths.append(path)
+        self._ids[path] = track_id
+        return track_id, True
+
+    def _counters(self, day: int, track_id: int) -> list:
+        bucket = self._days.setdefault(day, {})
+        row = bucket.get(track_id)
+        if row is None:
+            row = bucket[track_id] = [0, 0, 0, 0, 0.0, 0.0]
+        return row
+
+    def _track(self, track_id: int) -> TrackStats:
+        stats = self._stats.get(track_id)
+        if stats is None:
+            stats = self._stats[track_id] = TrackStats()
+        return stats
+
+    def _apply_event(self, rec_type: int, track_id: int, timestamp: float, value: float):
+        if track_id >= len(self.paths):
+            return
+        row = self._counters(_day(timestamp), track_id)
+        stats = self._track(track_id)
+        if rec_type == REC_START:
+            row[_STARTS] += 1
+            row[_LAST] = max(row[_LAST], timestamp)
+            stats.plays += 1
+            stats.last_played = max(stats.last_played, timestamp)
+        elif rec_type == REC_COMPLETE:
+            row[_COMPLETES] += 1
+            row[_LISTENED] += value
+            stats.completions += 1
+            stats.listened += value
+        elif rec_type == REC_SKIP:
+            row[_SKIPS] += 1
+            row[_LISTENED] += value
+            stats.skips += 1
+            stats.listened += value
+        elif rec_type == REC_SEEK:
+            row[_SEEKS] += 1
+            stats.seeks += 1
+        else:
+            return
+        self._events.append((rec_type, track_id, timestamp, value))
+
+    def _apply_day(self, track_id, day, starts, completes, skips, seeks, listened, last):
+        if track_id >= len(self.paths):
+            return
+        row = self._counters(day, track_id)
+        row[_STARTS] += starts
+        row[_COMPLETES] += completes
+        row[_SKIPS] += skips
+        row[_SEEKS] += seeks
+        row[_LISTENED] += listened
+        row[_LAST] = max(row[_LAST], last)
+        stats = self._track(track_id)
+        stats.plays += starts
+        stats.completions += completes
+        stats.skips += skips
+        stats.seeks += seeks
+        stats.listened += listened
+        stats.last_played = max(stats.last_played, last)
+
+    # ------------------ recording ------------------
+    def _record(self, rec_type: int, path: str, value: float = 0.0, timestamp: Optional[float] = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            track_id, new = self._intern(path)
+            chunks = []
+            if new:
+                chunks.append(_encode_record(REC_PATH, os.fsencode(path)))
+            chunks.append(_encode_record(rec_type, _EVENT.pack(track_id, timestamp, value)))
+            self._apply_event(rec_type, track_id, timestamp, value)
+            data = b''.join(chunks)
+            try:
+                self._file.write(data)
+                self._file.flush()
+                self._size += len(data)
+            except Exception as e:
+                logger.error(f"Could not append to play history: {e}")
+            stats = self._stats[track_id]
+            compact = len(self._events) > self._next_compact
+        metrics.inc('history_events_total')
+        if compact:
+            self.compact_async()
+        for callback in list(self._listeners):
+            try:
+                callback(path, stats)
+            except Exception as e:
+                logger.warning(f"Play history listener failed: {e}")
+
+    def record_start(self, path: str, timestamp: Optional[float] = None):
+        self._record(REC_START, path, 0.0, timestamp)
+
+    def record_complete(self, path: str, listened: float = 0.0, timestamp: Optional[float] = None):
+        self._record(REC_COMPLETE, path, listened, timestamp)
+
+    def record_skip(self, path: str, position: float = 0.0, timestamp: Optional[float] = None):
+        self._record(REC_SKIP, path, position, timestamp)
+
+    def record_seek(self, path: str, position: float = 0.0, timestamp: Optional[float] = None):
+        self._record(REC_SEEK, path, position, timestamp)
+
+    def subscribe(self, callback: Callable[[str, TrackStats], None]):
+        """callback(path, stats) after every recorded event"""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        try:
+            self._listeners.remove(callback)
+        except ValueError:
+            pass
+
+    # ------------------ queries ------------------
+    def stats(self, path: str) -> Optional[TrackStats]:
+        track_id = self._ids.get(path)
+        return self._stats.get(track_id) if track_id is not None else None
+
+    def items(self):
+        """(path, TrackStats) for every track ever played"""
+        return [(self.paths[i], stats) for i, stats in self._stats.items()]
+
+    @metrics.timed('history_top_seconds')
+    def top(self, n: int = 100, since: Optional[float] = None, until: Optional[float] = None,
+            by: str = 'plays') -> List[Tuple[str, int]]:
+        """Most played tracks as [(path, count)] between two timestamps (inclusive days)
+
+        by is 'plays', 'completions' or 'skips'.
+        """
+        slot = {'plays': _STARTS, 'completions': _COMPLETES, 'skips': _SKIPS}[by]
+        with self._lock:
+            if since is None and until is None:
+                attr = {'plays': 'plays', 'completions': 'completions', 'skips': 'skips'}[by]
+                totals = {i: getattr(s, attr) for i, s in self._stats.items()}
+            else:
+                first = _day(since) if since is not None else min(self._days, default=0)
+                last = _day(until) if until is not None else max(self._days, default=0)
+                totals = {}
+                if last - first < len(self._days):
+                    buckets = (self._days.get(d) for d in range(first, last + 1))
+                else:
+                    buckets = (b for d, b in self._days.items() if first <= d <= last)
+                for bucket in buckets:
+                    if not bucket:
+                        continue
+                    for track_id, row in bucket.items():
+                        if row[slot]:
+                            totals[track_id] = totals.get(track_id, 0) + row[slot]
+            best = heapq.nlargest(n, totals.items(), key=lambda item: (item[1], -item[0]))
+            return [(self.paths[i], count) for i, count in best if count]
+
+    def top_this_month(self, n: int = 100, now: Optional[float] = None) -> List[Tuple[str, int]]:
+        now = time.time() if now is None else now
+        first = date.fromtimestamp(now).replace(day=1)
+        return self.top(n, since=time.mktime(first.timetuple()), until=now)
+
+    def apply_to(self, library, paths=None):
+        """Copy play counts and last-played times into a metadata library
+
+        Only for paths when given (e.g. tracks the library just added).
+        """
+        if paths is None:
+            items = self.items()
+        else:
+            items = [(p, s) for p, s in ((p, self.stats(p)) for p in paths) if s is not None]
+        with library.batch():
+            for path, stats in items:
+                library.update(path, played=stats.plays, last_played=int(stats.last_played) or None)
+
+    # ------------------ compaction ------------------
+    def _snapshot(self, cutoff_day: int) -> bytes:
+        """Log contents with events before cutoff_day folded into day rows (holds _lock)"""
+        chunks = [HEADER.pack(MAGIC, VERSION)]
+        chunks.extend(_encode_record(REC_PATH, os.fsencode(p)) for p in self.paths)
+        # Day rows are rebuilt from the aggregates, minus what recent raw events contribute
+        recent = {}
+        kept = []
+        for event in self._events:
+            rec_type, track_id, timestamp, value = event
+            day = _day(timestamp)
+            if day < cutoff_day:
+                continue
+            kept.append(event)
+            row = recent.setdefault((day, track_id), [0, 0, 0, 0, 0.0, 0.0])
+            if rec_type == REC_START:
+                row[_STARTS] += 1
+                row[_LAST] = max(row[_LAST], timestamp)
+            elif rec_type == REC_COMPLETE:
+                row[_COMPLETES] += 1
+                row[_LISTENED] += value
+            elif rec_type == REC_SKIP:
+                row[_SKIPS] += 1
+                row[_LISTENED] += value
+            elif rec_type == REC_SEEK:
+                row[_SEEKS] += 1
+        for day in sorted(self._days):
+            for track_id, row in self._days[day].items():
+                sub = recent.get((day, track_id))
+                if sub is not None:
+                    row = [a - b for a, b in zip(row, sub)]
+                    row[_LAST] = self._days[day][track_id][_LAST] if row[_STARTS] else 0.0
+                if not any(row[:_LAST]):
+                    continue
+                counts = [min(c, 0xFFFF) for c in row[:_LISTENED]]
+                chunks.append(_encode_record(REC_DAY, _DAY.pack(track_id, day, *counts, row[_LISTENED], row[_LAST])))
+        for rec_type, track_id, timestamp, value in kept:
+            chunks.append(_encode_record(rec_type, _EVENT.pack(track_id, timestamp, value)))
+        self._events = kept
+        self._next_compact = len(kept) + self.compact_events
+        return b''.join(chunks)
+
+    def compact(self):
+        """Rewrite the log with old events folded into per-day rows"""
+        start = time.perf_counter()
+        cutoff = _day(time.time()) - self.keep_days
+        with self._lock:
+            data = self._snapshot(cutoff)
+            offset = self._size
+        tmp_path = self.log_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                with self._lock:
+                    # Copy whatever was appended while the snapshot was written
+                    self._file.flush()
+                    if self._size > offset:
+                        with open(self.log_path, 'rb') as src:
+                            src.seek(offset)
+                            f.write(src.read(self._size - offset))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._file.close()
+                    os.replace(tmp_path, self.log_path)
+                    self._file = open(self.log_path, 'r+b')
+                    self._file.seek(0, os.SEEK_END)
+                    self._size = self._file.tell()
+        except Exception as e:
+            logger.error(f"Play history compaction failed: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            with self._lock:
+                if self._file is None or self._file.closed:
+                    self._file = open(self.log_path, 'ab')
+            return
+        metrics.observe('history_compact_seconds', time.perf_counter() - start)
+        logger.debug(f"Compacted play history to {self._size} bytes")
+
+    def compact_async(self):
+        """Compact on a background thread (at most one at a time)"""
+        with self._lock:
+            if self._compacting is not None and self._compacting.is_alive():
+                return
+            self._compacting = threading.Thread(target=self.compact, name='history-compact', daemon=True)
+            self._compacting.start()
+
+    def close(self):
+        thread = self._compacting
+        if thread is not None:
+            thread.join(timeout=5.0)
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                finally:
+                    self._file.close()
+                    self._file = None
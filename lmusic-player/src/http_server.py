@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+HTTP streaming server for the library
+
+LibraryServer serves the tracks of a Library to other machines on the
+LAN from an asyncio event loop running on its own thread, so the Tk
+thread and the mixer never wait on network clients:
+
+    GET /api/library?q=<smart query>&offset=0&limit=500   browse (JSON)
+    GET /api/tracks/<id>                                   one track (JSON)
+    GET|HEAD /tracks/<id>                                  the audio file
+
+- Audio is sent with loop.sendfile(), which uses os.sendfile() so file
+  data goes from the page cache to the socket without passing through
+  Python; hundreds of concurrent streams cost one coroutine each
+- Range requests (single ranges, including suffix and open-ended forms)
+  get 206 Partial Content; If-Range and If-None-Match are honoured
+- ETags come from the library's size and mtime columns rather than a
+  hash of the file, so validating a request costs one fstat()
+- Only files in the library are served, by track id; paths never appear
+  in URLs
+- Connections are persistent (HTTP/1.1 keep-alive) and capped at
+  max_connections; idle ones are closed after idle_timeout seconds
+
+The Library is only read here. Mutations happen on the Tk thread, so a
+record being written at the same moment may be missing from a response.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import threading
+from email.utils import formatdate
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+from library import Library
+from smart_playlist import QueryError, compile_query
+
+logger = logging.getLogger(__name__)
+
+SERVER_NAME = 'lmusic-player'
+CONTENT_TYPES = {
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav',
+    '.ogg': 'audio/ogg',
+    '.flac': 'audio/flac',
+    '.m4a': 'audio/mp4',
+}
+# Fields returned by the JSON endpoints
+TRACK_FIELDS = ('title', 'artist', 'album', 'genre', 'year', 'track', 'disc', 'length', 'size', 'bpm', 'key')
+MAX_HEADER_BYTES = 16384
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+REASONS = {
+    200: 'OK', 206: 'Partial Content', 304: 'Not Modified', 400: 'Bad Request',
+    404: 'Not Found', 405: 'Method Not Allowed', 412: 'Precondition Failed',
+    416: 'Range Not Satisfiable', 431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str = '', headers: Optional[Dict[str, str]] = None):
+        super().__init__(message or REASONS.get(status, ''))
+        self.status = status
+        self.headers = headers or {}
+
+
+def make_etag(track_id: int, size: int, mtime: int) -> str:
+    return f'"{track_id:x}-{size:x}-{int(mtime):x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end inclusive) for a single 'bytes=' range; None to send the whole file
+
+    Raises HttpError(416) for ranges outside the file. Multiple ranges
+    are answered with the whole file, which RFC 9110 allows.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise HttpError(416, headers={'Content-Range': f'bytes */{size}'})
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise HttpError(416, headers={'Content-Range': f'bytes */{size}'})
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class LibraryServer:
+    """Serve a Library's tracks over HTTP from a background event loop"""
+
+    def __init__(self, library: Library, host: str = '127.0.0.1', port: int = 8765,
+                 max_connections: int = 512, idle_timeout: float = 30.0):
+        self.library = library
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self._writers = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    # ------------------ lifecycle ------------------
+    def start(self):
+        """Bind and serve on a daemon thread; returns once listening"""
+        if self._thread is not None:
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name='http-server', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._thread = None
+            raise self._error
+        logger.info(f"Serving library on http://{self.host}:{self.port}/")
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(self.serve())
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            self._loop.close()
+            return
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._shutdown())
+            self._loop.close()
+
+    async def _shutdown(self):
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def serve(self) -> asyncio.AbstractServer:
+        """Start listening on the running loop (for embedding in an asyncio app)"""
+        server = await asyncio.start_server(self._handle, self.host, self.port,
+                                            limit=MAX_HEADER_BYTES, backlog=self.max_connections)
+        self.port = server.sockets[0].getsockname()[1]
+        return server
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # ------------------ connections ------------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.connections >= self.max_connections:
+            metrics.inc('http_connections_rejected_total')
+            await self._send_error(writer, HttpError(503, 'Too many connections'), 'GET', False)
+            writer.close()
+            return
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.idle_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HttpError as e:
+                    await self._send_error(writer, e, 'GET', False)
+                    break
+                if request is None:
+                    break
+                method, target, version, headers = request
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                metrics.inc('http_requests_total')
+                try:
+                    await self._dispatch(writer, method, target, headers, keep_alive)
+                except HttpError as e:
+                    await self._send_error(writer, e, method, keep_alive)
+                except (ConnectionError, asyncio.CancelledError):
+                    raise
+                except Exception as e:
+                    logger.warning(f"HTTP request {method} {target} failed: {e}")
+                    await self._send_error(writer, HttpError(500), method, False)
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections -= 1
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        try:
+            data = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HttpError(431)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise
+        lines = data.decode('iso-8859-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise HttpError(400, 'Malformed request line')
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise HttpError(400, 'Malformed header')
+            headers[name.strip().lower()] = value.strip()
+        return method.upper(), target, version, headers
+
+    def _write_head(self, writer, status: int, headers: Dict[str, str], keep_alive: bool):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                 f"Server: {SERVER_NAME}",
+                 f"Date: {formatdate(usegmt=True)}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1'))
+
+    async def _send_bytes(self, writer, status: int, body: bytes, content_type: str,
+                          method: str, keep_alive: bool, headers: Optional[Dict[str, str]] = None):
+        head = dict(headers or {})
+        head['Content-Type'] = content_type
+        head['Content-Length'] = str(len(body))
+        self._write_head(writer, status, head, keep_alive)
+        if method != 'HEAD':
+            writer.write(body)
+        await writer.drain()
+
+    async def _send_json(self, writer, data, method: str, keep_alive: bool, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        await self._send_bytes(writer, status, body, 'application/json; charset=utf-8', method, keep_alive)
+
+    async def _send_error(self, writer, error: HttpError, method: str, keep_alive: bool):
+        body = json.dumps({'error': str(error)}).encode('utf-8')
+        try:
+            await self._send_bytes(writer, error.status, body, 'application/json; charset=utf-8',
+                                   method, keep_alive, error.headers)
+        except ConnectionError:
+            pass
+
+    # ------------------ routing ------------------
+    async def _dispatch(self, writer, method: str, target: str, headers: Dict[str, str], keep_alive: bool):
+        if method not in ('GET', 'HEAD'):
+            raise HttpError(405)
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        if parts[:1] == ['tracks'] and len(parts) == 2:
+            await self._send_track(writer, self._track_id(parts[1]), method, headers, keep_alive)
+        elif parts == ['api', 'library']:
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            loop = asyncio.get_running_loop()
+            # Queries and JSON encoding of large pages run off the event loop
+            page = await loop.run_in_executor(None, self.library_page, params)
+            await self._send_json(writer, page, method, keep_alive)
+        elif parts[:2] == ['api', 'tracks'] and len(parts) == 3:
+            record = self.track_record(self._track_id(parts[2]))
+            if record is None:
+                raise HttpError(404)
+            await self._send_json(writer, record, method, keep_alive)
+        else:
+            raise HttpError(404)
+
+    def _track_id(self, text: str) -> int:
+        try:
+            track_id = int(text)
+        except ValueError:
+            raise HttpError(404)
+        if not 0 <= track_id < len(self.library.paths) or self.library.paths[track_id] is None:
+            raise HttpError(404)
+        return track_id
+
+    # ------------------ JSON ------------------
+    def track_record(self, track_id: int) -> Optional[Dict]:
+        library = self.library
+        try:
+            path = library.paths[track_id]
+            if path is None:
+                return None
+            record = {'id': track_id, 'url': f"/tracks/{track_id}"}
+            columns = library.column_names()
+            for field in TRACK_FIELDS:
+                if field in columns:
+                    value = library.value(track_id, field)
+                    if value is not None:
+                        record[field] = value
+        except IndexError:
+            # Being added on the Tk thread right now
+            return None
+        record.setdefault('title', os.path.splitext(os.path.basename(path))[0])
+        return record
+
+    def library_page(self, params: Dict[str, str]) -> Dict:
+        """{'total', 'offset', 'tracks'} for ?q=&offset=&limit="""
+        try:
+            offset = max(0, int(params.get('offset', 0)))
+            limit = min(MAX_PAGE_SIZE, max(1, int(params.get('limit', DEFAULT_PAGE_SIZE))))
+        except ValueError:
+            raise HttpError(400, 'offset and limit must be integers')
+        query = params.get('q', '').strip()
+        if query:
+            try:
+                ids = [self.library.id_of(p) for p in compile_query(query, self.library).evaluate(self.library)]
+            except QueryError as e:
+                raise HttpError(400, str(e))
+        else:
+            ids = sorted(self.library.ids())
+        tracks = [r for r in (self.track_record(i) for i in ids[offset:offset + limit] if i is not None)
+                  if r is not None]
+        return {'total': len(ids), 'offset': offset, 'tracks': tracks}
+
+    # ------------------ audio ------------------
+    async def _send_track(self, writer, track_id: int, method: str, headers: Dict[str, str], keep_alive: bool):
+        path = self.library.paths[track_id]
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            raise HttpError(404)
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            # Validators come from the metadata cache unless the file changed since it was read
+            known_size = self.library.value(track_id, 'size')
+            known_mtime = self.library.value(track_id, 'mtime')
+            if known_size == size and known_mtime == int(st.st_mtime):
+                etag = make_etag(track_id, known_size, known_mtime)
+            else:
+                etag = make_etag(track_id, size, int(st.st_mtime))
+            common = {
+                'ETag': etag,
+                'Last-Modified': formatdate(st.st_mtime, usegmt=True),
+                'Accept-Ranges': 'bytes',
+                'Cache-Control': 'no-cache',
+            }
+            if_none_match = headers.get('if-none-match')
+            if if_none_match and (if_none_match.strip() == '*' or etag in
+                                  (t.strip() for t in if_none_match.split(','))):
+                self._write_head(writer, 304, common, keep_alive)
+                await writer.drain()
+                return
+
+            span = None
+            range_header = headers.get('range')
+            if_range = headers.get('if-range')
+            if range_header and (if_range is None or if_range.strip() == etag):
+                span = parse_range(range_header, size)
+            status = 200
+            start, count = 0, size
+            head = dict(common)
+            head['Content-Type'] = CONTENT_TYPES.get(os.path.splitext(path)[1].lower(),
+                                                     'application/octet-stream')
+            if span is not None:
+                status = 206
+                start, count = span[0], span[1] - span[0] + 1
+                head['Content-Range'] = f"bytes {span[0]}-{span[1]}/{size}"
+            head['Content-Length'] = str(count)
+            self._write_head(writer, status, head, keep_alive)
+            await writer.drain()
+            if method == 'HEAD' or not count:
+                return
+            metrics.inc('http_streams_total')
+            loop = asyncio.get_running_loop()
+            sent = await loop.sendfile(writer.transport, f, start, count)
+            metrics.inc('http_bytes_sent_total', sent)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Bounded background job executor shared by both UIs
+
+- Named worker pools with a fixed number of threads ('io' for disk bound
+  work such as scans and tag reads, 'cpu' for analysis)
+- Priorities: lower numbers run first within a pool
+- Coalescing: a job submitted with a key that is already queued or running
+  returns the existing job; map() skips items already queued under the
+  same key namespace
+- Cancellation: jobs can be cancelled individually or by group (e.g. all
+  metadata loads for a playlist that has since been cleared)
+- Results and callbacks are handed to a dispatcher; TkDispatcher runs them
+  on the Tk thread in time-boxed batches so a flood of results never
+  blocks the event loop
+- map_processes() spreads CPU-bound batches (feature extraction, tag
+  reads for the lmusic command) over worker processes
+"""
+
+import os
+import time
+import queue
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+DEFAULT_POOLS = {
+    'io': 2,
+    'cpu': max(1, (os.cpu_count() or 2) - 1),
+}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function to abandon work after cancellation"""
+
+
+class Job:
+    """Handle for a submitted unit of work"""
+
+    def __init__(self, fn, args, kwargs, key=None, priority=PRIORITY_NORMAL, group=None,
+                 callback=None, error_callback=None, finalizer=None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.priority = priority
+        self.group = group
+        self.callback = callback
+        self.error_callback = error_callback
+        self.finalizer = finalizer
+        self.cancelled = False
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self):
+        """Prevent the job from starting; running jobs should poll job.cancelled"""
+        self.cancelled = True
+
+    def check(self):
+        """Raise JobCancelled if the job was cancelled (for long running job bodies)"""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+
+def _direct_dispatch(callback, *args):
+    callback(*args)
+
+
+class JobExecutor:
+    """Priority job queues served by bounded worker pools"""
+
+    def __init__(self, pools: Optional[Dict[str, int]] = None, dispatcher: Optional[Callable] = None):
+        self.dispatcher = dispatcher or _direct_dispatch
+        self._queues = {}
+        self._threads = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._by_key = {}
+        self._jobs = set()
+        self._map_items = {}
+        self._shutdown = False
+        for name, workers in (pools or DEFAULT_POOLS).items():
+            q = queue.PriorityQueue()
+            self._queues[name] = q
+            for i in range(max(1, workers)):
+                t = threading.Thread(target=self._worker, args=(name, q), name=f"jobs-{name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    # ------------------ submission ------------------
+    def submit(self, fn, *args, key=None, priority=PRIORITY_NORMAL, pool='io', group=None,
+               callback=None, error_callback=None, finalizer=None, **kwargs) -> Job:
+        """Queue fn(*args, **kwargs); callback(result) runs through the dispatcher
+
+        finalizer() runs on the worker once the job is finished, failed or skipped.
+        """
+        if pool not in self._queues:
+            raise ValueError(f"Unknown job pool: {pool}")
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Job executor is shut down")
+            if key is not None:
+                existing = self._by_key.get(key)
+                if existing is not None and not existing.cancelled:
+                    metrics.inc('jobs_coalesced_total')
+                    return existing
+            job = Job(fn, args, kwargs, key, priority, group, callback, error_callback, finalizer)
+            if key is not None:
+                self._by_key[key] = job
+            self._jobs.add(job)
+        metrics.inc('jobs_submitted_total')
+        self._queues[pool].put((priority, next(self._seq), job))
+        return job
+
+    def map(self, fn, items: Iterable, key: Optional[str] = None, batch_size: int = 64,
+            priority=PRIORITY_NORMAL, pool='io', group=None,
+            on_batch: Optional[Callable] = None, on_done: Optional[Callable] = None) -> List[Job]:
+        """Run fn over items in batched jobs
+
+        on_batch(pairs) receives [(item, result), ...] for each finished batch
+        and on_done() runs once after the last batch, both via the dispatcher.
+        Cancelled, skipped and failed batches count as finished for on_done.
+        With key, items already queued under that namespace are skipped.
+        """
+        items = list(items)
+        if key is not None:
+            with self._lock:
+                seen = self._map_items.setdefault(key, set())
+                fresh = []
+                for item in items:
+                    if item not in seen:
+                        seen.add(item)
+                        fresh.append(item)
+            metrics.inc('jobs_coalesced_total', len(items) - len(fresh))
+            items = fresh
+
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        if not batches:
+            if on_done is not None:
+                self.dispatcher(on_done)
+            return []
+
+        remaining = [len(batches)]
+        remaining_lock = threading.Lock()
+
+        def finish_one():
+            with remaining_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and on_done is not None:
+                self.dispatcher(on_done)
+
+        def run_batch(batch, job_ref):
+            pairs = []
+            job = job_ref[0]
+            for item in batch:
+                if job is not None and job.cancelled:
+                    break
+                try:
+                    pairs.append((item, fn(item)))
+                except Exception as e:
+                    logger.debug(f"Job item failed for {item}: {e}")
+            return pairs
+
+        def release(batch):
+            if key is not None:
+                with self._lock:
+                    self._map_items.get(key, set()).difference_update(batch)
+            # Runs for every batch, including ones that never got to run
+            finish_one()
+
+        jobs = []
+        for batch in batches:
+            job_ref = [None]
+
+            def deliver(pairs):
+                if on_batch is not None and pairs:
+                    on_batch(pairs)
+
+            job = self.submit(run_batch, batch, job_ref, priority=priority, pool=pool, group=group,
+                              callback=deliver, finalizer=lambda batch=batch: release(batch))
+            job_ref[0] = job
+            jobs.append(job)
+        return jobs
+
+    # ------------------ cancellation ------------------
+    def cancel_group(self, group) -> int:
+        """Cancel every queued or running job in group; returns how many"""
+        count = 0
+        with self._lock:
+            for job in list(self._jobs):
+                if job.group == group and not job.cancelled:
+                    job.cancel()
+                    count += 1
+        if count:
+            metrics.inc('jobs_cancelled_total', count)
+        return count
+
+    def pending(self, group=None) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs if group is None or job.group == group)
+
+    def shutdown(self, wait: bool = False):
+        """Cancel outstanding work and stop the workers"""
+        with self._lock:
+            self._shutdown = True
+            for job in self._jobs:
+                job.cancel()
+        for name, q in self._queues.items():
+            for _ in range(sum(1 for t in self._threads if t.name.startswith(f"jobs-{name}-"))):
+                q.put((float('inf'), next(self._seq), None))
+        if wait:
+            for t in self._threads:
+                t.join(timeout=2.0)
+
+    # ------------------ workers ------------------
+    def _worker(self, pool, q):
+        while True:
+            _priority, _seq, job = q.get()
+            if job is None:
+                return
+            try:
+                if job.cancelled:
+                    metrics.inc('jobs_skipped_total')
+                    continue
+                start = time.perf_counter()
+                try:
+                    job.result = job.fn(*job.args, **job.kwargs)
+                except JobCancelled:
+                    job.cancelled = True
+                except Exception as e:
+                    job.error = e
+                    logger.warning(f"Background job failed: {e}")
+                metrics.observe(f"jobs_{pool}_run_seconds", time.perf_counter() - start)
+                if job.error is not None:
+                    if job.error_callback is not None:
+                        self.dispatcher(job.error_callback, job.error)
+                elif not job.cancelled and job.callback is not None:
+                    self.dispatcher(job.callback, job.result)
+            finally:
+                if job.finalizer is not None:
+                    try:
+                        job.finalizer()
+                    except Exception as e:
+                        logger.debug(f"Job finalizer failed: {e}")
+                with self._lock:
+                    self._jobs.discard(job)
+                    if job.key is not None and self._by_key.get(job.key) is job:
+                        del self._by_key[job.key]
+                job._done.set()
+
+
+class TkDispatcher:
+    """Run callbacks posted from worker threads on the Tk thread, in batches"""
+
+    def __init__(self, root, interval_ms: int = 50, budget: float = 0.008):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.budget = budget
+        self._queue = queue.SimpleQueue()
+        self._after_id = None
+        self._running = False
+
+    def post(self, callback, *args):
+        """Thread-safe: queue callback(*args) for the Tk thread"""
+        self._queue.put((callback, args))
+
+    __call__ = post
+
+    def start(self):
+        self._running = True
+        self._after_id = self.root.after(self.interval_ms, self._drain)
+
+    def stop(self):
+        self._running = False
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _drain(self):
+        deadline = time.perf_counter() + self.budget
+        while time.perf_counter() < deadline:
+            try:
+                callback, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.warning(f"Job callback failed: {e}")
+        if self._running:
+            self._after_id = self.root.after(self.interval_ms, self._drain)
+
+
+def map_processes(chunk_fn: Callable, items: Iterable, workers: Optional[int] = None,
+                  chunk_size: int = 8, cancelled: Optional[Callable[[], bool]] = None,
+                  args: tuple = ()) -> Iterator:
+    """Run chunk_fn(chunk, *args) for chunks of items on worker processes
+
+    Yields each chunk's return value as it finishes (in completion order).
+    chunk_fn must be a module-level function. Uses the 'spawn' start
+    method so it is safe to call from a threaded GUI process, and stops
+    early, dropping queued chunks, once cancelled() returns True.
+    """
+    items = list(items)
+    if not items:
+        return
+    workers = workers or os.cpu_count() or 1
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+        futures = [pool.submit(chunk_fn, chunk, *args) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                if cancelled is not None and cancelled():
+                    break
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
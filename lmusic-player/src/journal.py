@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Crash-safe session journal for Python Music Player
+
+Playlist edits and playback position are appended to a small binary
+journal next to the session snapshot. UI threads only queue records in
+memory; a background writer batches them and fsyncs at a bounded rate.
+When the journal grows past a threshold it is compacted into a fresh
+snapshot (see session.py) and truncated. The playlist copy for compaction
+is taken on the thread that edits the playlist (the UI tick calls
+record_position), so no edit can slip between the copy and the new journal.
+
+Each journal carries the generation number of the snapshot it applies
+to, so a crash between writing the snapshot and truncating the journal
+never replays edits twice.
+
+Journal layout (little endian):
+    header   magic, version, generation
+    records  type (uint8), payload length (uint32), payload, crc32 (uint32)
+"""
+
+import os
+import time
+import struct
+import zlib
+import logging
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import session
+import utils
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LMSJ'
+VERSION = 1
+HEADER = struct.Struct('<4sHQ')
+RECORD = struct.Struct('<BI')
+CRC = struct.Struct('<I')
+
+# Record types
+REC_ADD = 1
+REC_REMOVE = 2
+REC_MOVE = 3
+REC_CLEAR = 4
+REC_POSITION = 5
+
+_U32 = struct.Struct('<I')
+_MOVE = struct.Struct('<II')
+_POSITION = struct.Struct('<Id')
+
+
+def _encode_record(rec_type: int, payload: bytes) -> bytes:
+    """Frame a record with its type, length and checksum"""
+    head = RECORD.pack(rec_type, len(payload))
+    return head + payload + CRC.pack(zlib.crc32(head + payload))
+
+
+def _encode_paths(paths: Sequence[str]) -> bytes:
+    return b'\0'.join(os.fsencode(p) for p in paths)
+
+
+def _decode_paths(payload: bytes) -> List[str]:
+    return os.fsdecode(payload).split('\0') if payload else []
+
+
+def read_journal(journal_path: str) -> Tuple[Optional[int], List[Tuple[int, bytes]]]:
+    """Return (generation, records); a torn or corrupt tail is ignored"""
+    try:
+        with open(journal_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, []
+    except Exception as e:
+        logger.warning(f"Could not read journal {journal_path}: {e}")
+        return None, []
+
+    if len(data) < HEADER.size:
+        return None, []
+    magic, version, generation = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        logger.warning(f"Ignoring unrecognised journal {journal_path}")
+        return None, []
+
+    records = []
+    pos = HEADER.size
+    while pos + RECORD.size <= len(data):
+        rec_type, length = RECORD.unpack_from(data, pos)
+        end = pos + RECORD.size + length
+        if end + CRC.size > len(data):
+            break
+        (crc,) = CRC.unpack_from(data, end)
+        if crc != zlib.crc32(data[pos:end]):
+            logger.warning(f"Journal checksum mismatch at offset {pos}; discarding tail")
+            break
+        records.append((rec_type, data[pos + RECORD.size:end]))
+        pos = end + CRC.size
+    return generation, records
+
+
+def replay(player, records: List[Tuple[int, bytes]]) -> int:
+    """Apply journal records to a player's playlist; returns the number applied"""
+    applied = 0
+    playlist = player.playlist
+    for rec_type, payload in records:
+        try:
+            if rec_type == REC_ADD:
+                playlist.extend(_decode_paths(payload))
+            elif rec_type == REC_REMOVE:
+                (index,) = _U32.unpack(payload)
+                if 0 <= index < len(playlist):
+                    playlist.pop(index)
+            elif rec_type == REC_MOVE:
+                src, dst = _MOVE.unpack(payload)
+                if 0 <= src < len(playlist) and 0 <= dst < len(playlist):
+                    playlist.insert(dst, playlist.pop(src))
+            elif rec_type == REC_CLEAR:
+                playlist.clear()
+            elif rec_type == REC_POSITION:
+                index, position = _POSITION.unpack(payload)
+                player.current_index = index
+                player.current_position = position
+            else:
+                continue
+            applied += 1
+        except struct.error:
+            logger.warning(f"Skipping malformed journal record of type {rec_type}")
+    if playlist:
+        player.current_index = min(max(0, player.current_index), len(playlist) - 1)
+    else:
+        player.current_index = 0
+    return applied
+
+
+class SessionJournal:
+    """Append-only journal of playlist edits with throttled background fsync"""
+
+    def __init__(self, journal_path: str, session_path: str, flush_interval: float = 0.25,
+                 position_interval: float = 1.0, compact_bytes: int = 1024 * 1024):
+        self.journal_path = journal_path
+        self.session_path = session_path
+        self.flush_interval = flush_interval
+        self.position_interval = position_interval
+        self.compact_bytes = compact_bytes
+        self.generation = 0
+        self.player = None
+
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._pending = []
+        self._position = None
+        self._written_position = None
+        self._wake = threading.Event()
+        self._stop = False
+        self._compact_requested = False
+        self._compact_state = None
+        self._replayed = False
+        self._thread = None
+        self._file = None
+        self._size = 0
+        self._last_sync = 0.0
+
+    # ------------------ recovery ------------------
+    def restore_player(self, player, config=None) -> bool:
+        """Restore snapshot + journal into player; returns True when a playlist was restored"""
+        snapshot_generation = 0
+        snapshot = session.load_session(self.session_path)
+        if snapshot is not None:
+            snapshot_generation = snapshot.generation
+            snapshot.close()
+
+        restored = session.restore_player(player, self.session_path, config)
+        generation, records = read_journal(self.journal_path)
+        if generation is not None and generation == snapshot_generation and records:
+            count = replay(player, records)
+            logger.info(f"Replayed {count} journal records")
+            restored = bool(player.playlist)
+            self._replayed = True
+        self.generation = snapshot_generation
+        return restored
+
+    def attach(self, player):
+        """Start journaling edits made to player"""
+        self.player = player
+        player.journal = self
+        if self._replayed:
+            # Fold what was replayed at startup into a fresh snapshot
+            self.compact()
+        self._thread = threading.Thread(target=self._run, name='session-journal', daemon=True)
+        self._thread.start()
+
+    # ------------------ recording (cheap, called from any thread) ------------------
+    def _queue(self, record: Tuple[int, object]):
+        with self._lock:
+            self._pending.append(record)
+        self._wake.set()
+
+    def record_add(self, paths: Sequence[str]):
+        if paths:
+            self._queue((REC_ADD, list(paths)))
+
+    def record_remove(self, index: int):
+        self._queue((REC_REMOVE, index))
+
+    def record_move(self, src: int, dst: int):
+        self._queue((REC_MOVE, (src, dst)))
+
+    def record_clear(self):
+        self._queue((REC_CLEAR, None))
+
+    def record_position(self, index: int, position: float):
+        """Remember the latest position; written at most every position_interval"""
+        self._position = (int(index), float(position))
+        if self._compact_requested and self.player is not None:
+            self._compact_requested = False
+            with self._lock:
+                self._pending = []
+                self._compact_state = (list(self.player.playlist), self._position)
+            self._wake.set()
+
+    # ------------------ writing (background thread) ------------------
+    def _open(self):
+        header = HEADER.pack(MAGIC, VERSION, self.generation)
+        utils.atomic_write(self.journal_path, header)
+        self._file = open(self.journal_path, 'ab')
+        self._size = len(header)
+
+    def _encode(self, rec_type, value) -> bytes:
+        if rec_type == REC_ADD:
+            payload = _encode_paths(value)
+        elif rec_type == REC_REMOVE:
+            payload = _U32.pack(value)
+        elif rec_type == REC_MOVE:
+            payload = _MOVE.pack(*value)
+        elif rec_type == REC_POSITION:
+            payload = _POSITION.pack(*value)
+        else:
+            payload = b''
+        return _encode_record(rec_type, payload)
+
+    def flush(self):
+        """Write and fsync queued records"""
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                position = self._position
+            chunks = [self._encode(rec_type, value) for rec_type, value in pending]
+            if position is not None and position != self._written_position:
+                chunks.append(self._encode(REC_POSITION, position))
+                self._written_position = position
+            if not chunks:
+                return
+            if self._file is None:
+                self._open()
+            data = b''.join(chunks)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._size += len(data)
+            self._last_sync = time.monotonic()
+
+    def compact(self, state=None):
+        """Fold the journal into a new snapshot and start an empty journal
+
+        Without state this must run on the thread that edits the playlist.
+        """
+        if self.player is None:
+            return
+        with self._io_lock:
+            if state is None:
+                with self._lock:
+                    # Queued edits are already reflected in the live playlist
+                    self._pending = []
+                    state = (list(self.player.playlist), self._position)
+            playlist, position = state
+            index, pos = position if position is not None else (self.player.current_index, 0.0)
+            if session.save_session(self.session_path, playlist, index, pos,
+                                    self.player.durations, generation=self.generation + 1):
+                self.generation += 1
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._open()
+                self._written_position = position
+
+    def _run(self):
+        while not self._stop:
+            self._wake.wait(self.position_interval)
+            self._wake.clear()
+            # Rate limit fsyncs so bursts of edits share one sync
+            delay = self.flush_interval - (time.monotonic() - self._last_sync)
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                with self._lock:
+                    state, self._compact_state = self._compact_state, None
+                if state is not None:
+                    self.compact(state)
+                self.flush()
+                if self._size > self.compact_bytes:
+                    self._compact_requested = True
+            except Exception as e:
+                logger.error(f"Journal write failed: {e}")
+
+    def close(self, compact: bool = True):
+        """Stop the writer and (by default) compact into the session snapshot"""
+        self._stop = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        try:
+            if compact:
+                self.compact()
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self.player is not None and getattr(self.player, 'journal', None) is self:
+                self.player.journal = None
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Indexed track metadata store
+
+Library keeps one record per audio file in column lists indexed by track
+id, so queries can work on whole columns instead of per-track dicts:
+
+- text fields have a case-insensitive value -> ids index for equality
+  lookups and a lowered column for substring scans
+- numeric fields get a sorted (values, ids) view, built on first use and
+  rebuilt only after that field changes, for range lookups by bisection
+- subscribers are told which paths changed (coalesced inside batch())
+  so smart playlists can update live
+
+Mutations are expected on one thread (the Tk thread, via the job
+dispatcher); tag reading happens on workers through read_metadata().
+"""
+
+import os
+import json
+import time
+import bisect
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import cue
+import utils
+
+try:
+    from mutagen import File
+except Exception:
+    File = None
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_VERSION = 1
+
+TEXT_FIELDS = ('title', 'artist', 'album', 'genre', 'path')
+NUMERIC_FIELDS = ('year', 'track', 'disc', 'length', 'size', 'mtime', 'added', 'played', 'last_played')
+FIELDS = TEXT_FIELDS + NUMERIC_FIELDS
+
+
+def _leading_int(value) -> Optional[int]:
+    """'3/12' -> 3, '2019-05-01' -> 2019"""
+    digits = ''
+    for ch in str(value).strip():
+        if not ch.isdigit():
+            break
+        digits += ch
+    return int(digits) if digits else None
+
+
+def read_metadata(file_path: str) -> Dict:
+    """Read tags, length and file stats for one track (safe on worker threads)"""
+    track = cue.resolve(file_path) if cue.is_virtual(file_path) else None
+    if track is not None:
+        return _read_cue_metadata(file_path, track)
+    st = os.stat(file_path)
+    meta = {'size': st.st_size, 'mtime': int(st.st_mtime), 'length': 0,
+            'title': os.path.splitext(os.path.basename(file_path))[0]}
+    if File is None:
+        return meta
+    try:
+        audio = File(file_path, easy=True)
+    except Exception as e:
+        logger.debug(f"Could not read tags for {file_path}: {e}")
+        return meta
+    if audio is None:
+        return meta
+    info = getattr(audio, 'info', None)
+    if info is not None:
+        meta['length'] = int(getattr(info, 'length', 0) or 0)
+    tags = getattr(audio, 'tags', None) or {}
+    for field in ('title', 'artist', 'album', 'genre'):
+        try:
+            values = tags.get(field)
+        except Exception:
+            values = None
+        if values:
+            meta[field] = str(values[0])
+    for field, tag in (('year', 'date'), ('track', 'tracknumber'), ('disc', 'discnumber')):
+        try:
+            values = tags.get(tag)
+        except Exception:
+            values = None
+        if values:
+            number = _leading_int(values[0])
+            if number is not None:
+                meta[field] = number
+    return meta
+
+
+def _read_cue_metadata(file_path: str, track: cue.CueTrack) -> Dict:
+    """The album file's tags overlaid with the sheet's; size and mtime are the sheet's"""
+    meta = read_metadata(track.audio_path)
+    st = os.stat(cue.source_path(file_path))
+    meta.update(size=st.st_size, mtime=int(st.st_mtime), title=track.title, track=track.number,
+                length=int(track.length(meta['length'])))
+    if track.performer:
+        meta['artist'] = track.performer
+    for field in ('album', 'genre', 'year'):
+        value = getattr(track, field)
+        if value:
+            meta[field] = value
+    return meta
+
+
+class Library:
+    """Column store of track metadata with equality and range indexes"""
+
+    def __init__(self):
+        self.paths: List[Optional[str]] = []  # id -> path, None once removed
+        self._ids: Dict[str, int] = {}
+        self._live: Set[int] = set()
+        self._columns: Dict[str, list] = {f: [] for f in FIELDS}
+        self._lower: Dict[str, list] = {f: [] for f in TEXT_FIELDS}
+        self._text_index: Dict[str, Dict[str, Set[int]]] = {f: {} for f in TEXT_FIELDS}
+        self._sorted: Dict[str, tuple] = {}
+        self._listeners: List[Callable] = []
+        self._batch_depth = 0
+        self._changed: Set[str] = set()
+        self.version = 0
+
+    # ------------------ reads ------------------
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, path):
+        return path in self._ids
+
+    def id_of(self, path: str) -> Optional[int]:
+        return self._ids.get(path)
+
+    def ids(self) -> Set[int]:
+        """Ids of all tracks (shared set; do not modify)"""
+        return self._live
+
+    def column_names(self) -> List[str]:
+        return list(self._columns)
+
+    def text_fields(self) -> List[str]:
+        return list(self._text_index)
+
+    def get(self, path: str) -> Optional[Dict]:
+        track_id = self._ids.get(path)
+        if track_id is None:
+            return None
+        return {f: col[track_id] for f, col in self._columns.items() if col[track_id] is not None}
+
+    def value(self, track_id: int, field: str):
+        return self._columns[field][track_id]
+
+    def column(self, field: str) -> list:
+        """Values of field by track id (shared list; do not modify)"""
+        return self._columns[field]
+
+    def lowered(self, field: str) -> list:
+        """Case-folded text column by track id, '' when unset (shared list; do not modify)"""
+        return self._lower[field]
+
+    def equal(self, field: str, value: str) -> Set[int]:
+        """Ids whose text field equals value, ignoring case"""
+        return self._text_index[field].get(str(value).casefold(), set())
+
+    def range(self, field: str, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True) -> List[int]:
+        """Ids whose numeric field lies between lo and hi (None = unbounded)"""
+        values, ids = self.sorted_view(field)
+        if lo is None:
+            start = 0
+        else:
+            start = (bisect.bisect_left if lo_inclusive else bisect.bisect_right)(values, lo)
+        if hi is None:
+            end = len(values)
+        else:
+            end = (bisect.bisect_right if hi_inclusive else bisect.bisect_left)(values, hi)
+        return ids[start:end]
+
+    def sorted_view(self, field: str):
+        """(values, ids) of tracks that have field, ascending (case-folded for text)
+
+        Built on first use and cached until field changes.
+        """
+        view = self._sorted.get(field)
+        if view is None:
+            column = self._columns[field]
+            keys = self._lower.get(field, column)
+            pairs = sorted((keys[i], i) for i, v in enumerate(column) if v is not None)
+            view = ([v for v, _ in pairs], [i for _, i in pairs])
+            self._sorted[field] = view
+        return view
+
+    # ------------------ writes ------------------
+    def add(self, path: str, **fields) -> int:
+        """Insert or update path; returns its track id"""
+        track_id = self._ids.get(path)
+        if track_id is not None:
+            self.update(path, **fields)
+            return track_id
+        track_id = len(self.paths)
+        self.paths.append(path)
+        self._ids[path] = track_id
+        self._live.add(track_id)
+        for column in self._columns.values():
+            column.append(None)
+        for column in self._lower.values():
+            column.append('')
+        fields.setdefault('added', int(time.time()))
+        fields.setdefault('played', 0)
+        fields['path'] = path
+        self._write(track_id, fields)
+        return track_id
+
+    def update(self, path: str, **fields) -> bool:
+        track_id = self._ids.get(path)
+        if track_id is None:
+            return False
+        fields.pop('path', None)
+        self._write(track_id, fields)
+        return True
+
+    def add_field(self, name: str, numeric: bool = True):
+        """Register an extra column (e.g. analysis results)"""
+        if name in self._columns:
+            return
+        self._columns[name] = [None] * len(self.paths)
+        if not numeric:
+            self._lower[name] = [''] * len(self.paths)
+            self._text_index[name] = {}
+
+    def _write(self, track_id: int, fields: Dict):
+        for field, value in fields.items():
+            column = self._columns.get(field)
+            if column is None:
+                logger.debug(f"Ignoring unknown library field {field}")
+                continue
+            old = column[track_id]
+            if old == value:
+                continue
+            column[track_id] = value
+            if field in self._text_index:
+                index = self._text_index[field]
+                if old is not None:
+                    index.get(str(old).casefold(), set()).discard(track_id)
+                lowered = str(value).casefold() if value is not None else ''
+                self._lower[field][track_id] = lowered
+                if value is not None:
+                    index.setdefault(lowered, set()).add(track_id)
+            self._sorted.pop(field, None)
+            self._changed.add(self.paths[track_id])
+        self._notify()
+
+    def remove(self, path: str) -> bool:
+        track_id = self._ids.pop(path, None)
+        if track_id is None:
+            return False
+        self._live.discard(track_id)
+        for field, index in self._text_index.items():
+            old = self._columns[field][track_id]
+            if old is not None:
+                index.get(str(old).casefold(), set()).discard(track_id)
+        for column in self._columns.values():
+            column[track_id] = None
+        for column in self._lower.values():
+            column[track_id] = ''
+        self.paths[track_id] = None
+        self._sorted.clear()
+        self._changed.add(path)
+        self._notify()
+        return True
+
+    # ------------------ change notification ------------------
+    def subscribe(self, callback: Callable[[Set[str]], None]):
+        """callback(changed_paths) after every change (or batch of changes)"""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        try:
+            self._listeners.remove(callback)
+        except ValueError:
+            pass
+
+    @contextmanager
+    def batch(self):
+        """Coalesce notifications for many writes into one"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            self._notify()
+
+    def _notify(self):
+        if self._batch_depth or not self._changed:
+            return
+        changed, self._changed = self._changed, set()
+        self.version += 1
+        for callback in list(self._listeners):
+            try:
+                callback(changed)
+            except Exception as e:
+                logger.warning(f"Library listener failed: {e}")
+
+    # ------------------ scanning ------------------
+    def is_current(self, path: str, st=None) -> bool:
+        """True when path is stored with the file's current size and mtime"""
+        track_id = self._ids.get(path)
+        if track_id is None:
+            return False
+        try:
+            st = st or os.stat(cue.source_path(path))
+        except OSError:
+            return False
+        return (self._columns['size'][track_id] == st.st_size
+                and self._columns['mtime'][track_id] == int(st.st_mtime))
+
+    def read_if_stale(self, path: str) -> Optional[Dict]:
+        """read_metadata(path) unless the stored record is current (worker threads)"""
+        if self.is_current(path):
+            return None
+        return read_metadata(path)
+
+    def apply(self, pairs: Iterable):
+        """Store [(path, metadata), ...] from read_metadata as one batch"""
+        with self.batch():
+            for path, meta in pairs:
+                if meta is not None:
+                    self.add(path, **meta)
+
+    # ------------------ persistence ------------------
+    def to_dict(self) -> Dict:
+        live = [i for i, p in enumerate(self.paths) if p is not None]
+        return {
+            'version': LIBRARY_VERSION,
+            'columns': {f: [col[i] for i in live] for f, col in self._columns.items()},
+        }
+
+    def save(self, file_path: str) -> bool:
+        try:
+            data = json.dumps(self.to_dict(), ensure_ascii=False, separators=(',', ':'))
+            utils.atomic_write(file_path, data.encode('utf-8'))
+            return True
+        except Exception as e:
+            logger.error(f"Could not save library to {file_path}: {e}")
+            return False
+
+    @classmethod
+    def load(cls, file_path: str) -> 'Library':
+        """Load a saved library; an empty one if the file is missing or unreadable"""
+        library = cls()
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != LIBRARY_VERSION:
+                return library
+            columns = data['columns']
+            for name in columns:
+                if name not in library._columns:
+                    library.add_field(name, numeric=not any(isinstance(v, str) for v in columns[name]))
+            paths = columns.get('path', [])
+            with library.batch():
+                for i, path in enumerate(paths):
+                    library.add(path, **{f: col[i] for f, col in columns.items()
+                                         if f != 'path' and col[i] is not None})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Could not load library from {file_path}: {e}")
+            library = cls()
+        return library
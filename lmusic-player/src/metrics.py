@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Lightweight metrics and profiling for Python Music Player
+
+Counters and latency histograms for the player's hot paths. Recording a
+sample costs two perf_counter calls, a bisect and a lock, so it is safe
+to leave enabled. Metrics can be exported as JSON or Prometheus text, and
+an opt-in profiler (cProfile or a stack sampler) can be toggled at runtime.
+
+Usage:
+    import metrics
+
+    with metrics.timer('player_play_load_seconds'):
+        ...
+    metrics.inc('player_length_cache_hits_total')
+
+    @metrics.timed('ui_playlist_refresh_seconds')
+    def refresh(): ...
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+from collections import Counter as _StackCounter
+from typing import Dict, List, Optional
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+# Latency bucket upper bounds in seconds (Prometheus style, +Inf implied)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """Monotonic counter"""
+
+    __slots__ = ('name', 'help', 'value', '_lock')
+
+    def __init__(self, name: str, help: str = ''):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+    def to_dict(self) -> Dict:
+        return {'type': 'counter', 'value': self.value}
+
+
+class Gauge:
+    """Last observed value of a level (buffer fill, queue depth)"""
+
+    __slots__ = ('name', 'help', 'value')
+
+    def __init__(self, name: str, help: str = ''):
+        self.name = name
+        self.help = help
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def to_dict(self) -> Dict:
+        return {'type': 'gauge', 'value': self.value}
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with count, sum and max"""
+
+    __slots__ = ('name', 'help', 'buckets', 'counts', 'count', 'sum', 'max', '_lock')
+
+    def __init__(self, name: str, help: str = '', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile from bucket counts (upper bound of the bucket)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            'type': 'histogram',
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+        }
+
+
+class _Timer:
+    """Context manager recording elapsed time into a histogram"""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Optional[Histogram]):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.histogram is not None:
+            self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Named counters and histograms"""
+
+    def __init__(self):
+        self.enabled = True
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str = '') -> Counter:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, Counter(name, help))
+        return metric
+
+    def gauge(self, name: str, help: str = '') -> Gauge:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, Gauge(name, help))
+        return metric
+
+    def histogram(self, name: str, help: str = '', buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, Histogram(name, help, buckets))
+        return metric
+
+    def inc(self, name: str, amount: int = 1):
+        if self.enabled:
+            self.counter(name).inc(amount)
+
+    def set_gauge(self, name: str, value: float):
+        if self.enabled:
+            self.gauge(name).set(value)
+
+    def observe(self, name: str, value: float):
+        if self.enabled:
+            self.histogram(name).observe(value)
+
+    def timer(self, name: str) -> _Timer:
+        return _Timer(self.histogram(name) if self.enabled else None)
+
+    def timed(self, name: str):
+        """Decorator recording each call's duration"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self._metrics = {}
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: metric.to_dict() for name, metric in sorted(self._metrics.items())}
+
+    def to_json(self) -> str:
+        return json.dumps({'timestamp': time.time(), 'metrics': self.snapshot()}, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Render metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {metric.value}")
+            elif isinstance(metric, Gauge):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {metric.value}")
+            else:
+                lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, n in zip(metric.buckets, metric.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{le="+Inf"}} {metric.count}')
+                lines.append(f"{name}_sum {metric.sum}")
+                lines.append(f"{name}_count {metric.count}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, file_path: str, fmt: str = 'json') -> bool:
+        """Write metrics to a local file as 'json' or 'prometheus'"""
+        try:
+            text = self.to_prometheus() if fmt == 'prometheus' else self.to_json()
+            utils.atomic_write(file_path, text.encode('utf-8'))
+            logger.info(f"Metrics exported to {file_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Could not export metrics to {file_path}: {e}")
+            return False
+
+
+class Profiler:
+    """Runtime-toggleable profiler: 'cprofile' (deterministic) or 'sampling'
+
+    The sampler walks the target thread's stack every interval seconds and
+    aggregates collapsed stacks (flamegraph.pl compatible), which keeps
+    overhead bounded regardless of how hot the profiled code is.
+    """
+
+    def __init__(self, mode: str = 'sampling', interval: float = 0.005, thread_id: Optional[int] = None):
+        if mode not in ('cprofile', 'sampling'):
+            raise ValueError(f"Unknown profiler mode: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.running = False
+        self.samples = _StackCounter()
+        self._profile = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        if self.mode == 'cprofile':
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self.samples.clear()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name='profiler-sampler', daemon=True)
+            self._thread.start()
+        logger.info(f"Profiler started ({self.mode})")
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.mode == 'cprofile' and self._profile is not None:
+            self._profile.disable()
+        elif self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        logger.info("Profiler stopped")
+
+    def toggle(self) -> bool:
+        """Start or stop; returns True when now running"""
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+        return self.running
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def top(self, limit: int = 20) -> List:
+        """Most frequent sampled leaf functions as (function, samples)"""
+        leaves = _StackCounter()
+        for stack, n in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += n
+        return leaves.most_common(limit)
+
+    def dump(self, file_path: str) -> bool:
+        """Write pstats (cprofile) or collapsed stacks (sampling) to file_path"""
+        try:
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if self.mode == 'cprofile':
+                if self._profile is None:
+                    return False
+                self._profile.dump_stats(file_path)
+            else:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    for stack, n in self.samples.most_common():
+                        f.write(f"{stack} {n}\n")
+            logger.info(f"Profile written to {file_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Could not write profile to {file_path}: {e}")
+            return False
+
+
+# Process-wide default registry and convenience wrappers
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set_gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+timed = REGISTRY.timed
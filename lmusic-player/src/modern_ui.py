@@ -14,9 +14,9 @@ Features:
 
 import os
 import json
-import threading
 import time
 import logging
+import threading
 from io import BytesIO
 
 try:
@@ -26,11 +26,32 @@ except Exception:
     ctk = None
     from tkinter import ttk
 import tkinter as tk
-from tkinter import filedialog, messagebox
-
-from .player import MusicPlayer
-from .config import APP_NAME, CONFIG_FILE, BASE_DIR, ICONS_DIR
-from . import utils
+from tkinter import filedialog, messagebox, simpledialog
+
+from player import MusicPlayer
+from audio_output import settings_from_config
+from config import (APP_NAME, CONFIG_FILE, SESSION_FILE, JOURNAL_FILE, STALL_LOG_FILE, TRANSCODE_DIR,
+                    LIBRARY_FILE, HISTORY_FILE, FEATURES_FILE, SILENCE_FILE, BOOKMARKS_FILE,
+                    ANALYSIS_CHECKPOINT_FILE, BASE_DIR, ICONS_DIR)
+import cue
+import utils
+import metrics
+from journal import SessionJournal
+from watchdog import StallWatchdog
+from jobs import JobExecutor, TkDispatcher, PRIORITY_LOW
+from events import PlaybackEnded, SongChanged
+from transcode import TranscodeCache
+from silence import SilenceCache
+from bookmarks import BookmarkStore
+from http_server import LibraryServer
+from net_stream import is_stream_url
+from library import Library
+from history import PlayHistory
+from collation import SortKeyCache
+import features
+import analysis
+from similarity import FeatureMatrix, SimilarTracks
+from smart_playlist import SmartPlaylist, QueryError
 
 try:
     from PIL import Image, ImageTk
@@ -59,7 +80,58 @@ class ModernMusicPlayerApp:
         self.config = utils.load_config(CONFIG_FILE)
 
         # Player backend
-        self.player = MusicPlayer()
+        self.player = MusicPlayer(audio=settings_from_config(self.config))
+        self.player.output.adaptive = bool(self.config.get('audio_adaptive_buffer', True))
+        self.player.output.monitor = True
+        self.player.skip_duplicates = bool(self.config.get('skip_duplicates', True))
+
+        # Shared background executor; results are delivered on the Tk thread
+        self.dispatcher = TkDispatcher(self.root)
+        self.jobs = JobExecutor(dispatcher=self.dispatcher.post)
+        self.dispatcher.start()
+        self._refresh_pending = False
+        # Network streams connect and prefetch there, then start on the Tk thread
+        self.player.jobs = self.jobs
+        # Decoded copies of tracks the mixer cannot load (or would resample) on every play
+        quota = int(self.config.get('transcode_cache_mb', 2048)) * 1024 * 1024
+        self.player.transcoder = TranscodeCache(TRANSCODE_DIR, quota, jobs=self.jobs)
+        # Audible start/end offsets so tracks skip leading and trailing silence
+        if self.config.get('trim_silence', True) and features.available():
+            self.player.silence = SilenceCache(SILENCE_FILE, jobs=self.jobs)
+        # Per-track resume positions for long tracks (mapped on first use)
+        if self.config.get('resume_tracks', True):
+            min_length = float(self.config.get('resume_min_minutes', 10)) * 60
+            self.player.bookmarks = BookmarkStore(BOOKMARKS_FILE, jobs=self.jobs, min_length=min_length)
+        # Indexed tag metadata backing smart playlists
+        self.library = Library.load(LIBRARY_FILE)
+        analysis.register_fields(self.library)
+        self.smart_playlist = None
+        self._smart_applied = None
+        self._smart_pending = None
+        self.sort_keys = SortKeyCache(self.library)
+        self._sort_column = None
+        self._sort_descending = False
+        # Play events and listening stats; play counts feed the library
+        self.history = PlayHistory(HISTORY_FILE)
+        self.history.apply_to(self.library)
+        # Optional LAN streaming of the library (own thread and event loop)
+        self.http_server = None
+        if self.config.get('http_server', False):
+            self.http_server = LibraryServer(self.library, self.config.get('http_host', '0.0.0.0'),
+                                             int(self.config.get('http_port', 8765)))
+            try:
+                self.http_server.start()
+            except OSError as e:
+                logger.warning(f"Could not start the library server: {e}")
+                self.http_server = None
+        self.history.subscribe(self._on_history_event)
+        self.player.history = self.history
+        # Audio feature vectors for "autoplay similar" (needs NumPy)
+        self.features = FeatureMatrix.load(FEATURES_FILE) if features.available() else None
+        self.similar = SimilarTracks(self.features) if self.features is not None else None
+        self._analysis_stop = threading.Event()
+        self.autoplay_var = tk.BooleanVar(master=self.root, value=bool(self.config.get('autoplay_similar', False)))
+        self._toggle_autoplay()
         try:
             self.player.set_volume(self.config.get('volume', 0.7))
         except Exception:
@@ -68,27 +140,39 @@ class ModernMusicPlayerApp:
         # Build layout
         self._setup_layout()
 
-        # Bind player callbacks
-        self.player.on_song_change = self._on_song_change
-        self.player.on_playback_end = self._on_playback_end
+        # Player events: song changes are prepared on the event pool (tags,
+        # cover art) and shown on the Tk thread; track ends advance there
+        self.player.events.subscribe(SongChanged, self._on_song_change, name='modern_ui_song_change')
+        self.player.events.subscribe(PlaybackEnded, self._on_playback_end, dispatcher=self.dispatcher.post,
+                                     name='modern_ui_playback_end')
+
+        # Playlist undo/redo
+        self.root.bind_all('<Control-z>', lambda e: self._undo_edit())
+        self.root.bind_all('<Control-y>', lambda e: self._redo_edit())
+        self.root.bind_all('<Control-Shift-Z>', lambda e: self._redo_edit())
 
         # Update loop for UI
         self._updating = True
         self._schedule_update()
 
-        # Load last playlist if configured
+        # Report callbacks that block the Tk event loop
+        threshold = float(self.config.get('stall_threshold_ms', 250)) / 1000.0
+        self.watchdog = StallWatchdog(self.root, threshold=threshold, log_path=STALL_LOG_FILE)
+        self.watchdog.start()
+
+        # Restore last session snapshot + crash journal (falls back to legacy config playlist)
+        self.journal = SessionJournal(JOURNAL_FILE, SESSION_FILE)
         try:
-            last_pl = self.config.get('last_playlist')
-            if last_pl and isinstance(last_pl, list):
-                files = [f for f in last_pl if os.path.exists(f)]
-                if files:
-                    self.player.load_playlist(files)
+            restored = self.journal.restore_player(self.player, self.config)
+            self.journal.attach(self.player)
+            if restored:
+                self._refresh_playlist_ui()
+                self._load_metadata_background(list(self.player.playlist))
+                # Decode the restored track ahead of the first play
+                self.player.prefetch(include_current=True)
+                if self.config.get('resume_on_start'):
+                    self.player.resume()
                     self._refresh_playlist_ui()
-                    idx = int(self.config.get('last_index', 0))
-                    self.player.current_index = min(max(0, idx), len(files) - 1)
-                    if self.config.get('resume_on_start'):
-                        self.player.play(self.player.current_index)
-                        self._refresh_playlist_ui()
         except Exception:
             pass
 
@@ -124,6 +208,7 @@ class ModernMusicPlayerApp:
 
         ctk.CTkButton(self.sidebar, text="Add Files", command=self._add_files, fg_color="#27ae60").pack(fill='x', padx=8, pady=(18, 6))
         ctk.CTkButton(self.sidebar, text="Add Folder", command=self._add_folder, fg_color="#27ae60").pack(fill='x', padx=8, pady=6)
+        ctk.CTkButton(self.sidebar, text="Add Stream URL", command=self._add_stream_url, fg_color="#27ae60").pack(fill='x', padx=8, pady=6)
 
         # Library scan
         ctk.CTkButton(self.sidebar, text="Scan Library", command=self._scan_library).pack(fill='x', padx=8, pady=6)
@@ -148,12 +233,13 @@ class ModernMusicPlayerApp:
         body.grid_columnconfigure(1, weight=0)
 
         # Playlist tree
-        self.playlist_tree = ttk.Treeview(body, columns=("name", "artist", "duration"), show='headings', selectmode='browse')
-        self.playlist_tree.heading('name', text='Title')
-        self.playlist_tree.heading('artist', text='Artist')
-        self.playlist_tree.heading('duration', text='Duration')
+        self.playlist_tree = ttk.Treeview(body, columns=("name", "artist", "bpm", "key", "duration"), show='headings', selectmode='browse')
+        for col in ('name', 'artist', 'bpm', 'key', 'duration'):
+            self.playlist_tree.heading(col, text=self.HEADINGS[col], command=lambda c=col: self._sort_playlist(c))
         self.playlist_tree.column('name', width=420)
         self.playlist_tree.column('artist', width=200)
+        self.playlist_tree.column('bpm', width=60, anchor='center')
+        self.playlist_tree.column('key', width=50, anchor='center')
         self.playlist_tree.column('duration', width=80, anchor='center')
         self.playlist_tree.bind('<Double-1>', self._on_playlist_double_click)
 
@@ -231,8 +317,22 @@ class ModernMusicPlayerApp:
     def _show_file_menu(self):
         # Popup style menu using standard tkinter Menu for simplicity
         menu = tk.Menu(self.root, tearoff=0)
+        history = self.player.undo
+        menu.add_command(label=f"Undo {history.undo_label() or ''}".strip(), accelerator='Ctrl+Z',
+                         command=self._undo_edit, state='normal' if history.can_undo else 'disabled')
+        menu.add_command(label=f"Redo {history.redo_label() or ''}".strip(), accelerator='Ctrl+Y',
+                         command=self._redo_edit, state='normal' if history.can_redo else 'disabled')
+        menu.add_separator()
         menu.add_command(label='Load Playlist', command=lambda: self.load_playlist_from_file(filedialog.askopenfilename()))
         menu.add_command(label='Save Playlist', command=lambda: self.save_playlist(filedialog.asksaveasfilename(defaultextension='.json')))
+        menu.add_command(label='New Smart Playlist', command=self._new_smart_playlist)
+        menu.add_separator()
+        menu.add_command(label='Analyze Audio for Similar Tracks', command=self._analyze_library)
+        menu.add_command(label='Detect BPM and Key', command=self._analyze_bpm_key)
+        menu.add_checkbutton(label='Autoplay Similar Tracks', variable=self.autoplay_var,
+                             command=self._toggle_autoplay)
+        menu.add_separator()
+        menu.add_command(label='Debug Metrics', command=self._open_debug_panel)
         menu.add_separator()
         menu.add_command(label='Exit', command=self.quit)
         try:
@@ -249,12 +349,11 @@ class ModernMusicPlayerApp:
         self.header_label.config(text='Playlists')
 
     def _add_files(self):
-        files = filedialog.askopenfilenames(filetypes=[('Audio files', '*.mp3 *.wav *.ogg *.flac *.m4a')])
+        files = filedialog.askopenfilenames(filetypes=[('Audio files', '*.mp3 *.wav *.ogg *.flac *.m4a *.cue')])
         if files:
-            self.player.add_files(files)
+            count = self.player.add_files(files)
             self._refresh_playlist_ui()
-            # Background metadata loader
-            threading.Thread(target=self._load_metadata_background, args=(files,), daemon=True).start()
+            self._load_metadata_background(self.player.playlist[len(self.player.playlist) - count:])
 
     def _add_folder(self):
         folder = filedialog.askdirectory()
@@ -262,22 +361,42 @@ class ModernMusicPlayerApp:
             filecount = self.player.add_folder(folder)
             self._refresh_playlist_ui()
             if filecount > 0:
-                threading.Thread(target=self._load_metadata_background, args=([os.path.join(folder, f) for f in os.listdir(folder)],), daemon=True).start()
+                # Only the audio files add_folder actually queued
+                self._load_metadata_background(self.player.playlist[len(self.player.playlist) - filecount:])
+
+    def _add_stream_url(self):
+        url = simpledialog.askstring('Add Stream', 'HTTP(S) stream or radio playlist URL:', parent=self.root)
+        if not url:
+            return
+        url = url.strip()
+        if not is_stream_url(url):
+            messagebox.showerror('Error', 'Enter an http:// or https:// URL')
+            return
+        self.player.add_files([url])
+        self._refresh_playlist_ui()
 
     def _scan_library(self):
         path = filedialog.askdirectory()
         if not path:
             return
-        # Walk directory and gather audio files
+        # Walk the tree on the io pool; a repeated scan of the same folder is coalesced
+        self.jobs.submit(self._walk_audio_files, path, key=('scan', path), group='scan',
+                         callback=self._on_scan_done)
+
+    @staticmethod
+    def _walk_audio_files(path):
         audio_files = []
         for root, _, files in os.walk(path):
             for f in files:
                 if f.lower().endswith(('.mp3', '.wav', '.ogg', '.flac', '.m4a')):
                     audio_files.append(os.path.join(root, f))
+        return audio_files
+
+    def _on_scan_done(self, audio_files):
         if audio_files:
-            self.player.add_files(audio_files)
+            count = self.player.add_files(audio_files)
             self._refresh_playlist_ui()
-            threading.Thread(target=self._load_metadata_background, args=(audio_files,), daemon=True).start()
+            self._load_metadata_background(self.player.playlist[len(self.player.playlist) - count:])
 
     def _open_settings(self):
         # Minimal settings dialog using a Toplevel window
@@ -306,6 +425,12 @@ class ModernMusicPlayerApp:
         except Exception as e:
             messagebox.showerror('Error', f'Could not open settings: {e}')
 
+    def _open_debug_panel(self):
+        from debug_panel import DebugPanel
+        previous = getattr(self, '_debug_panel', None)
+        self._debug_panel = DebugPanel(self.root, profiler=previous.profiler if previous else None,
+                                       watchdog=self.watchdog)
+
     def _save_settings(self, win, resume_on_start, theme='dark', crossfade_ms=500):
         self.config['resume_on_start'] = resume_on_start
         self.config['theme'] = theme
@@ -319,30 +444,209 @@ class ModernMusicPlayerApp:
         win.destroy()
 
     def _load_metadata_background(self, files):
-        for f in files:
-            try:
-                # cause player to compute song length and metadata
-                self.player.get_song_length(f)
-            except Exception:
-                pass
-        # once loaded refresh UI
-        self.root.after(10, self._refresh_playlist_ui)
+        # Tags are read into the library on the shared executor; the view refreshes once per batch
+        files = [f for f in files if not is_stream_url(f)]
+        if files:
+            self.jobs.map(self.library.read_if_stale, files, key='metadata', priority=PRIORITY_LOW,
+                          group='metadata', on_batch=self._on_metadata_batch)
+
+    def _on_metadata_batch(self, pairs):
+        with self.library.batch():
+            self.library.apply(pairs)
+            # Tracks new to the library start at played=0; restore their history
+            self.history.apply_to(self.library, [path for path, meta in pairs if meta is not None])
+        for path, _meta in pairs:
+            track_id = self.library.id_of(path)
+            if track_id is not None:
+                self.player.durations[path] = self.library.value(track_id, 'length') or 0
+        self._request_refresh()
+
+    # ------------------ smart playlists ------------------
+    def _new_smart_playlist(self):
+        query = simpledialog.askstring(
+            'New Smart Playlist',
+            'Query, e.g.  artist:"Name" and length>300 order by added desc limit 200',
+            parent=self.root)
+        if query:
+            self._open_smart_playlist(query, query)
+
+    def _open_smart_playlist(self, name, query):
+        try:
+            smart = SmartPlaylist(name, query, self.library, on_update=self._schedule_smart_update)
+        except QueryError as e:
+            messagebox.showerror('Smart Playlist', f'Invalid query: {e}')
+            return
+        self._close_smart_playlist()
+        self.smart_playlist = smart
+        self._apply_smart_results(smart.paths)
+        self._load_metadata_background(list(self.player.playlist))
+        self.header_label.config(text=f'Smart: {name}')
+
+    def _close_smart_playlist(self):
+        if self.smart_playlist is not None:
+            self.smart_playlist.close()
+        self.smart_playlist = None
+        self._smart_applied = None
+
+    def _schedule_smart_update(self, paths):
+        # Library changes arrive per metadata batch; apply at most twice a second
+        if self._smart_pending is None:
+            self.root.after(500, self._run_smart_update)
+        self._smart_pending = paths
+
+    def _run_smart_update(self):
+        paths, self._smart_pending = self._smart_pending, None
+        if paths is None or self.smart_playlist is None:
+            return
+        if self.player.playlist != self._smart_applied:
+            # Edited by hand since the last update: stop following the query
+            self._close_smart_playlist()
+            return
+        self._apply_smart_results(paths)
 
+    def _apply_smart_results(self, paths):
+        current = None
+        if 0 <= self.player.current_index < len(self.player.playlist):
+            current = self.player.playlist[self.player.current_index]
+        self.player.load_playlist(paths)
+        position = self.player.playlist.position(current) if current is not None else None
+        self.player.current_index = position or 0
+        self._smart_applied = list(self.player.playlist)
+        self._refresh_playlist_ui()
+
+    def _request_refresh(self):
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.root.after(250, self._run_refresh)
+
+    def _run_refresh(self):
+        self._refresh_pending = False
+        self._refresh_playlist_ui()
+
+    # ------------------ similar tracks ------------------
+    def _toggle_autoplay(self):
+        enabled = bool(self.autoplay_var.get()) and self.similar is not None
+        self.player.autoplay = self.similar if enabled else None
+        self.config['autoplay_similar'] = bool(self.autoplay_var.get())
+
+    def _analyze_library(self):
+        if self.features is None:
+            messagebox.showerror('Analyze Audio', 'NumPy is required for audio analysis.')
+            return
+        paths = self.features.missing(p for p in self.library.paths if p is not None)
+        if not paths:
+            self.header_label.config(text='All tracks analyzed')
+            return
+        self.jobs.submit(self._run_analysis, paths, key='features', pool='cpu', group='features',
+                         callback=self._on_analysis_done)
+
+    def _run_analysis(self, paths):
+        done = 0
+        for vectors in features.extract_batch(paths, cancelled=self._analysis_stop.is_set):
+            done += len(vectors)
+            self.dispatcher.post(self._on_analysis_batch, vectors, done, len(paths))
+        return done
+
+    def _on_analysis_batch(self, vectors, done, total):
+        self.features.update(vectors)
+        self.header_label.config(text=f'Analyzing {done}/{total}')
+
+    def _on_analysis_done(self, count):
+        self.features.save(FEATURES_FILE)
+        self.header_label.config(text=f'Analyzed {count} tracks')
+
+    def _analyze_bpm_key(self):
+        """Batch BPM/key detection for library tracks not analysed yet (resumes from the checkpoint)"""
+        if not features.available():
+            messagebox.showerror('Detect BPM and Key', 'NumPy is required for audio analysis.')
+            return
+        bpms, keys = self.library.column('bpm'), self.library.column('key')
+        paths = [p for i, p in enumerate(self.library.paths)
+                 if p is not None and bpms[i] is None and keys[i] is None]
+        if not paths:
+            self.header_label.config(text='All tracks analyzed')
+            return
+        self.jobs.submit(self._run_bpm_key, paths, key='bpm_key', pool='cpu', group='features',
+                         callback=self._on_bpm_key_done)
+
+    def _run_bpm_key(self, paths):
+        checkpoint = analysis.AnalysisCheckpoint(ANALYSIS_CHECKPOINT_FILE)
+        done = 0
+        for results in analysis.analyze_batch(paths, checkpoint, cancelled=self._analysis_stop.is_set):
+            done += len(results)
+            self.dispatcher.post(self._on_bpm_key_batch, results, done, len(paths))
+        return done
+
+    def _on_bpm_key_batch(self, results, done, total):
+        with self.library.batch():
+            for path, result in results.items():
+                self.library.update(path, **result)
+        self.header_label.config(text=f'Analyzing {done}/{total}')
+        self._request_refresh()
+
+    def _on_bpm_key_done(self, count):
+        self.library.save(LIBRARY_FILE)
+        self.header_label.config(text=f'Detected BPM and key for {count} tracks')
+
+    def _on_history_event(self, path, stats):
+        """Keep library play counts (and smart playlists using them) current"""
+        self.library.update(path, played=stats.plays, last_played=int(stats.last_played))
+
+    # Treeview column -> collation.COLUMN_KEYS entry
+    SORT_KEYS = {'name': 'title', 'artist': 'artist', 'bpm': 'bpm', 'key': 'key', 'duration': 'length'}
+    HEADINGS = {'name': 'Title', 'artist': 'Artist', 'bpm': 'BPM', 'key': 'Key', 'duration': 'Duration'}
+
+    @metrics.timed('ui_playlist_sort_seconds')
+    def _sort_playlist(self, column):
+        """Sort by a column (artist sorts by artist, album, disc, track); click again to reverse"""
+        if not self.player.playlist:
+            return
+        if column == self._sort_column:
+            self._sort_descending = not self._sort_descending
+        else:
+            self._sort_column = column
+            self._sort_descending = False
+        order = self.sort_keys.sort_order(self.player.playlist, self.SORT_KEYS[column], self._sort_descending)
+        self.player.reorder(order)
+        for col, text in self.HEADINGS.items():
+            if col == column:
+                text += ' \u25bc' if self._sort_descending else ' \u25b2'
+            self.playlist_tree.heading(col, text=text)
+        self._refresh_playlist_ui()
+
+    def _undo_edit(self):
+        if self.player.undo_edit() is not None:
+            self._refresh_playlist_ui()
+
+    def _redo_edit(self):
+        if self.player.redo_edit() is not None:
+            self._refresh_playlist_ui()
+
+    @metrics.timed('ui_playlist_refresh_seconds')
     def _refresh_playlist_ui(self):
         # Clear tree
         for item in self.playlist_tree.get_children():
             self.playlist_tree.delete(item)
         for i, fpath in enumerate(self.player.playlist):
             info = self.player.get_current_song_info() if i == self.player.current_index else None
+            track_id = self.library.id_of(fpath)
+            bpm, key = '', ''
+            if track_id is not None:
+                bpm = self.library.value(track_id, 'bpm')
+                bpm = f'{bpm:.0f}' if bpm else ''
+                key = self.library.value(track_id, 'key') or ''
             if info and i == self.player.current_index:
                 name = info.get('title', os.path.basename(fpath))
                 artist = info.get('artist', '')
                 dur = utils.format_time(info.get('length', 0))
             else:
-                name = os.path.basename(fpath)
-                artist = ''
-                dur = utils.format_time(self.player.get_song_length(fpath))
-            self.playlist_tree.insert('', 'end', iid=str(i), values=(name, artist, dur))
+                if track_id is None:
+                    name, artist = cue.display_name(fpath), ''
+                else:
+                    name = self.library.value(track_id, 'title') or cue.display_name(fpath)
+                    artist = self.library.value(track_id, 'artist') or ''
+                dur = utils.format_time(self.player.durations.get(fpath, 0))
+            self.playlist_tree.insert('', 'end', iid=str(i), values=(name, artist, bpm, key, dur))
         # highlight current
         if 0 <= self.player.current_index < len(self.player.playlist):
             try:
@@ -421,19 +725,29 @@ class ModernMusicPlayerApp:
         except Exception as e:
             logger.warning(f"Volume change error: {e}")
 
-    def _on_song_change(self, song_info):
+    def _on_song_change(self, event):
+        """Read tags and cover art off the Tk thread, then update the widgets there"""
+        song_info = event.info
         if not song_info:
             return
+        art = None
+        try:
+            data = self._extract_album_art(song_info.get('file_path'))
+            if data:
+                art = Image.open(BytesIO(data)).resize((160, 160))
+        except Exception:
+            art = None
+        self.dispatcher.post(self._show_song, song_info, art)
+
+    def _show_song(self, song_info, art):
         self.now_title_lbl.configure(text=song_info.get('title', ''))
         self.now_artist_lbl.configure(text=song_info.get('artist', ''))
         self.meta_title.configure(text=song_info.get('title', ''))
         self.meta_artist.configure(text=song_info.get('artist', ''))
         # album art
         try:
-            art = self._extract_album_art(song_info.get('file_path'))
-            if art:
-                img = Image.open(BytesIO(art)).resize((160, 160))
-                photo = ImageTk.PhotoImage(img)
+            if art is not None:
+                photo = ImageTk.PhotoImage(art)
                 self.now_art.configure(image=photo)
                 self.now_art.image = photo
                 self.album_art_label.configure(image=photo)
@@ -453,14 +767,17 @@ class ModernMusicPlayerApp:
         except Exception:
             pass
 
-    def _on_playback_end(self):
-        # automatically play next
+    def _on_playback_end(self, event):
+        # automatically play next, unless another track was started meanwhile
+        if event.index != self.player.current_index:
+            return
         try:
             self.player.next()
             self._refresh_playlist_ui()
         except Exception:
             pass
 
+    @metrics.timed('ui_tick_seconds')
     def _schedule_update(self):
         try:
             if self.player.is_playing:
@@ -471,12 +788,15 @@ class ModernMusicPlayerApp:
                     percent = (pos / length) * 100
                     self.progress_slider.set(percent)
                     self.progress_time_var.set(utils.format_time(pos))
+            if getattr(self, 'journal', None) is not None:
+                self.journal.record_position(self.player.current_index, self.player.get_current_position())
             if self._updating:
                 self.root.after(200, self._schedule_update)
         except Exception:
             if self._updating:
                 self.root.after(200, self._schedule_update)
 
+    @metrics.timed('ui_album_art_seconds')
     def _extract_album_art(self, file_path):
         try:
             if Image is None:
@@ -501,6 +821,9 @@ class ModernMusicPlayerApp:
     def save_playlist(self, filename):
         try:
             pl = {'name': os.path.basename(filename), 'files': list(self.player.playlist)}
+            if self.smart_playlist is not None:
+                # Reloading follows the query; 'files' keeps the snapshot for other players
+                pl['query'] = self.smart_playlist.query.text
             os.makedirs(os.path.join(BASE_DIR, 'playlists'), exist_ok=True)
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(pl, f, indent=2)
@@ -511,22 +834,47 @@ class ModernMusicPlayerApp:
         try:
             with open(filename, 'r', encoding='utf-8') as f:
                 pl = json.load(f)
+            if pl.get('query'):
+                self._open_smart_playlist(pl.get('name') or pl['query'], pl['query'])
+                return
             files = [f for f in pl.get('files', []) if os.path.exists(f)]
+            self.jobs.cancel_group('metadata')
             self.player.load_playlist(files)
             self._refresh_playlist_ui()
+            self._load_metadata_background(list(self.player.playlist))
         except Exception as e:
             messagebox.showerror('Error', f'Could not load playlist: {e}')
 
     def quit(self):
         self._updating = False
+        self.watchdog.stop()
+        self.dispatcher.stop()
+        self.jobs.shutdown()
         self.config['volume'] = self.player.volume
-        self.config['last_playlist'] = list(self.player.playlist)
-        self.config['last_index'] = self.player.current_index
+        # Playlist and index are stored in the session snapshot, not config.json
+        self.config['last_playlist'] = None
         utils.save_config(CONFIG_FILE, self.config)
+        try:
+            self.journal.close()
+        except Exception:
+            pass
+        self._close_smart_playlist()
+        self.library.save(LIBRARY_FILE)
+        self.history.close()
+        if self.http_server is not None:
+            self.http_server.stop()
+        if self.player.silence is not None:
+            self.player.silence.save()
+        self._analysis_stop.set()
+        if self.features is not None:
+            self.features.save(FEATURES_FILE)
         try:
             self.player.shutdown()
         except Exception:
             pass
+        # After shutdown, which records the position playback stopped at
+        if self.player.bookmarks is not None:
+            self.player.bookmarks.close()
         try:
             self.root.quit()
             self.root.destroy()
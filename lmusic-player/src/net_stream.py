@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Buffered playback of HTTP(S) streams and internet radio
+
+pygame.mixer.music.load() accepts a file-like object and reads from it on
+the audio thread, which must never wait on the network. HttpStream is
+that file object: a fetch thread downloads into a RingBuffer ahead of the
+reader, and the audio thread only ever copies bytes out of memory. When
+the ring runs dry, read() waits at most read_timeout and then returns
+zero bytes (which decoders skip as junk, i.e. silence) rather than stall
+the mixer, which holds the audio device lock while it decodes.
+
+- Prefetch: playback starts once prefetch_bytes are buffered
+  (wait_ready), and the fetch thread keeps up to capacity bytes ahead
+- Stall detection: a connection that delivers nothing for stall_timeout
+  seconds is dropped and reopened
+- Reconnect: dropped or failed connections are retried with backoff,
+  cycling through the alternate URLs of an M3U/PLS playlist; finite files
+  resume with a Range request at the current offset
+- Seeking (decoders probe headers and chunk layouts) is served from the
+  bytes retained in the ring when possible, otherwise by reconnecting at
+  the target offset for servers that accept ranges
+- Metrics: stream_buffer_fill_ratio (gauge), stream_underruns_total,
+  stream_silence_reads_total, stream_stalls_total, stream_reconnects_total,
+  stream_bytes_total
+
+resolve_playlist() expands .m3u/.pls radio URLs into their entries.
+"""
+
+import io
+import os
+import time
+import socket
+import logging
+import threading
+import http.client
+import urllib.request
+from typing import List, Optional, Sequence
+from urllib.parse import urljoin, urlsplit
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'lmusic-player'
+STREAM_SCHEMES = ('http://', 'https://')
+PLAYLIST_EXTENSIONS = ('.m3u', '.m3u8', '.pls')
+PLAYLIST_TYPES = ('audio/x-mpegurl', 'audio/mpegurl', 'application/vnd.apple.mpegurl',
+                  'audio/x-scpls', 'application/pls+xml')
+# Content type -> pygame.mixer.music.load() namehint
+NAMEHINTS = {
+    'audio/mpeg': 'mp3', 'audio/mp3': 'mp3', 'audio/aacp': 'aac', 'audio/aac': 'aac',
+    'audio/ogg': 'ogg', 'application/ogg': 'ogg', 'audio/vorbis': 'ogg', 'audio/opus': 'opus',
+    'audio/flac': 'flac', 'audio/x-flac': 'flac', 'audio/wav': 'wav', 'audio/x-wav': 'wav',
+    'audio/wave': 'wav',
+}
+MAX_PLAYLIST_BYTES = 64 * 1024
+READ_SIZE = 16 * 1024
+
+
+def is_stream_url(path: str) -> bool:
+    return isinstance(path, str) and path.lower().startswith(STREAM_SCHEMES)
+
+
+def stream_title(url: str) -> str:
+    """Display name for a stream URL: its file name, else the host"""
+    parts = urlsplit(url)
+    name = os.path.basename(parts.path.rstrip('/'))
+    return name or parts.netloc
+
+
+# ------------------ playlists ------------------
+def parse_playlist(text: str, base_url: str = '') -> List[str]:
+    """Entry URLs of an M3U or PLS playlist, in order"""
+    lines = [line.strip() for line in text.splitlines()]
+    if any(line.startswith('#EXT-X-') for line in lines):
+        raise ValueError("HLS playlists are not supported")
+    entries = []
+    if any(line.lower() == '[playlist]' for line in lines):
+        numbered = []
+        for line in lines:
+            key, sep, value = line.partition('=')
+            if sep and key.lower().startswith('file') and key[4:].isdigit():
+                numbered.append((int(key[4:]), value.strip()))
+        entries = [value for _n, value in sorted(numbered)]
+    else:
+        entries = [line for line in lines if line and not line.startswith('#')]
+    return [urljoin(base_url, entry) for entry in entries]
+
+
+def _open(url: str, timeout: float, offset: int = 0):
+    headers = {'User-Agent': USER_AGENT, 'Icy-MetaData': '0'}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+
+
+def _content_type(response) -> str:
+    return (response.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+
+
+def resolve_playlist(url: str, timeout: float = 10.0) -> List[str]:
+    """[url], or the entries of the M3U/PLS playlist url points to"""
+    path = urlsplit(url).path.lower()
+    if not path.endswith(PLAYLIST_EXTENSIONS):
+        return [url]
+    with _open(url, timeout) as response:
+        if _content_type(response).startswith('audio/') and _content_type(response) not in PLAYLIST_TYPES:
+            # A stream behind a playlist-looking URL
+            return [url]
+        text = response.read(MAX_PLAYLIST_BYTES).decode('utf-8', 'replace')
+    entries = [e for e in parse_playlist(text, url) if is_stream_url(e)]
+    if not entries:
+        raise ValueError(f"No stream URLs in playlist {url}")
+    return entries
+
+
+# ------------------ buffering ------------------
+class RingBuffer:
+    """Fixed-size byte ring between one writer thread and one reader
+
+    Positions are absolute stream offsets. Bytes already read stay in the
+    ring (up to `history` of them) until the writer needs the room, so
+    short backward seeks need no refetch.
+    """
+
+    def __init__(self, capacity: int, history: int = 256 * 1024):
+        self.capacity = capacity
+        self.history = min(history, capacity // 2)
+        self._buf = bytearray(capacity)
+        self.start = 0  # oldest retained offset
+        self.end = 0    # offset after the last written byte
+        self.pos = 0    # read offset
+        self.eof = False
+        self.closed = False
+        self.cond = threading.Condition()
+
+    @property
+    def fill(self) -> int:
+        """Unread bytes"""
+        return self.end - self.pos
+
+    def _space(self) -> int:
+        return self.capacity - (self.end - max(self.start, self.pos - self.history))
+
+    def reset(self, offset: int):
+        with self.cond:
+            self.start = self.end = self.pos = offset
+            self.eof = False
+            self.cond.notify_all()
+
+    def write(self, data: bytes, generation_ok=lambda: True) -> bool:
+        """Append data, waiting for the reader to make room; False if closed or abandoned"""
+        view = memoryview(data)
+        with self.cond:
+            while len(view):
+                while self._space() <= 0:
+                    if self.closed or not generation_ok():
+                        return False
+                    self.cond.wait(0.1)
+                if self.closed or not generation_ok():
+                    return False
+                n = min(len(view), self._space())
+                index = self.end % self.capacity
+                first = min(n, self.capacity - index)
+                self._buf[index:index + first] = view[:first]
+                self._buf[:n - first] = view[first:n]
+                self.end += n
+                self.start = max(self.start, self.end - self.capacity)
+                view = view[n:]
+                self.cond.notify_all()
+        return True
+
+    def finish(self):
+        with self.cond:
+            self.eof = True
+            self.cond.notify_all()
+
+    def read(self, n: int, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Up to n bytes; b'' at the end of the stream, None on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.end <= self.pos and not self.eof and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            n = min(n, self.end - self.pos)
+            if n <= 0:
+                return b''
+            index = self.pos % self.capacity
+            first = min(n, self.capacity - index)
+            data = bytes(self._buf[index:index + first]) + bytes(self._buf[:n - first])
+            self.pos += n
+            self.cond.notify_all()
+            return data
+
+    def seek_within(self, offset: int) -> bool:
+        """Move the read position if offset is retained or already written"""
+        with self.cond:
+            if self.start <= offset <= self.end:
+                self.pos = offset
+                self.cond.notify_all()
+                return True
+            return False
+
+    def wait_fill(self, nbytes: int, timeout: float) -> bool:
+        """Wait until nbytes are unread (or the stream ended)"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.fill < nbytes and not self.eof and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            return True
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class HttpStream(io.RawIOBase):
+    """Read-only, ring-buffered file object over an HTTP(S) resource"""
+
+    def __init__(self, urls: Sequence[str], capacity: int = 2 * 1024 * 1024,
+                 prefetch_bytes: int = 256 * 1024, stall_timeout: float = 5.0,
+                 max_retries: int = 5, backoff: float = 0.5, read_timeout: float = 0.05):
+        super().__init__()
+        if isinstance(urls, str):
+            urls = [urls]
+        self.urls = list(urls)
+        self.prefetch_bytes = min(prefetch_bytes, capacity // 2)
+        self.stall_timeout = stall_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Longest read() waits for data before returning silence
+        self.read_timeout = read_timeout
+        self.buffer = RingBuffer(capacity)
+        self.length = None          # total size for finite resources
+        self.accepts_ranges = False
+        self.content_type = ''
+        self.error = None
+        self.underruns = 0
+        self.reconnects = 0
+        self._url_index = 0
+        self._generation = 0        # bumped by seeks that need a new connection
+        self._response = None
+        self._connected = threading.Event()
+        self._thread = None
+
+    # ------------------ lifecycle ------------------
+    def start(self) -> 'HttpStream':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._fetch_loop, name='http-stream', daemon=True)
+            self._thread.start()
+        return self
+
+    def wait_ready(self, timeout: float = 10.0) -> bool:
+        """Block until prefetch_bytes are buffered; raises the fetch error if it gave up"""
+        deadline = time.monotonic() + timeout
+        self._connected.wait(timeout)
+        ready = self.buffer.wait_fill(self.prefetch_bytes, max(0.0, deadline - time.monotonic()))
+        if self.error is not None and not self.buffer.fill:
+            raise self.error
+        return ready
+
+    @property
+    def namehint(self) -> str:
+        """Format hint for pygame from the content type, else the URL's extension"""
+        hint = NAMEHINTS.get(self.content_type)
+        if hint is None:
+            hint = os.path.splitext(urlsplit(self.urls[self._url_index]).path)[1].lstrip('.').lower()
+        return hint
+
+    def close(self):
+        if not self.closed:
+            self.buffer.close()
+            self._interrupt()
+            if self._thread is not None and self._thread is not threading.current_thread():
+                self._thread.join(timeout=2)
+        super().close()
+
+    # ------------------ fetching ------------------
+    def _interrupt(self):
+        """Make a blocked read on the current connection return at once"""
+        response = self._response
+        try:
+            response.fp.raw._sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+
+    def _drop_response(self):
+        response, self._response = self._response, None
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def _connect(self, offset: int):
+        url = self.urls[self._url_index]
+        # The timeout also bounds each read: a connection silent for longer has stalled
+        response = _open(url, self.stall_timeout, offset if self.accepts_ranges else 0)
+        self.content_type = _content_type(response) or self.content_type
+        length = response.headers.get('Content-Length')
+        ranged = response.status == 206
+        if response.status == 200:
+            self.accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+            if length is not None and self.length is None:
+                self.length = int(length)
+        elif ranged:
+            self.accepts_ranges = True
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if total.isdigit():
+                self.length = int(total)
+        self._response = response
+        return response, (offset if ranged else 0)
+
+    def _fetch_loop(self):
+        buffer = self.buffer
+        failures = 0
+        while not buffer.closed:
+            generation = self._generation
+            offset = buffer.end
+            if self.length is not None and offset >= self.length:
+                # Everything is buffered; idle until a seek needs a refetch
+                buffer.finish()
+                with buffer.cond:
+                    buffer.cond.wait_for(lambda: buffer.closed or generation != self._generation)
+                continue
+            try:
+                response, at = self._connect(offset)
+                self._connected.set()
+                live = self.length is None
+                skip = 0 if live else offset - at
+                while not buffer.closed and generation == self._generation:
+                    data = response.read1(READ_SIZE)
+                    if not data:
+                        break
+                    failures = 0
+                    metrics.inc('stream_bytes_total', len(data))
+                    if skip:
+                        # Server ignored the Range header: drop what we already have
+                        dropped = min(skip, len(data))
+                        data, skip = data[dropped:], skip - dropped
+                        if not data:
+                            continue
+                    if not buffer.write(data, lambda: generation == self._generation):
+                        break
+                    self._report_fill()
+                if generation != self._generation or buffer.closed:
+                    continue
+                if self.length is not None and buffer.end >= self.length:
+                    continue
+                # Closed early, or a live stream dropped: reconnect
+                raise ConnectionError("connection closed by server")
+            except (socket.timeout, TimeoutError) as e:
+                metrics.inc('stream_stalls_total')
+                logger.info(f"Stream stalled ({e}); reconnecting")
+                failures += 1
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                if buffer.closed or generation != self._generation:
+                    continue
+                logger.info(f"Stream connection failed: {e}")
+                failures += 1
+            finally:
+                self._drop_response()
+            if buffer.closed:
+                return
+            if failures > self.max_retries:
+                self.error = ConnectionError(f"Giving up on {self.urls[self._url_index]} after "
+                                             f"{failures} failed attempts")
+                logger.warning(str(self.error))
+                self._connected.set()
+                buffer.finish()
+                return
+            if failures:
+                self.reconnects += 1
+                metrics.inc('stream_reconnects_total')
+                # Try the next alternate URL, backing off once every URL has failed
+                self._url_index = (self._url_index + 1) % len(self.urls)
+                if self._url_index == 0 or len(self.urls) == 1:
+                    with buffer.cond:
+                        buffer.cond.wait_for(lambda: buffer.closed,
+                                             min(self.backoff * 2 ** (failures - 1), 10.0))
+
+    def _report_fill(self):
+        metrics.set_gauge('stream_buffer_fill_ratio', self.buffer.fill / self.buffer.capacity)
+
+    # ------------------ file interface (audio thread) ------------------
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self.length is not None and self.accepts_ranges
+
+    def tell(self) -> int:
+        return self.buffer.pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = READ_SIZE
+        buffer = self.buffer
+        if not buffer.fill and not buffer.eof:
+            self.underruns += 1
+            metrics.inc('stream_underruns_total')
+        data = buffer.read(size, self.read_timeout)
+        if data is None:
+            # Stalled or reconnecting: play silence rather than end the stream or block the mixer
+            metrics.inc('stream_silence_reads_total')
+            data = bytes(min(size, READ_SIZE))
+        self._report_fill()
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.buffer.pos
+        elif whence == io.SEEK_END:
+            if self.length is None:
+                raise OSError("Cannot seek from the end of a live stream")
+            offset += self.length
+        offset = max(0, offset)
+        if self.length is not None:
+            offset = min(offset, self.length)
+        if self.buffer.seek_within(offset):
+            return offset
+        if not self.seekable():
+            raise OSError("Stream is not seekable this far")
+        # Refetch from the target offset
+        self._generation += 1
+        self.buffer.reset(offset)
+        self._interrupt()
+        return offset
+
+
+def open_stream(url: str, **kwargs) -> HttpStream:
+    """Resolve a radio playlist if needed and start buffering"""
+    return HttpStream(resolve_playlist(url), **kwargs).start()
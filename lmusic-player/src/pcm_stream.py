@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped PCM playback for WAV files in the mixer's native format
+
+pygame.mixer.music.load() reads and buffers a file itself, and seeking
+means decoding from the start again. For uncompressed WAVs whose rate,
+width and channel count already match the mixer (including everything in
+the transcode cache), PcmStream maps the file read-only and hands out
+memoryview slices of the data chunk, and PcmPlayback feeds them to a
+reserved mixer channel one fixed-size chunk at a time.
+
+- Resident memory stays flat: only the chunk being played and the one
+  queued behind it are held by the mixer, and pages already played are
+  dropped from the mapping with madvise(MADV_DONTNEED)
+- Seeking is arithmetic on the byte offset; nothing is re-read or decoded
+- pygame copies each chunk into its own buffer when a Sound is created;
+  that copy is bounded by the chunk size
+"""
+
+import os
+import mmap
+import time
+import struct
+import logging
+from typing import Optional
+
+import pygame
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+PAGE_SIZE = mmap.PAGESIZE
+# Reserved mixer channels: PCM playback and AudioOutput's callback probe
+# (Sound effects use the others)
+PCM_CHANNEL = 0
+PROBE_CHANNEL = 1
+RESERVED_CHANNELS = 2
+
+
+class WavInfo:
+    """Layout of a PCM WAV file's data chunk"""
+
+    __slots__ = ('data_offset', 'data_size', 'channels', 'rate', 'sample_width', 'block_align')
+
+    def __init__(self, data_offset, data_size, channels, rate, sample_width, block_align):
+        self.data_offset = data_offset
+        self.data_size = data_size
+        self.channels = channels
+        self.rate = rate
+        self.sample_width = sample_width
+        self.block_align = block_align
+
+    @property
+    def byte_rate(self) -> int:
+        return self.rate * self.block_align
+
+    @property
+    def frames(self) -> int:
+        return self.data_size // self.block_align
+
+    @property
+    def length(self) -> float:
+        return self.frames / self.rate if self.rate else 0.0
+
+
+def parse_wav(buf) -> WavInfo:
+    """Locate the fmt and data chunks of a RIFF/WAVE buffer without copying it
+
+    Raises ValueError for anything that is not integer PCM.
+    """
+    if len(buf) < 12 or buf[0:4] != b'RIFF' or buf[8:12] != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE file")
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(buf):
+        chunk_id = buf[pos:pos + 4]
+        size = struct.unpack_from('<I', buf, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b'fmt ':
+            if size < 16:
+                raise ValueError("Truncated fmt chunk")
+            tag, channels, rate, _byte_rate, block_align, bits = struct.unpack_from('<HHIIHH', buf, body)
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                tag = struct.unpack_from('<H', buf, body + 24)[0]
+            if tag != WAVE_FORMAT_PCM or not channels or not block_align:
+                raise ValueError(f"Unsupported WAV encoding {tag:#x}")
+            fmt = (channels, rate, (bits + 7) // 8, block_align)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("data chunk before fmt chunk")
+            # Writers that never patched the header leave 0 or 0xFFFFFFFF here
+            available = len(buf) - body
+            size = available if size == 0 or size > available else size
+            size -= size % fmt[3]
+            return WavInfo(body, size, *fmt)
+        pos = body + size + (size & 1)
+    raise ValueError("No data chunk")
+
+
+class PcmStream:
+    """Read-only memory map over the data chunk of a PCM WAV file"""
+
+    def __init__(self, file_path: str):
+        self.path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        try:
+            self.info = parse_wav(self._map)
+        except Exception:
+            self._map.close()
+            self._file.close()
+            raise
+        self._view = memoryview(self._map)
+        self._start = self.info.data_offset
+        self._end = self._start + self.info.data_size
+        self.offset = self._start
+        self._released = self._page_floor(self._start)
+        self._advise(getattr(mmap, 'MADV_SEQUENTIAL', None), 0, len(self._map))
+
+    @staticmethod
+    def _page_floor(offset: int) -> int:
+        return offset - offset % PAGE_SIZE
+
+    def _advise(self, option, start: int, length: int):
+        if option is None or length <= 0 or not hasattr(self._map, 'madvise'):
+            return
+        try:
+            self._map.madvise(option, start, length)
+        except (OSError, ValueError):
+            pass
+
+    def matches(self, rate: int, size: int, channels: int) -> bool:
+        """True when the data can be handed to a mixer opened with these settings"""
+        return (self.info.rate == rate and self.info.channels == channels
+                and self.info.sample_width * 8 == abs(size))
+
+    @property
+    def at_end(self) -> bool:
+        return self.offset >= self._end
+
+    def tell(self) -> float:
+        """Position of the next read in seconds"""
+        return (self.offset - self._start) / self.info.byte_rate
+
+    def seek(self, seconds: float):
+        frame = min(max(0, int(seconds * self.info.rate)), self.info.frames)
+        self.offset = self._start + frame * self.info.block_align
+        self._released = min(self._released, self._page_floor(self.offset))
+
+    def set_end(self, seconds: Optional[float] = None):
+        """Stop reading at seconds (None: the end of the data chunk)"""
+        end = self._start + self.info.data_size
+        if seconds is not None:
+            frame = min(max(0, int(seconds * self.info.rate)), self.info.frames)
+            end = self._start + frame * self.info.block_align
+        self._end = end
+
+    def read(self, nbytes: int) -> memoryview:
+        """View of the next nbytes of PCM data (empty at the end)
+
+        Pages before this read are dropped from memory; the caller must
+        release the view before the next read.
+        """
+        nbytes -= nbytes % self.info.block_align
+        start = self.offset
+        end = min(start + nbytes, self._end)
+        self.offset = end
+        release_to = self._page_floor(start)
+        if release_to > self._released:
+            self._advise(getattr(mmap, 'MADV_DONTNEED', None), self._released, release_to - self._released)
+            self._released = release_to
+        return self._view[start:end]
+
+    def close(self):
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            logger.debug("PCM stream closed with a view still exported")
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class PcmPlayback:
+    """Play a PcmStream on a reserved mixer channel in fixed-size chunks
+
+    One chunk plays while the next waits in the channel queue; pump() must
+    run more often than chunk_seconds (MusicPlayer.check_events does).
+    """
+
+    def __init__(self, stream: PcmStream, chunk_seconds: float = 1.0):
+        self.stream = stream
+        info = stream.info
+        self.chunk_bytes = max(1, int(info.rate * chunk_seconds)) * info.block_align
+        if pygame.mixer.get_num_channels() < RESERVED_CHANNELS:
+            pygame.mixer.set_num_channels(RESERVED_CHANNELS)
+        pygame.mixer.set_reserved(RESERVED_CHANNELS)
+        self.channel = pygame.mixer.Channel(PCM_CHANNEL)
+        self.paused = False
+        self.finished = False
+        self._current = None  # (start seconds, duration) of the playing chunk
+        self._pending = None  # same for the queued chunk
+        self._started = 0.0
+        self._paused_at = 0.0
+
+    def _next_chunk(self):
+        start = self.stream.tell()
+        view = self.stream.read(self.chunk_bytes)
+        try:
+            if not len(view):
+                return None
+            duration = len(view) / self.stream.info.byte_rate
+            return start, duration, pygame.mixer.Sound(buffer=view)
+        finally:
+            view.release()
+
+    def play(self, start_pos: float = 0.0, fade_ms: int = 0, end_pos: Optional[float] = None):
+        """Start (or restart) playback at start_pos seconds, ending at end_pos"""
+        self.channel.stop()
+        self.stream.set_end(end_pos)
+        self.stream.seek(start_pos)
+        self.paused = False
+        self.finished = False
+        self._pending = None
+        self._start_chunk(fade_ms)
+
+    def _start_chunk(self, fade_ms: int = 0):
+        chunk = self._next_chunk()
+        if chunk is None:
+            self._current = None
+            self.finished = True
+            return
+        start, duration, sound = chunk
+        self.channel.play(sound, fade_ms=fade_ms)
+        self._current = (start, duration)
+        self._started = time.perf_counter()
+        self._fill()
+
+    def _fill(self):
+        if self._pending is None and self.channel.get_queue() is None:
+            chunk = self._next_chunk()
+            if chunk is not None:
+                start, duration, sound = chunk
+                self.channel.queue(sound)
+                self._pending = (start, duration)
+
+    def pump(self) -> bool:
+        """Keep the channel queue full; returns True once the track has ended"""
+        if self.paused or self.finished:
+            return False
+        if self._pending is not None and self.channel.get_queue() is None:
+            # The mixer moved on to the queued chunk
+            self._started += self._current[1]
+            self._current, self._pending = self._pending, None
+        if not self.channel.get_busy():
+            if self.stream.at_end and self._pending is None:
+                self.finished = True
+                return True
+            # Pumped too late and the channel ran dry
+            metrics.inc('pcm_underruns_total')
+            self._pending = None
+            self._start_chunk()
+            return False
+        self._fill()
+        return False
+
+    def position(self) -> float:
+        if self._current is None:
+            return self.stream.tell()
+        now = self._paused_at if self.paused else time.perf_counter()
+        start, duration = self._current
+        return start + min(max(0.0, now - self._started), duration)
+
+    def pause(self):
+        if not self.paused:
+            self.channel.pause()
+            self._paused_at = time.perf_counter()
+            self.paused = True
+
+    def unpause(self):
+        if self.paused:
+            self.channel.unpause()
+            self._started += time.perf_counter() - self._paused_at
+            self.paused = False
+
+    def set_volume(self, volume: float):
+        self.channel.set_volume(volume)
+
+    def stop(self):
+        try:
+            self.channel.stop()
+        except Exception:
+            pass
+        self.stream.close()
+
+
+def open_for_mixer(file_path: str) -> Optional[PcmStream]:
+    """Map file_path if it is a PCM WAV in the mixer's current format, else None"""
+    if not file_path.lower().endswith('.wav'):
+        return None
+    init = pygame.mixer.get_init()
+    if not init:
+        return None
+    try:
+        stream = PcmStream(file_path)
+    except (OSError, ValueError) as e:
+        logger.debug(f"Not mapping {os.path.basename(file_path)}: {e}")
+        return None
+    if not stream.matches(*init):
+        stream.close()
+        return None
+    return stream
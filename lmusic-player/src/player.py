@@ -6,6 +6,17 @@ Core music player functionality using PyGame
 import pygame
 import os
 import logging
+import functools
+
+import cue
+import metrics
+from audio_output import AudioOutput
+from events import EventBus, PlaybackEnded, SongChanged
+from playlist import Playlist
+from undo import UndoHistory
+from jobs import PRIORITY_HIGH
+from pcm_stream import PcmPlayback, open_for_mixer
+from net_stream import is_stream_url, open_stream, stream_title
 
 # Import mutagen optionally; tests may run in environments without it
 try:
@@ -26,9 +37,25 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _undoable(label):
+    """Record the playlist edits made by a MusicPlayer method as one undo step"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with self.undo.step(label, self.current_index):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class MusicPlayer:
-    def __init__(self):
-        """Initialize the music player"""
+    def __init__(self, audio=None):
+        """Initialize the music player
+
+        audio: AudioSettings for the mixer (the low-latency profile by default)
+        """
+        # Opens the mixer, grows its buffer after underruns and times commands
+        self.output = AudioOutput(audio)
         # Initialize mixer lazily; tests may not have audio devices
         try:
             self.initialize_mixer()
@@ -36,17 +63,60 @@ class MusicPlayer:
             logger.warning("Mixer initialization failed during tests; continuing without audio")
 
         # Player state
-        self.playlist = []
+        # Undo/redo of playlist edits (follows whichever Playlist is assigned)
+        self.undo = UndoHistory()
+        self.playlist = Playlist()
+        # Leave out entries already queued (same file after normalization) when adding
+        self.skip_duplicates = False
         self.current_index = 0
         self.paused = False
         self.volume = 0.7
         self.current_position = 0
         self.song_length = 0
         self.is_playing = False
+        # Cached song lengths keyed by path (persisted in the session snapshot)
+        self.durations = {}
+        # Optional SessionJournal recording playlist edits for crash recovery
+        self.journal = None
+        # Optional TranscodeCache decoding formats the mixer handles poorly
+        self.transcoder = None
+        # Active memory-mapped PCM playback (mixer-format WAVs), else mixer.music is used
+        self._pcm = None
+        # Buffered reader feeding mixer.music for HTTP(S) playlist entries
+        self._stream = None
+        self.stream_options = {}
+        # Optional JobExecutor: streams are opened on it and started from its
+        # dispatcher instead of blocking play(); without one they open in place
+        self.jobs = None
+        # Bumped by play() and stop(); a deferred start for an older token is dropped
+        self._play_token = 0
+        # Token of the deferred start being waited for, and what to record once it plays
+        self._pending = None
+        self._pending_started = None
+        self._deferred = None  # the job submission, made once play() has finished
+        # Optional PlayHistory recording starts, completions, skips and seeks
+        self.history = None
+        self._history_track = None
+        # Optional provider of similar tracks (next_tracks(seeds, count, exclude))
+        # used to extend the playlist instead of wrapping around
+        self.autoplay = None
+        # Optional SilenceCache; tracks start and end at their audible audio
+        self.silence = None
+        # mixer.music: position the track was started at and where to cut it
+        self._music_offset = 0.0
+        self._trim_end = None
+        # Audio file behind the current entry and the entry's offset into it
+        # (non-zero for CUE sheet tracks); positions reported are relative to it
+        self._loaded_path = None
+        self._base = 0.0
+        # Optional BookmarkStore; long tracks resume where they were left
+        self.bookmarks = None
+        self._bookmark_path = None
+        # Tracks in a row that failed to load (while the mixer works)
+        self._failed_loads = 0
 
-        # Callbacks for UI updates
-        self.on_song_change = None
-        self.on_playback_end = None
+        # SongChanged and PlaybackEnded are published here for UIs and services
+        self.events = EventBus()
         # Mute support
         self.muted = False
         self._last_volume = self.volume
@@ -54,37 +124,75 @@ class MusicPlayer:
         logger.info("Music Player initialized")
         # If a playlist was restored externally, it can be loaded by UI
 
-    def initialize_mixer(self):
+    @property
+    def playlist(self):
+        return self._playlist
+
+    @playlist.setter
+    def playlist(self, entries):
+        # Plain lists assigned by callers get the path index as well
+        self._playlist = entries if isinstance(entries, Playlist) else Playlist(entries)
+        self.undo.attach(self._playlist)
+
+    def initialize_mixer(self, settings=None):
         """Initialize PyGame mixer with error handling"""
         try:
-            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
+            self.output.open(settings)
             logger.info("PyGame mixer initialized successfully")
         except pygame.error as e:
             logger.error(f"Could not initialize audio mixer: {e}")
             raise Exception(f"Audio system error: {e}")
 
+    @_undoable('Add Files')
     def add_files(self, file_paths):
-        """Add multiple files to playlist"""
-        added_count = 0
+        """Add multiple files to playlist
+
+        CUE sheets, and audio files with a sheet beside them, are added as
+        one virtual entry per track.
+        """
+        added = []
         audio_extensions = ('.mp3', '.wav', '.ogg', '.m4a', '.flac')
 
         for file_path in file_paths:
-            if os.path.isfile(file_path) and file_path.lower().endswith(audio_extensions):
-                self.playlist.append(file_path)
-                added_count += 1
+            if is_stream_url(file_path):
+                added.append(file_path)
+                logger.debug(f"Added stream to playlist: {file_path}")
+            elif cue.is_virtual(file_path) and cue.resolve(file_path) is not None:
+                added.append(file_path)
+            elif os.path.isfile(file_path) and file_path.lower().endswith('.cue'):
+                tracks = [t for t in cue.expand(file_path) if t not in added]
+                added.extend(tracks)
+                logger.debug(f"Added {len(tracks)} tracks from {os.path.basename(file_path)}")
+            elif os.path.isfile(file_path) and file_path.lower().endswith(audio_extensions):
+                sheet = cue.sheet_for(file_path)
+                if sheet is not None:
+                    added.extend(t for t in cue.expand(sheet) if t not in added)
+                else:
+                    added.append(file_path)
                 logger.debug(f"Added to playlist: {os.path.basename(file_path)}")
             else:
                 logger.warning(f"Skipped invalid file: {file_path}")
 
+        if self.skip_duplicates:
+            added = self.playlist.extend_unique(added)
+        else:
+            self.playlist.extend(added)
+        added_count = len(added)
+        if self.journal is not None:
+            self.journal.record_add(added)
         logger.info(f"Added {added_count} files to playlist")
         return added_count
 
+    @_undoable('Load Playlist')
     def load_playlist(self, file_paths):
         """Replace current playlist with provided list, return count"""
-        self.playlist = []
+        self.playlist.clear()
+        if self.journal is not None:
+            self.journal.record_clear()
         added = self.add_files(file_paths)
         return added
 
+    @_undoable('Add Folder')
     def add_folder(self, folder_path):
         """Add all audio files from folder to playlist"""
         if not os.path.isdir(folder_path):
@@ -94,16 +202,31 @@ class MusicPlayer:
         audio_extensions = ('.mp3', '.wav', '.ogg', '.m4a', '.flac')
 
         try:
-            for file in os.listdir(folder_path):
+            names = os.listdir(folder_path)
+            # Single-file rips are added track by track from their sheets
+            sheets = [os.path.join(folder_path, f) for f in names if f.lower().endswith('.cue')]
+            covered = set()
+            for sheet in sheets:
+                tracks = cue.expand(sheet)
+                if tracks:
+                    covered.update(os.path.abspath(t.audio_path) for t in cue.load_cue(sheet))
+                    audio_files.extend(tracks)
+            for file in names:
                 file_path = os.path.join(folder_path, file)
-                if os.path.isfile(file_path) and file.lower().endswith(audio_extensions):
+                if (os.path.isfile(file_path) and file.lower().endswith(audio_extensions)
+                        and os.path.abspath(file_path) not in covered):
                     audio_files.append(file_path)
         except PermissionError as e:
             raise Exception(f"Permission denied accessing folder: {e}")
         except Exception as e:
             raise Exception(f"Error reading folder: {e}")
 
-        self.playlist.extend(audio_files)
+        if self.skip_duplicates:
+            audio_files = self.playlist.extend_unique(audio_files)
+        else:
+            self.playlist.extend(audio_files)
+        if self.journal is not None:
+            self.journal.record_add(audio_files)
         logger.info(f"Added {len(audio_files)} files from folder: {folder_path}")
         return len(audio_files)
 
@@ -125,28 +248,93 @@ class MusicPlayer:
         try:
             file_path = self.playlist[self.current_index]
             logger.info(f"Playing: {os.path.basename(file_path)}")
+            # Restarting the same track at an offset is a seek; anything else ends the previous track
+            seeking = start_pos > 0 and file_path == self._history_track
+            if not seeking:
+                self._history_end(completed=False)
+                self._bookmark_end(completed=False)
+            streaming = is_stream_url(file_path)
+            track = cue.resolve(file_path) if cue.is_virtual(file_path) else None
+            if track is None and cue.is_virtual(file_path):
+                logger.warning(f"Cue track no longer available: {file_path}")
+                return False
+            audio_path = track.audio_path if track is not None else file_path
+            base = track.start if track is not None else 0.0
+            if self.bookmarks is not None and start_pos <= 0 and not streaming:
+                resume = self.bookmarks.get(file_path)
+                if resume:
+                    start_pos = resume
+                    metrics.inc('player_bookmark_resumes_total')
+            end_pos = None
+            if track is not None:
+                # Ends where the next track starts; check_events() cuts or carries on there
+                end_pos = track.end
+            elif self.silence is not None and not streaming:
+                bounds = self.silence.bounds(file_path)
+                if bounds is not None:
+                    if start_pos <= 0:
+                        start_pos = bounds[0]
+                    end_pos = bounds[1]
+                else:
+                    self.silence.ensure(file_path, priority=PRIORITY_HIGH)
+            self._trim_end = None
+            # Another track of the file that is already playing: seek, don't reload
+            in_stream = track is not None and self.is_playing and audio_path == self._loaded_path
+            self._base = base
 
-            # Stop any currently playing music
+            loaded = True
+            self._play_token += 1
+            self._pending = self._pending_started = self._deferred = None
             try:
-                # fade out any currently playing music slightly to avoid pops
-                try:
-                    pygame.mixer.music.fadeout(200)
-                except Exception:
-                    pass
+                if in_stream:
+                    with metrics.timer('player_play_seek_seconds'):
+                        self._seek_loaded(base + start_pos)
+                    # check_events() cuts the track or moves on to the next one here
+                    self._trim_end = end_pos
+                else:
+                    self._loaded_path = None
+                    if self.output.pending_backoff:
+                        # Underruns asked for a larger buffer; reopening cuts the old track anyway
+                        self._stop_pcm()
+                        self._close_stream()
+                        self.output.apply_backoff()
+                    # Stop any currently playing music; fade out slightly to avoid pops
+                    try:
+                        pygame.mixer.music.fadeout(200)
+                    except Exception:
+                        pass
 
-                pygame.mixer.music.load(file_path)
-                # Some formats/mixers support start position; if not, fallback
-                try:
-                    pygame.mixer.music.play(fade_ms=fade_ms, start=start_pos)
-                except TypeError:
-                    # Older pygame versions may not accept start on all formats
-                    pygame.mixer.music.play(fade_ms=fade_ms)
-            except Exception:
-                # In case mixer isn't initialized (e.g., headless tests), skip actual playback
-                logger.debug("Skipping real playback (mixer not available)")
+                    with metrics.timer('player_play_load_seconds'):
+                        self._close_stream()
+                        if streaming:
+                            self._play_stream(file_path, fade_ms, start_pos)
+                        else:
+                            self._play_file(audio_path, fade_ms, base + start_pos, end_pos, track is not None)
+                if self._pending is None:
+                    self._output_started()
+            except Exception as e:
+                metrics.inc('player_play_errors_total')
+                if pygame.mixer.get_init():
+                    # The mixer is up, so the file itself could not be played
+                    loaded = False
+                    logger.warning(f"Could not play {os.path.basename(file_path)}: {e}")
+                else:
+                    # In case mixer isn't initialized (e.g., headless tests), skip actual playback
+                    logger.debug("Skipping real playback (mixer not available)")
 
             self.paused = False
             self.is_playing = True
+            pending = self._pending is not None
+            if not loaded:
+                self._load_failed()
+            if self.journal is not None:
+                self.journal.record_position(self.current_index, start_pos)
+            if pending:
+                self._pending_started = functools.partial(self._track_started, file_path, start_pos, seeking, streaming)
+                # Reported by get_current_position() until the mixer has it
+                self.current_position = start_pos
+            elif loaded:
+                self._track_started(file_path, start_pos, seeking, streaming)
 
             # Get song length
             self.song_length = self.get_song_length(file_path)
@@ -157,51 +345,310 @@ class MusicPlayer:
             except Exception:
                 pass
 
-            # Notify UI about song change
-            if self.on_song_change:
-                self.on_song_change(self.get_current_song_info())
+            # Subscribers are notified asynchronously; tags are read on their side
+            self._song_changed()
+
+            # Set up end event detection if mixer exists (a deferred start does it once playing)
+            if not pending:
+                try:
+                    pygame.mixer.music.set_endevent(pygame.USEREVENT)
+                except Exception:
+                    pass
+            else:
+                deferred, self._deferred = self._deferred, None
+                deferred()
+
+            self.prefetch()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error playing file: {e}")
+            raise
+
+    def _track_started(self, file_path, start_pos, seeking, streaming):
+        """Record the start (or seek) of a track that is now playing"""
+        self._failed_loads = 0
+        if self.history is not None:
+            if seeking:
+                self.history.record_seek(file_path, start_pos)
+            else:
+                self.history.record_start(file_path)
+                self._history_track = file_path
+        if not streaming:
+            self._bookmark_path = file_path
 
-            # Set up end event detection if mixer exists
+    def _load_failed(self):
+        """Count a track that could not be played
+
+        It is reported as ended once so front-ends move on, unless nothing
+        in the playlist plays; then playback stops.
+        """
+        self._failed_loads += 1
+        if self._failed_loads >= len(self.playlist):
+            logger.warning("No playable tracks in the playlist; stopping")
+            self.is_playing = False
+
+    def _output_started(self):
+        self.output.start()
+        self.output.mark('play')
+
+    def _start_later(self, prepare, args, start, discard=None, pool='io'):
+        """Run prepare(*args) on self.jobs, then start(result) through its dispatcher
+
+        play() returns right away and submits the job once it is done. A result
+        arriving after another play() or stop() is handed to discard() instead;
+        a failure counts as a track that could not be loaded.
+        """
+        token = self._play_token
+        self._pending = token
+        try:
+            # The outgoing track fades out without reporting an end
+            pygame.mixer.music.set_endevent()
+        except Exception:
+            pass
+
+        def finish(result):
+            if self._pending != token:
+                if discard is not None:
+                    discard(result)
+                return
+            try:
+                start(result)
+            except Exception as e:
+                if discard is not None:
+                    discard(result)
+                failed(e)
+                return
+            self._pending = None
+            started, self._pending_started = self._pending_started, None
+            if started is not None:
+                started()
             try:
+                if self.paused:
+                    if self._pcm is not None:
+                        self._pcm.pause()
+                    pygame.mixer.music.pause()
                 pygame.mixer.music.set_endevent(pygame.USEREVENT)
             except Exception:
                 pass
+            self._output_started()
+
+        def failed(error):
+            if self._pending != token:
+                return
+            self._pending = self._pending_started = None
+            metrics.inc('player_play_errors_total')
+            if pygame.mixer.get_init():
+                logger.warning(f"Could not start playback: {error}")
+                self._load_failed()
+            else:
+                logger.debug("Skipping real playback (mixer not available)")
+
+        self._deferred = functools.partial(self.jobs.submit, prepare, *args, priority=PRIORITY_HIGH, pool=pool,
+                                           callback=finish, error_callback=failed)
 
+    def resume(self):
+        """Play the current entry from current_position (set by session restore)"""
+        return self.play(self.current_index, start_pos=max(0.0, float(self.current_position or 0.0)))
+
+    def _play_pcm(self, path, fade_ms, start_pos, end_pos=None):
+        """Play a mixer-format WAV from a memory map; False to use mixer.music"""
+        if self._pcm is not None and self._pcm.stream.path == path:
+            # Same track: seeking only moves the offset into the existing mapping
+            self._pcm.play(start_pos, fade_ms, end_pos)
             return True
+        self._stop_pcm()
+        stream = open_for_mixer(path)
+        if stream is None:
+            return False
+        self._pcm = PcmPlayback(stream)
+        self._pcm.set_volume(self.volume)
+        self._pcm.play(start_pos, fade_ms, end_pos)
+        return True
 
+    def _play_file(self, audio_path, fade_ms, start_pos, end_pos, cue_track=False):
+        """Load audio_path and play it from start_pos; end_pos is where to stop (None: the end)
+
+        A track that has to be decoded first is decoded on self.jobs and
+        started once it is in the transcode cache.
+        """
+        if self.jobs is not None and self.transcoder is not None and self.transcoder.needs_decode(audio_path):
+            self._stop_pcm()
+            self._start_later(self.transcoder.transcode, (audio_path,),
+                              lambda _cached: self._start_file(audio_path, fade_ms, start_pos, end_pos, cue_track),
+                              pool='cpu')
+        else:
+            self._start_file(audio_path, fade_ms, start_pos, end_pos, cue_track)
+
+    def _start_file(self, audio_path, fade_ms, start_pos, end_pos, cue_track):
+        load_path = audio_path
+        if self.transcoder is not None:
+            load_path = self.transcoder.resolve(audio_path)
+        # A CUE track keeps decoding into the next one; check_events() decides at end_pos
+        if self._play_pcm(load_path, fade_ms, start_pos, None if cue_track else end_pos):
+            if cue_track:
+                self._trim_end = end_pos
+        else:
+            pygame.mixer.music.load(load_path)
+            # Some formats/mixers support start position; if not, fallback
+            try:
+                pygame.mixer.music.play(fade_ms=fade_ms, start=start_pos)
+                self._music_offset = start_pos
+            except TypeError:
+                # Older pygame versions may not accept start on all formats
+                pygame.mixer.music.play(fade_ms=fade_ms)
+                self._music_offset = 0.0
+            # check_events() cuts the track here
+            self._trim_end = end_pos
+        self._loaded_path = audio_path
+
+    def _seek_loaded(self, position):
+        """Move playback of the loaded file to position (seconds into the file)"""
+        if self.paused:
+            self.unpause()
+        if self._pcm is not None:
+            self._pcm.play(position)
+            return
+        try:
+            # get_pos() keeps counting from the original play() call
+            pygame.mixer.music.set_pos(position)
+            self._music_offset = position - pygame.mixer.music.get_pos() / 1000.0
+        except pygame.error:
+            # Formats without seek support restart decoding at the offset
+            pygame.mixer.music.play(start=position)
+            self._music_offset = position
+
+    def _play_stream(self, url, fade_ms, start_pos):
+        """Buffer an HTTP(S) stream (or radio playlist) and hand it to mixer.music
+
+        With self.jobs the playlist lookup and prefetch run there and playback
+        starts once the buffer is ready.
+        """
+        self._stop_pcm()
+        if self.jobs is None:
+            self._start_stream(self._open_stream(url), fade_ms, start_pos)
+        else:
+            self._start_later(self._open_stream, (url,),
+                              lambda stream: self._start_stream(stream, fade_ms, start_pos),
+                              discard=lambda stream: stream.close())
+
+    def _open_stream(self, url):
+        """Resolve a radio playlist, connect and prefetch (waits on the network)"""
+        try:
+            stream = open_stream(url, **self.stream_options)
         except Exception as e:
-            logger.error(f"Error playing file: {e}")
+            logger.warning(f"Could not open stream {url}: {e}")
+            raise
+        try:
+            stream.wait_ready()
+        except Exception:
+            stream.close()
             raise
+        return stream
+
+    def _start_stream(self, stream, fade_ms, start_pos):
+        """Hand a prefetched stream to mixer.music"""
+        try:
+            pygame.mixer.music.load(stream, stream.namehint)
+            # Only finite files served with range support can start at an offset
+            start_pos = start_pos if stream.seekable() else 0.0
+            pygame.mixer.music.play(fade_ms=fade_ms, start=start_pos)
+        except Exception:
+            stream.close()
+            raise
+        self._stream = stream
+        self._music_offset = start_pos
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _history_end(self, completed):
+        """Record how the track whose start was recorded ended (once)"""
+        path, self._history_track = self._history_track, None
+        if path is None or self.history is None:
+            return
+        if completed:
+            self.history.record_complete(path, self.song_length)
+        else:
+            self.history.record_skip(path, self.get_current_position())
+
+    def _bookmark_end(self, completed):
+        """Save (or clear, once played out) the resume position of the outgoing track"""
+        path, self._bookmark_path = self._bookmark_path, None
+        if path is None or self.bookmarks is None:
+            return
+        if completed:
+            self.bookmarks.clear(path)
+        else:
+            self.bookmarks.update(path, self.get_current_position(), self.song_length, force=True)
+
+    def _stop_pcm(self):
+        if self._pcm is not None:
+            self._pcm.stop()
+            self._pcm = None
+
+    def prefetch(self, count=3, include_current=False):
+        """Queue background decodes and silence scans for the next count tracks"""
+        if (self.transcoder is None and self.silence is None) or not self.playlist:
+            return
+        n = len(self.playlist)
+        start = 0 if include_current else 1
+        upcoming = [self.playlist[(self.current_index + i) % n] for i in range(start, min(count + 1, n))]
+        upcoming = [p for p in upcoming if not is_stream_url(p)]
+        if self.transcoder is not None:
+            # Tracks of one CUE sheet share a file; decode it once
+            self.transcoder.prefetch(list(dict.fromkeys(cue.audio_path(p) for p in upcoming)))
+        if self.silence is not None:
+            # CUE tracks play their exact span
+            self.silence.prefetch([p for p in upcoming if not cue.is_virtual(p)])
 
     def pause(self):
         """Pause current song"""
         if self.is_playing and not self.paused:
+            if self.bookmarks is not None and self._bookmark_path is not None:
+                self.bookmarks.update(self._bookmark_path, self.get_current_position(), self.song_length, force=True)
+            if self._pcm is not None:
+                self._pcm.pause()
             try:
                 pygame.mixer.music.pause()
             except Exception:
                 pass
+            self.output.mark('pause')
             self.paused = True
             logger.debug("Playback paused")
 
     def unpause(self):
         """Unpause current song"""
         if self.paused:
+            if self._pcm is not None:
+                self._pcm.unpause()
             try:
                 pygame.mixer.music.unpause()
             except Exception:
                 pass
+            self.output.mark('unpause')
             self.paused = False
             logger.debug("Playback resumed")
 
     def stop(self):
         """Stop playback"""
+        self._play_token += 1
+        self._pending = self._pending_started = self._deferred = None
+        self._bookmark_end(completed=False)
+        self._stop_pcm()
         try:
             pygame.mixer.music.stop()
         except Exception:
             pass
+        self._close_stream()
+        self.output.stop()
         self.paused = False
         self.is_playing = False
         self.current_position = 0
+        self._trim_end = None
+        self._loaded_path = None
         logger.debug("Playback stopped")
 
     def next(self):
@@ -209,10 +656,25 @@ class MusicPlayer:
         if not self.playlist:
             return False
 
+        # After a track ends on its own this is a no-op (already recorded complete)
+        self._history_end(completed=False)
+        if self.current_index >= len(self.playlist) - 1 and self.autoplay is not None:
+            if self._extend_similar():
+                self.current_index += 1
+                return self.play(fade_ms=500)
         self.current_index = (self.current_index + 1) % len(self.playlist)
         logger.debug(f"Next song - index: {self.current_index}")
         return self.play(fade_ms=500)
 
+    def _extend_similar(self, seeds=5):
+        """Append a track similar to the last few played; False if none was found"""
+        try:
+            picks = self.autoplay.next_tracks(self.playlist[-seeds:], count=1, exclude=set(self.playlist))
+        except Exception as e:
+            logger.warning(f"Autoplay failed: {e}")
+            return False
+        return bool(picks) and self.add_files(picks) > 0
+
     def previous(self):
         """Play previous song in playlist"""
         if not self.playlist:
@@ -225,10 +687,13 @@ class MusicPlayer:
     def set_volume(self, volume):
         """Set volume level (0.0 to 1.0)"""
         self.volume = max(0.0, min(1.0, volume))
+        if self._pcm is not None:
+            self._pcm.set_volume(self.volume)
         try:
             pygame.mixer.music.set_volume(self.volume)
         except Exception:
             pass
+        self.output.mark('volume')
         logger.debug(f"Volume set to: {self.volume}")
 
     def toggle_mute(self):
@@ -245,58 +710,108 @@ class MusicPlayer:
             pass
 
     def get_current_position(self):
-        """Get current playback position in seconds"""
-        if not self.is_playing or self.paused:
+        """Get current playback position in seconds (from the start of a CUE track)"""
+        if self._pcm is not None and self.is_playing:
+            # Exact, including the start offset and time spent paused
+            return self._pcm.position() - self._base
+        if not self.is_playing or self.paused or self._pending is not None:
             return self.current_position
 
         try:
-            # PyGame returns position in milliseconds
-            return pygame.mixer.music.get_pos() / 1000.0
+            # PyGame returns milliseconds since play(), not counting the start offset
+            return self._music_offset + pygame.mixer.music.get_pos() / 1000.0 - self._base
         except Exception:
             return self.current_position
 
     def get_song_length(self, file_path):
         """Get song length in seconds using mutagen"""
+        if is_stream_url(file_path):
+            return 0
+        if cue.is_virtual(file_path):
+            track = cue.resolve(file_path)
+            if track is None:
+                return 0
+            if track.end is None:
+                # The last track runs to the end of the audio file
+                return int(track.length(self.get_song_length(track.audio_path)))
+            return int(track.length())
+        cached = self.durations.get(file_path)
+        if cached is not None:
+            metrics.inc('player_length_cache_hits_total')
+            return cached
+        metrics.inc('player_length_cache_misses_total')
         try:
             if File is None:
                 return 0
-            if file_path.lower().endswith('.mp3') and MP3 is not None:
-                audio = MP3(file_path)
-            elif file_path.lower().endswith('.flac') and FLAC is not None:
-                audio = FLAC(file_path)
-            elif file_path.lower().endswith('.ogg') and OggVorbis is not None:
-                audio = OggVorbis(file_path)
-            elif file_path.lower().endswith('.m4a') and MP4 is not None:
-                audio = MP4(file_path)
-            else:
-                audio = File(file_path) if File is not None else None
+            with metrics.timer('player_song_length_seconds'):
+                if file_path.lower().endswith('.mp3') and MP3 is not None:
+                    audio = MP3(file_path)
+                elif file_path.lower().endswith('.flac') and FLAC is not None:
+                    audio = FLAC(file_path)
+                elif file_path.lower().endswith('.ogg') and OggVorbis is not None:
+                    audio = OggVorbis(file_path)
+                elif file_path.lower().endswith('.m4a') and MP4 is not None:
+                    audio = MP4(file_path)
+                else:
+                    audio = File(file_path) if File is not None else None
 
             if audio is not None and hasattr(audio, 'info'):
-                return int(getattr(audio.info, 'length', 0))
+                length = int(getattr(audio.info, 'length', 0))
+                self.durations[file_path] = length
+                return length
         except Exception as e:
             logger.warning(f"Could not get song length for {file_path}: {e}")
 
         return 0  # Unknown length
 
+    def _song_changed(self):
+        self.events.publish(SongChanged(self.current_index, self.playlist[self.current_index], self))
+
+    def _playback_ended(self):
+        path = self.playlist[self.current_index] if 0 <= self.current_index < len(self.playlist) else None
+        self.events.publish(PlaybackEnded(self.current_index, path))
+
     def get_current_song_info(self):
         """Get info about currently playing song"""
         if not self.playlist or self.current_index >= len(self.playlist):
             return None
+        return self.song_info(self.playlist[self.current_index])
 
-        file_path = self.playlist[self.current_index]
+    def song_info(self, file_path):
+        """Title, artist, length and position for a playlist entry (reads tags)"""
         file_name = os.path.basename(file_path)
+        if is_stream_url(file_path):
+            return {
+                'file_path': file_path,
+                'file_name': stream_title(file_path),
+                'title': stream_title(file_path),
+                'artist': 'Internet Stream',
+                'length': 0,
+                'position': self.get_current_position()
+            }
+        track = cue.resolve(file_path) if cue.is_virtual(file_path) else None
+        if track is not None:
+            return {
+                'file_path': file_path,
+                'file_name': cue.display_name(file_path),
+                'title': track.title,
+                'artist': track.performer or 'Unknown Artist',
+                'length': self.song_length,
+                'position': self.get_current_position()
+            }
 
         try:
             title = file_name
             artist = 'Unknown Artist'
             if File is not None:
                 audio = None
-                if file_path.lower().endswith('.mp3') and MP3 is not None:
-                    audio = MP3(file_path)
-                elif file_path.lower().endswith('.flac') and FLAC is not None:
-                    audio = FLAC(file_path)
-                else:
-                    audio = File(file_path)
+                with metrics.timer('player_tag_read_seconds'):
+                    if file_path.lower().endswith('.mp3') and MP3 is not None:
+                        audio = MP3(file_path)
+                    elif file_path.lower().endswith('.flac') and FLAC is not None:
+                        audio = FLAC(file_path)
+                    else:
+                        audio = File(file_path)
 
                 if audio is not None:
                     # Many mutagen types expose tags differently; attempt common fields
@@ -320,17 +835,23 @@ class MusicPlayer:
             'position': self.get_current_position()
         }
 
+    @_undoable('Clear Playlist')
     def clear_playlist(self):
         """Clear the playlist"""
         self.stop()
         self.playlist.clear()
         self.current_index = 0
+        if self.journal is not None:
+            self.journal.record_clear()
         logger.info("Playlist cleared")
 
+    @_undoable('Remove')
     def remove_from_playlist(self, index):
         """Remove song from playlist at specified index"""
         if 0 <= index < len(self.playlist):
             removed_file = self.playlist.pop(index)
+            if self.journal is not None:
+                self.journal.record_remove(index)
 
             # Adjust current index if needed
             if index < self.current_index:
@@ -346,24 +867,184 @@ class MusicPlayer:
             return True
         return False
 
+    @_undoable('Move')
+    def move(self, index, new_index):
+        """Move song at index to new_index, keeping the current song selected"""
+        if not (0 <= index < len(self.playlist) and 0 <= new_index < len(self.playlist)):
+            return False
+        if index == new_index:
+            return True
+        self.playlist.insert(new_index, self.playlist.pop(index))
+        if self.current_index == index:
+            self.current_index = new_index
+        elif index < self.current_index <= new_index:
+            self.current_index -= 1
+        elif new_index <= self.current_index < index:
+            self.current_index += 1
+        if self.journal is not None:
+            self.journal.record_move(index, new_index)
+        return True
+
+    @_undoable('Reorder')
+    def reorder(self, order):
+        """Rearrange the playlist so that position i holds the song at order[i]"""
+        if sorted(order) != list(range(len(self.playlist))):
+            return False
+        current = self.current_index
+        # Slice assignment reuses the index keys of the existing entries
+        self.playlist[:] = [self.playlist[i] for i in order]
+        if 0 <= current < len(order):
+            self.current_index = order.index(current)
+        if self.journal is not None:
+            self.journal.record_clear()
+            self.journal.record_add(self.playlist)
+            self.journal.record_position(self.current_index, self.get_current_position())
+        return True
+
+    def undo_edit(self):
+        """Revert the last playlist edit; returns its label, or None when there is none"""
+        return self._apply_history(self.undo.undo, 'Undid')
+
+    def redo_edit(self):
+        """Apply the last undone playlist edit again; returns its label or None"""
+        return self._apply_history(self.undo.redo, 'Redid')
+
+    def _apply_history(self, action, verb):
+        playing = None
+        if self.is_playing and 0 <= self.current_index < len(self.playlist):
+            playing = self.playlist[self.current_index]
+        result = action(self.current_index)
+        if result is None:
+            return None
+        label, index = result
+        # Keep the track that is playing selected wherever it now is
+        position = self.playlist.position(playing) if playing is not None else None
+        if position is None:
+            position = min(index, len(self.playlist) - 1) if self.playlist else 0
+        self.current_index = max(0, position)
+        if self.journal is not None:
+            self.journal.record_clear()
+            self.journal.record_add(list(self.playlist))
+            self.journal.record_position(self.current_index, self.get_current_position())
+        logger.info(f"{verb} playlist edit: {label}")
+        return label
+
     def check_events(self):
         """Check for music events (like song end)"""
-        try:
-            for event in pygame.event.get():
-                if event.type == pygame.USEREVENT:  # Song ended
-                    logger.debug("Song ended event received")
-                    if self.on_playback_end:
-                        self.on_playback_end()
-                    return True
-        except Exception:
-            pass
+        if self.bookmarks is not None and self._bookmark_path is not None and self.is_playing and not self.paused:
+            # Throttled by the store to one position per interval
+            self.bookmarks.update(self._bookmark_path, self.get_current_position(), self.song_length)
+        if self._pcm is not None and self._pcm.pump():
+            self._stop_pcm()
+            self.is_playing = False
+            logger.debug("Song ended (PCM stream)")
+            self._history_end(completed=True)
+            self._bookmark_end(completed=True)
+            self._playback_ended()
+            return True
+        if (self._trim_end is not None and self.is_playing and not self.paused
+                and self._base + self.get_current_position() >= self._trim_end):
+            if self._continue_cue():
+                return False
+            # Only silence (or the next CUE track) is left; end the track now instead of playing it out
+            self._trim_end = None
+            self._stop_pcm()
+            try:
+                # Stopping would post the end event as well
+                pygame.mixer.music.set_endevent()
+                pygame.mixer.music.stop()
+            except Exception:
+                pass
+            self._loaded_path = None
+            self.is_playing = False
+            logger.debug("Song ended (end offset reached)")
+            self._history_end(completed=True)
+            self._bookmark_end(completed=True)
+            self._playback_ended()
+            return True
+        if self._music_ended():
+            logger.debug("Song ended event received")
+            self._close_stream()
+            self.is_playing = False
+            self._history_end(completed=True)
+            self._bookmark_end(completed=True)
+            self._playback_ended()
+            return True
         return False
 
-    def shutdown(self):
-        """Cleanup resources"""
-        self.stop()
+    def next_event_in(self):
+        """Seconds until check_events() next has work to do; None while nothing plays
+
+        Lets a front-end sleep between checks instead of polling: queued PCM
+        chunks need topping up within half a chunk, trimmed and CUE tracks end
+        at their offset, and mixer.music has no other way to report its end.
+        """
+        if not self.is_playing or self.paused:
+            return None
+        wait = 0.5
+        if self._trim_end is not None:
+            remaining = self._trim_end - (self._base + self.get_current_position())
+            wait = min(wait, max(0.0, remaining))
+        return wait
+
+    def _music_ended(self):
+        """True once mixer.music has finished the current track"""
+        if self._pending is not None:
+            # Still opening; nothing has been handed to the mixer yet
+            return False
         try:
-            pygame.mixer.quit()
-        except Exception:
+            return any(event.type == pygame.USEREVENT for event in pygame.event.get())
+        except pygame.error:
             pass
+        # Without a video system (terminal front-end) the end event is never posted
+        try:
+            return (self.is_playing and not self.paused and self._pcm is None
+                    and not pygame.mixer.music.get_busy())
+        except pygame.error:
+            return False
+
+    def _continue_cue(self):
+        """Move on to the next CUE track in place when it starts where this one ends
+
+        The audio keeps playing, so the transition is gapless; only the
+        playlist state changes. False when the next entry is elsewhere.
+        """
+        if self.current_index + 1 >= len(self.playlist):
+            return False
+        current = cue.resolve(self.playlist[self.current_index])
+        following_path = self.playlist[self.current_index + 1]
+        following = cue.resolve(following_path)
+        if current is None or not cue.contiguous(current, following):
+            return False
+        self._history_end(completed=True)
+        self._bookmark_end(completed=True)
+        self.current_index += 1
+        self._base = following.start
+        self._trim_end = following.end
+        self.song_length = self.get_song_length(following_path)
+        metrics.inc('player_cue_transitions_total')
+        if self.journal is not None:
+            self.journal.record_position(self.current_index, 0.0)
+        if self.history is not None:
+            self.history.record_start(following_path)
+            self._history_track = following_path
+        self._bookmark_path = following_path
+        self._song_changed()
+        self.prefetch()
+        return True
+
+    def shutdown(self, quit_mixer=True):
+        """Cleanup resources
+
+        quit_mixer=False leaves the process-wide mixer open for other players;
+        whoever owns it quits it once the last of them has shut down.
+        """
+        self.stop()
+        report = self.output.report()
+        if report['latency_ms']:
+            logger.info(f"Audio output latency (median ms): {report['latency_ms']}; underruns: {report['underruns']}")
+        if quit_mixer:
+            self.output.close()
+        else:
+            self.output.stop()
         logger.info("Music player shutdown complete")
\ No newline at end of file
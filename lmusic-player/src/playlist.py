@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+The player's playlist: a list of entries with a normalized-path index
+
+Playlist is a list subclass, so code that edits player.playlist directly
+(journal replay, session restore, the UIs) keeps working with append,
+extend, insert, pop, clear and slicing; every mutation also updates a
+hash index keyed by the normalized path:
+
+- os.path.realpath (symlinks and '..' resolved; directories are resolved
+  once and cached, so a file costs one lstat), os.path.normcase (folds
+  case where the filesystem does) and Unicode NFC, so 'Café' typed and
+  'Café' decomposed by a macOS volume are the same file
+- CUE virtual entries normalize their sheet path; stream URLs are kept
+  as they are
+
+`path in playlist` and count_of() are O(1) through a key -> count map.
+position() is O(1): first positions are kept up to date for appends and
+rebuilt in one pass on the first lookup after an edit in the middle.
+extend_unique() appends only entries not queued yet (nor repeated in the
+batch), which is what MusicPlayer's skip-duplicates mode uses.
+
+An optional listener(op, *args) is told about every edit as 'extend'
+(paths, keys), 'insert' (index, path, key), 'delete' (start, stop) or
+'replace' (paths, keys); UndoHistory uses it to follow the playlist.
+"""
+
+import os
+import unicodedata
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional
+
+import cue
+from net_stream import is_stream_url
+
+_SEP = os.sep
+
+@lru_cache(maxsize=4096)
+def _real_dir(folder: str) -> str:
+    return os.path.realpath(folder)
+
+
+def normalize_path(path: str) -> str:
+    """Index key for a playlist entry"""
+    if is_stream_url(path):
+        return path
+    parts = cue.split_virtual(path)
+    if parts is not None:
+        return f"{normalize_path(parts[0])}#{parts[1]}"
+    if (not os.path.isabs(path) or _SEP + '.' in path or _SEP + _SEP in path
+            or (os.altsep and os.altsep in path)):
+        path = os.path.abspath(path)
+    # Already absolute and clean (the common case): skip the posixpath helpers
+    folder, _sep, name = path.rpartition(_SEP)
+    real = _real_dir(folder or _SEP).rstrip(_SEP) + _SEP + name
+    if os.path.islink(real):
+        real = os.path.realpath(real)
+    return unicodedata.normalize('NFC', os.path.normcase(real))
+
+
+class Playlist(list):
+    """List of playlist entries kept in sync with a normalized-path index"""
+
+    def __init__(self, entries: Iterable[str] = ()):
+        super().__init__()
+        self._keys: List[str] = []
+        self._counts: Dict[str, int] = {}
+        # key -> first position; None until rebuilt after a mid-list edit
+        self._positions: Optional[Dict[str, int]] = {}
+        self.listener: Optional[Callable] = None
+        self.extend(entries)
+
+    # ------------------ lookups ------------------
+    def __contains__(self, path) -> bool:
+        return isinstance(path, str) and normalize_path(path) in self._counts
+
+    def count_of(self, path: str) -> int:
+        """How many entries refer to the same file as path"""
+        return self._counts.get(normalize_path(path), 0)
+
+    def position(self, path: str) -> Optional[int]:
+        """Index of the first entry referring to path, or None"""
+        if self._positions is None:
+            positions = {}
+            for i, key in enumerate(self._keys):
+                positions.setdefault(key, i)
+            self._positions = positions
+        return self._positions.get(normalize_path(path))
+
+    def index_keys(self) -> List[str]:
+        """Normalized keys of the entries, in playlist order"""
+        return list(self._keys)
+
+    # ------------------ index upkeep ------------------
+    def _count(self, keys: Iterable[str], delta: int):
+        counts = self._counts
+        for key in keys:
+            n = counts.get(key, 0) + delta
+            if n > 0:
+                counts[key] = n
+            else:
+                counts.pop(key, None)
+
+    def _known(self) -> Dict[str, str]:
+        """entry -> key, taken before a reordering so entries are not resolved again"""
+        return dict(zip(super().__iter__(), self._keys))
+
+    def _reindex(self, known: Dict[str, str]):
+        known_key = known.get
+        self._keys = [known_key(path) or normalize_path(path) for path in super().__iter__()]
+        self._counts = {}
+        self._count(self._keys, 1)
+        self._positions = None
+        self._changed('replace', list(self), list(self._keys))
+
+    def _changed(self, op: str, *args):
+        if self.listener is not None:
+            self.listener(op, *args)
+
+    def restore(self, paths: List[str], keys: List[str]):
+        """Replace the contents with paths whose keys are already known"""
+        super().__setitem__(slice(None), paths)
+        self._keys = list(keys)
+        self._counts = {}
+        self._count(self._keys, 1)
+        self._positions = None
+        self._changed('replace', paths, keys)
+
+    # ------------------ mutations ------------------
+    def append(self, path: str):
+        key = normalize_path(path)
+        if self._positions is not None:
+            self._positions.setdefault(key, len(self))
+        super().append(path)
+        self._keys.append(key)
+        self._count((key,), 1)
+        self._changed('extend', [path], [key])
+
+    def extend(self, paths: Iterable[str]):
+        paths = list(paths)
+        self._extend(paths, [normalize_path(path) for path in paths])
+
+    def extend_unique(self, paths: Iterable[str]) -> List[str]:
+        """Append the paths not queued yet (first occurrence wins); returns them"""
+        counts = self._counts
+        fresh, keys = [], []
+        batch = set()
+        for path in paths:
+            key = normalize_path(path)
+            if key not in counts and key not in batch:
+                batch.add(key)
+                fresh.append(path)
+                keys.append(key)
+        self._extend(fresh, keys)
+        return fresh
+
+    def _extend(self, paths: List[str], keys: List[str]):
+        if self._positions is not None:
+            for offset, key in enumerate(keys, len(self)):
+                self._positions.setdefault(key, offset)
+        super().extend(paths)
+        self._keys.extend(keys)
+        self._count(keys, 1)
+        self._changed('extend', paths, keys)
+
+    def __iadd__(self, paths):
+        self.extend(paths)
+        return self
+
+    def insert(self, index: int, path: str):
+        key = normalize_path(path)
+        n = len(self)
+        # Where list.insert puts it (out of range indexes clamp)
+        at = max(0, min(index + n if index < 0 else index, n))
+        super().insert(index, path)
+        self._keys.insert(index, key)
+        self._count((key,), 1)
+        self._positions = None
+        self._changed('insert', at, path, key)
+
+    def pop(self, index: int = -1) -> str:
+        path = super().pop(index)
+        key = self._keys.pop(index)
+        self._count((key,), -1)
+        at = index + len(self) + 1 if index < 0 else index
+        if at != len(self):
+            self._positions = None
+        elif self._positions is not None and self._positions.get(key) == len(self):
+            del self._positions[key]
+        self._changed('delete', at, at + 1)
+        return path
+
+    def remove(self, path: str):
+        del self[super().index(path)]
+
+    def clear(self):
+        super().clear()
+        self._keys.clear()
+        self._counts.clear()
+        self._positions = {}
+        self._changed('replace', [], [])
+
+    def __delitem__(self, index):
+        n = len(self)
+        super().__delitem__(index)
+        if isinstance(index, slice):
+            removed = self._keys[index]
+            del self._keys[index]
+            self._count(removed, -1)
+            start, stop, step = index.indices(n)
+            if step == 1:
+                self._changed('delete', start, max(start, stop))
+            else:
+                self._changed('replace', list(self), list(self._keys))
+        else:
+            self._count((self._keys.pop(index),), -1)
+            at = index + n if index < 0 else index
+            self._changed('delete', at, at + 1)
+        self._positions = None
+
+    def __setitem__(self, index, value):
+        known = self._known()
+        super().__setitem__(index, value)
+        self._reindex(known)
+
+    def sort(self, *args, **kwargs):
+        known = self._known()
+        super().sort(*args, **kwargs)
+        self._reindex(known)
+
+    def reverse(self):
+        super().reverse()
+        self._keys.reverse()
+        self._positions = None
+        self._changed('replace', list(self), list(self._keys))
+
+    def __imul__(self, n):
+        known = self._known()
+        super().__imul__(n)
+        self._reindex(known)
+        return self
+
+    def __reduce_ex__(self, protocol):
+        # Pickles (and copies) as a Playlist built from its entries
+        return (type(self), (list(self),))
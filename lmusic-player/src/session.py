@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Binary session snapshot for Python Music Player
+
+Session state (playlist paths, current index, position and cached
+durations) is kept out of config.json in a compact, versioned
+binary file that can be memory-mapped on startup.
+
+File layout (little endian):
+    header     magic, version, flags, count, current index, position, blob size,
+               journal generation (version 2+)
+    offsets    (count + 1) x uint64 byte offsets into the path blob
+    (order)    count x uint32, versions 1 and 2 only; never used, skipped on load
+    durations  count x float32 cached lengths in seconds, -1.0 when unknown
+    blob       NUL separated, filesystem encoded paths
+"""
+
+import os
+import sys
+import mmap
+import struct
+import logging
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LMSS'
+VERSION = 3
+HEADER_V1 = struct.Struct('<4sHHIIdQ')
+HEADER = struct.Struct('<4sHHIIdQQ')
+UNKNOWN_DURATION = -1.0
+
+_NATIVE_LITTLE = sys.byteorder == 'little'
+
+
+def _pack_array(typecode: str, values) -> bytes:
+    """Pack values into little endian bytes"""
+    arr = array(typecode, values)
+    if not _NATIVE_LITTLE:
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _view_array(buf, typecode: str, start: int, count: int):
+    """Return a read-only typed view over buf, copying only on big endian hosts"""
+    size = array(typecode).itemsize
+    raw = memoryview(buf)[start:start + count * size]
+    if _NATIVE_LITTLE:
+        return raw.cast(typecode)
+    arr = array(typecode)
+    arr.frombytes(raw)
+    arr.byteswap()
+    return memoryview(arr)
+
+
+def encode_session(playlist: Sequence[str], current_index: int = 0, position: float = 0.0,
+                   durations: Optional[Dict[str, float]] = None, generation: int = 0) -> bytes:
+    """Serialize session state into the binary snapshot format"""
+    count = len(playlist)
+    durations = durations or {}
+
+    encoded = [os.fsencode(p) for p in playlist]
+    offsets = array('Q', [0]) * (count + 1)
+    pos = 0
+    for i, raw in enumerate(encoded):
+        offsets[i] = pos
+        pos += len(raw) + 1
+    offsets[count] = pos
+    blob = b'\0'.join(encoded) + b'\0' if encoded else b''
+
+    lengths = [float(durations.get(p) or UNKNOWN_DURATION) for p in playlist]
+    current = min(max(0, int(current_index)), max(0, count - 1))
+
+    header = HEADER.pack(MAGIC, VERSION, 0, count, current, float(position), len(blob), generation)
+    if not _NATIVE_LITTLE:
+        offsets.byteswap()
+    return b''.join([
+        header,
+        offsets.tobytes(),
+        _pack_array('f', lengths),
+        blob,
+    ])
+
+
+def save_session(session_path: str, playlist: Sequence[str], current_index: int = 0,
+                 position: float = 0.0, durations: Optional[Dict[str, float]] = None,
+                 generation: int = 0) -> bool:
+    """Write a session snapshot, replacing any previous one atomically"""
+    try:
+        data = encode_session(playlist, current_index, position, durations, generation)
+        utils.atomic_write(session_path, data)
+        logger.info(f"Session saved to {session_path} ({len(playlist)} tracks)")
+        return True
+    except Exception as e:
+        logger.error(f"Could not save session to {session_path}: {e}")
+        return False
+
+
+class SessionSnapshot:
+    """Read-only view of a session snapshot backed by a memory mapping"""
+
+    def __init__(self, buf, mapping=None):
+        if len(buf) < HEADER_V1.size:
+            raise ValueError("Session snapshot is truncated")
+        magic, version = struct.unpack_from('<4sH', buf, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a session snapshot")
+        if version == 1:
+            header = HEADER_V1
+            _m, _v, _flags, count, current, position, blob_size = header.unpack_from(buf, 0)
+            generation = 0
+        elif version in (2, VERSION) and len(buf) >= HEADER.size:
+            header = HEADER
+            _m, _v, _flags, count, current, position, blob_size, generation = header.unpack_from(buf, 0)
+        else:
+            raise ValueError(f"Unsupported session snapshot version: {version}")
+
+        offsets_start = header.size
+        durations_start = offsets_start + (count + 1) * 8
+        if version < 3:
+            # Skip the play order older versions wrote (always the identity)
+            durations_start += count * 4
+        blob_start = durations_start + count * 4
+        if len(buf) < blob_start + blob_size:
+            raise ValueError("Session snapshot is truncated")
+
+        self._buf = buf
+        self._mapping = mapping
+        self._blob_start = blob_start
+        self._blob_size = blob_size
+        self._paths = None
+        self.count = count
+        self.current_index = current
+        self.position = position
+        self.generation = generation
+        self.offsets = _view_array(buf, 'Q', offsets_start, count + 1)
+        self.durations = _view_array(buf, 'f', durations_start, count)
+
+    def __len__(self):
+        return self.count
+
+    def path(self, index: int) -> str:
+        """Decode a single path without touching the rest of the table"""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start = self._blob_start + self.offsets[index]
+        end = self._blob_start + self.offsets[index + 1] - 1
+        return os.fsdecode(bytes(self._buf[start:end]))
+
+    @property
+    def paths(self) -> List[str]:
+        """All playlist paths in stored order (decoded once, then cached)"""
+        if self._paths is None:
+            if self.count == 0:
+                self._paths = []
+            else:
+                start = self._blob_start
+                blob = bytes(self._buf[start:start + self._blob_size - 1])
+                self._paths = os.fsdecode(blob).split('\0')
+        return self._paths
+
+    def duration_map(self) -> Dict[str, int]:
+        """Known durations keyed by path, as consumed by MusicPlayer.durations"""
+        result = {}
+        for path, length in zip(self.paths, self.durations):
+            if length >= 0:
+                result[path] = int(length)
+        return result
+
+    def close(self):
+        """Release the underlying memory mapping"""
+        for view in (self.offsets, self.durations):
+            try:
+                view.release()
+            except Exception:
+                pass
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def load_session(session_path: str) -> Optional[SessionSnapshot]:
+    """Memory-map a session snapshot; returns None when missing or invalid"""
+    if not os.path.exists(session_path):
+        return None
+    try:
+        with open(session_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return SessionSnapshot(mapping, mapping)
+        except Exception:
+            mapping.close()
+            raise
+    except Exception as e:
+        logger.warning(f"Could not load session from {session_path}: {e}")
+        return None
+
+
+def restore_player(player, session_path: str, config: Optional[Dict] = None) -> bool:
+    """Restore playlist, index and durations into a MusicPlayer
+
+    Falls back to the legacy ``last_playlist`` entry of config.json so
+    sessions written by older versions are migrated on first start.
+    Returns True when a non-empty playlist was restored.
+    """
+    snapshot = load_session(session_path)
+    if snapshot is not None:
+        with snapshot:
+            if not snapshot.count:
+                return False
+            player.durations.update(snapshot.duration_map())
+            player.playlist = list(snapshot.paths)
+            player.current_index = snapshot.current_index
+            player.current_position = snapshot.position
+        return True
+
+    legacy = (config or {}).get('last_playlist')
+    if legacy and isinstance(legacy, list):
+        files = [f for f in legacy if os.path.exists(f)]
+        if files:
+            player.load_playlist(files)
+            idx = int((config or {}).get('last_index', 0))
+            player.current_index = min(max(0, idx), len(player.playlist) - 1)
+            return bool(player.playlist)
+    return False
+
+
+def save_player(player, session_path: str) -> bool:
+    """Snapshot the current state of a MusicPlayer"""
+    try:
+        position = float(player.get_current_position())
+    except Exception:
+        position = 0.0
+    return save_session(session_path, list(player.playlist), player.current_index,
+                        position, player.durations)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Leading and trailing silence detection
+
+find_bounds() streams a track in fixed-size blocks and computes the RMS
+level of short windows with one vectorized reduction per block; the first
+and last windows above the threshold give the audible start and end.
+Only the current block (plus a partial window carried over) is held, so
+memory use does not depend on the length of the track:
+
+- PCM WAV files are read through a PcmStream, which drops pages already
+  analysed from the mapping
+- other formats are piped out of ffmpeg when it is on PATH; without it
+  they are not analysed (a full decode through pygame would hold the
+  whole track)
+
+SilenceCache keeps the offsets keyed by file mtime (an
+analysis.AnalysisCheckpoint file), fills itself on the shared
+JobExecutor, and is what MusicPlayer consults to start and end tracks at
+the audible audio.
+"""
+
+import os
+import logging
+import threading
+import subprocess
+from typing import Iterable, Iterator, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import metrics
+from analysis import AnalysisCheckpoint
+from features import FFMPEG, SAMPLE_RATE
+from jobs import PRIORITY_LOW
+from pcm_stream import PcmStream
+
+logger = logging.getLogger(__name__)
+
+# RMS window length and the level below which a window counts as silent
+WINDOW_SECONDS = 0.05
+THRESHOLD_DB = -60.0
+# Audio decoded per step
+BLOCK_SECONDS = 10.0
+# Silence shorter than this is left alone (seeking costs more than it saves)
+MIN_TRIM_SECONDS = 0.25
+
+
+def _wav_blocks(file_path: str, block_seconds: float) -> Iterator[Tuple["np.ndarray", int, int]]:
+    """(float32 interleaved block, rate, channels) from a PCM WAV"""
+    with PcmStream(file_path) as stream:
+        info = stream.info
+        dtype = {1: np.uint8, 2: np.int16, 4: np.int32}.get(info.sample_width)
+        if dtype is None:
+            raise ValueError(f"Unsupported sample width {info.sample_width}")
+        block_bytes = max(1, int(info.rate * block_seconds)) * info.block_align
+        while True:
+            view = stream.read(block_bytes)
+            try:
+                if not len(view):
+                    return
+                raw = np.frombuffer(view, dtype=dtype)
+                block = raw.astype(np.float32)
+                del raw
+            finally:
+                view.release()
+            if dtype is np.uint8:
+                block = (block - 128.0) / 128.0
+            else:
+                block /= float(np.iinfo(dtype).max)
+            yield block, info.rate, info.channels
+
+
+def _ffmpeg_blocks(file_path: str, block_seconds: float,
+                   rate: int = SAMPLE_RATE) -> Iterator[Tuple["np.ndarray", int, int]]:
+    """Mono float32 blocks piped out of ffmpeg"""
+    cmd = [FFMPEG, '-v', 'error', '-nostdin', '-i', file_path, '-vn',
+           '-ac', '1', '-ar', str(rate), '-f', 'f32le', '-']
+    block_bytes = int(rate * block_seconds) * 4
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 4], dtype='<f4'), rate, 1
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+def stream_blocks(file_path: str, block_seconds: float = BLOCK_SECONDS):
+    """Block iterator for file_path, or None when it cannot be streamed"""
+    if file_path.lower().endswith('.wav'):
+        return _wav_blocks(file_path, block_seconds)
+    if FFMPEG:
+        return _ffmpeg_blocks(file_path, block_seconds)
+    return None
+
+
+def audible_bounds(blocks: Iterable[Tuple["np.ndarray", int, int]],
+                   window_seconds: float = WINDOW_SECONDS,
+                   threshold_db: float = THRESHOLD_DB) -> Optional[Tuple[float, float, float]]:
+    """(audible start, audible end, length) in seconds; None if nothing is audible"""
+    threshold = 10.0 ** (threshold_db / 20.0)
+    carry = None
+    window = window_frames = None
+    windows_seen = 0
+    first = last = None
+    frames = 0
+    rate = 0
+    for block, rate, channels in blocks:
+        if window is None:
+            window_frames = max(1, int(rate * window_seconds))
+            window = window_frames * channels
+            carry = np.empty(0, dtype=np.float32)
+        frames += len(block) // channels
+        data = np.concatenate((carry, block)) if len(carry) else block
+        count = len(data) // window
+        if count:
+            windows = data[:count * window].reshape(count, window)
+            rms = np.sqrt(np.einsum('ij,ij->i', windows, windows) / window)
+            loud = np.flatnonzero(rms > threshold)
+            if len(loud):
+                if first is None:
+                    first = windows_seen + int(loud[0])
+                last = windows_seen + int(loud[-1])
+            windows_seen += count
+        carry = data[count * window:].copy()
+    if window is None:
+        return None
+    if len(carry):
+        # The partial window at the very end
+        if np.sqrt(np.mean(carry * carry)) > threshold:
+            if first is None:
+                first = windows_seen
+            last = windows_seen
+    if first is None:
+        return None
+    length = frames / rate
+    # Keep one window of margin on each side so soft attacks and tails survive
+    start = max(0.0, (first - 1) * window_frames / rate)
+    end = min(length, (last + 2) * window_frames / rate)
+    return start, end, length
+
+
+def find_bounds(file_path: str, window_seconds: float = WINDOW_SECONDS,
+                threshold_db: float = THRESHOLD_DB) -> Optional[Tuple[float, Optional[float]]]:
+    """(start, end) playback offsets for file_path; end is None when the tail is not trimmed
+
+    Returns None for silent or unreadable files and for formats that
+    cannot be streamed.
+    """
+    blocks = stream_blocks(file_path)
+    if blocks is None:
+        return None
+    with metrics.timer('silence_analysis_seconds'):
+        bounds = audible_bounds(blocks, window_seconds, threshold_db)
+    if bounds is None:
+        return None
+    start, end, length = bounds
+    if start < MIN_TRIM_SECONDS:
+        start = 0.0
+    return start, (end if length - end >= MIN_TRIM_SECONDS else None)
+
+
+class SilenceCache:
+    """Audible start/end offsets by path, computed in the background"""
+
+    def __init__(self, file_path: str, jobs=None):
+        self.jobs = jobs
+        self._store = AnalysisCheckpoint(file_path, flush_interval=30.0)
+        self._lock = threading.Lock()
+
+    def bounds(self, path: str) -> Optional[Tuple[float, Optional[float]]]:
+        """Cached (start, end) for an unchanged file, else None"""
+        with self._lock:
+            entry = self._store.get(path)
+        if entry is None or entry.get('start') is None:
+            return None
+        return entry['start'], entry.get('end')
+
+    def analyze(self, path: str) -> Optional[Tuple[float, Optional[float]]]:
+        """Analyse path now (blocking) and cache the result"""
+        try:
+            mtime = int(os.stat(path).st_mtime)
+            bounds = find_bounds(path)
+        except Exception as e:
+            logger.debug(f"Could not scan {os.path.basename(path)} for silence: {e}")
+            return None
+        start, end = bounds if bounds is not None else (None, None)
+        with self._lock:
+            # Unanalysable files are stored too, so they are not retried on every play
+            self._store.record(path, mtime, {'start': start, 'end': end})
+        return bounds
+
+    def ensure(self, path: str, priority: int = PRIORITY_LOW):
+        """Queue a background analysis unless path is already cached"""
+        if self.jobs is None or np is None:
+            return None
+        with self._lock:
+            if self._store.get(path) is not None:
+                return None
+        try:
+            return self.jobs.submit(self.analyze, path, key=('silence', path),
+                                    priority=priority, pool='cpu', group='silence')
+        except RuntimeError:
+            # Executor already shut down
+            return None
+
+    def prefetch(self, paths: Iterable[str]):
+        for i, path in enumerate(paths):
+            self.ensure(path, priority=PRIORITY_LOW + i)
+
+    def save(self):
+        with self._lock:
+            self._store.flush()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+Smart playlists: saved queries evaluated against the Library indexes
+
+Query language (keywords are case-insensitive):
+
+    artist:"Daft Punk" and length>300 and played<5 order by added desc limit 200
+    genre:jazz or genre:blues
+    not album:live* year>=1990 order by artist, album, disc, track
+    added<7d                      # relative ages: s m h d w (added in the last week)
+    beatles                       # bare words match title, artist or album
+
+- field:value / field=value    case-insensitive equality (index lookup);
+                               '*' and '?' wildcards scan the column
+- field~value                  substring match
+- field!=value                  also matches tracks without the field
+                               (the same as not field=value)
+- < <= > >= on numeric fields (length, year, track, disc, played, added,
+  last_played, size, mtime, and bpm once analysed); lengths accept m:ss,
+  dates YYYY-MM-DD
+- 'and' is implied between adjacent terms; 'or', 'not' and parentheses
+- order by field [asc|desc], ...  and  limit N
+
+Predicates become set operations over track ids (index lookups, bisected
+ranges, column scans), so evaluation stays in the milliseconds on large
+libraries; SmartPlaylist re-evaluates when the library changes.
+"""
+
+import re
+import json
+import time
+import itertools
+import fnmatch
+import operator
+import logging
+from typing import Callable, List, Optional, Set
+
+import metrics
+from library import Library, FIELDS, TEXT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+FIELD_ALIASES = {
+    'name': 'title',
+    'duration': 'length',
+    'plays': 'played',
+    'playcount': 'played',
+    'date': 'year',
+    'tracknumber': 'track',
+    'discnumber': 'disc',
+    'lastplayed': 'last_played',
+    'tempo': 'bpm',
+}
+# Timestamp fields accept dates and relative ages
+TIME_FIELDS = ('added', 'last_played', 'mtime')
+BARE_FIELDS = ('title', 'artist', 'album')
+KEYWORDS = ('and', 'or', 'not', 'order', 'by', 'asc', 'desc', 'limit')
+AGE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<clock>\d+(?::\d{1,2})+(?![^\s<>=!:~(),"']))
+  | (?P<op><=|>=|!=|<|>|=|:|~|\(|\)|,)
+  | (?P<word>[^\s<>=!:~(),"']+)
+)''', re.VERBOSE)
+
+
+class QueryError(ValueError):
+    """Raised for queries that cannot be parsed"""
+
+
+def tokenize(text: str) -> List[tuple]:
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise QueryError(f"Unexpected character at {pos}: {text[pos:pos + 10]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'clock':
+            kind = 'word'
+        elif kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'word' and value.lower() in KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+
+# ------------------ expression nodes ------------------
+# Nodes return the set of matching track ids. evaluate() answers from the
+# indexes (or a full column scan); filter() tests a candidate set directly,
+# which _And uses once the candidates are few. cost orders _And's children
+# so the most selective lookups run first.
+_NARROW = 8
+
+
+def _scan(lib: Library, column: list, ids: Set[int], needle: str = None, match=None) -> Set[int]:
+    """Ids in ids whose column value contains needle or matches the regex"""
+    if ids is lib.ids():
+        # Enumerating the column beats indexing it once per id
+        if match is None:
+            return {i for i, v in enumerate(column) if needle in v}
+        return {i for i, v in enumerate(column) if v and match(v)}
+    if match is None:
+        return {i for i in ids if needle in column[i]}
+    return {i for i in ids if column[i] and match(column[i])}
+
+
+class _All:
+    cost = 0
+
+    def evaluate(self, lib: Library, universe: Set[int]) -> Set[int]:
+        return universe
+
+    def filter(self, lib: Library, ids: Set[int]) -> Set[int]:
+        return ids
+
+
+class _And:
+    cost = 1
+
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda c: c.cost)
+
+    def evaluate(self, lib, universe):
+        return self.filter(lib, universe, universe)
+
+    def filter(self, lib, ids, universe=None):
+        result = ids
+        universe = universe if universe is not None else ids
+        for child in self.children:
+            if child.cost >= 2 or len(result) * _NARROW < len(universe):
+                result = child.filter(lib, result)
+            else:
+                result = result & child.evaluate(lib, universe)
+            if not result:
+                break
+        return result
+
+
+class _Or:
+    cost = 1
+
+    def __init__(self, children):
+        self.children = children
+
+    def evaluate(self, lib, universe):
+        result = set()
+        for child in self.children:
+            result |= child.evaluate(lib, universe)
+        return result
+
+    def filter(self, lib, ids):
+        result = set()
+        remaining = ids
+        for child in self.children:
+            hits = child.filter(lib, remaining)
+            result |= hits
+            remaining = remaining - hits
+        return result
+
+
+class _Not:
+    def __init__(self, child):
+        self.child = child
+        self.cost = child.cost
+
+    def evaluate(self, lib, universe):
+        return universe - self.child.evaluate(lib, universe)
+
+    def filter(self, lib, ids):
+        return ids - self.child.filter(lib, ids)
+
+
+class _Text:
+    """Equality (index), wildcard or substring (scan) match on a text field"""
+
+    def __init__(self, field, op, value):
+        self.field = field
+        self.op = op
+        self.value = value.casefold()
+        self.pattern = None
+        if op != '~' and any(ch in self.value for ch in '*?['):
+            self.pattern = re.compile(fnmatch.translate(self.value))
+        self.cost = 2 if op == '~' or self.pattern is not None else 0
+
+    def filter(self, lib, ids):
+        column = lib.lowered(self.field)
+        if self.op == '~':
+            matched = _scan(lib, column, ids, needle=self.value)
+        elif self.pattern is not None:
+            matched = _scan(lib, column, ids, match=self.pattern.match)
+        else:
+            value = self.value
+            matched = {i for i in ids if column[i] == value} if value else set()
+        return ids - matched if self.op == '!=' else matched
+
+    def evaluate(self, lib, universe):
+        if self.cost:
+            return self.filter(lib, universe)
+        matched = lib.equal(self.field, self.value)
+        return universe - matched if self.op == '!=' else set(matched)
+
+
+class _Bare:
+    """Substring match on any of title, artist, album"""
+
+    cost = 2
+
+    def __init__(self, value):
+        self.value = value.casefold()
+
+    def filter(self, lib, ids):
+        result = set()
+        for field in BARE_FIELDS:
+            result |= _scan(lib, lib.lowered(field), ids, needle=self.value)
+        return result
+
+    def evaluate(self, lib, universe):
+        return self.filter(lib, universe)
+
+
+class _Range:
+    """Comparison on a numeric field; value may be a callable (relative ages)"""
+
+    cost = 1
+    _OPS = {'=': operator.eq, ':': operator.eq, '!=': operator.ne, '<': operator.lt,
+            '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+    def __init__(self, field, op, value):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def filter(self, lib, ids):
+        value = self.value() if callable(self.value) else self.value
+        column = lib.column(self.field)
+        if self.op == '!=':
+            # Like evaluate() (and not field=value), tracks without the field match
+            return {i for i in ids if column[i] is None or column[i] != value}
+        compare = self._OPS[self.op]
+        return {i for i in ids if column[i] is not None and compare(column[i], value)}
+
+    def evaluate(self, lib, universe):
+        value = self.value() if callable(self.value) else self.value
+        op = self.op
+        if op in ('=', ':'):
+            return set(lib.range(self.field, value, value))
+        if op == '!=':
+            return universe - set(lib.range(self.field, value, value))
+        if op == '<':
+            return set(lib.range(self.field, hi=value, hi_inclusive=False))
+        if op == '<=':
+            return set(lib.range(self.field, hi=value))
+        if op == '>':
+            return set(lib.range(self.field, lo=value, lo_inclusive=False))
+        return set(lib.range(self.field, lo=value))
+
+
+_FLIP = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '=': '=', ':': ':', '!=': '!='}
+
+
+def _numeric_value(field: str, op: str, text: str):
+    """Parse a numeric literal; returns (op, value) with ages turned into timestamps"""
+    try:
+        return op, float(text) if '.' in text else int(text)
+    except ValueError:
+        pass
+    if field == 'length' and re.fullmatch(r'\d+(:\d{1,2}){1,2}', text):
+        seconds = 0
+        for part in text.split(':'):
+            seconds = seconds * 60 + int(part)
+        return op, seconds
+    if field in TIME_FIELDS:
+        age = re.fullmatch(r'(\d+(?:\.\d+)?)([smhdw])', text)
+        if age:
+            seconds = float(age.group(1)) * AGE_UNITS[age.group(2)]
+            # "added<7d" means less than 7 days old, i.e. a later timestamp
+            return _FLIP[op], lambda: time.time() - seconds
+        try:
+            return op, time.mktime(time.strptime(text, '%Y-%m-%d'))
+        except ValueError:
+            pass
+    raise QueryError(f"Expected a number for {field}, got {text!r}")
+
+
+# ------------------ parser ------------------
+class _Parser:
+    def __init__(self, text: str, fields, text_fields):
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.fields = set(fields)
+        self.text_fields = set(text_fields)
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value=None):
+        k, v = self.peek()
+        if k == kind and (value is None or v == value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect_value(self):
+        kind, value = self.take()
+        if kind not in ('word', 'string'):
+            raise QueryError(f"Expected a value, got {value!r}")
+        return value
+
+    def field_name(self, word):
+        name = FIELD_ALIASES.get(word.lower(), word.lower())
+        if name not in self.fields:
+            raise QueryError(f"Unknown field {word!r}")
+        return name
+
+    def parse(self):
+        where = _All()
+        if self.peek()[0] is not None and self.peek() != ('keyword', 'order') and self.peek() != ('keyword', 'limit'):
+            where = self.parse_or()
+        order = []
+        if self.accept('keyword', 'order'):
+            if not self.accept('keyword', 'by'):
+                raise QueryError("Expected 'by' after 'order'")
+            while True:
+                kind, word = self.take()
+                if kind not in ('word', 'string'):
+                    raise QueryError(f"Expected a field to order by, got {word!r}")
+                field = self.field_name(word)
+                descending = False
+                if self.accept('keyword', 'desc'):
+                    descending = True
+                else:
+                    self.accept('keyword', 'asc')
+                order.append((field, descending))
+                if not self.accept('op', ','):
+                    break
+        limit = None
+        if self.accept('keyword', 'limit'):
+            kind, value = self.take()
+            if kind != 'word' or not value.isdigit():
+                raise QueryError(f"Expected a number after 'limit', got {value!r}")
+            limit = int(value)
+        if self.peek()[0] is not None:
+            raise QueryError(f"Unexpected {self.peek()[1]!r}")
+        return where, order, limit
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.accept('keyword', 'or'):
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else _Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while True:
+            if self.accept('keyword', 'and'):
+                children.append(self.parse_not())
+                continue
+            kind, value = self.peek()
+            # Implicit 'and' between adjacent terms
+            if kind in ('word', 'string') or (kind == 'op' and value == '(') or (kind, value) == ('keyword', 'not'):
+                children.append(self.parse_not())
+                continue
+            break
+        return children[0] if len(children) == 1 else _And(children)
+
+    def parse_not(self):
+        if self.accept('keyword', 'not'):
+            return _Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        if self.accept('op', '('):
+            node = self.parse_or()
+            if not self.accept('op', ')'):
+                raise QueryError("Missing ')'")
+            return node
+        kind, word = self.take()
+        if kind not in ('word', 'string'):
+            raise QueryError(f"Unexpected {word!r}")
+        op_kind, op = self.peek()
+        if kind == 'word' and op_kind == 'op' and (op in _FLIP or op == '~'):
+            self.pos += 1
+            field = self.field_name(word)
+            value = self.expect_value()
+            if field in self.text_fields:
+                if op not in (':', '=', '!=', '~'):
+                    raise QueryError(f"{field} is text; use ':', '=', '!=' or '~'")
+                return _Text(field, op, value)
+            if op == '~':
+                raise QueryError(f"{field} is numeric; '~' only applies to text")
+            op, value = _numeric_value(field, op, value)
+            return _Range(field, op, value)
+        return _Bare(word)
+
+
+class Query:
+    """A compiled smart playlist query"""
+
+    def __init__(self, text: str, library: Optional[Library] = None):
+        self.text = text.strip()
+        if library is not None:
+            parser = _Parser(self.text, library.column_names(), library.text_fields())
+        else:
+            parser = _Parser(self.text, FIELDS, TEXT_FIELDS)
+        self.where, self.order, self.limit = parser.parse()
+
+    def evaluate(self, library: Library) -> List[str]:
+        """Matching paths, ordered and limited"""
+        with metrics.timer('smart_playlist_eval_seconds'):
+            ids = self.where.evaluate(library, library.ids())
+            return [library.paths[i] for i in self._order(library, ids)]
+
+    def _order(self, library: Library, ids: Set[int]) -> List[int]:
+        """Order ids by the ORDER BY keys; missing values go last"""
+        if not self.order:
+            ordered = sorted(ids)
+            return ordered if self.limit is None else ordered[:self.limit]
+
+        field, descending = self.order[0]
+        values, view_ids = library.sorted_view(field)
+        if len(ids) * _NARROW < len(view_ids):
+            # Few matches: sorting them is cheaper than walking the view
+            return self._sort_small(library, ids)
+
+        # Walk the primary key's cached sorted view rather than sorting the
+        # matches; with a limit the walk stops as soon as enough are found
+        positions = range(len(view_ids) - 1, -1, -1) if descending else range(len(view_ids))
+        secondary = len(self.order) > 1
+        limit = self.limit
+        picked = []
+        for j in positions:
+            if view_ids[j] in ids:
+                if limit is not None and len(picked) >= limit:
+                    # Secondary keys may still reorder the last group of equal values
+                    if not secondary or values[j] != values[picked[-1]]:
+                        break
+                picked.append(j)
+
+        missing = []
+        if limit is None or len(picked) < limit:
+            column = library.column(field)
+            missing = sorted(i for i in ids if column[i] is None)
+
+        if not secondary:
+            ordered = [view_ids[j] for j in picked] + missing
+        else:
+            groups = [[view_ids[j] for j in group]
+                      for _value, group in itertools.groupby(picked, key=values.__getitem__)]
+            groups.append(missing)
+            ordered = [i for group in groups for i in self._sort_group(library, group)]
+        return ordered if limit is None else ordered[:limit]
+
+    def _sort_small(self, library: Library, ids: Set[int]) -> List[int]:
+        ordered = self._sort_group(library, sorted(ids), self.order)
+        return ordered if self.limit is None else ordered[:self.limit]
+
+    def _sort_group(self, library: Library, group: List[int], keys=None) -> List[int]:
+        """Stable sort by keys (default: the secondary ORDER BY keys), missing values last"""
+        if len(group) < 2:
+            return group
+        text_fields = library.text_fields()
+        for field, descending in reversed(keys if keys is not None else self.order[1:]):
+            raw = library.column(field)
+            column = library.lowered(field) if field in text_fields else raw
+            present = [i for i in group if raw[i] is not None]
+            missing = [i for i in group if raw[i] is None]
+            present.sort(key=column.__getitem__, reverse=descending)
+            group = present + missing
+        return group
+
+
+def compile_query(text: str, library: Optional[Library] = None) -> Query:
+    """Parse text into a Query (raises QueryError)"""
+    return Query(text, library)
+
+
+class SmartPlaylist:
+    """A named query whose results follow library changes"""
+
+    def __init__(self, name: str, query: str, library: Library,
+                 on_update: Optional[Callable[[List[str]], None]] = None):
+        self.name = name
+        self.library = library
+        self.query = compile_query(query, library)
+        self.on_update = on_update
+        self.paths = self.query.evaluate(library)
+        library.subscribe(self._on_library_change)
+
+    def _on_library_change(self, changed):
+        paths = self.query.evaluate(self.library)
+        if paths != self.paths:
+            self.paths = paths
+            if self.on_update is not None:
+                self.on_update(paths)
+
+    def close(self):
+        self.library.unsubscribe(self._on_library_change)
+
+    def to_dict(self):
+        return {'name': self.name, 'query': self.query.text}
+
+
+def save_smart_playlist(file_path: str, name: str, query: str):
+    """Store a smart playlist definition (JSON with name and query)"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump({'name': name, 'query': query}, f, indent=2, ensure_ascii=False)
+
+
+def load_smart_playlist(file_path: str):
+    """(name, query) from a definition file, or None for static playlists"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or 'query' not in data:
+        return None
+    return data.get('name', ''), data['query']
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Decode cache for formats the mixer handles poorly
+
+pygame.mixer.music cannot load most .m4a files, and FLACs recorded at a
+rate other than the mixer's are resampled on every play. TranscodeCache
+decodes such tracks once into 16-bit PCM WAV files at the mixer's rate and
+channel count, so loading them costs the same as a native WAV.
+
+- Decoding runs on the shared JobExecutor ('cpu' pool, group 'transcode');
+  the player prefetches the upcoming tracks after every play()
+- Entries are keyed by real path, size, mtime and target format, so an
+  edited source file is decoded again. A decode already running is waited
+  for rather than repeated, and one that failed is not retried for the
+  same entry
+- The cache is an LRU bounded by a disk quota; recency is persisted in the
+  files' mtimes so it survives restarts
+- Decoding uses ffmpeg when it is on PATH, otherwise pygame.mixer.Sound
+  (which needs an initialized mixer and cannot read .m4a)
+"""
+
+import os
+import wave
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+import pygame
+
+import metrics
+from jobs import PRIORITY_HIGH, PRIORITY_LOW
+
+try:
+    from mutagen.flac import FLAC
+except Exception:
+    FLAC = None
+
+logger = logging.getLogger(__name__)
+
+# Containers pygame.mixer.music cannot load; played from the cache only
+UNSUPPORTED_EXTENSIONS = ('.m4a', '.mp4', '.aac')
+# Fallback target when the mixer is not initialized (matches initialize_mixer)
+DEFAULT_RATE = 44100
+DEFAULT_CHANNELS = 2
+
+FFMPEG = shutil.which('ffmpeg')
+
+
+def mixer_format():
+    """(rate, channels) of the initialized mixer, or the player defaults"""
+    try:
+        init = pygame.mixer.get_init()
+    except Exception:
+        init = None
+    if init:
+        return init[0], init[2]
+    return DEFAULT_RATE, DEFAULT_CHANNELS
+
+
+def decode_ffmpeg(src: str, dst: str, rate: int, channels: int):
+    """Decode src to a 16-bit PCM WAV at rate/channels with ffmpeg"""
+    cmd = [FFMPEG, '-v', 'error', '-nostdin', '-y', '-i', src, '-vn',
+           '-ac', str(channels), '-ar', str(rate), '-acodec', 'pcm_s16le', '-f', 'wav', dst]
+    subprocess.run(cmd, check=True, capture_output=True, timeout=600)
+
+
+def decode_pygame(src: str, dst: str, rate: int, channels: int):
+    """Decode src with pygame.mixer.Sound (output is in the mixer's own format)"""
+    init = pygame.mixer.get_init()
+    if not init:
+        raise RuntimeError("Mixer not initialized")
+    freq, size, mixer_channels = init
+    sound = pygame.mixer.Sound(src)
+    with wave.open(dst, 'wb') as w:
+        w.setnchannels(mixer_channels)
+        w.setsampwidth(abs(size) // 8)
+        w.setframerate(freq)
+        w.writeframes(sound.get_raw())
+
+
+def default_decoder() -> Callable:
+    return decode_ffmpeg if FFMPEG else decode_pygame
+
+
+class TranscodeCache:
+    """LRU cache of pre-decoded WAV files bounded by a disk quota"""
+
+    def __init__(self, cache_dir: str, quota_bytes: int = 2 << 30, jobs=None,
+                 decoder: Optional[Callable] = None):
+        self.cache_dir = cache_dir
+        self.quota_bytes = quota_bytes
+        self.jobs = jobs
+        self.decoder = decoder or default_decoder()
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        self._probes = {}  # (path, size, mtime_ns) -> needs transcode
+        self._decoding = {}  # entry name -> Event set when its decode finishes
+        self._failed = set()  # entry names that could not be decoded
+        self._pinned = None
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files on disk"""
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.tmp'):
+                # Left behind by an interrupted decode
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            elif entry.name.endswith('.wav'):
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name, st.st_size))
+        for _mtime, name, size in sorted(found):
+            self._entries[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    # ------------------ keys ------------------
+    def needs_transcode(self, file_path: str, st=None) -> bool:
+        """True for containers the mixer cannot load and FLACs not at the mixer rate"""
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext in UNSUPPORTED_EXTENSIONS:
+            return True
+        if ext != '.flac' or FLAC is None:
+            return False
+        try:
+            st = st or os.stat(file_path)
+        except OSError:
+            return False
+        probe_key = (file_path, st.st_size, st.st_mtime_ns)
+        result = self._probes.get(probe_key)
+        if result is None:
+            try:
+                info = FLAC(file_path).info
+                result = info.sample_rate != mixer_format()[0] or info.bits_per_sample > 16
+            except Exception:
+                result = False
+            self._probes[probe_key] = result
+        return result
+
+    def _entry_name(self, file_path: str, st) -> str:
+        rate, channels = mixer_format()
+        ident = f"{os.path.realpath(file_path)}\0{st.st_size}\0{st.st_mtime_ns}\0{rate}\0{channels}"
+        return hashlib.sha1(ident.encode('utf-8', 'surrogateescape')).hexdigest() + '.wav'
+
+    def _key(self, file_path: str) -> Optional[str]:
+        """Cache entry name for file_path, or None when it plays natively"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        if not self.needs_transcode(file_path, st):
+            return None
+        return self._entry_name(file_path, st)
+
+    # ------------------ lookups ------------------
+    def lookup(self, file_path: str) -> Optional[str]:
+        """Path of the decoded copy if it is cached"""
+        name = self._key(file_path)
+        if name is None:
+            return None
+        return self._touch(name)
+
+    def _touch(self, name: str) -> Optional[str]:
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = os.path.join(self.cache_dir, name)
+        try:
+            os.utime(path)
+        except OSError:
+            # Removed behind our back
+            with self._lock:
+                self.total_bytes -= self._entries.pop(name, 0)
+            return None
+        return path
+
+    def needs_decode(self, file_path: str) -> bool:
+        """True if resolve() would have to decode file_path before returning"""
+        if os.path.splitext(file_path)[1].lower() not in UNSUPPORTED_EXTENSIONS:
+            return False
+        name = self._key(file_path)
+        if name is None:
+            return False
+        with self._lock:
+            return name not in self._entries and name not in self._failed
+
+    def resolve(self, file_path: str) -> str:
+        """Path to hand to the mixer for file_path
+
+        Cached tracks play from the cache. On a miss, formats the mixer can
+        still load play from the original while a decode is queued; formats
+        it cannot load at all are decoded synchronously (see needs_decode()).
+        """
+        name = self._key(file_path)
+        if name is None:
+            return file_path
+        cached = self._touch(name)
+        if cached is None:
+            metrics.inc('transcode_cache_misses_total')
+            if os.path.splitext(file_path)[1].lower() in UNSUPPORTED_EXTENSIONS:
+                cached = self.transcode(file_path)
+            else:
+                self.ensure(file_path, priority=PRIORITY_HIGH)
+        else:
+            metrics.inc('transcode_cache_hits_total')
+        self._pinned = os.path.basename(cached) if cached else None
+        return cached or file_path
+
+    # ------------------ decoding ------------------
+    def transcode(self, file_path: str) -> Optional[str]:
+        """Decode file_path into the cache (blocking); returns the cached path
+
+        Waits for a decode of the same entry already running on another
+        thread instead of starting a second one.
+        """
+        name = self._key(file_path)
+        if name is None:
+            return None
+        cached = self._touch(name)
+        if cached is not None:
+            return cached
+        with self._lock:
+            if name in self._failed:
+                return None
+            running = self._decoding.get(name)
+            if running is None:
+                self._decoding[name] = threading.Event()
+        if running is not None:
+            metrics.inc('transcode_waits_total')
+            running.wait()
+            return self._touch(name)
+        try:
+            return self._decode(file_path, name)
+        finally:
+            with self._lock:
+                self._decoding.pop(name).set()
+
+    def _decode(self, file_path: str, name: str) -> Optional[str]:
+        rate, channels = mixer_format()
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        os.close(fd)
+        try:
+            start = time.perf_counter()
+            self.decoder(file_path, tmp_path, rate, channels)
+            metrics.observe('transcode_seconds', time.perf_counter() - start)
+            dst = os.path.join(self.cache_dir, name)
+            os.replace(tmp_path, dst)
+        except Exception as e:
+            metrics.inc('transcode_errors_total')
+            logger.warning(f"Could not decode {os.path.basename(file_path)}: {e}")
+            with self._lock:
+                self._failed.add(name)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+
+        size = os.path.getsize(dst)
+        with self._lock:
+            self.total_bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+        self._evict()
+        logger.debug(f"Decoded {os.path.basename(file_path)} into cache ({size} bytes)")
+        return dst
+
+    def ensure(self, file_path: str, priority: int = PRIORITY_LOW):
+        """Queue a background decode unless the track is native or cached"""
+        if self.jobs is None:
+            return None
+        name = self._key(file_path)
+        if name is None:
+            return None
+        with self._lock:
+            if name in self._entries or name in self._failed:
+                return None
+        try:
+            return self.jobs.submit(self.transcode, file_path, key=('transcode', file_path),
+                                    priority=priority, pool='cpu', group='transcode')
+        except RuntimeError:
+            # Executor already shut down
+            return None
+
+    def prefetch(self, file_paths: Iterable[str]):
+        """Decode upcoming tracks ahead of time, nearest first"""
+        for i, path in enumerate(file_paths):
+            self.ensure(path, priority=PRIORITY_LOW + i)
+
+    # ------------------ eviction ------------------
+    def _evict(self):
+        """Drop least recently used entries until the cache fits the quota"""
+        removed = []
+        with self._lock:
+            for name in list(self._entries):
+                if self.total_bytes <= self.quota_bytes:
+                    break
+                if name == self._pinned:
+                    # Never delete the file the mixer is streaming from
+                    continue
+                self.total_bytes -= self._entries.pop(name)
+                removed.append(name)
+        for name in removed:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+        if removed:
+            metrics.inc('transcode_cache_evictions_total', len(removed))
+
+    def clear(self):
+        """Remove every cached file"""
+        with self._lock:
+            names = list(self._entries)
+            self._entries.clear()
+            self.total_bytes = 0
+            self._pinned = None
+        for name in names:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Terminal front-end for Python Music Player
+
+A curses UI on MusicPlayer for small headless machines reached over SSH.
+It imports only the player and its playback modules (no Tk, PIL, NumPy or
+the library index), so it starts in a fraction of the GUIs' time and
+resident memory.
+
+Everything runs on one selector loop that blocks on the terminal and a
+wake-up pipe (written by the SIGWINCH handler). There are no timers: the
+loop only has a timeout while a track plays, set from
+MusicPlayer.next_event_in() and the next tick of the clock. Paused or
+stopped, the process sleeps until a key is pressed.
+
+- The playlist view is virtualized: only the visible rows are formatted,
+  from file names (or CUE titles) and cached durations; no tags are read
+- '/' filters the playlist as you type; each keystroke that extends the
+  query only narrows the previous matches
+- The session snapshot is restored at start and written on quit
+
+Keys:
+    up/down j/k, PgUp/PgDn, g/G    move          Enter    play selection
+    space  pause/resume            n/p      next/previous track
+    left/right  seek -/+10 s       s        stop
+    +/-    volume                  m        mute
+    /      search (Esc clears)     q        quit
+"""
+
+import os
+import sys
+import curses
+import signal
+import logging
+import selectors
+
+# Keep pygame's banner off the terminal curses is about to take over
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import cue
+import utils
+import session
+from config import CONFIG_FILE, SESSION_FILE, JOURNAL_FILE, BOOKMARKS_FILE, TUI_LOG_FILE
+from player import MusicPlayer
+from audio_output import settings_from_config
+from events import PlaybackEnded, SongChanged, inline
+from journal import SessionJournal
+from bookmarks import BookmarkStore
+from net_stream import is_stream_url, stream_title
+
+logger = logging.getLogger(__name__)
+
+SEEK_STEP = 10.0
+VOLUME_STEP = 0.05
+_ENTER = ('\n', '\r', curses.KEY_ENTER)
+_BACKSPACE = ('\b', '\x7f', curses.KEY_BACKSPACE)
+_ESCAPE = '\x1b'
+
+
+class TerminalApp:
+    """Curses front-end driving a MusicPlayer from a single selector loop"""
+
+    def __init__(self, paths=None):
+        self.config = utils.load_config(CONFIG_FILE)
+        self.player = MusicPlayer(audio=settings_from_config(self.config))
+        self.player.output.adaptive = bool(self.config.get('audio_adaptive_buffer', True))
+        self.player.output.monitor = True
+        self.player.set_volume(float(self.config.get('volume', 0.7)))
+        self.player.skip_duplicates = bool(self.config.get('skip_duplicates', True))
+        if self.config.get('resume_tracks', True):
+            min_length = float(self.config.get('resume_min_minutes', 10)) * 60
+            self.player.bookmarks = BookmarkStore(BOOKMARKS_FILE, min_length=min_length)
+        self.journal = SessionJournal(JOURNAL_FILE, SESSION_FILE)
+        if paths:
+            self._load_paths(paths)
+        else:
+            self.journal.restore_player(self.player, self.config)
+        # The loop thread publishes (play(), check_events()), so deliver in place
+        self.player.events.subscribe(SongChanged, self._on_song_change, dispatcher=inline, name='tui_song_change')
+        self.player.events.subscribe(PlaybackEnded, self._on_playback_end, dispatcher=inline,
+                                     name='tui_playback_end')
+
+        self.screen = None
+        self.running = False
+        self.cursor = self.player.current_index
+        self.top = 0
+        self.searching = False
+        self.query = ''
+        self.matches = None  # playlist indices shown while filtering
+        self.message = ''
+        self._now = None
+        self._names = {}
+        self._dirty = True
+        self._wake_r = self._wake_w = None
+
+    def _load_paths(self, paths):
+        self.player.playlist = []
+        for path in paths:
+            if os.path.isdir(path):
+                self.player.add_folder(path)
+            else:
+                self.player.add_files([path])
+        self.player.current_index = 0
+
+    # ------------------ entry point ------------------
+    def run(self):
+        """Take over the terminal until the user quits"""
+        root = logging.getLogger()
+        handlers = root.handlers[:]
+        # Log lines written to stderr would tear through the curses screen
+        for handler in handlers:
+            root.removeHandler(handler)
+        file_handler = logging.FileHandler(TUI_LOG_FILE)
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        root.addHandler(file_handler)
+        try:
+            curses.wrapper(self._main)
+        finally:
+            self.shutdown()
+            root.removeHandler(file_handler)
+            file_handler.close()
+            for handler in handlers:
+                root.addHandler(handler)
+
+    def shutdown(self):
+        """Write the session snapshot and release the mixer"""
+        self.config['volume'] = self.player.volume
+        utils.save_config(CONFIG_FILE, self.config)
+        try:
+            position = float(self.player.get_current_position())
+        except Exception:
+            position = 0.0
+        # A newer generation than the journal's, so the journal is not replayed over it
+        session.save_session(SESSION_FILE, list(self.player.playlist), self.player.current_index,
+                             position, self.player.durations, generation=self.journal.generation + 1)
+        self.player.shutdown()
+        if self.player.bookmarks is not None:
+            self.player.bookmarks.close()
+
+    def _main(self, screen):
+        self.screen = screen
+        screen.nodelay(True)
+        screen.keypad(True)
+        try:
+            curses.curs_set(0)
+            curses.use_default_colors()
+            # Esc clears the search; don't wait a second for an escape sequence
+            curses.set_escdelay(25)
+        except curses.error:
+            pass
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        previous = signal.signal(signal.SIGWINCH, self._on_winch)
+        selector = selectors.DefaultSelector()
+        selector.register(sys.stdin.fileno(), selectors.EVENT_READ, 'keys')
+        selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+        self.running = True
+        try:
+            while self.running:
+                if self._dirty:
+                    self._draw()
+                else:
+                    self._draw_now_playing()
+                    self.screen.refresh()
+                for key, _mask in selector.select(self._timeout()):
+                    if key.data == 'keys':
+                        self._read_keys()
+                    else:
+                        self._drain_wake()
+                self.player.check_events()
+        finally:
+            signal.signal(signal.SIGWINCH, previous)
+            selector.close()
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+
+    def _timeout(self):
+        """None (block until input) unless something is playing"""
+        wait = self.player.next_event_in()
+        if wait is None:
+            return None
+        # Wake for the next second of the clock as well
+        clock = 1.0 - self.player.get_current_position() % 1.0
+        return max(0.0, min(wait, clock))
+
+    def _on_winch(self, signum, frame):
+        try:
+            os.write(self._wake_w, b'r')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _drain_wake(self):
+        try:
+            while os.read(self._wake_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+        # Refresh the size ncurses would have picked up from its own SIGWINCH handler
+        try:
+            size = os.get_terminal_size(sys.stdout.fileno())
+            curses.resizeterm(size.lines, size.columns)
+        except (OSError, curses.error):
+            pass
+        self._dirty = True
+
+    # ------------------ player callbacks ------------------
+    def _on_song_change(self, event):
+        # Tags are read when the line is drawn, after play() has returned
+        self._now = event
+        self._dirty = True
+
+    def _on_playback_end(self, event):
+        self.player.next()
+
+    # ------------------ input ------------------
+    def _read_keys(self):
+        while True:
+            try:
+                key = self.screen.get_wch()
+            except curses.error:
+                return
+            if self.searching:
+                self._search_key(key)
+            else:
+                self._command_key(key)
+            self._dirty = True
+
+    def _command_key(self, key):
+        player = self.player
+        rows = self._list_height()
+        if key == 'q':
+            self.running = False
+        elif key in (curses.KEY_UP, 'k'):
+            self._move(-1)
+        elif key in (curses.KEY_DOWN, 'j'):
+            self._move(1)
+        elif key == curses.KEY_PPAGE:
+            self._move(-rows)
+        elif key == curses.KEY_NPAGE:
+            self._move(rows)
+        elif key in (curses.KEY_HOME, 'g'):
+            self._move(-self._count())
+        elif key in (curses.KEY_END, 'G'):
+            self._move(self._count())
+        elif key in _ENTER:
+            if self._count():
+                self._play(self._index(self.cursor))
+        elif key == ' ':
+            if not player.is_playing:
+                self._play(player.current_index)
+            elif player.paused:
+                player.unpause()
+            else:
+                player.pause()
+        elif key == 'n':
+            player.next()
+        elif key == 'p':
+            player.previous()
+        elif key == 's':
+            player.stop()
+        elif key in (curses.KEY_LEFT, curses.KEY_RIGHT) and player.is_playing:
+            step = SEEK_STEP if key == curses.KEY_RIGHT else -SEEK_STEP
+            position = max(0.0, player.get_current_position() + step)
+            if not player.song_length or position < player.song_length:
+                player.play(player.current_index, start_pos=position)
+        elif key in ('+', '='):
+            player.set_volume(player.volume + VOLUME_STEP)
+        elif key == '-':
+            player.set_volume(player.volume - VOLUME_STEP)
+        elif key == 'm':
+            player.toggle_mute()
+        elif key == '/':
+            self.searching = True
+        elif key == _ESCAPE:
+            self._set_query('')
+        elif key == curses.KEY_RESIZE:
+            pass
+
+    def _search_key(self, key):
+        if key in _ENTER:
+            self.searching = False
+        elif key == _ESCAPE:
+            self.searching = False
+            self._set_query('')
+        elif key in _BACKSPACE:
+            self._set_query(self.query[:-1])
+        elif isinstance(key, str) and key.isprintable():
+            self._set_query(self.query + key)
+
+    def _play(self, index):
+        try:
+            if not self.player.play(index):
+                self.message = "Could not play that entry"
+        except Exception as e:
+            self.message = f"Error: {e}"
+
+    # ------------------ playlist view ------------------
+    def _name(self, index):
+        path = self.player.playlist[index]
+        name = self._names.get(path)
+        if name is None:
+            if is_stream_url(path):
+                name = stream_title(path)
+            else:
+                name = cue.display_name(path)
+            self._names[path] = name
+        return name
+
+    def _set_query(self, query):
+        previous = self.query
+        self.query = query
+        if not query:
+            self.matches = None
+        else:
+            narrowing = self.matches is not None and previous and query.startswith(previous)
+            candidates = self.matches if narrowing else range(len(self.player.playlist))
+            folded = query.casefold()
+            self.matches = [i for i in candidates if folded in self._name(i).casefold()]
+        self.cursor = 0 if self.matches is not None else self.player.current_index
+        self.top = 0
+
+    def _count(self):
+        return len(self.matches) if self.matches is not None else len(self.player.playlist)
+
+    def _index(self, row):
+        """Playlist index shown at view row"""
+        return self.matches[row] if self.matches is not None else row
+
+    def _move(self, delta):
+        self.cursor = min(max(0, self.cursor + delta), max(0, self._count() - 1))
+
+    def _list_height(self):
+        height, _width = self.screen.getmaxyx()
+        return max(1, height - 2)
+
+    # ------------------ drawing ------------------
+    def _put(self, y, text, attr=curses.A_NORMAL):
+        _height, width = self.screen.getmaxyx()
+        try:
+            # The bottom-right cell cannot be written without scrolling
+            self.screen.addnstr(y, 0, text.ljust(width - 1), width - 1, attr)
+        except curses.error:
+            pass
+
+    def _draw(self):
+        self._dirty = False
+        height, width = self.screen.getmaxyx()
+        rows = self._list_height()
+        count = self._count()
+        self.cursor = min(self.cursor, max(0, count - 1))
+        if self.cursor < self.top:
+            self.top = self.cursor
+        elif self.cursor >= self.top + rows:
+            self.top = self.cursor - rows + 1
+        player = self.player
+        for row in range(rows):
+            position = self.top + row
+            if position >= count:
+                self._put(row, '')
+                continue
+            index = self._index(position)
+            path = player.playlist[index]
+            current = index == player.current_index and player.is_playing
+            length = player.durations.get(path)
+            duration = utils.format_time(length) if length else ''
+            label = f"{'>' if current else ' '} {index + 1:>4}  {self._name(index)}"
+            label = label[:max(0, width - len(duration) - 3)]
+            line = label.ljust(max(0, width - len(duration) - 2)) + duration
+            attr = curses.A_REVERSE if position == self.cursor else (curses.A_BOLD if current else curses.A_NORMAL)
+            self._put(row, line, attr)
+        self._draw_now_playing()
+        if self.searching or self.query:
+            matches = len(self.matches) if self.matches is not None else count
+            self._put(height - 1, f"/{self.query}  ({matches} matches)")
+        else:
+            self._put(height - 1, self.message or "q quit  / search  space pause  n/p next/prev  +/- volume")
+            self.message = ''
+        self.screen.refresh()
+
+    def _draw_now_playing(self):
+        height, _width = self.screen.getmaxyx()
+        player = self.player
+        info = self._now.info if self._now is not None else None
+        if not player.is_playing or not info:
+            self._put(height - 2, "Stopped", curses.A_BOLD)
+            return
+        state = 'Paused' if player.paused else 'Playing'
+        clock = utils.format_time(player.get_current_position())
+        if player.song_length:
+            clock += f" / {utils.format_time(player.song_length)}"
+        volume = 'muted' if player.muted else f"vol {int(round(player.volume * 100))}%"
+        self._put(height - 2, f"{state}: {info['title']} - {info['artist']}  [{clock}]  {volume}",
+                  curses.A_BOLD)
+
+
+def main(paths=None):
+    """Run the terminal front-end (optionally on the given files and folders)"""
+    TerminalApp(paths).run()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
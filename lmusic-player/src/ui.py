@@ -13,9 +13,10 @@ User interface for Python Music Player using Tkinter
 """
 
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import os
 import time
+import threading
 try:
     from PIL import Image, ImageTk
 except Exception:
@@ -23,8 +24,28 @@ except Exception:
     ImageTk = None
 
 from player import MusicPlayer
-from config import BASE_DIR, ASSETS_DIR, ICONS_DIR, CONFIG_FILE, APP_NAME
+from audio_output import settings_from_config
+from config import (BASE_DIR, ASSETS_DIR, ICONS_DIR, CONFIG_FILE, SESSION_FILE, JOURNAL_FILE,
+                    STALL_LOG_FILE, TRANSCODE_DIR, LIBRARY_FILE, HISTORY_FILE, FEATURES_FILE,
+                    SILENCE_FILE, BOOKMARKS_FILE, APP_NAME)
+import cue
 import utils
+import metrics
+from journal import SessionJournal
+from watchdog import StallWatchdog
+from jobs import JobExecutor, TkDispatcher, PRIORITY_LOW
+from events import PlaybackEnded, SongChanged
+from transcode import TranscodeCache
+from silence import SilenceCache
+from bookmarks import BookmarkStore
+from http_server import LibraryServer
+from net_stream import is_stream_url
+from library import Library
+from history import PlayHistory
+from collation import SortKeyCache
+import features
+from similarity import FeatureMatrix, SimilarTracks
+from smart_playlist import SmartPlaylist, QueryError, save_smart_playlist, load_smart_playlist
 
 
 class MusicPlayerApp:
@@ -36,7 +57,58 @@ class MusicPlayerApp:
         self.config = utils.load_config(CONFIG_FILE)
 
         self.setup_window()
-        self.player = MusicPlayer()
+        self.player = MusicPlayer(audio=settings_from_config(self.config))
+        self.player.output.adaptive = bool(self.config.get('audio_adaptive_buffer', True))
+        self.player.output.monitor = True
+        self.player.skip_duplicates = bool(self.config.get('skip_duplicates', True))
+
+        # Shared background executor; results are delivered on the Tk thread
+        self.dispatcher = TkDispatcher(self.root)
+        self.jobs = JobExecutor(dispatcher=self.dispatcher.post)
+        self.dispatcher.start()
+        self._refresh_pending = False
+        # Network streams connect and prefetch there, then start on the Tk thread
+        self.player.jobs = self.jobs
+        # Decoded copies of tracks the mixer cannot load (or would resample) on every play
+        quota = int(self.config.get('transcode_cache_mb', 2048)) * 1024 * 1024
+        self.player.transcoder = TranscodeCache(TRANSCODE_DIR, quota, jobs=self.jobs)
+        # Audible start/end offsets so tracks skip leading and trailing silence
+        if self.config.get('trim_silence', True) and features.available():
+            self.player.silence = SilenceCache(SILENCE_FILE, jobs=self.jobs)
+        # Per-track resume positions for long tracks (mapped on first use)
+        if self.config.get('resume_tracks', True):
+            min_length = float(self.config.get('resume_min_minutes', 10)) * 60
+            self.player.bookmarks = BookmarkStore(BOOKMARKS_FILE, jobs=self.jobs, min_length=min_length)
+        # Indexed tag metadata backing smart playlists
+        self.library = Library.load(LIBRARY_FILE)
+        self.smart_playlist = None
+        self._smart_applied = None
+        self._smart_pending = None
+        # Cached collation keys for sorting by column
+        self.sort_keys = SortKeyCache(self.library)
+        self._sort_column = None
+        self._sort_descending = False
+        # Play events and listening stats; play counts feed the library
+        self.history = PlayHistory(HISTORY_FILE)
+        self.history.apply_to(self.library)
+        # Optional LAN streaming of the library (own thread and event loop)
+        self.http_server = None
+        if self.config.get('http_server', False):
+            self.http_server = LibraryServer(self.library, self.config.get('http_host', '0.0.0.0'),
+                                             int(self.config.get('http_port', 8765)))
+            try:
+                self.http_server.start()
+            except OSError as e:
+                print(f"Could not start the library server: {e}")
+                self.http_server = None
+        self.history.subscribe(self._on_history_event)
+        self.player.history = self.history
+        # Audio feature vectors for "autoplay similar" (needs NumPy)
+        self.features = FeatureMatrix.load(FEATURES_FILE) if features.available() else None
+        self.similar = SimilarTracks(self.features) if self.features is not None else None
+        self._analysis_stop = threading.Event()
+        self.autoplay_var = tk.BooleanVar(value=bool(self.config.get('autoplay_similar', False)))
+        self.toggle_autoplay()
         # Apply saved volume to player
         try:
             initial_volume = float(self.config.get('volume', self.player.volume))
@@ -52,6 +124,11 @@ class MusicPlayerApp:
         self.updating_progress = False
         self.dragging_progress = False
 
+        # Report callbacks that block the Tk event loop
+        threshold = float(self.config.get('stall_threshold_ms', 250)) / 1000.0
+        self.watchdog = StallWatchdog(self.root, threshold=threshold, log_path=STALL_LOG_FILE)
+        self.watchdog.start()
+
         print("UI initialized successfully")
 
     def setup_window(self):
@@ -84,9 +161,11 @@ class MusicPlayerApp:
         self.root.geometry(f'{width}x{height}+{x}+{y}')
 
     def setup_player_callbacks(self):
-        """Setup callbacks for player events"""
-        self.player.on_song_change = self.on_song_change
-        self.player.on_playback_end = self.on_playback_end
+        """Subscribe to player events, delivered on the Tk thread"""
+        self.player.events.subscribe(SongChanged, self.on_song_change, dispatcher=self.dispatcher.post,
+                                     name='ui_song_change')
+        self.player.events.subscribe(PlaybackEnded, self.on_playback_end, dispatcher=self.dispatcher.post,
+                                     name='ui_playback_end')
 
     def setup_ui(self):
         """Setup user interface components"""
@@ -113,16 +192,32 @@ class MusicPlayerApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Add Files...", command=self.add_files, accelerator="Ctrl+O")
         file_menu.add_command(label="Add Folder...", command=self.add_folder, accelerator="Ctrl+Shift+O")
+        file_menu.add_command(label="Add Stream URL...", command=self.add_stream_url)
         file_menu.add_separator()
         file_menu.add_command(label="Load Playlist...", command=self.load_playlist_dialog)
         file_menu.add_command(label="Save Playlist...", command=self.save_playlist_dialog)
+        file_menu.add_command(label="New Smart Playlist...", command=self.new_smart_playlist)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.quit_app, accelerator="Ctrl+Q")
         menubar.add_cascade(label="File", menu=file_menu)
 
+        # Edit menu
+        edit_menu = tk.Menu(menubar, tearoff=0)
+        edit_menu.add_command(label="Undo", command=self.undo_edit, accelerator="Ctrl+Z")
+        edit_menu.add_command(label="Redo", command=self.redo_edit, accelerator="Ctrl+Y")
+        menubar.add_cascade(label="Edit", menu=edit_menu)
+
+        # Library menu
+        library_menu = tk.Menu(menubar, tearoff=0)
+        library_menu.add_command(label="Analyze Audio for Similar Tracks", command=self.analyze_library)
+        library_menu.add_checkbutton(label="Autoplay Similar Tracks", variable=self.autoplay_var,
+                                     command=self.toggle_autoplay)
+        menubar.add_cascade(label="Library", menu=library_menu)
+
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
         help_menu.add_command(label="About", command=self.show_about)
+        help_menu.add_command(label="Debug Metrics...", command=self.show_debug_panel)
         menubar.add_cascade(label="Help", menu=help_menu)
 
         # Theme menu
@@ -138,6 +233,9 @@ class MusicPlayerApp:
         self.root.bind_all('<Control-o>', lambda e: self.add_files())
         self.root.bind_all('<Control-Shift-O>', lambda e: self.add_folder())
         self.root.bind_all('<Control-q>', lambda e: self.quit_app())
+        self.root.bind_all('<Control-z>', lambda e: self.undo_edit())
+        self.root.bind_all('<Control-y>', lambda e: self.redo_edit())
+        self.root.bind_all('<Control-Shift-Z>', lambda e: self.redo_edit())
 
         # Apply saved theme
         theme = self.config.get('theme', 'dark')
@@ -189,6 +287,13 @@ class MusicPlayerApp:
         """Show about dialog"""
         messagebox.showinfo("About", f"{APP_NAME}\nA lightweight Python music player")
 
+    def show_debug_panel(self):
+        """Open the metrics/profiler debug panel"""
+        from debug_panel import DebugPanel
+        previous = getattr(self, 'debug_panel', None)
+        self.debug_panel = DebugPanel(self.root, profiler=previous.profiler if previous else None,
+                                      watchdog=getattr(self, 'watchdog', None))
+
     def create_title_bar(self):
         """Create title bar"""
         title_frame = tk.Frame(self.root, bg='#34495e', height=60)
@@ -418,8 +523,10 @@ class MusicPlayerApp:
                                          selectmode='browse')
 
         # Configure columns
-        self.playlist_tree.heading('name', text='Song Name')
-        self.playlist_tree.heading('duration', text='Duration')
+        self.playlist_tree.heading('name', text='Song Name',
+                                   command=lambda: self.sort_playlist('name'))
+        self.playlist_tree.heading('duration', text='Duration',
+                                   command=lambda: self.sort_playlist('duration'))
         self.playlist_tree.column('name', width=400, anchor='w')
         self.playlist_tree.column('duration', width=80, anchor='center')
 
@@ -475,25 +582,22 @@ class MusicPlayerApp:
 
         # Start event checker
         self.check_music_events()
-        # If config has last playlist and resume_on_start, attempt to load and play
+        # Restore the last session (snapshot + crash journal) and optionally resume playback
+        self.journal = SessionJournal(JOURNAL_FILE, SESSION_FILE)
         try:
-            if self.config.get('last_playlist'):
-                last_pl = self.config.get('last_playlist')
-                if last_pl and isinstance(last_pl, list):
-                    # Filter to files that exist
-                    files = [f for f in last_pl if os.path.exists(f)]
-                    if files:
-                        self.player.load_playlist(files)
+            restored = self.journal.restore_player(self.player, self.config)
+            self.journal.attach(self.player)
+            if restored:
+                self.update_playlist_display()
+                self.load_metadata(list(self.player.playlist))
+                # Decode the restored track ahead of the first play
+                self.player.prefetch(include_current=True)
+                if self.config.get('resume_on_start'):
+                    try:
+                        self.player.resume()
                         self.update_playlist_display()
-                        last_index = int(self.config.get('last_index', 0))
-                        if 0 <= last_index < len(self.player.playlist):
-                            self.player.current_index = last_index
-                        if self.config.get('resume_on_start'):
-                            try:
-                                self.player.play(self.player.current_index)
-                                self.update_playlist_display()
-                            except Exception:
-                                pass
+                    except Exception:
+                        pass
         except Exception:
             pass
 
@@ -524,12 +628,21 @@ class MusicPlayerApp:
             self.play_music()
 
     def save_playlist_dialog(self):
-        """Save current playlist to an M3U file"""
+        """Save current playlist to an M3U file (or the smart playlist query to JSON)"""
         if not self.player.playlist:
             messagebox.showinfo('Save Playlist', 'Playlist is empty')
             return
-        path = filedialog.asksaveasfilename(defaultextension='.m3u', filetypes=[('Playlist files', '*.m3u'), ('All files', '*.*')])
-        if path:
+        filetypes = [('Playlist files', '*.m3u'), ('All files', '*.*')]
+        if self.smart_playlist is not None:
+            filetypes.insert(1, ('Smart playlists', '*.json'))
+        path = filedialog.asksaveasfilename(defaultextension='.m3u', filetypes=filetypes)
+        if path and self.smart_playlist is not None and path.lower().endswith('.json'):
+            try:
+                save_smart_playlist(path, self.smart_playlist.name, self.smart_playlist.query.text)
+                self.status_var.set(f"Saved smart playlist: {os.path.basename(path)}")
+            except Exception as e:
+                messagebox.showerror('Error', f'Could not save playlist: {e}')
+        elif path:
             try:
                 with open(path, 'w', encoding='utf-8') as f:
                     f.write('#EXTM3U\n')
@@ -541,15 +654,26 @@ class MusicPlayerApp:
 
     def load_playlist_dialog(self):
         """Load an M3U playlist and replace current playlist"""
-        path = filedialog.askopenfilename(filetypes=[('Playlist files', '*.m3u'), ('All files', '*.*')])
-        if path:
+        path = filedialog.askopenfilename(filetypes=[('Playlist files', '*.m3u'), ('Smart playlists', '*.json'),
+                                                     ('All files', '*.*')])
+        if path and path.lower().endswith('.json'):
+            try:
+                definition = load_smart_playlist(path)
+                if definition is None:
+                    raise ValueError('not a smart playlist')
+                self.open_smart_playlist(*definition)
+            except Exception as e:
+                messagebox.showerror('Error', f'Could not load playlist: {e}')
+        elif path:
             try:
                 with open(path, 'r', encoding='utf-8') as f:
                     lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
                     # Only keep existing files
                     files = [l for l in lines if os.path.exists(l)]
+                    self.jobs.cancel_group('metadata')
                     count = self.player.load_playlist(files)
                     self.update_playlist_display()
+                    self.load_metadata(list(self.player.playlist))
                     self.status_var.set(f"Loaded playlist: {count} files from {os.path.basename(path)}")
             except Exception as e:
                 messagebox.showerror('Error', f'Could not load playlist: {e}')
@@ -574,12 +698,13 @@ class MusicPlayerApp:
         files = filedialog.askopenfilenames(
             title="Select Audio Files",
             filetypes=[
-                ("All Supported Formats", "*.mp3 *.wav *.ogg *.m4a *.flac"),
+                ("All Supported Formats", "*.mp3 *.wav *.ogg *.m4a *.flac *.cue"),
                 ("MP3 Files", "*.mp3"),
                 ("WAV Files", "*.wav"),
                 ("OGG Files", "*.ogg"),
                 ("FLAC Files", "*.flac"),
                 ("M4A Files", "*.m4a"),
+                ("CUE Sheets", "*.cue"),
                 ("All Files", "*.*")
             ]
         )
@@ -590,19 +715,7 @@ class MusicPlayerApp:
                 count = self.player.add_files(files)
                 self.update_playlist_display()
                 self.status_var.set(f"✅ Added {count} files to playlist")
-
-                # Spawn background thread to fetch metadata (length/title/artist) without blocking UI
-                import threading
-                def fetch_metadata(paths):
-                    for p in paths:
-                        try:
-                            length = self.player.get_song_length(p)
-                            # Update UI for the entry if it is displayed
-                            self.root.after(10, self.update_playlist_display)
-                        except Exception:
-                            pass
-                t = threading.Thread(target=fetch_metadata, args=(files,), daemon=True)
-                t.start()
+                self.load_metadata(self.player.playlist[len(self.player.playlist) - count:])
             except Exception as e:
                 messagebox.showerror("Error", f"Could not add files: {e}")
 
@@ -614,18 +727,134 @@ class MusicPlayerApp:
                 count = self.player.add_folder(folder)
                 self.update_playlist_display()
                 self.status_var.set(f"✅ Added {count} files from folder")
+                self.load_metadata(self.player.playlist[len(self.player.playlist) - count:])
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
+    def add_stream_url(self):
+        """Add an HTTP(S) stream or M3U/PLS radio URL to the playlist"""
+        url = simpledialog.askstring("Add Stream", "HTTP(S) stream or radio playlist URL:", parent=self.root)
+        if not url:
+            return
+        url = url.strip()
+        if not is_stream_url(url):
+            messagebox.showerror("Error", "Enter an http:// or https:// URL")
+            return
+        self.player.add_files([url])
+        self.update_playlist_display()
+        self.status_var.set("✅ Added stream to playlist")
+
+    def load_metadata(self, paths):
+        """Read tags into the library on the shared executor, refreshing the view per batch"""
+        paths = [p for p in paths if not is_stream_url(p)]
+        if paths:
+            self.jobs.map(self.library.read_if_stale, paths, key='metadata', priority=PRIORITY_LOW,
+                          group='metadata', on_batch=self._on_metadata_batch)
+
+    def _on_metadata_batch(self, pairs):
+        with self.library.batch():
+            self.library.apply(pairs)
+            # Tracks new to the library start at played=0; restore their history
+            self.history.apply_to(self.library, [path for path, meta in pairs if meta is not None])
+        for path, _meta in pairs:
+            track_id = self.library.id_of(path)
+            if track_id is not None:
+                self.player.durations[path] = self.library.value(track_id, 'length') or 0
+        self.request_playlist_refresh()
+
+    def new_smart_playlist(self):
+        """Ask for a query and make its live results the playlist"""
+        query = simpledialog.askstring(
+            'New Smart Playlist',
+            'Query, e.g.  artist:"Name" and length>300 order by added desc limit 200',
+            parent=self.root)
+        if query:
+            self.open_smart_playlist(query, query)
+
+    def open_smart_playlist(self, name, query):
+        """Follow the results of query; they are reapplied as the library changes"""
+        try:
+            smart = SmartPlaylist(name, query, self.library, on_update=self._schedule_smart_update)
+        except QueryError as e:
+            messagebox.showerror('Smart Playlist', f'Invalid query: {e}')
+            return
+        self.close_smart_playlist()
+        self.smart_playlist = smart
+        self._apply_smart_results(smart.paths)
+        self.load_metadata(list(self.player.playlist))
+        self.status_var.set(f"Smart playlist: {len(smart.paths)} tracks")
+
+    def close_smart_playlist(self):
+        if self.smart_playlist is not None:
+            self.smart_playlist.close()
+        self.smart_playlist = None
+        self._smart_applied = None
+
+    def _schedule_smart_update(self, paths):
+        # Library changes arrive per metadata batch; apply at most twice a second
+        if self._smart_pending is None:
+            self.root.after(500, self._run_smart_update)
+        self._smart_pending = paths
+
+    def _run_smart_update(self):
+        paths, self._smart_pending = self._smart_pending, None
+        if paths is None or self.smart_playlist is None:
+            return
+        if self.player.playlist != self._smart_applied:
+            # Edited by hand since the last update: stop following the query
+            self.close_smart_playlist()
+            return
+        self._apply_smart_results(paths)
+
+    def _apply_smart_results(self, paths):
+        """Replace the playlist with paths, keeping the current track selected"""
+        current = None
+        if 0 <= self.player.current_index < len(self.player.playlist):
+            current = self.player.playlist[self.player.current_index]
+        self.player.load_playlist(paths)
+        position = self.player.playlist.position(current) if current is not None else None
+        self.player.current_index = position or 0
+        self._smart_applied = list(self.player.playlist)
+        self.update_playlist_display()
+
+    def request_playlist_refresh(self):
+        """Coalesce refresh requests into a single display update"""
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.root.after(250, self._run_playlist_refresh)
+
+    def _run_playlist_refresh(self):
+        self._refresh_pending = False
+        self.update_playlist_display()
+
     def clear_playlist(self):
         """Clear playlist"""
         if messagebox.askyesno("Confirm", "Clear entire playlist?"):
+            self.jobs.cancel_group('metadata')
             self.player.clear_playlist()
             self.update_playlist_display()
             self.song_var.set("No song selected")
             self.artist_var.set("")
             self.status_var.set("Playlist cleared")
 
+    def undo_edit(self):
+        """Undo the last playlist edit"""
+        label = self.player.undo_edit()
+        if label is None:
+            self.status_var.set("Nothing to undo")
+            return
+        self.update_playlist_display()
+        self.status_var.set(f"Undid {label}")
+
+    def redo_edit(self):
+        """Redo the last undone playlist edit"""
+        label = self.player.redo_edit()
+        if label is None:
+            self.status_var.set("Nothing to redo")
+            return
+        self.update_playlist_display()
+        self.status_var.set(f"Redid {label}")
+
     def remove_selected(self):
         """Remove selected song from playlist"""
         selection = self.playlist_tree.selection()
@@ -643,7 +872,7 @@ class MusicPlayerApp:
         index = self.playlist_tree.index(selection[0])
         if index <= 0:
             return
-        self.player.playlist[index - 1], self.player.playlist[index] = self.player.playlist[index], self.player.playlist[index - 1]
+        self.player.move(index, index - 1)
         self.update_playlist_display()
         self.playlist_tree.selection_set(self.playlist_tree.get_children()[index - 1])
 
@@ -655,10 +884,73 @@ class MusicPlayerApp:
         index = self.playlist_tree.index(selection[0])
         if index >= len(self.player.playlist) - 1:
             return
-        self.player.playlist[index + 1], self.player.playlist[index] = self.player.playlist[index], self.player.playlist[index + 1]
+        self.player.move(index, index + 1)
         self.update_playlist_display()
         self.playlist_tree.selection_set(self.playlist_tree.get_children()[index + 1])
 
+    def toggle_autoplay(self):
+        """Extend the playlist with similar tracks when it runs out (if enabled)"""
+        enabled = bool(self.autoplay_var.get()) and self.similar is not None
+        self.player.autoplay = self.similar if enabled else None
+        self.config['autoplay_similar'] = bool(self.autoplay_var.get())
+
+    def analyze_library(self):
+        """Extract feature vectors for library tracks that have none, on all cores"""
+        if self.features is None:
+            messagebox.showerror("Analyze Audio", "NumPy is required for audio analysis.")
+            return
+        paths = self.features.missing(p for p in self.library.paths if p is not None)
+        if not paths:
+            self.status_var.set("All library tracks are analyzed")
+            return
+        self.status_var.set(f"Analyzing {len(paths)} tracks...")
+        self.jobs.submit(self._run_analysis, paths, key='features', pool='cpu', group='features',
+                         callback=self._on_analysis_done)
+
+    def _run_analysis(self, paths):
+        """Worker thread: feed batches from the process pool back to the Tk thread"""
+        done = 0
+        for vectors in features.extract_batch(paths, cancelled=self._analysis_stop.is_set):
+            done += len(vectors)
+            self.dispatcher.post(self._on_analysis_batch, vectors, done, len(paths))
+        return done
+
+    def _on_analysis_batch(self, vectors, done, total):
+        self.features.update(vectors)
+        self.status_var.set(f"Analyzing tracks... {done}/{total}")
+
+    def _on_analysis_done(self, count):
+        self.features.save(FEATURES_FILE)
+        self.status_var.set(f"Analyzed {count} tracks")
+
+    def _on_history_event(self, path, stats):
+        """Keep library play counts (and smart playlists using them) current"""
+        self.library.update(path, played=stats.plays, last_played=int(stats.last_played))
+
+    # Treeview column -> collation.COLUMN_KEYS entry
+    SORT_KEYS = {'name': 'file', 'duration': 'length'}
+    HEADINGS = {'name': 'Song Name', 'duration': 'Duration'}
+
+    @metrics.timed('ui_playlist_sort_seconds')
+    def sort_playlist(self, column):
+        """Sort the playlist by a column; clicking the same column again reverses it"""
+        if not self.player.playlist:
+            return
+        if column == self._sort_column:
+            self._sort_descending = not self._sort_descending
+        else:
+            self._sort_column = column
+            self._sort_descending = False
+        order = self.sort_keys.sort_order(self.player.playlist, self.SORT_KEYS[column],
+                                          self._sort_descending)
+        self.player.reorder(order)
+        for name, text in self.HEADINGS.items():
+            if name == column:
+                text += ' \u25bc' if self._sort_descending else ' \u25b2'
+            self.playlist_tree.heading(name, text=text)
+        self.update_playlist_display()
+
+    @metrics.timed('ui_playlist_refresh_seconds')
     def update_playlist_display(self):
         """Update the playlist treeview display"""
         # Clear current display
@@ -673,9 +965,9 @@ class MusicPlayerApp:
                 display_name = song_info['title']
                 duration = utils.format_time(song_info['length'])
             else:
-                display_name = os.path.basename(file_path)
-                # Get duration for this file
-                duration = utils.format_time(self.player.get_song_length(file_path))
+                display_name = cue.display_name(file_path)
+                # Only cached durations here; unknown ones are filled in by load_metadata
+                duration = utils.format_time(self.player.durations.get(file_path, 0))
 
             self.playlist_tree.insert('', 'end', values=(display_name, duration))
 
@@ -690,8 +982,6 @@ class MusicPlayerApp:
         """Play selected music"""
         try:
             if self.player.play():
-                self.config['last_index'] = self.player.current_index
-                self.config['last_playlist'] = list(self.player.playlist)
                 self.update_playlist_display()
                 self.play_btn.config(text="⏸ Pause")
                 self.status_var.set("Now playing")
@@ -750,8 +1040,9 @@ class MusicPlayerApp:
             self.update_playlist_display()
             self.status_var.set("Previous song")
 
-    def on_song_change(self, song_info):
+    def on_song_change(self, event):
         """Callback when song changes"""
+        song_info = event.info
         if song_info:
             self.song_var.set(song_info['title'])
             self.artist_var.set(song_info['artist'])
@@ -760,8 +1051,11 @@ class MusicPlayerApp:
             total_time = utils.format_time(song_info['length'])
             self.total_time_var.set(total_time)
 
-    def on_playback_end(self):
+    def on_playback_end(self, event):
         """Callback when playback ends naturally"""
+        if event.index != self.player.current_index:
+            # Another track was started before the event arrived
+            return
         print("Playback ended, playing next song...")
         self.next_song()
 
@@ -801,6 +1095,7 @@ class MusicPlayerApp:
             position = (float(value) / 100.0) * self.player.song_length
             self.current_time_var.set(utils.format_time(position))
 
+    @metrics.timed('ui_tick_seconds')
     def update_progress(self):
         """Update progress bar and time display"""
         # We keep last_time/last_pos to interpolate rendering between pygame.get_pos updates
@@ -820,14 +1115,11 @@ class MusicPlayerApp:
                     # interpolate forward smoothly
                     elapsed = now - self._last_progress_time
                     current_pos = self._last_progress_pos + elapsed
-                    # do not exceed actual length
-                    song_info = self.player.get_current_song_info()
-                    if song_info and song_info['length'] > 0:
-                        current_pos = min(current_pos, song_info['length'])
-                song_info = self.player.get_current_song_info()
-
-                if song_info and song_info['length'] > 0:
-                    progress = (current_pos / song_info['length']) * 100
+                # Use the cached length; re-reading tags here stalled every tick
+                length = self.player.song_length
+                if length > 0:
+                    current_pos = min(current_pos, length)
+                    progress = (current_pos / length) * 100
                     self.progress_var.set(progress)
 
                     # Update current time
@@ -835,9 +1127,14 @@ class MusicPlayerApp:
             except Exception as e:
                 print(f"Progress update error: {e}")
 
+        # Throttled by the journal itself; only the latest position is kept
+        if getattr(self, 'journal', None) is not None:
+            self.journal.record_position(self.player.current_index, self.player.get_current_position())
+
         # Schedule next update
         self.root.after(200, self.update_progress)
 
+    @metrics.timed('ui_tick_seconds')
     def check_music_events(self):
         """Check for music events like song end"""
         self.player.check_events()
@@ -847,16 +1144,33 @@ class MusicPlayerApp:
     def quit_app(self):
         """Quit application safely"""
         if messagebox.askokcancel("Quit", "Are you sure you want to quit?"):
-            # Save config (persist volume and last playlist)
+            # Save settings to config.json and playback state to the session snapshot
             try:
                 self.config['volume'] = float(self.player.volume)
-                # Optionally save last playlist path list
-                self.config['last_playlist'] = getattr(self.player, 'playlist', None)
+                # Playlist now lives in the session snapshot; drop the legacy copy
+                self.config['last_playlist'] = None
                 utils.save_config(CONFIG_FILE, self.config)
+                self.journal.close()
             except Exception:
                 pass
-
+            self.close_smart_playlist()
+            self.library.save(LIBRARY_FILE)
+            self.history.close()
+            if self.http_server is not None:
+                self.http_server.stop()
+            if self.player.silence is not None:
+                self.player.silence.save()
+            self._analysis_stop.set()
+            if self.features is not None:
+                self.features.save(FEATURES_FILE)
+
+            self.watchdog.stop()
+            self.dispatcher.stop()
+            self.jobs.shutdown()
             self.player.shutdown()
+            # After shutdown, which records the position playback stopped at
+            if self.player.bookmarks is not None:
+                self.player.bookmarks.close()
             self.root.quit()
             self.root.destroy()
 
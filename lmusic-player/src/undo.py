@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Undo/redo for playlist edits
+
+UndoHistory keeps a persistent copy of the playlist (PVector) in step
+with the live Playlist through its listener, and each undoable edit
+(MusicPlayer wraps them in history.step()) remembers the version from
+before it. Versions share structure: a PVector is a spine of fixed-size
+chunks, and an edit copies only the spine and the chunks it touches, so
+hundreds of steps on a 100k-track playlist cost a few KB each instead of
+a copy of the list. Clearing or replacing the playlist keeps the old
+version alive by reference; nothing is copied.
+
+Undo restores the stored entries together with their index keys, so the
+playlist index is rebuilt without resolving paths again.
+
+Edits made outside a step (journal replay, code editing player.playlist
+directly) cannot be undone; they end the history instead of being
+silently reverted by a later undo.
+"""
+
+import bisect
+import itertools
+from array import array
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+CHUNK_SIZE = 256
+
+
+class PVector:
+    """Immutable sequence; edits return a new vector sharing unchanged chunks"""
+
+    __slots__ = ('_chunks', '_ends')
+
+    def __init__(self, chunks: tuple = ()):
+        self._chunks = chunks
+        self._ends = array('q', itertools.accumulate(len(c) for c in chunks))
+
+    @classmethod
+    def from_iterable(cls, items: Iterable) -> 'PVector':
+        items = tuple(items)
+        return cls(tuple(items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)))
+
+    def __len__(self):
+        return self._ends[-1] if self._ends else 0
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._chunks)
+
+    def __getitem__(self, index: int):
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("PVector index out of range")
+        chunk, offset = self._locate(index)
+        return self._chunks[chunk][offset]
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """(chunk number, offset in chunk) of position index (< len)"""
+        chunk = bisect.bisect_right(self._ends, index)
+        start = self._ends[chunk - 1] if chunk else 0
+        return chunk, index - start
+
+    def extend(self, items: Iterable) -> 'PVector':
+        items = tuple(items)
+        if not items:
+            return self
+        chunks = list(self._chunks)
+        if chunks and len(chunks[-1]) < CHUNK_SIZE:
+            room = CHUNK_SIZE - len(chunks[-1])
+            chunks[-1] = chunks[-1] + items[:room]
+            items = items[room:]
+        chunks.extend(items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE))
+        return PVector(tuple(chunks))
+
+    def insert(self, index: int, item) -> 'PVector':
+        n = len(self)
+        index = max(0, min(index, n))
+        if index == n:
+            return self.extend((item,))
+        chunk, offset = self._locate(index)
+        old = self._chunks[chunk]
+        grown = old[:offset] + (item,) + old[offset:]
+        if len(grown) > 2 * CHUNK_SIZE:
+            replacement = (grown[:CHUNK_SIZE], grown[CHUNK_SIZE:])
+        else:
+            replacement = (grown,)
+        return PVector(self._chunks[:chunk] + replacement + self._chunks[chunk + 1:])
+
+    def delete(self, start: int, stop: int) -> 'PVector':
+        """Remove positions start..stop-1"""
+        n = len(self)
+        start, stop = max(0, start), min(stop, n)
+        if start >= stop:
+            return self
+        first, first_offset = self._locate(start)
+        last, last_offset = self._locate(stop - 1)
+        merged = self._chunks[first][:first_offset] + self._chunks[last][last_offset + 1:]
+        before, after = self._chunks[:first], self._chunks[last + 1:]
+        # Keep chunks from fragmenting: fold a small remainder into its neighbour
+        if len(merged) < CHUNK_SIZE // 4 and after and len(merged) + len(after[0]) <= 2 * CHUNK_SIZE:
+            merged, after = merged + after[0], after[1:]
+        return PVector(before + ((merged,) if merged else ()) + after)
+
+
+class _Step:
+    __slots__ = ('label', 'entries', 'keys', 'index')
+
+    def __init__(self, label: str, entries: PVector, keys: PVector, index: int):
+        self.label = label
+        self.entries = entries
+        self.keys = keys
+        self.index = index
+
+
+class UndoHistory:
+    """Bounded undo and redo stacks of playlist versions"""
+
+    def __init__(self, limit: int = 200):
+        self.limit = limit
+        self._undo: List[_Step] = []
+        self._redo: List[_Step] = []
+        self._playlist = None
+        self._entries = PVector()
+        self._keys = PVector()
+        self._depth = 0
+        self._before: Optional[_Step] = None
+        self._restoring = False
+
+    # ------------------ tracking ------------------
+    def attach(self, playlist):
+        """Follow playlist (replacing any previous one); starts an empty history"""
+        if self._playlist is not None and self._playlist is not playlist:
+            self._playlist.listener = None
+        self._playlist = playlist
+        playlist.listener = self._on_change
+        self._entries = PVector.from_iterable(playlist)
+        self._keys = PVector.from_iterable(playlist.index_keys())
+        self.clear()
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+
+    def _on_change(self, op: str, *args):
+        if self._restoring:
+            return
+        if op == 'extend':
+            paths, keys = args
+            self._entries = self._entries.extend(paths)
+            self._keys = self._keys.extend(keys)
+        elif op == 'insert':
+            index, path, key = args
+            self._entries = self._entries.insert(index, path)
+            self._keys = self._keys.insert(index, key)
+        elif op == 'delete':
+            start, stop = args
+            self._entries = self._entries.delete(start, stop)
+            self._keys = self._keys.delete(start, stop)
+        else:
+            paths, keys = args
+            self._entries = PVector.from_iterable(paths)
+            self._keys = PVector.from_iterable(keys)
+        if self._depth == 0:
+            self.clear()
+
+    @contextmanager
+    def step(self, label: str, index: int):
+        """Group the playlist edits made inside into one undoable step
+
+        index is the current song index to restore on undo. Nested steps
+        fold into the outermost one; steps that change nothing are dropped.
+        """
+        if self._depth == 0:
+            self._before = _Step(label, self._entries, self._keys, index)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                before, self._before = self._before, None
+                if before.entries is not self._entries:
+                    self._undo.append(before)
+                    del self._undo[:-self.limit]
+                    self._redo.clear()
+
+    # ------------------ undo / redo ------------------
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def undo_label(self) -> Optional[str]:
+        return self._undo[-1].label if self._undo else None
+
+    def redo_label(self) -> Optional[str]:
+        return self._redo[-1].label if self._redo else None
+
+    def undo(self, index: int) -> Optional[Tuple[str, int]]:
+        """Restore the playlist from before the last step; (label, index then) or None"""
+        return self._swap(self._undo, self._redo, index)
+
+    def redo(self, index: int) -> Optional[Tuple[str, int]]:
+        """Apply the last undone step again; (label, index then) or None"""
+        return self._swap(self._redo, self._undo, index)
+
+    def _swap(self, source: List[_Step], target: List[_Step], index: int):
+        if not source or self._playlist is None or self._depth:
+            return None
+        step = source.pop()
+        target.append(_Step(step.label, self._entries, self._keys, index))
+        self._restoring = True
+        try:
+            self._playlist.restore(list(step.entries), list(step.keys))
+        finally:
+            self._restoring = False
+        self._entries, self._keys = step.entries, step.keys
+        return step.label, step.index
@@ -80,11 +80,31 @@ def load_config(config_path: str) -> Dict[str, Any]:
     return default_config
 
 
+def atomic_write(file_path: str, data: bytes) -> None:
+    """Write bytes via a temporary file, fsync and atomic rename"""
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
 def save_config(config_path: str, config: Dict[str, Any]) -> bool:
-    """Save configuration to JSON file"""
+    """Save configuration to JSON file (atomically replaced)"""
     try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+        data = json.dumps(config, indent=4, ensure_ascii=False)
+        atomic_write(config_path, data.encode('utf-8'))
         logging.info(f"Configuration saved to {config_path}")
         return True
     except Exception as e:
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Main-thread stall watchdog for the Tk event loop
+
+A heartbeat scheduled with root.after() measures event-loop lag. A
+monitor thread notices when the heartbeat stops for longer than the
+threshold, samples the main thread's stack while the stall lasts and,
+once the loop recovers, records a report with the stall duration and the
+stacks seen (most frequent first), so the blocking callback can be found.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class StallReport:
+    """One detected stall of the main thread"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.wall_time = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks = Counter()
+
+    def add_sample(self, stack: str):
+        self.samples += 1
+        self.stacks[stack] += 1
+
+    @property
+    def culprit(self) -> str:
+        """Innermost frame of the most frequently sampled stack"""
+        if not self.stacks:
+            return 'unknown'
+        stack = self.stacks.most_common(1)[0][0]
+        lines = [l for l in stack.strip().splitlines() if l.strip().startswith('File ')]
+        return lines[-1].strip() if lines else 'unknown'
+
+    def format(self) -> str:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.wall_time))
+        out = [f"[{when}] main thread blocked for {self.duration * 1000:.0f} ms "
+               f"({self.samples} samples) in {self.culprit}"]
+        for stack, n in self.stacks.most_common(3):
+            share = n * 100 // max(1, self.samples)
+            out.append(f"--- {n} samples ({share}%) ---")
+            out.append(stack.rstrip())
+        return '\n'.join(out)
+
+    def to_dict(self) -> Dict:
+        return {
+            'time': self.wall_time,
+            'duration_s': self.duration,
+            'samples': self.samples,
+            'culprit': self.culprit,
+            'stacks': [{'count': n, 'stack': s} for s, n in self.stacks.most_common()],
+        }
+
+
+class StallWatchdog:
+    """Detect and report callbacks that block the Tk event loop"""
+
+    def __init__(self, root, threshold: float = 0.25, interval: float = 0.05,
+                 log_path: Optional[str] = None, max_reports: int = 50):
+        self.root = root
+        self.threshold = threshold
+        self.interval = interval
+        self.log_path = log_path
+        self.reports = deque(maxlen=max_reports)
+
+        self._main_id = threading.main_thread().ident
+        self._last_beat = time.perf_counter()
+        self._expected = None
+        self._current = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._after_id = None
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._main_id = threading.get_ident()  # the thread running the Tk loop
+        self._last_beat = time.perf_counter()
+        self._schedule()
+        self._thread = threading.Thread(target=self._monitor, name='stall-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    # ------------------ main thread ------------------
+    def _schedule(self):
+        self._expected = time.perf_counter() + self.interval
+        self._after_id = self.root.after(int(self.interval * 1000), self._beat)
+
+    def _beat(self):
+        now = time.perf_counter()
+        metrics.observe('ui_event_loop_lag_seconds', max(0.0, now - self._expected))
+        with self._lock:
+            self._last_beat = now
+            report, self._current = self._current, None
+        if report is not None:
+            self._finish(report, now)
+        if self._running:
+            self._schedule()
+
+    def _finish(self, report: StallReport, now: float):
+        report.duration = now - report.started
+        self.reports.append(report)
+        metrics.inc('ui_stalls_total')
+        metrics.observe('ui_stall_seconds', report.duration)
+        text = report.format()
+        logger.warning(text)
+        if self.log_path:
+            try:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(text + '\n\n')
+            except Exception as e:
+                logger.error(f"Could not write stall log {self.log_path}: {e}")
+
+    # ------------------ monitor thread ------------------
+    def _monitor(self):
+        poll = self.interval / 2
+        while self._running:
+            time.sleep(poll)
+            now = time.perf_counter()
+            with self._lock:
+                # The heartbeat is due every interval; anything beyond that is blocking time
+                blocked_since = self._last_beat + self.interval
+                if now - blocked_since < self.threshold:
+                    continue
+                if self._current is None:
+                    self._current = StallReport(blocked_since)
+                report = self._current
+            frame = sys._current_frames().get(self._main_id)
+            if frame is not None:
+                report.add_sample(''.join(traceback.format_stack(frame)))
+
+    def recent(self, limit: int = 10) -> List[StallReport]:
+        return list(self.reports)[-limit:]
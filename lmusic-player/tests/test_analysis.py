@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Unit tests for BPM and key detection
+"""
+
+import unittest
+import os
+import wave
+import tempfile
+import sys
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import analysis
+from collation import SortKeyCache
+from library import Library
+from smart_playlist import compile_query
+
+RATE = 22050
+
+
+def scale_track(tonic, minor, bpm=120, seconds=10.0):
+    """Scale tones weighted towards the tonic triad, pulsing on every beat"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    steps = (0, 2, 3, 5, 7, 8, 10) if minor else (0, 2, 4, 5, 7, 9, 11)
+    triad = (0, 3, 7) if minor else (0, 4, 7)
+    signal = np.zeros_like(t)
+    for step in steps:
+        freq = 261.63 * 2 ** ((tonic + step) / 12)
+        weight = 1.0 if step in triad else 0.35
+        signal += weight * (np.sin(2 * np.pi * freq * t) + 0.3 * np.sin(4 * np.pi * freq * t))
+    signal *= 0.5 + 0.5 * np.exp(-(t % (60.0 / bpm)) / 0.05)
+    return (signal / np.abs(signal).max()).astype(np.float32)
+
+
+def write_wav(path, samples):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes((samples * 32000).astype('<i2').tobytes())
+
+
+class TestCamelot(unittest.TestCase):
+
+    def test_wheel_codes(self):
+        """Test keys map to their Camelot codes"""
+        expected = {'C': '8B', 'Am': '8A', 'G': '9B', 'Em': '9A', 'F': '7B', 'F#': '2B',
+                    'D#m': '2A', 'B': '1B', 'G#m': '1A'}
+        for key, code in expected.items():
+            self.assertEqual(analysis.camelot(key), code, key)
+        self.assertIsNone(analysis.camelot('H'))
+        self.assertIsNone(analysis.camelot(None))
+
+
+@unittest.skipIf(np is None, "NumPy is required for audio analysis")
+class TestAnalysis(unittest.TestCase):
+
+    def test_all_keys(self):
+        """Test every major and minor key is detected"""
+        for tonic in range(12):
+            for minor in (False, True):
+                expected = analysis.key_name(tonic, minor)
+                self.assertEqual(analysis.estimate_key(scale_track(tonic, minor)), expected)
+
+    def test_bpm(self):
+        """Test the tempo estimate and silence handling"""
+        self.assertAlmostEqual(analysis.estimate_bpm(scale_track(0, False, bpm=124)), 124, delta=2)
+        silence = np.zeros(RATE * 3, dtype=np.float32)
+        self.assertIsNone(analysis.estimate_bpm(silence))
+        self.assertIsNone(analysis.estimate_key(silence))
+
+    def test_batch_checkpoint_and_library(self):
+        """Test a batch run checkpoints results and they become sortable and searchable"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            specs = [(9, True, 100), (0, False, 128), (7, False, 90)]
+            paths = []
+            for i, (tonic, minor, bpm) in enumerate(specs):
+                path = os.path.join(tmpdir, f"{i}.wav")
+                write_wav(path, scale_track(tonic, minor, bpm, seconds=6.0))
+                paths.append(path)
+            checkpoint_path = os.path.join(tmpdir, 'analysis.json')
+            results = {}
+            for batch in analysis.analyze_batch(paths, analysis.AnalysisCheckpoint(checkpoint_path), workers=2):
+                results.update(batch)
+            self.assertEqual([results[p]['key'] for p in paths], ['Am', 'C', 'G'])
+            self.assertTrue(os.path.exists(checkpoint_path))
+
+            # A second run is served from the checkpoint without workers
+            checkpoint = analysis.AnalysisCheckpoint(checkpoint_path)
+            batches = list(analysis.analyze_batch(paths, checkpoint, workers=0))
+            self.assertEqual(len(batches), 1)
+            self.assertEqual(batches[0], results)
+
+            library = Library()
+            analysis.register_fields(library)
+            with library.batch():
+                for path, result in results.items():
+                    library.add(path, **result)
+            fast = compile_query('tempo>=120', library).evaluate(library)
+            self.assertEqual(fast, [paths[1]])
+            self.assertEqual(compile_query('key:am', library).evaluate(library), [paths[0]])
+            order = SortKeyCache(library).sort_order(paths, 'key')
+            # 7B (F... none), 8A (Am), 8B (C), 9B (G)
+            self.assertEqual([paths[i] for i in order], [paths[0], paths[1], paths[2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the asyncio player facade
+"""
+
+import unittest
+import time
+import asyncio
+import tempfile
+import threading
+import os
+import sys
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pygame
+from async_player import AsyncMusicPlayer, SONG_CHANGE, STATE, PLAYLIST
+
+
+class TestAsyncMusicPlayer(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a few placeholder audio files"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.tmpdir.name, f"track{i}.mp3")
+            with open(path, 'wb') as f:
+                f.write(b'\0' * 128)
+            self.files.append(path)
+
+    def test_commands_publish_events(self):
+        """Test awaited commands update state and reach event subscribers"""
+        async def scenario():
+            async with AsyncMusicPlayer(poll_interval=0.01) as player:
+                events = player.events()
+                first = asyncio.ensure_future(events.__anext__())
+                await asyncio.sleep(0)
+
+                self.assertEqual(await player.add_files(self.files), 3)
+                await player.play(1)
+                await player.next()
+                await player.set_volume(0.3)
+
+                seen = [await first]
+                while len(seen) < 6:
+                    seen.append(await asyncio.wait_for(events.__anext__(), 1))
+                return player, seen
+
+        player, seen = asyncio.run(scenario())
+        types = [e.type for e in seen]
+        self.assertEqual(types[0], PLAYLIST)
+        self.assertEqual(types.count(SONG_CHANGE), 2)
+        self.assertEqual(types.count(STATE), 2)
+        self.assertEqual(player.player.current_index, 2)
+        self.assertAlmostEqual(player.player.volume, 0.3)
+
+    def test_many_players_one_loop(self):
+        """Test hundreds of simulated players can be driven concurrently"""
+        async def drive(player):
+            await player.load_playlist(self.files)
+            await player.play(0)
+            await player.seek(12.5)
+            await player.next()
+            length = await player.get_song_length(self.files[0])
+            await player.close()
+            return player.player.current_index, length
+
+        async def scenario():
+            players = [AsyncMusicPlayer() for _ in range(200)]
+            return await asyncio.gather(*(drive(p) for p in players))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(len(results), 200)
+        self.assertTrue(all(index == 1 for index, _length in results))
+
+    def test_close_leaves_shared_mixer_open(self):
+        """Test closing facades stops their players but not the process-wide mixer"""
+        driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        self.addCleanup(self._restore_driver, driver)
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        except pygame.error as e:
+            self.skipTest(f"dummy audio driver unavailable: {e}")
+
+        async def drive(player):
+            await player.load_playlist(self.files)
+            await player.play(0)
+            await player.close()
+
+        async def scenario():
+            players = [AsyncMusicPlayer() for _ in range(20)]
+            await asyncio.wait_for(asyncio.gather(*(drive(p) for p in players)), 10)
+            return players
+
+        players = asyncio.run(scenario())
+        self.assertTrue(pygame.mixer.get_init())
+        self.assertFalse(any(p.player.is_playing for p in players))
+
+    def _restore_driver(self, driver):
+        pygame.mixer.quit()
+        if driver is None:
+            os.environ.pop('SDL_AUDIODRIVER', None)
+        else:
+            os.environ['SDL_AUDIODRIVER'] = driver
+
+    def test_polling_is_serialized_with_commands(self):
+        """Test end-of-track polling runs on the executor and never during a command"""
+        polls = []
+
+        async def scenario():
+            async with AsyncMusicPlayer(poll_interval=0.005) as player:
+                backend = player.player
+                busy = []
+                real_play, real_check = backend.play, backend.check_events
+
+                def slow_play(*args, **kwargs):
+                    busy.append(True)
+                    try:
+                        time.sleep(0.05)
+                        return real_play(*args, **kwargs)
+                    finally:
+                        busy.pop()
+
+                def check_events():
+                    polls.append((threading.current_thread() is loop_thread, bool(busy)))
+                    return real_check()
+
+                backend.play, backend.check_events = slow_play, check_events
+                await player.load_playlist(self.files)
+                for _ in range(3):
+                    await player.play(0)
+
+        loop_thread = threading.current_thread()
+        asyncio.run(scenario())
+        self.assertTrue(polls)
+        self.assertEqual(set(polls), {(False, False)})
+
+    def test_events_end_on_close(self):
+        """Test event iterators finish when the player closes"""
+        async def scenario():
+            player = AsyncMusicPlayer()
+            await player.start()
+
+            async def collect():
+                return [e async for e in player.events()]
+
+            task = asyncio.ensure_future(collect())
+            await asyncio.sleep(0)
+            await player.stop()
+            await player.close()
+            return await asyncio.wait_for(task, 1)
+
+        events = asyncio.run(scenario())
+        self.assertEqual([e.type for e in events], [STATE])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Unit tests for mixer output profiles, underrun backoff and command latency
+"""
+
+import unittest
+import gc
+import os
+import sys
+import time
+import wave
+import tempfile
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pygame
+import metrics
+from audio_output import AudioOutput, AudioSettings, settings_for, settings_from_config, UNDERRUN_LIMIT
+from player import MusicPlayer
+
+
+def write_silence(path, seconds, rate=44100):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(int(seconds * rate) * 4))
+
+
+class TestAudioOutput(unittest.TestCase):
+
+    def test_profiles(self):
+        """Test profiles, overrides and the config mapping"""
+        self.assertEqual(settings_for('low_latency').buffer, 512)
+        self.assertEqual(settings_for('high_quality').buffer, 4096)
+        self.assertEqual(settings_for('no-such-profile'), settings_for('low_latency'))
+        custom = settings_from_config({'audio_profile': 'balanced', 'audio_buffer': 1024, 'audio_frequency': None})
+        self.assertEqual(custom, AudioSettings(44100, -16, 2, 1024))
+        self.assertAlmostEqual(custom.buffer_seconds, 1024 / 44100)
+
+    def test_underruns_grow_buffer(self):
+        """Test late callbacks count as underruns and repeated ones schedule a larger buffer"""
+        output = AudioOutput(AudioSettings(buffer=441))
+        output.settings = AudioSettings(buffer=441)  # 10 ms per callback
+        period, poll = 0.01, 0.0025
+        now = 100.0
+        for _ in range(50):
+            now += period
+            output._consumed(now, now - poll)
+        self.assertEqual(output.underruns, 0)
+        # The probe thread was itself held up: the gap says nothing about the device
+        now += 0.2
+        output._consumed(now, None)
+        now += period
+        output._consumed(now, now - poll)
+        self.assertEqual(output.underruns, 0)
+        for i in range(UNDERRUN_LIMIT):
+            self.assertFalse(output.pending_backoff)
+            now += 0.05
+            output._consumed(now, now - poll)
+        self.assertEqual(output.underruns, UNDERRUN_LIMIT)
+        self.assertTrue(output.pending_backoff)
+        self.assertEqual(output.report()['pending_buffer_frames'], 882)
+
+        fixed = AudioOutput(adaptive=False)
+        fixed.settings = AudioSettings(buffer=441)
+        for i in range(UNDERRUN_LIMIT + 1):
+            fixed._consumed(200.0 + i * 0.05, 200.0 + i * 0.05 - poll)
+        self.assertFalse(fixed.pending_backoff)
+
+    def test_marks_resolve_at_next_callback(self):
+        """Test a command is timed at the first callback after it plus one buffer"""
+        output = AudioOutput()
+        output.settings = AudioSettings(buffer=441)
+        output._thread = object()  # marks are only kept while the probe runs
+        output.mark('pause')
+        issued = output._marks[0][1]
+        output._consumed(issued + 0.001, issued - 0.003)  # callback most likely before the command
+        self.assertEqual(len(output._marks), 1)
+        output._consumed(issued + 0.008, issued + 0.004)
+        self.assertEqual(output._marks, [])
+        self.assertAlmostEqual(output.latency('pause'), 0.016)
+        self.assertIn('audio_pause_latency_seconds', metrics.REGISTRY.snapshot())
+
+
+class TestPlayerOutput(unittest.TestCase):
+
+    def setUp(self):
+        """Set up SDL's dummy audio driver"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self._driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        pygame.mixer.quit()
+        self.addCleanup(self._restore)
+
+    def _restore(self):
+        pygame.mixer.quit()
+        if self._driver is None:
+            os.environ.pop('SDL_AUDIODRIVER', None)
+        else:
+            os.environ['SDL_AUDIODRIVER'] = self._driver
+
+    def test_latency_and_backoff(self):
+        """Test commands are timed against the real mixer and a backoff reopens it at the next track"""
+        player = MusicPlayer(audio=settings_for('low_latency'))
+        if player.output.settings is None:
+            self.skipTest("dummy audio driver unavailable")
+        player.output.monitor = True
+        self.addCleanup(player.stop)
+        path = os.path.join(self.tmpdir.name, 'tone.wav')
+        write_silence(path, 3)
+        player.load_playlist([path, path])
+        # A collector pause makes probe polls late, and late polls drop their marks
+        gc.disable()
+        self.addCleanup(gc.enable)
+        player.play(0)
+        for command in (player.pause, player.unpause, lambda: player.set_volume(0.5)):
+            time.sleep(0.1)
+            command()
+        deadline = time.time() + 5
+        while len(player.output.report()['latency_ms']) < 4 and time.time() < deadline:
+            time.sleep(0.02)
+        report = player.output.report()
+        self.assertEqual(set(report['latency_ms']), {'play', 'pause', 'unpause', 'volume'})
+        buffer_ms = 512 / 44100 * 1000
+        for command, ms in report['latency_ms'].items():
+            # One device buffer, plus at most one callback wait and scheduling slack
+            self.assertGreaterEqual(ms, buffer_ms, command)
+            self.assertLess(ms, 3 * buffer_ms + 50, command)
+
+        player.output._backoff = player.output.settings.replace(buffer=1024)
+        player.play(1)
+        self.assertEqual(player.output.settings.buffer, 1024)
+        self.assertFalse(player.output.pending_backoff)
+        self.assertTrue(pygame.mixer.get_init())
+        self.assertIsNotNone(player._pcm)
+        time.sleep(0.2)
+        self.assertGreater(player.get_current_position(), 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Unit tests for per-track resume positions
+"""
+
+import unittest
+import os
+import sys
+import time
+import wave
+import tempfile
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pygame
+from bookmarks import BookmarkStore
+from player import MusicPlayer
+
+
+class TestBookmarkStore(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a temporary bookmark file"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'bookmarks.bin')
+
+    def test_roundtrip(self):
+        """Test positions survive a reopen and finished tracks are cleared"""
+        store = BookmarkStore(self.path)
+        for i in range(2000):
+            store.update(f'/books/{i}.mp3', 100.0 + i, 3600, force=True)
+        store.update('/books/7.mp3', 3590, 3600, force=True)
+        store.clear('/books/8.mp3')
+        store.close()
+
+        reopened = BookmarkStore(self.path)
+        self.assertIsNone(reopened._table)  # nothing is read until the first lookup
+        self.assertEqual(reopened.get('/books/1999.mp3'), 2099.0)
+        self.assertIsNone(reopened.get('/books/7.mp3'))
+        self.assertIsNone(reopened.get('/books/8.mp3'))
+        self.assertIsNone(reopened.get('/books/missing.mp3'))
+        self.assertEqual(len(reopened), 1998)
+        reopened.close()
+
+    def test_thresholds_and_throttle(self):
+        """Test short tracks are ignored and updates are throttled"""
+        store = BookmarkStore(self.path, interval=60.0)
+        self.assertFalse(store.update('/song.mp3', 120, 240, force=True))
+        self.assertIsNone(store.get('/song.mp3'))
+        self.assertTrue(store.update('/book.mp3', 120, 3600))
+        self.assertFalse(store.update('/book.mp3', 125, 3600))
+        self.assertEqual(store.get('/book.mp3'), 120)
+        # Near the start the bookmark is dropped
+        self.assertTrue(store.update('/book.mp3', 3, 3600, force=True))
+        self.assertIsNone(store.get('/book.mp3'))
+
+    def test_corrupt_file(self):
+        """Test an unreadable table is ignored"""
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        store = BookmarkStore(self.path)
+        self.assertIsNone(store.get('/book.mp3'))
+        store.update('/book.mp3', 120, 3600, force=True)
+        store.close()
+        self.assertEqual(BookmarkStore(self.path).get('/book.mp3'), 120)
+
+
+class TestResumePlayback(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mixer on SDL's dummy audio driver"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self._driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        except pygame.error as e:
+            self.skipTest(f"dummy audio driver unavailable: {e}")
+        self.addCleanup(self._restore)
+
+    def _restore(self):
+        pygame.mixer.quit()
+        if self._driver is None:
+            os.environ.pop('SDL_AUDIODRIVER', None)
+        else:
+            os.environ['SDL_AUDIODRIVER'] = self._driver
+
+    def test_play_resumes(self):
+        """Test stopping records the position and play() carries on from it"""
+        track = os.path.join(self.tmpdir.name, 'chapter.wav')
+        with wave.open(track, 'wb') as w:
+            w.setnchannels(2)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(b'\0' * 4 * 44100 * 4)
+        player = MusicPlayer()
+        player.bookmarks = BookmarkStore(os.path.join(self.tmpdir.name, 'bookmarks.bin'),
+                                         min_length=2, min_position=0.2, end_margin=0.5)
+        player.load_playlist([track])
+        player.durations[track] = 4
+
+        self.assertTrue(player.play(0))
+        time.sleep(0.6)
+        player.stop()
+        saved = player.bookmarks.get(track)
+        self.assertIsNotNone(saved)
+        self.assertGreater(saved, 0.4)
+
+        self.assertTrue(player.play(0))
+        self.assertGreaterEqual(player.get_current_position(), saved - 0.05)
+        # An explicit start position wins over the bookmark
+        player.stop()
+        self.assertTrue(player.play(0, start_pos=0.1))
+        self.assertLess(player.get_current_position(), 0.4)
+        player.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the lmusic command-line tools
+"""
+
+import unittest
+import os
+import io
+import sys
+import json
+import wave
+import shutil
+import tempfile
+import contextlib
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import cli
+import utils
+from library import Library
+
+
+def write_wav(path, seconds, rate=8000):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(os.urandom(2 * int(seconds * rate)))
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a small tree with one duplicated file"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.root = os.path.join(self.tmpdir.name, 'music')
+        os.makedirs(os.path.join(self.root, 'rock'))
+        os.makedirs(os.path.join(self.root, 'jazz'))
+        self.first = os.path.join(self.root, 'rock', 'first.wav')
+        self.second = os.path.join(self.root, 'jazz', 'second.wav')
+        self.copy = os.path.join(self.root, 'jazz', 'copy.wav')
+        write_wav(self.first, 2)
+        write_wav(self.second, 3)
+        shutil.copy(self.first, self.copy)
+        with open(os.path.join(self.root, 'notes.txt'), 'w') as f:
+            f.write('not audio')
+        self.library = os.path.join(self.tmpdir.name, 'library.json')
+
+    def run_cli(self, *argv):
+        out, err = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            code = cli.main(['--library', self.library, '-j', '1', *argv])
+        return code, out.getvalue().splitlines(), err.getvalue()
+
+    def test_scan_is_incremental(self):
+        """Test new files are added once and unchanged files are skipped"""
+        code, lines, _err = self.run_cli('scan', self.root)
+        self.assertEqual(code, 0)
+        self.assertEqual(sorted(lines), sorted(f'+ {p}' for p in (self.first, self.second, self.copy)))
+        self.assertEqual(len(Library.load(self.library)), 3)
+
+        _code, lines, err = self.run_cli('scan', self.root)
+        self.assertEqual(lines, [])
+        self.assertIn('0 added', err)
+
+        os.remove(self.second)
+        _code, lines, _err = self.run_cli('scan', '--prune', self.root)
+        self.assertEqual(lines, [f'- {self.second}'])
+        self.assertNotIn(self.second, Library.load(self.library))
+
+    def test_stats_and_dupes(self):
+        """Test totals use the shared formatters and identical files are grouped"""
+        self.run_cli('scan', self.root)
+        _code, lines, _err = self.run_cli('stats')
+        size = sum(os.path.getsize(p) for p in (self.first, self.second, self.copy))
+        self.assertIn('Tracks:    3', lines)
+        self.assertIn(f'Duration:  {utils.get_human_readable_time(7)}', lines)
+        self.assertIn(f'Size:      {utils.format_file_size(size)}', lines)
+
+        _code, lines, err = self.run_cli('dupes')
+        self.assertEqual(lines, sorted([self.copy, self.first]))
+        self.assertIn('1 duplicate groups', err)
+
+    def test_verify_and_playlist(self):
+        """Test verify reports changed files and queries build playlists"""
+        self.run_cli('scan', self.root)
+        code, lines, _err = self.run_cli('verify')
+        self.assertEqual((code, lines), (0, []))
+        write_wav(self.second, 1)
+        os.utime(self.second, (1, 1))
+        code, lines, _err = self.run_cli('verify', '--quick')
+        self.assertEqual((code, lines), (1, [f'CHANGED {self.second}']))
+
+        _code, lines, _err = self.run_cli('playlist', 'build', 'path~/jazz/ order by title')
+        self.assertEqual(lines, ['#EXTM3U', self.copy, self.second])
+        smart = os.path.join(self.tmpdir.name, 'jazz.json')
+        self.run_cli('playlist', 'build', 'path~jazz', '--smart', '--name', 'Jazz', '-o', smart)
+        with open(smart, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'name': 'Jazz', 'query': 'path~jazz'})
+        code, _lines, err = self.run_cli('stats', '-q', 'year >')
+        self.assertEqual(code, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
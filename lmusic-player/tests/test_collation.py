@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Unit tests for column sort keys and playlist reordering
+"""
+
+import unittest
+import os
+import time
+import sys
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from collation import SortKeyCache, natural_key
+from library import Library
+from player import MusicPlayer
+
+
+class TestCollation(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a library with multi-disc albums"""
+        self.library = Library()
+        rows = [
+            ('/m/z.mp3', 'beta', 'Album', 1, 1, 'Z', 200),
+            ('/m/b10.mp3', 'Alpha', 'Second', 1, 10, 'Ten', 100),
+            ('/m/b2.mp3', 'alpha', 'Second', 1, 2, 'Two', 300),
+            ('/m/a2.mp3', 'Alpha', 'First', 2, 1, 'Disc two', 150),
+            ('/m/a1.mp3', 'Alpha', 'First', 1, 5, 'Disc one', 250),
+        ]
+        with self.library.batch():
+            for path, artist, album, disc, track, title, length in rows:
+                self.library.add(path, artist=artist, album=album, disc=disc, track=track,
+                                 title=title, length=length)
+        self.library.add('/m/untagged.mp3')
+        self.paths = [r[0] for r in rows] + ['/m/untagged.mp3']
+        self.keys = SortKeyCache(self.library)
+
+    def sorted_paths(self, column, descending=False):
+        return [self.paths[i] for i in self.keys.sort_order(self.paths, column, descending)]
+
+    def test_natural_order(self):
+        """Test digit runs compare numerically and case is ignored"""
+        names = ['Track 10', 'track 2', 'Track 1', 'Track 1b', 'intro']
+        self.assertEqual(sorted(names, key=natural_key),
+                         ['intro', 'Track 1', 'Track 1b', 'track 2', 'Track 10'])
+
+    def test_artist_is_multi_key(self):
+        """Test the artist column sorts by artist, album, disc and track"""
+        self.assertEqual(self.sorted_paths('artist'),
+                         ['/m/a1.mp3', '/m/a2.mp3', '/m/b2.mp3', '/m/b10.mp3', '/m/z.mp3', '/m/untagged.mp3'])
+
+    def test_length_and_descending(self):
+        """Test numeric columns, missing values last and reversed order"""
+        self.assertEqual(self.sorted_paths('length')[:2], ['/m/b10.mp3', '/m/a2.mp3'])
+        self.assertEqual(self.sorted_paths('length')[-1], '/m/untagged.mp3')
+        self.assertEqual(self.sorted_paths('file', descending=True)[0], '/m/z.mp3')
+
+    def test_missing_values_last_when_descending(self):
+        """Test untagged tracks stay at the end when a column is sorted descending"""
+        self.assertEqual(self.sorted_paths('length', descending=True),
+                         ['/m/b2.mp3', '/m/a1.mp3', '/m/z.mp3', '/m/a2.mp3', '/m/b10.mp3', '/m/untagged.mp3'])
+        self.assertEqual(self.sorted_paths('artist', descending=True),
+                         ['/m/z.mp3', '/m/b10.mp3', '/m/b2.mp3', '/m/a2.mp3', '/m/a1.mp3', '/m/untagged.mp3'])
+
+    def test_keys_follow_library_changes(self):
+        """Test cached keys are dropped when a track's tags change"""
+        self.assertEqual(self.sorted_paths('title')[0], '/m/a1.mp3')
+        self.library.update('/m/z.mp3', title='Aardvark')
+        self.assertEqual(self.sorted_paths('title')[0], '/m/z.mp3')
+
+    def test_resort_uses_cached_keys(self):
+        """Test sorting 100k tracks again only looks up stored keys"""
+        library = Library()
+        with library.batch():
+            for i in range(100000):
+                library.add(f"/m/{i}.mp3", artist=f"Artist {i % 997}", album=f"Album {i % 13}",
+                            track=i % 20, title=f"Song {i}")
+        paths = list(library.paths)
+        keys = SortKeyCache(library)
+        keys.sort_order(paths, 'artist')
+        start = time.perf_counter()
+        order = keys.sort_order(paths, 'artist', descending=True)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(paths[order[-1]], '/m/0.mp3')
+        self.assertLess(elapsed, 1.0)
+
+    def test_player_reorder(self):
+        """Test reorder keeps the current song selected"""
+        player = MusicPlayer()
+        player.playlist = ['a.mp3', 'b.mp3', 'c.mp3']
+        player.current_index = 1
+        self.assertTrue(player.reorder([2, 1, 0]))
+        self.assertEqual(player.playlist, ['c.mp3', 'b.mp3', 'a.mp3'])
+        self.assertEqual(player.current_index, 1)
+        self.assertTrue(player.reorder([1, 2, 0]))
+        self.assertEqual(player.current_index, 0)
+        self.assertFalse(player.reorder([0, 0, 1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Unit tests for CUE sheet parsing and virtual track playback
+"""
+
+import unittest
+import os
+import sys
+import time
+import wave
+import tempfile
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pygame
+import cue
+from events import PlaybackEnded, SongChanged, inline
+from player import MusicPlayer
+from library import read_metadata
+
+SHEET = '''\ufeffREM GENRE Ambient
+REM DATE 2004
+PERFORMER "Album Artist"
+TITLE "Whole Album"
+FILE "album.wav" WAVE
+  TRACK 01 AUDIO
+    TITLE "First"
+    INDEX 01 00:00:00
+  TRACK 02 AUDIO
+    TITLE "Second"
+    PERFORMER "Guest"
+    INDEX 00 00:00:30
+    INDEX 01 00:00:45
+  TRACK 03 AUDIO
+    TITLE "Third"
+    INDEX 01 00:01:00
+'''
+
+
+def write_wav(path, seconds, rate=44100, channels=2):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b'\x00\x00' * channels * int(seconds * rate))
+
+
+class TestCueParsing(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a rip: a 1.5 s WAV with a three-track sheet beside it"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.audio = os.path.join(self.tmpdir.name, 'album.wav')
+        self.sheet = os.path.join(self.tmpdir.name, 'album.cue')
+        write_wav(self.audio, 1.5)
+        with open(self.sheet, 'w', encoding='utf-8') as f:
+            f.write(SHEET)
+
+    def test_parse(self):
+        """Test offsets, pregaps and album fields inherited by tracks"""
+        tracks = cue.load_cue(self.sheet)
+        self.assertEqual([t.number for t in tracks], [1, 2, 3])
+        first, second, third = tracks
+        self.assertEqual(first.audio_path, self.audio)
+        self.assertEqual((first.start, first.end), (0.0, 0.6))
+        # INDEX 00 is a pregap: it stays with the previous track
+        self.assertAlmostEqual(second.start, 0.6)
+        self.assertAlmostEqual(second.end, 1.0)
+        self.assertIsNone(third.end)
+        self.assertEqual(first.performer, 'Album Artist')
+        self.assertEqual(second.performer, 'Guest')
+        self.assertEqual((third.album, third.genre, third.year), ('Whole Album', 'Ambient', 2004))
+        self.assertTrue(cue.contiguous(first, second))
+        self.assertEqual(cue.parse_timestamp('74:59:74'), 74 * 60 + 59 + 74 / 75)
+
+    def test_cp1252_sheet(self):
+        """Test sheets that are not UTF-8 still parse"""
+        with open(self.sheet, 'wb') as f:
+            f.write(b'FILE "album.wav" WAVE\n  TRACK 01 AUDIO\n    TITLE "Caf\xe9"\n    INDEX 01 00:00:00\n')
+        self.assertEqual(cue.load_cue(self.sheet)[0].title, 'Café')
+
+    def test_playlist_expansion(self):
+        """Test sheets and ripped files expand to one entry per track"""
+        player = MusicPlayer()
+        self.assertEqual(player.add_files([self.audio]), 3)
+        self.assertEqual(player.playlist, [f'{self.sheet}#1', f'{self.sheet}#2', f'{self.sheet}#3'])
+        player.load_playlist([self.sheet])
+        self.assertEqual(len(player.playlist), 3)
+        player.clear_playlist()
+        write_wav(os.path.join(self.tmpdir.name, 'single.wav'), 0.1)
+        self.assertEqual(player.add_folder(self.tmpdir.name), 4)
+        self.assertNotIn(self.audio, player.playlist)
+
+        self.assertEqual(cue.display_name(f'{self.sheet}#2'), '02. Second')
+        meta = read_metadata(f'{self.sheet}#2')
+        self.assertEqual((meta['title'], meta['artist'], meta['track']), ('Second', 'Guest', 2))
+        self.assertEqual(meta['mtime'], int(os.stat(self.sheet).st_mtime))
+
+
+class TestCuePlayback(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mixer on SDL's dummy audio driver and a three-track rip"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self._driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        except pygame.error as e:
+            self.skipTest(f"dummy audio driver unavailable: {e}")
+        self.addCleanup(self._restore)
+        write_wav(os.path.join(self.tmpdir.name, 'album.wav'), 1.5)
+        self.sheet = os.path.join(self.tmpdir.name, 'album.cue')
+        with open(self.sheet, 'w', encoding='utf-8') as f:
+            f.write(SHEET)
+
+    def _restore(self):
+        pygame.mixer.quit()
+        if self._driver is None:
+            os.environ.pop('SDL_AUDIODRIVER', None)
+        else:
+            os.environ['SDL_AUDIODRIVER'] = self._driver
+
+    def test_gapless_advance(self):
+        """Test tracks of one file follow each other without reloading the audio"""
+        player = MusicPlayer()
+        player.load_playlist([self.sheet])
+        changes, ended = [], []
+        player.events.subscribe(SongChanged, lambda e: changes.append((e.index, e.info['title'], player._pcm)),
+                                dispatcher=inline)
+        player.events.subscribe(PlaybackEnded, lambda e: ended.append(e.index), dispatcher=inline)
+
+        self.assertTrue(player.play(0))
+        pcm = player._pcm
+        self.assertIsNotNone(pcm)
+        # Jumping to another track of the same file is a seek in the open mapping
+        self.assertTrue(player.play(1))
+        self.assertIs(player._pcm, pcm)
+        self.assertLess(player.get_current_position(), 0.1)
+        self.assertTrue(player.play(0))
+
+        started = time.time()
+        while not ended and time.time() - started < 5:
+            player.check_events()
+            time.sleep(0.01)
+        self.assertEqual(ended, [2])
+        self.assertEqual([i for i, _title, _pcm in changes[-3:]], [0, 1, 2])
+        self.assertEqual(changes[-1][1], 'Third')
+        self.assertTrue(all(p is pcm for _i, _title, p in changes))
+        self.assertEqual(player.song_length, 0)  # 0.5 s, reported in whole seconds
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the player event bus
+"""
+
+import unittest
+import os
+import sys
+import time
+import threading
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import metrics
+from events import Event, EventBus, PlaybackEnded, SongChanged, inline
+from player import MusicPlayer
+
+
+class ManualDispatcher:
+    """Holds deliveries until run() (stands in for the Tk dispatcher)"""
+
+    def __init__(self):
+        self.queued = []
+
+    def __call__(self, callback, *args):
+        self.queued.append((callback, args))
+
+    def run(self):
+        queued, self.queued = self.queued, []
+        for callback, args in queued:
+            callback(*args)
+
+
+class TestEventBus(unittest.TestCase):
+
+    def test_fan_out_by_type(self):
+        """Test every matching subscriber gets the event and base classes match subclasses"""
+        bus = EventBus()
+        songs, everything = [], []
+        bus.subscribe(SongChanged, songs.append, dispatcher=inline)
+        subscription = bus.subscribe(Event, everything.append, dispatcher=inline)
+        bus.publish(SongChanged(0, '/a.mp3', info={'title': 'A'}))
+        bus.publish(PlaybackEnded(0, '/a.mp3'))
+        self.assertEqual([e.path for e in songs], ['/a.mp3'])
+        self.assertEqual([type(e) for e in everything], [SongChanged, PlaybackEnded])
+        bus.unsubscribe(subscription)
+        bus.publish(PlaybackEnded(1, '/b.mp3'))
+        self.assertEqual(len(everything), 2)
+        self.assertEqual(len(bus), 1)
+
+    def test_coalescing_keeps_order(self):
+        """Test a lagging subscriber sees only the latest song, after earlier ends"""
+        bus = EventBus()
+        dispatcher = ManualDispatcher()
+        seen = []
+        bus.subscribe(Event, seen.append, dispatcher=dispatcher)
+        bus.publish(SongChanged(0, '/a.mp3'))
+        bus.publish(PlaybackEnded(0, '/a.mp3'))
+        bus.publish(SongChanged(1, '/b.mp3'))
+        bus.publish(SongChanged(2, '/c.mp3'))
+        self.assertEqual(len(dispatcher.queued), 1)  # one delivery scheduled
+        dispatcher.run()
+        self.assertEqual([(type(e).__name__, e.index) for e in seen],
+                         [('PlaybackEnded', 0), ('SongChanged', 2)])
+
+    def test_slow_subscriber_does_not_block(self):
+        """Test publish returns while a background subscriber is still busy"""
+        bus = EventBus()
+        release = threading.Event()
+        done = threading.Event()
+        failing = []
+
+        def slow(event):
+            release.wait(5)
+            done.set()
+
+        def broken(event):
+            failing.append(event)
+            raise RuntimeError("boom")
+
+        bus.subscribe(SongChanged, slow, name='slow art loader')
+        bus.subscribe(SongChanged, broken, dispatcher=inline)
+        started = time.perf_counter()
+        bus.publish(SongChanged(0, '/a.mp3'))
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(len(failing), 1)
+        release.set()
+        self.assertTrue(done.wait(5))
+        deadline = time.time() + 5
+        while 'event_slow_art_loader_handler_seconds' not in metrics.REGISTRY.snapshot() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIn('event_slow_art_loader_latency_seconds', metrics.REGISTRY.snapshot())
+
+    def test_player_reads_tags_lazily(self):
+        """Test play() publishes without reading tags; subscribers read them on access"""
+        player = MusicPlayer()
+        path = os.path.join(os.path.dirname(__file__), 'missing-track.mp3')
+        player.playlist = [path]
+        calls = []
+        real_song_info = player.song_info
+        player.song_info = lambda p: calls.append(p) or real_song_info(p)
+        seen = []
+        player.events.subscribe(SongChanged, seen.append, dispatcher=inline)
+        player.play(0)
+        self.assertEqual(len(seen), 1)
+        self.assertEqual(calls, [])
+        self.assertEqual(seen[0].info['file_path'], path)
+        self.assertIs(seen[0].info, seen[0].info)
+        self.assertEqual(calls, [path])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the play history store
+"""
+
+import unittest
+import os
+import time
+import wave
+import tempfile
+import sys
+from datetime import datetime
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pygame
+from events import PlaybackEnded, inline
+from history import PlayHistory
+from library import Library
+from player import MusicPlayer
+
+DAY = 86400
+
+
+class TestPlayHistory(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a history log in a temporary directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmpdir.name, 'history.log')
+        self.history = PlayHistory(self.log_path)
+
+    def tearDown(self):
+        """Clean up"""
+        self.history.close()
+        self.tmpdir.cleanup()
+
+    def test_aggregates_survive_reload(self):
+        """Test per-track counters are rebuilt from the log"""
+        h = self.history
+        h.record_start('/m/a.mp3')
+        h.record_seek('/m/a.mp3', 30.0)
+        h.record_complete('/m/a.mp3', 200.0)
+        h.record_start('/m/a.mp3')
+        h.record_skip('/m/a.mp3', 12.5)
+        h.record_start('/m/b.mp3')
+        h.close()
+
+        self.history = PlayHistory(self.log_path)
+        stats = self.history.stats('/m/a.mp3')
+        self.assertEqual((stats.plays, stats.completions, stats.skips, stats.seeks), (2, 1, 1, 1))
+        self.assertAlmostEqual(stats.listened, 212.5, places=3)
+        self.assertAlmostEqual(stats.skip_rate, 0.5)
+        self.assertEqual(self.history.stats('/m/b.mp3').plays, 1)
+        self.assertIsNone(self.history.stats('/m/never.mp3'))
+
+    def test_torn_tail_is_dropped(self):
+        """Test a partially written record is ignored and overwritten"""
+        self.history.record_start('/m/a.mp3')
+        self.history.close()
+        with open(self.log_path, 'ab') as f:
+            f.write(b'\x02\x10\x00')
+        self.history = PlayHistory(self.log_path)
+        self.history.record_start('/m/a.mp3')
+        self.history.close()
+        self.history = PlayHistory(self.log_path)
+        self.assertEqual(self.history.stats('/m/a.mp3').plays, 2)
+
+    def test_top_by_period(self):
+        """Test top tracks for this month exclude older plays"""
+        now = time.mktime(datetime(2026, 3, 20, 12).timetuple())
+        h = self.history
+        for i in range(5):
+            h.record_start('/m/old.mp3', timestamp=now - 40 * DAY + i)
+        for i in range(3):
+            h.record_start('/m/new.mp3', timestamp=now - DAY + i)
+        h.record_start('/m/once.mp3', timestamp=now)
+
+        self.assertEqual(h.top_this_month(now=now), [('/m/new.mp3', 3), ('/m/once.mp3', 1)])
+        self.assertEqual(h.top(1), [('/m/old.mp3', 5)])
+        self.assertEqual(h.top(10, since=now - 50 * DAY, until=now - 30 * DAY), [('/m/old.mp3', 5)])
+
+    def test_compaction_folds_old_events(self):
+        """Test compaction shrinks the log without changing any statistic"""
+        now = time.time()
+        h = self.history
+        for i in range(2000):
+            ts = now - (400 - i % 400) * DAY
+            h.record_start(f"/m/{i % 50}.mp3", timestamp=ts)
+            if i % 3:
+                h.record_complete(f"/m/{i % 50}.mp3", 180.0, timestamp=ts + 180)
+            else:
+                h.record_skip(f"/m/{i % 50}.mp3", 20.0, timestamp=ts + 20)
+        h.record_start('/m/recent.mp3')
+        before = {p: s.to_dict() for p, s in h.items()}
+        top = h.top(10, since=now - 100 * DAY)
+        size = os.path.getsize(self.log_path)
+
+        h.compact()
+        h.record_start('/m/recent.mp3')
+        h.close()
+        self.assertLess(os.path.getsize(self.log_path), size / 2)
+
+        self.history = PlayHistory(self.log_path)
+        after = {p: s.to_dict() for p, s in self.history.items()}
+        before['/m/recent.mp3']['plays'] += 1
+        for path, stats in before.items():
+            for name, value in stats.items():
+                if name != 'last_played' or path != '/m/recent.mp3':
+                    self.assertAlmostEqual(after[path][name], value, places=2, msg=f"{path} {name}")
+        self.assertEqual(self.history.top(10, since=now - 100 * DAY), [
+            (p, c + (p == '/m/recent.mp3')) for p, c in top])
+
+    def test_top_is_fast_over_years(self):
+        """Test a monthly top-100 stays in milliseconds with years of history"""
+        h = self.history
+        now = time.time()
+        today = datetime.now().toordinal()
+        # Three years of 30 plays a day, loaded the way compacted day rows are
+        for day in range(today - 3 * 365, today + 1):
+            for j in range(30):
+                track_id, _new = h._intern(f"/m/{(day * 7 + j) % 5000}.mp3")
+                h._apply_day(track_id, day, 1, 1, 0, 0, 200.0, now)
+        start = time.perf_counter()
+        h.top_this_month()
+        h.top(100, since=now - 365 * DAY)
+        self.assertLess(time.perf_counter() - start, 0.05)
+
+    def test_player_hooks_and_library(self):
+        """Test play/next/end hooks record events and feed library play counts"""
+        # Playable files, so history is kept whether or not a mixer opens
+        a, b = (os.path.join(self.tmpdir.name, name) for name in ('a.wav', 'b.wav'))
+        for path in (a, b):
+            with wave.open(path, 'wb') as w:
+                w.setnchannels(2)
+                w.setsampwidth(2)
+                w.setframerate(44100)
+                w.writeframes(bytes(2 * 44100 * 4))
+        player = MusicPlayer()
+        self.addCleanup(player.shutdown)
+        player.history = self.history
+        player.get_song_length = lambda path: 100
+        player.playlist = [a, b]
+        library = Library()
+        library.add(a)
+        library.add(b)
+        self.history.subscribe(lambda path, stats: library.update(path, played=stats.plays))
+
+        player.play(0)
+        player.play(0, start_pos=30.0)  # seek
+        player.next()  # skip a
+        player._history_end(completed=True)  # b ends on its own
+        player.next()  # no second record for b
+        stats_a = self.history.stats(a)
+        stats_b = self.history.stats(b)
+        self.assertEqual((stats_a.plays, stats_a.skips, stats_a.seeks), (2, 1, 1))
+        self.assertEqual((stats_b.plays, stats_b.completions, stats_b.skips), (1, 1, 0))
+        self.assertEqual(library.get(a)['played'], 2)
+
+
+
+class TestUnplayableTracks(unittest.TestCase):
+
+    def setUp(self):
+        """Set up corrupt tracks and a mixer on SDL's dummy audio driver"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.files = []
+        for name in ('bad1.mp3', 'bad2.mp3'):
+            path = os.path.join(self.tmpdir.name, name)
+            with open(path, 'wb') as f:
+                f.write(bytes(range(256)) * 20)
+            self.files.append(path)
+        self._driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        except pygame.error as e:
+            self.skipTest(f"dummy audio driver unavailable: {e}")
+        self.addCleanup(self._restore)
+
+    def _restore(self):
+        pygame.mixer.quit()
+        if self._driver is None:
+            os.environ.pop('SDL_AUDIODRIVER', None)
+        else:
+            os.environ['SDL_AUDIODRIVER'] = self._driver
+
+    def test_failed_load_ends_once(self):
+        """Test a track that cannot load is reported ended once and never counted as played"""
+        history = PlayHistory(os.path.join(self.tmpdir.name, 'history.log'))
+        self.addCleanup(history.close)
+        player = MusicPlayer()
+        player.history = history
+        player.load_playlist(self.files)
+        ended = []
+        player.events.subscribe(PlaybackEnded, ended.append, dispatcher=inline)
+
+        player.play(0)
+        self.assertEqual([player.check_events() for _ in range(3)], [True, False, False])
+        self.assertEqual(len(ended), 1)
+        self.assertFalse(player.is_playing)
+        stats = history.stats(self.files[0])
+        self.assertEqual((stats.plays, stats.completions) if stats else (0, 0), (0, 0))
+
+        # A whole playlist of failures stops instead of cycling through it every tick
+        player.next()
+        self.assertFalse(player.is_playing)
+        self.assertFalse(player.check_events())
+        self.assertEqual(len(ended), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the library HTTP streaming server
+"""
+
+import unittest
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import http.client
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from http_server import LibraryServer, parse_range, HttpError
+from library import Library
+
+
+class TestParseRange(unittest.TestCase):
+
+    def test_forms(self):
+        """Test closed, open-ended, suffix and unsatisfiable ranges"""
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=990-5000', 1000), (990, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        # Ignored: multiple ranges, other units, garbage
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range('items=0-1', 1000))
+        self.assertIsNone(parse_range('bytes=a-b', 1000))
+        with self.assertRaises(HttpError) as ctx:
+            parse_range('bytes=1000-', 1000)
+        self.assertEqual(ctx.exception.status, 416)
+
+
+class TestLibraryServer(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a library of files with known content and a running server"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.library = Library()
+        self.content = {}
+        for i, (artist, size) in enumerate((('Alpha', 1 << 20), ('Beta', 5000), ('Alpha', 300))):
+            path = os.path.join(self.tmpdir.name, f"{i}.mp3")
+            data = os.urandom(size)
+            with open(path, 'wb') as f:
+                f.write(data)
+            st = os.stat(path)
+            track_id = self.library.add(path, title=f"Song {i}", artist=artist,
+                                        size=st.st_size, mtime=int(st.st_mtime))
+            self.content[track_id] = data
+        self.server = LibraryServer(self.library, port=0)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def request(self, method, target, headers=None, conn=None):
+        conn = conn or http.client.HTTPConnection('127.0.0.1', self.server.port, timeout=10)
+        conn.request(method, target, headers=headers or {})
+        response = conn.getresponse()
+        return response, response.read()
+
+    def test_library_json(self):
+        """Test browsing, paging and smart queries"""
+        response, body = self.request('GET', '/api/library')
+        self.assertEqual(response.status, 200)
+        page = json.loads(body)
+        self.assertEqual(page['total'], 3)
+        self.assertEqual([t['title'] for t in page['tracks']], ['Song 0', 'Song 1', 'Song 2'])
+        self.assertNotIn('path', page['tracks'][0])
+
+        page = json.loads(self.request('GET', '/api/library?q=artist%3Aalpha&limit=1&offset=1')[1])
+        self.assertEqual(page['total'], 2)
+        self.assertEqual([t['id'] for t in page['tracks']], [2])
+
+        response, body = self.request('GET', '/api/library?q=year%3E%3D')
+        self.assertEqual(response.status, 400)
+        response, body = self.request('GET', '/api/tracks/1')
+        self.assertEqual(json.loads(body)['artist'], 'Beta')
+
+    def test_full_and_ranged_downloads(self):
+        """Test whole files, byte ranges and keep-alive reuse"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.port, timeout=10)
+        response, body = self.request('GET', '/tracks/1', conn=conn)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.content[1])
+        self.assertEqual(response.getheader('Content-Type'), 'audio/mpeg')
+        self.assertEqual(response.getheader('Accept-Ranges'), 'bytes')
+
+        response, body = self.request('GET', '/tracks/0', {'Range': 'bytes=1000-1999'}, conn=conn)
+        self.assertEqual(response.status, 206)
+        self.assertEqual(response.getheader('Content-Range'), f"bytes 1000-1999/{1 << 20}")
+        self.assertEqual(body, self.content[0][1000:2000])
+
+        response, body = self.request('GET', '/tracks/0', {'Range': 'bytes=-10'}, conn=conn)
+        self.assertEqual(body, self.content[0][-10:])
+
+        response, body = self.request('GET', '/tracks/2', {'Range': 'bytes=300-'}, conn=conn)
+        self.assertEqual(response.status, 416)
+        self.assertEqual(response.getheader('Content-Range'), 'bytes */300')
+
+        response, body = self.request('HEAD', '/tracks/0', conn=conn)
+        self.assertEqual(response.getheader('Content-Length'), str(1 << 20))
+        self.assertEqual(body, b'')
+        conn.close()
+
+    def test_etags(self):
+        """Test conditional requests against ETags from the metadata cache"""
+        response, _ = self.request('HEAD', '/tracks/1')
+        etag = response.getheader('ETag')
+        st = os.stat(self.library.paths[1])
+        self.assertEqual(etag, f'"1-{st.st_size:x}-{int(st.st_mtime):x}"')
+
+        response, body = self.request('GET', '/tracks/1', {'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(body, b'')
+
+        # A stale If-Range gets the whole, current file
+        response, body = self.request('GET', '/tracks/1', {'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(body), 5000)
+        response, body = self.request('GET', '/tracks/1', {'Range': 'bytes=0-9', 'If-Range': etag})
+        self.assertEqual(response.status, 206)
+
+    def test_errors(self):
+        """Test unknown tracks and methods"""
+        self.assertEqual(self.request('GET', '/tracks/99')[0].status, 404)
+        self.assertEqual(self.request('GET', '/tracks/x')[0].status, 404)
+        self.assertEqual(self.request('GET', '/etc/passwd')[0].status, 404)
+        self.assertEqual(self.request('POST', '/tracks/0')[0].status, 405)
+        self.library.remove(self.library.paths[2])
+        self.assertEqual(self.request('GET', '/tracks/2')[0].status, 404)
+
+    def test_concurrent_streams(self):
+        """Test hundreds of simultaneous ranged streams are served correctly"""
+        port = self.server.port
+        expected = self.content[0]
+
+        async def fetch(i):
+            start = (i * 3001) % (len(expected) - 65536)
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"GET /tracks/0 HTTP/1.1\r\nHost: x\r\nRange: bytes={start}-{start + 65535}\r\n"
+                         f"Connection: close\r\n\r\n".encode())
+            data = await reader.read()
+            writer.close()
+            head, _, body = data.partition(b'\r\n\r\n')
+            return head.startswith(b'HTTP/1.1 206') and body == expected[start:start + 65536]
+
+        async def run():
+            return await asyncio.gather(*(fetch(i) for i in range(300)))
+
+        results = asyncio.run(run())
+        self.assertEqual(sum(results), 300)
+        self.assertEqual(self.server.connections, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
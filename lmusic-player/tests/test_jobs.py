@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the background job executor
+"""
+
+import unittest
+import os
+import threading
+import sys
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from jobs import JobExecutor, PRIORITY_HIGH, PRIORITY_LOW
+
+
+class TestJobExecutor(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a single-worker executor so ordering is deterministic"""
+        self.jobs = JobExecutor(pools={'io': 1})
+        self.gate = threading.Event()
+        # Occupy the only worker until the test releases it
+        self.blocker = self.jobs.submit(self.gate.wait)
+
+    def test_priority_and_coalescing(self):
+        """Test higher priority runs first and duplicate keys share one job"""
+        order = []
+        low = self.jobs.submit(order.append, 'low', priority=PRIORITY_LOW)
+        high = self.jobs.submit(order.append, 'high', priority=PRIORITY_HIGH, key='k')
+        again = self.jobs.submit(order.append, 'dup', priority=PRIORITY_HIGH, key='k')
+        self.assertIs(high, again)
+
+        self.gate.set()
+        self.assertTrue(low.wait(2))
+        self.assertEqual(order, ['high', 'low'])
+
+    def test_cancel_group(self):
+        """Test stale jobs in a group are skipped"""
+        ran = []
+        jobs = [self.jobs.submit(ran.append, i, group='metadata') for i in range(3)]
+        keep = self.jobs.submit(ran.append, 'keep', group='other')
+        self.assertEqual(self.jobs.cancel_group('metadata'), 3)
+
+        self.gate.set()
+        self.assertTrue(keep.wait(2))
+        self.assertTrue(all(job.wait(2) for job in jobs))
+        self.assertEqual(ran, ['keep'])
+
+    def test_map_batches_and_dedupes(self):
+        """Test map delivers batches, skips queued duplicates and signals completion"""
+        batches = []
+        done = threading.Event()
+        self.jobs.map(lambda x: x * 2, range(10), key='double', batch_size=4,
+                      on_batch=batches.append, on_done=done.set)
+        # Items already queued under the same key are coalesced away
+        self.assertEqual(self.jobs.map(lambda x: x * 2, range(10), key='double'), [])
+
+        self.gate.set()
+        self.assertTrue(done.wait(2))
+        self.assertEqual([len(b) for b in batches], [4, 4, 2])
+        self.assertEqual(sorted(r for b in batches for _, r in b), [x * 2 for x in range(10)])
+
+    def test_map_done_after_cancelled_batches(self):
+        """Test on_done still fires when batches are cancelled before they run"""
+        batches = []
+        done = threading.Event()
+        self.jobs.map(lambda x: x, range(10), batch_size=4, group='scan',
+                      on_batch=batches.append, on_done=done.set)
+        self.assertEqual(self.jobs.cancel_group('scan'), 3)
+
+        self.gate.set()
+        self.assertTrue(done.wait(2))
+        self.assertEqual(batches, [])
+
+    def tearDown(self):
+        """Stop the workers"""
+        self.gate.set()
+        self.jobs.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
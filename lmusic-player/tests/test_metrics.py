@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Unit tests for metrics and profiling
+"""
+
+import unittest
+import os
+import json
+import time
+import tempfile
+import sys
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import metrics
+from watchdog import StallWatchdog
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a private registry"""
+        self.registry = metrics.MetricsRegistry()
+
+    def test_counter_and_histogram(self):
+        """Test counters, histogram quantiles and the timed decorator"""
+        self.registry.inc('hits_total')
+        self.registry.inc('hits_total', 2)
+        for value in (0.0002, 0.003, 0.003, 0.2):
+            self.registry.observe('latency_seconds', value)
+
+        @self.registry.timed('call_seconds')
+        def work():
+            return 42
+
+        self.assertEqual(work(), 42)
+        snap = self.registry.snapshot()
+        self.assertEqual(snap['hits_total']['value'], 3)
+        self.assertEqual(snap['latency_seconds']['count'], 4)
+        self.assertEqual(snap['latency_seconds']['p50'], 0.005)
+        self.assertAlmostEqual(snap['latency_seconds']['max'], 0.2)
+        self.assertEqual(snap['call_seconds']['count'], 1)
+
+    def test_disabled_registry_records_nothing(self):
+        """Test the registry can be switched off at runtime"""
+        self.registry.enabled = False
+        self.registry.inc('hits_total')
+        with self.registry.timer('latency_seconds'):
+            pass
+        self.assertEqual(self.registry.snapshot(), {})
+
+    def test_exports(self):
+        """Test JSON and Prometheus exports"""
+        self.registry.counter('plays_total', 'Tracks started').inc()
+        self.registry.observe('load_seconds', 0.02)
+        text = self.registry.to_prometheus()
+        self.assertIn('# HELP plays_total Tracks started', text)
+        self.assertIn('plays_total 1', text)
+        self.assertIn('load_seconds_bucket{le="0.025"} 1', text)
+        self.assertIn('load_seconds_count 1', text)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'metrics.json')
+            self.assertTrue(self.registry.export(path, 'json'))
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.assertEqual(data['metrics']['plays_total']['value'], 1)
+
+    def test_sampling_profiler(self):
+        """Test the sampling profiler collects stacks of the main thread"""
+        profiler = metrics.Profiler('sampling', interval=0.001)
+        profiler.start()
+        deadline = time.time() + 0.1
+        while time.time() < deadline:
+            sum(range(1000))
+        profiler.stop()
+        self.assertTrue(profiler.samples)
+        self.assertTrue(profiler.top(5))
+
+
+class FakeRoot:
+    """Minimal stand-in for Tk's after() scheduling, pumped by the test"""
+
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, callback):
+        self.pending.append((time.perf_counter() + ms / 1000.0, callback))
+        return len(self.pending)
+
+    def after_cancel(self, after_id):
+        self.pending = []
+
+    def pump(self, seconds):
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            due = [p for p in self.pending if p[0] <= time.perf_counter()]
+            self.pending = [p for p in self.pending if p[0] > time.perf_counter()]
+            for _, callback in due:
+                callback()
+            time.sleep(0.005)
+
+
+class TestStallWatchdog(unittest.TestCase):
+
+    def test_blocking_callback_is_reported(self):
+        """Test a blocking callback is caught with its stack"""
+        def slow_callback():
+            time.sleep(0.3)
+
+        root = FakeRoot()
+        watchdog = StallWatchdog(root, threshold=0.1, interval=0.02)
+        watchdog.start()
+        try:
+            root.pump(0.1)
+            self.assertEqual(len(watchdog.reports), 0)
+            slow_callback()
+            root.pump(0.1)
+        finally:
+            watchdog.stop()
+
+        self.assertEqual(len(watchdog.reports), 1)
+        report = watchdog.reports[0]
+        self.assertGreaterEqual(report.duration, 0.25)
+        self.assertIn('slow_callback', report.culprit)
+        self.assertIn('slow_callback', report.format())
+
+
+if __name__ == '__main__':
+    unittest.main()
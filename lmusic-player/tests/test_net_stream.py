@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Unit tests for buffered HTTP stream playback
+"""
+
+import unittest
+import os
+import io
+import sys
+import time
+import wave
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pygame
+import metrics
+from net_stream import HttpStream, RingBuffer, open_stream, parse_playlist, resolve_playlist
+from jobs import JobExecutor
+from player import MusicPlayer
+
+
+class JitterServer:
+    """Local stand-in for a remote host: throttled, jittery, and able to stall or drop
+
+    Serves `payload` at /track.<ext> (with Range support), an endless
+    stream at /live, and any text registered in `playlists`.
+    """
+
+    def __init__(self, payload: bytes, rate: int = 0, jitter: float = 0.0, chunk: int = 8192,
+                 content_type: str = 'audio/mpeg'):
+        self.payload = payload
+        self.rate = rate            # bytes per second, 0 for unthrottled
+        self.jitter = jitter        # max random pause between chunks (seconds)
+        self.chunk = chunk
+        self.content_type = content_type
+        self.stall_at = None        # (offset, seconds): go silent once at offset
+        self.drop_at = None         # offset: close the connection once at offset
+        self.playlists = {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests.append((self.path, self.headers.get('Range')))
+                if self.path in server.playlists:
+                    body = server.playlists[self.path].encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'audio/x-scpls' if self.path.endswith('.pls')
+                                     else 'audio/x-mpegurl')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif self.path.startswith('/track'):
+                    server.send_file(self)
+                elif self.path == '/live':
+                    server.send_live(self)
+                else:
+                    self.send_error(404)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _pace(self, sent: int):
+        if self.jitter:
+            time.sleep(random.uniform(0, self.jitter))
+        if self.rate:
+            time.sleep(sent / self.rate)
+
+    def _faults(self, handler, position: int, sent: int) -> bool:
+        """Apply a pending stall or drop; True if the connection was dropped"""
+        if self.stall_at is not None and position >= self.stall_at[0]:
+            seconds = self.stall_at[1]
+            self.stall_at = None
+            time.sleep(seconds)
+        if self.drop_at is not None and position >= self.drop_at:
+            self.drop_at = None
+            handler.close_connection = True
+            handler.connection.shutdown(2)
+            return True
+        return False
+
+    def send_file(self, handler):
+        size = len(self.payload)
+        start = 0
+        header = handler.headers.get('Range')
+        if header:
+            start = int(header.split('=')[1].split('-')[0])
+            handler.send_response(206)
+            handler.send_header('Content-Range', f"bytes {start}-{size - 1}/{size}")
+        else:
+            handler.send_response(200)
+        handler.send_header('Content-Type', self.content_type)
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.send_header('Content-Length', str(size - start))
+        handler.end_headers()
+        position = start
+        try:
+            while position < size:
+                if self._faults(handler, position, 0):
+                    return
+                data = self.payload[position:position + self.chunk]
+                handler.wfile.write(data)
+                position += len(data)
+                self._pace(len(data))
+        except OSError:
+            pass
+
+    def send_live(self, handler):
+        handler.send_response(200)
+        handler.send_header('Content-Type', self.content_type)
+        handler.end_headers()
+        handler.close_connection = True
+        position = 0
+        try:
+            while position < 50 * 1024 * 1024:
+                if self._faults(handler, position, 0):
+                    return
+                handler.wfile.write(self.payload[:self.chunk])
+                position += self.chunk
+                self._pace(self.chunk)
+        except OSError:
+            pass
+
+
+def read_all(stream, size=4096):
+    out = bytearray()
+    while True:
+        data = stream.read(size)
+        if not data:
+            return bytes(out)
+        out += data
+
+
+class TestPlaylists(unittest.TestCase):
+
+    def test_parse(self):
+        """Test M3U and PLS entries, relative URLs and HLS rejection"""
+        m3u = "#EXTM3U\n#EXTINF:-1,Radio\nhttp://a.example/stream\n\nrelative.mp3\n"
+        self.assertEqual(parse_playlist(m3u, 'http://b.example/list/radio.m3u'),
+                         ['http://a.example/stream', 'http://b.example/list/relative.mp3'])
+        pls = "[playlist]\nFile2=http://two/\nTitle1=One\nFile1=http://one/\nNumberOfEntries=2\n"
+        self.assertEqual(parse_playlist(pls), ['http://one/', 'http://two/'])
+        with self.assertRaises(ValueError):
+            parse_playlist("#EXTM3U\n#EXT-X-TARGETDURATION:10\nseg1.ts\n")
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_wraparound_backpressure_and_history(self):
+        """Test data survives wrapping, writers wait for room, and read bytes stay seekable"""
+        ring = RingBuffer(1000, history=200)
+        payload = bytes(range(256)) * 20
+        writer = threading.Thread(target=lambda: (ring.write(payload), ring.finish()))
+        writer.start()
+        time.sleep(0.05)
+        self.assertLessEqual(ring.fill, 1000)
+        out = bytearray()
+        while True:
+            data = ring.read(333, timeout=2)
+            if not data:
+                break
+            out += data
+        writer.join()
+        self.assertEqual(bytes(out), payload)
+        self.assertTrue(ring.seek_within(len(payload) - 150))
+        self.assertEqual(ring.read(10), payload[-150:-140])
+        self.assertFalse(ring.seek_within(0))
+        self.assertIsNone(RingBuffer(10).read(1, timeout=0.01))
+
+
+class TestHttpStream(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a jittery, throttled stand-in server"""
+        self.payload = os.urandom(600 * 1024)
+        self.server = JitterServer(self.payload, rate=4 * 1024 * 1024, jitter=0.002)
+        self.addCleanup(self.server.close)
+
+    def open(self, path='/track.mp3', **kwargs):
+        kwargs.setdefault('capacity', 256 * 1024)
+        kwargs.setdefault('prefetch_bytes', 64 * 1024)
+        kwargs.setdefault('stall_timeout', 0.5)
+        kwargs.setdefault('backoff', 0.05)
+        # Wait out stalls like a plain reader so payloads compare exactly
+        kwargs.setdefault('read_timeout', 10.0)
+        stream = open_stream(self.server.url + path, **kwargs)
+        self.addCleanup(stream.close)
+        return stream
+
+    def test_prefetch_and_metrics(self):
+        """Test playback waits for the prefetch and the fill level is reported"""
+        stream = self.open()
+        self.assertTrue(stream.wait_ready(5))
+        self.assertGreaterEqual(stream.buffer.fill, 64 * 1024)
+        self.assertEqual(stream.namehint, 'mp3')
+        self.assertTrue(stream.seekable())
+        self.assertGreater(metrics.gauge('stream_buffer_fill_ratio').value, 0)
+        self.assertEqual(read_all(stream), self.payload)
+
+    def test_stall_and_drop_reconnect_with_range(self):
+        """Test a silent connection and a dropped one both resume where they stopped"""
+        stalls = metrics.counter('stream_stalls_total').value
+        self.server.stall_at = (200 * 1024, 2.0)
+        self.server.drop_at = 400 * 1024
+        stream = self.open()
+        self.assertEqual(read_all(stream), self.payload)
+        self.assertEqual(metrics.counter('stream_stalls_total').value, stalls + 1)
+        self.assertEqual(stream.reconnects, 2)
+        ranges = [r for _p, r in self.server.requests if r]
+        self.assertEqual(len(ranges), 2)
+
+    def test_underruns_counted(self):
+        """Test a reader outrunning a slow link records underruns"""
+        self.server.rate = 256 * 1024
+        stream = self.open(prefetch_bytes=16 * 1024)
+        stream.wait_ready(5)
+        before = metrics.counter('stream_underruns_total').value
+        self.assertEqual(read_all(stream, 64 * 1024), self.payload)
+        self.assertGreater(stream.underruns, 0)
+        self.assertGreaterEqual(metrics.counter('stream_underruns_total').value - before, stream.underruns)
+
+    def test_seek_refetches_outside_buffer(self):
+        """Test seeks inside the ring are free and seeks outside it use a range request"""
+        stream = self.open()
+        head = stream.read(1000)
+        stream.seek(10)
+        self.assertEqual(stream.read(20), self.payload[10:30])
+        self.assertEqual(stream.seek(-100, io.SEEK_END), len(self.payload) - 100)
+        self.assertEqual(read_all(stream), self.payload[-100:])
+        stream.seek(0)
+        self.assertEqual(stream.read(1000), head)
+
+    def test_live_stream_and_playlist_failover(self):
+        """Test a radio playlist fails over to its next entry and a dropped live stream reconnects"""
+        self.server.playlists['/radio.pls'] = (
+            "[playlist]\nFile1=http://127.0.0.1:9/dead\nFile2=" + self.server.url + "/live\n")
+        self.assertEqual(resolve_playlist(self.server.url + '/radio.pls')[1], self.server.url + '/live')
+        self.server.drop_at = 100 * 1024
+        stream = self.open('/radio.pls', max_retries=5)
+        self.assertFalse(stream.seekable())
+        data = bytearray()
+        while len(data) < 300 * 1024:
+            data += stream.read(8192)
+        self.assertGreaterEqual(stream.reconnects, 2)
+        with self.assertRaises(OSError):
+            stream.seek(0, io.SEEK_END)
+
+    def test_stalled_read_returns_silence(self):
+        """Test a read during a stall returns zeros promptly instead of blocking the audio thread"""
+        self.server.stall_at = (128 * 1024, 2.0)
+        stream = self.open(read_timeout=0.05)
+        self.assertTrue(stream.wait_ready(5))
+        before = metrics.counter('stream_silence_reads_total').value
+        slowest = 0.0
+        while stream.tell() < len(self.payload):
+            start = time.monotonic()
+            data = stream.read(4096)
+            slowest = max(slowest, time.monotonic() - start)
+            if data == bytes(len(data)):
+                break
+        self.assertTrue(data)
+        self.assertEqual(data, bytes(len(data)))
+        self.assertLessEqual(stream.tell(), 128 * 1024 + 8192)
+        self.assertLess(slowest, 0.5)
+        self.assertGreater(metrics.counter('stream_silence_reads_total').value, before)
+        # Padding is not part of the stream: reading resumes where the stall began
+        position = stream.tell()
+        stream.read_timeout = 10.0
+        self.assertEqual(stream.read(100), self.payload[position:position + 100])
+
+    def test_gives_up(self):
+        """Test an unreachable stream reports an error instead of hanging"""
+        stream = HttpStream(['http://127.0.0.1:9/none'], stall_timeout=0.2, max_retries=2, backoff=0.01)
+        stream.start()
+        self.addCleanup(stream.close)
+        with self.assertRaises(ConnectionError):
+            stream.wait_ready(5)
+        self.assertEqual(stream.read(10), b'')
+
+
+class TestStreamPlayback(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mixer on SDL's dummy audio driver"""
+        self._driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        except pygame.error as e:
+            self.skipTest(f"dummy audio driver unavailable: {e}")
+        self.addCleanup(self._restore)
+
+    def _restore(self):
+        pygame.mixer.quit()
+        if self._driver is None:
+            os.environ.pop('SDL_AUDIODRIVER', None)
+        else:
+            os.environ['SDL_AUDIODRIVER'] = self._driver
+
+    def wav_server(self, seconds=1, **kwargs):
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(2)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(b'\0\0' * 2 * int(seconds * 44100))
+        server = JitterServer(buf.getvalue(), rate=2 * 1024 * 1024, jitter=0.002, content_type='audio/wav', **kwargs)
+        self.addCleanup(server.close)
+        return server
+
+    def wait_playing(self, player, position=0.1, timeout=5.0):
+        """True once the mixer plays and the player is past position"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if pygame.mixer.music.get_busy() and player.get_current_position() > position:
+                return True
+            time.sleep(0.02)
+        return False
+
+    def test_player_plays_url(self):
+        """Test a URL playlist entry plays through the buffered reader and ends"""
+        server = self.wav_server()
+
+        player = MusicPlayer()
+        self.assertEqual(player.add_files([server.url + '/track.wav', '/no/such/file.mp3']), 1)
+        self.assertTrue(player.play(0))
+        stream = player._stream
+        self.assertIsNotNone(stream)
+        self.assertEqual(player.get_current_song_info()['title'], 'track.wav')
+        self.assertTrue(self.wait_playing(player))
+        # End events need a display; watch the mixer instead
+        deadline = time.time() + 10
+        while pygame.mixer.music.get_busy() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(pygame.mixer.music.get_busy())
+        self.assertEqual(stream.tell(), len(server.payload))
+        player.stop()
+        self.assertIsNone(player._stream)
+        self.assertTrue(stream.closed)
+
+    def test_player_opens_url_on_jobs(self):
+        """Test play() returns before a slow stream is ready and starts it once prefetched"""
+        server = self.wav_server(seconds=3)
+        jobs = JobExecutor()
+        self.addCleanup(jobs.shutdown)
+        player = MusicPlayer()
+        player.jobs = jobs
+        self.addCleanup(player.stop)
+        player.add_files([server.url + '/track.wav', server.url + '/track2.wav'])
+
+        server.stall_at = (0, 0.5)
+        start = time.monotonic()
+        self.assertTrue(player.play(0))
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertIsNone(player._stream)
+        self.assertFalse(player.check_events())
+        deadline = time.time() + 5
+        while player._stream is None and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertIsNotNone(player._stream)
+        self.assertTrue(self.wait_playing(player))
+
+        # A stream still connecting when the user moves on is closed, never played
+        opened = []
+        open_stream = player._open_stream
+        player._open_stream = lambda url: opened.append(open_stream(url)) or opened[-1]
+        server.stall_at = (0, 0.5)
+        player.play(1)
+        self.assertEqual(player.get_current_position(), 0.0)
+        player.stop()
+        deadline = time.time() + 5
+        while not (opened and opened[0].closed) and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertTrue(opened[0].closed)
+        self.assertIsNone(player._stream)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Unit tests for memory-mapped PCM playback
+"""
+
+import unittest
+import os
+import sys
+import time
+import wave
+import hashlib
+import tempfile
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pygame
+from pcm_stream import PcmStream, parse_wav
+from events import PlaybackEnded
+from player import MusicPlayer
+
+
+def write_pcm(path, seconds, rate=44100, channels=2):
+    """Write a 16-bit WAV whose frames count up, so offsets are checkable"""
+    frames = int(seconds * rate)
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        block = b''.join((i & 0x7FFF).to_bytes(2, 'little') * channels for i in range(rate))
+        for _ in range(frames // rate):
+            w.writeframes(block)
+        w.writeframes(block[:(frames % rate) * 2 * channels])
+
+
+def resident_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+class TestPcmStream(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a temporary directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'set.wav')
+
+    def test_parse_and_seek(self):
+        """Test the data chunk is located and seeks are frame aligned"""
+        write_pcm(self.path, 2.5, rate=8000, channels=1)
+        with PcmStream(self.path) as stream:
+            info = stream.info
+            self.assertEqual((info.rate, info.channels, info.sample_width), (8000, 1, 2))
+            self.assertAlmostEqual(info.length, 2.5)
+            self.assertTrue(stream.matches(8000, -16, 1))
+            self.assertFalse(stream.matches(44100, -16, 1))
+
+            stream.seek(1.25)
+            self.assertAlmostEqual(stream.tell(), 1.25)
+            view = stream.read(5)  # rounded down to whole frames
+            self.assertEqual(len(view), 4)
+            self.assertEqual(int.from_bytes(view[:2], 'little'), 2000)
+            view.release()
+
+            stream.seek(99)
+            self.assertTrue(stream.at_end)
+            view = stream.read(1024)
+            self.assertEqual(len(view), 0)
+            view.release()
+
+    def test_rejects_non_pcm(self):
+        """Test compressed or malformed files are refused"""
+        with self.assertRaises(ValueError):
+            parse_wav(b'RIFF\0\0\0\0WAVEfmt \x10\0\0\0' + b'\x55\0' + b'\0' * 14)
+        with self.assertRaises(ValueError):
+            parse_wav(b'ID3\x04' + b'\0' * 40)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/status'), "needs /proc to read RSS")
+    def test_resident_memory_stays_flat(self):
+        """Test streaming a long file does not keep it resident"""
+        write_pcm(self.path, 600, rate=44100, channels=2)  # ~100 MiB
+        size_kb = os.path.getsize(self.path) // 1024
+        with PcmStream(self.path) as stream:
+            before = resident_kb()
+            digest = hashlib.sha1()
+            while True:
+                view = stream.read(1 << 20)
+                if not len(view):
+                    view.release()
+                    break
+                digest.update(view)
+                view.release()
+            grown = resident_kb() - before
+        self.assertLess(grown, size_kb // 4)
+
+
+class TestPcmPlayback(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mixer on SDL's dummy audio driver"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self._driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        except pygame.error as e:
+            self.skipTest(f"dummy audio driver unavailable: {e}")
+        self.addCleanup(self._restore)
+
+    def _restore(self):
+        pygame.mixer.quit()
+        if self._driver is None:
+            os.environ.pop('SDL_AUDIODRIVER', None)
+        else:
+            os.environ['SDL_AUDIODRIVER'] = self._driver
+
+    def test_player_uses_mapped_stream(self):
+        """Test mixer-format WAVs stream from the map, seek in place and end"""
+        path = os.path.join(self.tmpdir.name, 'short.wav')
+        write_pcm(path, 1.5)
+        player = MusicPlayer()
+        player.load_playlist([path])
+        ended = []
+        player.events.subscribe(PlaybackEnded, lambda e: ended.append(True))
+
+        self.assertTrue(player.play(0))
+        pcm = player._pcm
+        self.assertIsNotNone(pcm)
+        player.play(0, start_pos=1.0)
+        self.assertIs(player._pcm, pcm)  # same mapping, new offset
+        self.assertGreaterEqual(player.get_current_position(), 1.0)
+
+        player.pause()
+        paused_at = player.get_current_position()
+        time.sleep(0.1)
+        self.assertEqual(player.get_current_position(), paused_at)
+        player.unpause()
+
+        deadline = time.time() + 5
+        while not ended and time.time() < deadline:
+            player.check_events()
+            time.sleep(0.02)
+        self.assertTrue(ended)
+        self.assertIsNone(player._pcm)
+
+
+if __name__ == '__main__':
+    unittest.main()
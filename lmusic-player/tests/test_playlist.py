@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the playlist path index
+"""
+
+import unittest
+import os
+import sys
+import pickle
+import tempfile
+import unicodedata
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from playlist import Playlist, normalize_path
+from player import MusicPlayer
+
+
+class TestPlaylistIndex(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a folder of empty tracks and a symlink to it"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.folder = os.path.join(self.tmpdir.name, 'album')
+        os.makedirs(self.folder)
+        self.files = []
+        for name in ('a.mp3', 'b.mp3', 'c.mp3', 'Café.mp3'):
+            path = os.path.join(self.folder, unicodedata.normalize('NFC', name))
+            open(path, 'wb').close()
+            self.files.append(path)
+        self.link = os.path.join(self.tmpdir.name, 'linked')
+        os.symlink(self.folder, self.link)
+
+    def assertIndexConsistent(self, playlist):
+        for path in set(playlist):
+            self.assertEqual(playlist.count_of(path), list(playlist).count(path))
+            self.assertEqual(playlist.position(path), list(playlist).index(path))
+
+    def test_normalization(self):
+        """Test symlinks, relative parts and Unicode forms resolve to one key"""
+        a, _b, _c, cafe = self.files
+        self.assertEqual(normalize_path(os.path.join(self.link, 'a.mp3')), normalize_path(a))
+        self.assertEqual(normalize_path(os.path.join(self.folder, '..', 'album', 'a.mp3')), normalize_path(a))
+        self.assertEqual(normalize_path(unicodedata.normalize('NFD', cafe)), normalize_path(cafe))
+        self.assertEqual(normalize_path(f'{a}.cue#2'), normalize_path(os.path.join(self.link, 'a.mp3.cue#2')))
+        self.assertEqual(normalize_path('http://radio.example/stream'), 'http://radio.example/stream')
+
+    def test_index_follows_edits(self):
+        """Test membership and positions stay correct through every kind of edit"""
+        a, b, c, cafe = self.files
+        playlist = Playlist([a, b, c])
+        self.assertIn(os.path.join(self.link, 'b.mp3'), playlist)
+        self.assertNotIn(cafe, playlist)
+        self.assertEqual(playlist.position(c), 2)
+
+        playlist.append(a)
+        self.assertEqual(playlist.count_of(a), 2)
+        playlist.insert(0, cafe)
+        self.assertEqual(playlist.position(a), 1)
+        playlist.insert(2, playlist.pop(3))
+        self.assertIndexConsistent(playlist)
+        playlist.sort()
+        self.assertIndexConsistent(playlist)
+        playlist[:] = [c, b]
+        self.assertEqual(playlist.count_of(a), 0)
+        self.assertEqual(playlist.position(b), 1)
+        del playlist[0]
+        playlist.reverse()
+        playlist.extend([a, a])
+        playlist.remove(a)
+        self.assertIndexConsistent(playlist)
+        copied = pickle.loads(pickle.dumps(playlist))
+        self.assertEqual(copied.position(a), playlist.position(a))
+        playlist.clear()
+        self.assertNotIn(b, playlist)
+        self.assertIsNone(playlist.position(b))
+
+    def test_player_skips_duplicates(self):
+        """Test re-adding a folder (or the same files by another path) queues nothing new"""
+        player = MusicPlayer()
+        player.skip_duplicates = True
+        self.assertEqual(player.add_folder(self.folder), 4)
+        self.assertEqual(player.add_folder(self.link), 0)
+        self.assertEqual(player.add_files([self.files[0], os.path.join(self.link, 'b.mp3')]), 0)
+        self.assertEqual(len(player.playlist), 4)
+
+        player.skip_duplicates = False
+        self.assertEqual(player.add_files([self.files[0]]), 1)
+        # Lists assigned by session restore are indexed as well
+        player.playlist = list(self.files)
+        self.assertEqual(player.playlist.position(self.files[2]), 2)
+        player.move(2, 0)
+        player.reorder([3, 2, 1, 0])
+        self.assertIndexConsistent(player.playlist)
+
+
+if __name__ == '__main__':
+    unittest.main()
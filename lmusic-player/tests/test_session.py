@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the binary session snapshot
+"""
+
+import unittest
+import os
+import wave
+import struct
+import tempfile
+import sys
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pygame
+import session
+import journal
+from player import MusicPlayer
+
+
+class TestSessionSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a temporary snapshot path"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'session.bin')
+
+    def test_roundtrip(self):
+        """Test saving and loading preserves paths, index, position and durations"""
+        playlist = ['/music/a.mp3', '/music/Björk - Jóga.flac', '/music/c.ogg']
+        durations = {'/music/a.mp3': 181, '/music/c.ogg': 42}
+        self.assertTrue(session.save_session(self.path, playlist, 2, 12.5, durations))
+
+        with session.load_session(self.path) as snap:
+            self.assertEqual(len(snap), 3)
+            self.assertEqual(snap.paths, playlist)
+            self.assertEqual(snap.path(1), playlist[1])
+            self.assertEqual(snap.current_index, 2)
+            self.assertAlmostEqual(snap.position, 12.5)
+            self.assertEqual(snap.duration_map(), durations)
+
+    def test_reads_version_2(self):
+        """Test snapshots written with the old play order table still load"""
+        paths = [b'/music/a.mp3', b'/music/b.mp3']
+        blob = b'\0'.join(paths) + b'\0'
+        data = b''.join([
+            session.HEADER.pack(session.MAGIC, 2, 0, 2, 1, 3.5, len(blob), 7),
+            struct.pack('<3Q', 0, len(paths[0]) + 1, len(blob)),
+            struct.pack('<2I', 0, 1),
+            struct.pack('<2f', 60.0, -1.0),
+            blob,
+        ])
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        with session.load_session(self.path) as snap:
+            self.assertEqual(snap.paths, ['/music/a.mp3', '/music/b.mp3'])
+            self.assertEqual(snap.current_index, 1)
+            self.assertEqual(snap.generation, 7)
+            self.assertEqual(snap.duration_map(), {'/music/a.mp3': 60})
+
+    def test_empty_and_invalid(self):
+        """Test empty playlists load and garbage files are rejected"""
+        session.save_session(self.path, [])
+        with session.load_session(self.path) as snap:
+            self.assertEqual(snap.paths, [])
+
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot at all, just some bytes')
+        self.assertIsNone(session.load_session(self.path))
+        self.assertIsNone(session.load_session(os.path.join(self.tmpdir.name, 'missing.bin')))
+
+    def test_restore_player(self):
+        """Test restoring a snapshot and migrating the legacy config playlist"""
+        player = MusicPlayer()
+        try:
+            session.save_session(self.path, ['x.mp3', 'y.mp3'], 1, 0.0, {'y.mp3': 99})
+            self.assertTrue(session.restore_player(player, self.path))
+            self.assertEqual(player.playlist, ['x.mp3', 'y.mp3'])
+            self.assertEqual(player.current_index, 1)
+            self.assertEqual(player.get_song_length('y.mp3'), 99)
+
+            os.unlink(self.path)
+            legacy = os.path.join(self.tmpdir.name, 'legacy.mp3')
+            open(legacy, 'wb').close()
+            config = {'last_playlist': [legacy, '/missing.mp3'], 'last_index': 5}
+            self.assertTrue(session.restore_player(player, self.path, config))
+            self.assertEqual(player.playlist, [legacy])
+            self.assertEqual(player.current_index, 0)
+        finally:
+            player.shutdown()
+
+    def tearDown(self):
+        """Clean up temporary files"""
+        self.tmpdir.cleanup()
+
+
+class TestSessionJournal(unittest.TestCase):
+
+    def setUp(self):
+        """Set up temporary audio files and state paths"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.session_path = os.path.join(self.tmpdir.name, 'session.bin')
+        self.journal_path = os.path.join(self.tmpdir.name, 'session.journal')
+        self.files = []
+        for name in ('a.mp3', 'b.mp3', 'c.wav'):
+            path = os.path.join(self.tmpdir.name, name)
+            open(path, 'wb').close()
+            self.files.append(path)
+
+    def _recover(self):
+        player = MusicPlayer()
+        self.addCleanup(player.shutdown)
+        jrnl = journal.SessionJournal(self.journal_path, self.session_path)
+        # Stop the writer thread without compacting, like a killed process
+        self.addCleanup(jrnl.close, False)
+        jrnl.restore_player(player)
+        return player, jrnl
+
+    def test_recover_without_clean_shutdown(self):
+        """Test edits flushed to the journal survive a crash (no close/compact)"""
+        player, jrnl = self._recover()
+        jrnl.attach(player)
+        player.add_files(self.files)
+        player.move(2, 0)
+        player.remove_from_playlist(1)
+        jrnl.record_position(1, 42.0)
+        jrnl.flush()
+
+        recovered, _ = self._recover()
+        self.assertEqual(recovered.playlist, [self.files[2], self.files[1]])
+        self.assertEqual(recovered.current_index, 1)
+        self.assertAlmostEqual(recovered.current_position, 42.0)
+
+    def test_resume_at_journaled_position(self):
+        """Test resuming after a crash starts the track at the position in the journal"""
+        track = os.path.join(self.tmpdir.name, 'long.wav')
+        with wave.open(track, 'wb') as w:
+            w.setnchannels(2)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(bytes(44100 * 4 * 30))
+        driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        except pygame.error as e:
+            self.skipTest(f"dummy audio driver unavailable: {e}")
+        finally:
+            if driver is None:
+                os.environ.pop('SDL_AUDIODRIVER', None)
+            else:
+                os.environ['SDL_AUDIODRIVER'] = driver
+        self.addCleanup(pygame.mixer.quit)
+
+        player, jrnl = self._recover()
+        jrnl.attach(player)
+        player.add_files([self.files[0], track])
+        jrnl.record_position(1, 20.0)
+        jrnl.flush()
+
+        recovered, _ = self._recover()
+        self.assertTrue(recovered.resume())
+        self.addCleanup(recovered.stop)
+        self.assertEqual(recovered.current_index, 1)
+        self.assertAlmostEqual(recovered.get_current_position(), 20.0, delta=0.5)
+
+    def test_compaction_is_not_replayed_twice(self):
+        """Test a stale journal is ignored once a newer snapshot exists"""
+        player, jrnl = self._recover()
+        jrnl.attach(player)
+        player.add_files(self.files[:2])
+        jrnl.flush()
+        stale = open(self.journal_path, 'rb').read()
+        jrnl.close()
+        # Simulate a crash between writing the snapshot and truncating the journal
+        with open(self.journal_path, 'wb') as f:
+            f.write(stale)
+
+        recovered, _ = self._recover()
+        self.assertEqual(recovered.playlist, self.files[:2])
+
+    def test_torn_tail_is_ignored(self):
+        """Test a partially written last record does not break recovery"""
+        player, jrnl = self._recover()
+        jrnl.attach(player)
+        player.add_files(self.files[:1])
+        jrnl.flush()
+        player.add_files(self.files[1:])
+        jrnl.flush()
+        with open(self.journal_path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.journal_path) - 3)
+
+        recovered, _ = self._recover()
+        self.assertEqual(recovered.playlist, self.files[:1])
+
+
+if __name__ == '__main__':
+    unittest.main()
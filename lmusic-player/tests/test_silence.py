@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Unit tests for silence detection and trimmed playback
+"""
+
+import unittest
+import os
+import sys
+import time
+import wave
+import tempfile
+import tracemalloc
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import pygame
+from events import PlaybackEnded
+from player import MusicPlayer
+
+if np is not None:
+    import silence
+    from silence import SilenceCache, audible_bounds, find_bounds
+
+
+def write_track(path, parts, rate=44100, channels=2):
+    """Write a 16-bit WAV from (seconds, amplitude) parts of a 440 Hz tone"""
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        for seconds, amplitude in parts:
+            t = np.arange(int(seconds * rate)) / rate
+            tone = (amplitude * 32000 * np.sin(2 * np.pi * 440 * t)).astype('<i2')
+            w.writeframes(np.repeat(tone, channels).tobytes())
+
+
+@unittest.skipIf(np is None, "NumPy is required for silence detection")
+class TestSilenceDetection(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a temporary directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_bounds(self):
+        """Test leading and trailing silence is found with a one-window margin"""
+        write_track(self.path('padded.wav'), [(2.0, 0), (3.0, 0.5), (1.5, 0)])
+        start, end = find_bounds(self.path('padded.wav'))
+        self.assertAlmostEqual(start, 2.0, delta=silence.WINDOW_SECONDS * 1.5)
+        self.assertAlmostEqual(end, 5.0, delta=silence.WINDOW_SECONDS * 2.5)
+        self.assertLessEqual(start, 2.0)
+        self.assertGreaterEqual(end, 5.0)
+
+        # Quiet but audible audio is kept; near-silent tails are not trimmed
+        write_track(self.path('quiet.wav'), [(0.1, 0), (2.0, 0.01), (0.1, 0)])
+        self.assertEqual(find_bounds(self.path('quiet.wav')), (0.0, None))
+        write_track(self.path('silent.wav'), [(2.0, 0)])
+        self.assertIsNone(find_bounds(self.path('silent.wav')))
+
+    def test_memory_is_constant(self):
+        """Test a long stream is analysed without holding more than a block"""
+        rate = 22050
+
+        def blocks(seconds):
+            tone = np.sin(np.arange(rate, dtype=np.float32)).astype(np.float32) * 0.5
+            quiet = np.zeros(rate, dtype=np.float32)
+            for i in range(seconds):
+                yield (tone if 5 <= i < seconds - 7 else quiet), rate, 1
+
+        peaks = []
+        for seconds in (60, 1200):
+            tracemalloc.start()
+            bounds = audible_bounds(blocks(seconds))
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            self.assertAlmostEqual(bounds[0], 5.0, delta=0.1)
+            self.assertAlmostEqual(bounds[1], seconds - 7.0, delta=0.15)
+        # 20x the audio, the same working set
+        self.assertLess(peaks[1], peaks[0] * 1.5 + 65536)
+        self.assertLess(peaks[1], 1 << 20)
+
+    def test_cache(self):
+        """Test offsets persist and a modified file is analysed again"""
+        track = self.path('t.wav')
+        write_track(track, [(1.0, 0), (1.0, 0.5)])
+        cache = SilenceCache(self.path('silence.json'))
+        self.assertIsNone(cache.bounds(track))
+        cache.analyze(track)
+        start, end = cache.bounds(track)
+        self.assertAlmostEqual(start, 1.0, delta=0.1)
+        self.assertIsNone(end)
+        cache.save()
+
+        reloaded = SilenceCache(self.path('silence.json'))
+        self.assertEqual(reloaded.bounds(track), (start, end))
+        os.utime(track, (time.time() + 10, time.time() + 10))
+        self.assertIsNone(reloaded.bounds(track))
+
+
+@unittest.skipIf(np is None, "NumPy is required for silence detection")
+class TestTrimmedPlayback(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a mixer on SDL's dummy audio driver"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self._driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        except pygame.error as e:
+            self.skipTest(f"dummy audio driver unavailable: {e}")
+        self.addCleanup(self._restore)
+
+    def _restore(self):
+        pygame.mixer.quit()
+        if self._driver is None:
+            os.environ.pop('SDL_AUDIODRIVER', None)
+        else:
+            os.environ['SDL_AUDIODRIVER'] = self._driver
+
+    def test_playback_skips_silence(self):
+        """Test playback starts at the audible start and ends at the audible end"""
+        path = os.path.join(self.tmpdir.name, 'padded.wav')
+        write_track(path, [(1.5, 0), (0.5, 0.5), (2.0, 0)])
+        cache = SilenceCache(os.path.join(self.tmpdir.name, 'silence.json'))
+        cache.analyze(path)
+        player = MusicPlayer()
+        player.silence = cache
+        player.load_playlist([path])
+        ended = []
+        player.events.subscribe(PlaybackEnded, lambda e: ended.append(time.time()))
+
+        started = time.time()
+        self.assertTrue(player.play(0))
+        self.assertGreaterEqual(player.get_current_position(), 1.4)
+        while not ended and time.time() - started < 5:
+            player.check_events()
+            time.sleep(0.02)
+        self.assertTrue(ended)
+        # About 0.6 s of audio instead of 4 s
+        self.assertLess(ended[0] - started, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
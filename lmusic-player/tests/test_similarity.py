@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Unit tests for audio features and similar-track search
+"""
+
+import unittest
+import os
+import time
+import wave
+import tempfile
+import sys
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import features
+from player import MusicPlayer
+
+if np is not None:
+    from similarity import FeatureMatrix, IVFIndex, SimilarTracks
+
+
+def write_track(path, bpm, tone, seconds=8.0, rate=22050, channels=1):
+    """Noise bursts on every beat over a steady tone"""
+    t = np.arange(int(seconds * rate)) / rate
+    signal = 0.2 * np.sin(2 * np.pi * tone * t)
+    signal += 0.6 * np.exp(-(t % (60.0 / bpm)) / 0.02) * np.random.default_rng(0).standard_normal(len(t))
+    data = (np.clip(signal, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(np.repeat(data, channels).tobytes())
+
+
+@unittest.skipIf(np is None, "NumPy is required for audio analysis")
+class TestFeatures(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a directory of synthetic tracks"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def track(self, name, bpm, tone, **kwargs):
+        path = os.path.join(self.tmpdir.name, name)
+        write_track(path, bpm, tone, **kwargs)
+        return path
+
+    def test_tempo_and_shape(self):
+        """Test the vector layout and the tempo estimate"""
+        for bpm in (90, 128, 150):
+            vector = features.extract_features(self.track(f"{bpm}.wav", bpm, 440, channels=2, rate=44100))
+            self.assertEqual(vector.shape, (features.FEATURE_DIM,))
+            self.assertEqual(vector.dtype, np.float32)
+            tempo = vector[features.FEATURE_NAMES.index('tempo')] * features.MAX_BPM
+            self.assertAlmostEqual(tempo, bpm, delta=2.0)
+
+    def test_silence_has_no_tempo(self):
+        """Test silent input yields finite features and zero tempo"""
+        vector = features.features_from_samples(np.zeros(features.SAMPLE_RATE * 2, dtype=np.float32))
+        self.assertTrue(np.isfinite(vector).all())
+        self.assertEqual(vector[features.FEATURE_NAMES.index('tempo')], 0.0)
+
+    def test_batch_uses_worker_processes(self):
+        """Test batch extraction returns one result per path, None for bad files"""
+        paths = [self.track(f"{i}.wav", 100 + 10 * i, 220 * (i + 1)) for i in range(3)]
+        bad = os.path.join(self.tmpdir.name, 'bad.wav')
+        with open(bad, 'wb') as f:
+            f.write(b'not audio')
+        results = {}
+        for batch in features.extract_batch(paths + [bad], workers=2, chunk_size=2):
+            results.update(batch)
+        self.assertEqual(set(results), set(paths + [bad]))
+        self.assertIsNone(results[bad])
+        np.testing.assert_allclose(results[paths[1]], features.extract_features(paths[1]), rtol=1e-5)
+
+
+@unittest.skipIf(np is None, "NumPy is required for audio analysis")
+class TestSimilarity(unittest.TestCase):
+
+    def clustered(self, count, clusters=200, seed=1):
+        rng = np.random.default_rng(seed)
+        centers = rng.standard_normal((clusters, features.FEATURE_DIM))
+        labels = rng.integers(0, clusters, count)
+        return (centers[labels] + 0.3 * rng.standard_normal((count, features.FEATURE_DIM))).astype(np.float32)
+
+    def test_index_recall_and_latency(self):
+        """Test 100k-track queries are fast and match exact search"""
+        vectors = self.clustered(100000)
+        index = IVFIndex(vectors)
+        exact_data = index._normalize(vectors)
+        rng = np.random.default_rng(2)
+        hits = 0
+        elapsed = []
+        for row in rng.integers(0, len(vectors), 50):
+            start = time.perf_counter()
+            found = index.search(vectors[row], 10, exclude={int(row)})
+            elapsed.append(time.perf_counter() - start)
+            exact = np.argsort(-(exact_data @ exact_data[row]))[1:11]
+            hits += len({r for r, _ in found} & set(exact.tolist()))
+        self.assertGreaterEqual(hits / 500, 0.9)
+        self.assertLess(float(np.median(elapsed)), 0.01)
+
+    def test_matrix_save_load(self):
+        """Test vectors round-trip and updates replace rows in place"""
+        matrix = FeatureMatrix()
+        vectors = self.clustered(5)
+        matrix.update({f"/m/{i}.mp3": v for i, v in enumerate(vectors)})
+        matrix.update({'/m/0.mp3': vectors[4], '/m/bad.mp3': None})
+        self.assertEqual(len(matrix), 5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'features.npz')
+            self.assertTrue(matrix.save(path))
+            loaded = FeatureMatrix.load(path)
+        self.assertEqual(loaded.paths, matrix.paths)
+        np.testing.assert_array_equal(loaded.vector('/m/0.mp3'), vectors[4])
+        self.assertTrue(loaded.vectors.flags['C_CONTIGUOUS'])
+        self.assertEqual(len(FeatureMatrix.load('/nonexistent/features.npz')), 0)
+
+    def test_autoplay_extends_playlist(self):
+        """Test next() on the last track appends and plays a similar one"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for i in range(4):
+                path = os.path.join(tmpdir, f"{i}.mp3")
+                open(path, 'wb').close()
+                paths.append(path)
+            matrix = FeatureMatrix()
+            base = self.clustered(2, clusters=2)
+            # 0 and 2 are alike, as are 1 and 3
+            matrix.update({p: base[i % 2] + 0.01 * i for i, p in enumerate(paths)})
+            similar = SimilarTracks(matrix)
+            self.assertEqual(similar.similar(paths[0], k=1)[0][0], paths[2])
+
+            player = MusicPlayer()
+            player.get_song_length = lambda path: 0
+            player.playlist = [paths[1]]
+            player.autoplay = similar
+            player.next()
+            self.assertEqual(player.playlist, [paths[1], paths[3]])
+            self.assertEqual(player.current_index, 1)
+
+            player.autoplay = None
+            player.next()
+            self.assertEqual(player.current_index, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the metadata library and smart playlist queries
+"""
+
+import unittest
+import os
+import time
+import tempfile
+import sys
+
+# Add src and benchmarks to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from library import Library, read_metadata
+from smart_playlist import SmartPlaylist, QueryError, compile_query
+
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
+
+
+def make_library():
+    lib = Library()
+    rows = [
+        # path, artist, album, title, length, played, added, track
+        ('/m/a1.mp3', 'Alpha', 'First', 'Intro', 200, 0, 100, 1),
+        ('/m/a2.mp3', 'Alpha', 'First', 'Long Song', 420, 2, 300, 2),
+        ('/m/a3.mp3', 'alpha', 'Second', 'Epic', 610, 9, 200, 1),
+        ('/m/b1.mp3', 'Beta', 'Live at Home', 'Jam', 330, 1, 400, 1),
+        ('/m/b2.mp3', 'Beta', 'Studio', 'Short', 95, 4, 500, 2),
+    ]
+    with lib.batch():
+        for path, artist, album, title, length, played, added, track in rows:
+            lib.add(path, artist=artist, album=album, title=title, length=length,
+                    played=played, added=added, track=track)
+    return lib
+
+
+class TestLibrary(unittest.TestCase):
+
+    def test_indexes_follow_updates(self):
+        """Test equality and range lookups stay correct after edits"""
+        lib = make_library()
+        self.assertEqual(len(lib.equal('artist', 'ALPHA')), 3)
+        self.assertEqual(sorted(lib.range('length', lo=300)), [1, 2, 3])
+
+        lib.update('/m/a3.mp3', artist='Gamma', length=100)
+        lib.remove('/m/b1.mp3')
+        self.assertEqual(len(lib.equal('artist', 'alpha')), 2)
+        self.assertEqual(sorted(lib.range('length', lo=300)), [1])
+        self.assertNotIn('/m/b1.mp3', lib)
+        self.assertEqual(len(lib), 4)
+
+    def test_batch_notifies_once(self):
+        """Test subscribers get one notification per batch with changed paths"""
+        lib = make_library()
+        seen = []
+        lib.subscribe(seen.append)
+        with lib.batch():
+            lib.update('/m/a1.mp3', played=5)
+            lib.update('/m/a2.mp3', played=5)
+            lib.update('/m/b2.mp3', played=4)  # unchanged
+        self.assertEqual(seen, [{'/m/a1.mp3', '/m/a2.mp3'}])
+
+    def test_save_and_load(self):
+        """Test the library round-trips through its JSON file"""
+        lib = make_library()
+        lib.remove('/m/a2.mp3')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'library.json')
+            self.assertTrue(lib.save(path))
+            loaded = Library.load(path)
+        self.assertEqual(len(loaded), 4)
+        self.assertEqual(loaded.get('/m/a3.mp3')['album'], 'Second')
+        self.assertEqual(loaded.get('/m/a3.mp3')['added'], 200)
+        self.assertEqual(len(Library.load('/nonexistent/library.json')), 0)
+
+    @unittest.skipIf(mutagen is None, "mutagen is required to read tags")
+    def test_read_metadata(self):
+        """Test tags, numbers and length are read from real files"""
+        import libgen
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files = libgen.generate_library(tmpdir, 4, workers=1)
+            # mp3, flac and ogg carry tags; the wav does not
+            for i, path in enumerate(files[:3]):
+                tags = libgen.track_spec(i)[3]
+                meta = read_metadata(path)
+                self.assertEqual(meta['artist'], tags['artist'])
+                self.assertEqual(meta['track'], tags['tracknumber'])
+                self.assertEqual(meta['year'], tags['date'])
+            self.assertEqual(read_metadata(files[3])['title'], os.path.splitext(os.path.basename(files[3]))[0])
+
+            lib = Library()
+            lib.apply([(p, lib.read_if_stale(p)) for p in files])
+            self.assertTrue(all(lib.read_if_stale(p) is None for p in files))
+
+
+class TestQueries(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a small library"""
+        self.lib = make_library()
+
+    def run_query(self, text):
+        return [os.path.basename(p) for p in compile_query(text, self.lib).evaluate(self.lib)]
+
+    def test_filters(self):
+        """Test field predicates, boolean operators and bare words"""
+        self.assertEqual(self.run_query('artist:alpha and length>300'), ['a2.mp3', 'a3.mp3'])
+        self.assertEqual(self.run_query('artist:alpha length>300 played<5'), ['a2.mp3'])
+        self.assertEqual(self.run_query('album:live* or title~ort'), ['b1.mp3', 'b2.mp3'])
+        self.assertEqual(self.run_query('not artist:alpha'), ['b1.mp3', 'b2.mp3'])
+        self.assertEqual(self.run_query('artist!=beta and (track=2 or played>=9)'), ['a2.mp3', 'a3.mp3'])
+        self.assertEqual(self.run_query('length>=7:00'), ['a2.mp3', 'a3.mp3'])
+        self.assertEqual(self.run_query('"long"'), ['a2.mp3'])
+        self.assertEqual(self.run_query('epic'), ['a3.mp3'])
+
+    def test_not_equal_matches_missing_values(self):
+        """Test != on a numeric field means the same alone and next to a narrowing term"""
+        self.lib.update('/m/a2.mp3', year=2000)
+        self.lib.update('/m/a3.mp3', year=1999)
+        # Enough tracks that a narrow term makes 'and' filter the rest instead of evaluating it
+        with self.lib.batch():
+            for i in range(10):
+                self.lib.add(f'/m/z{i}.mp3', artist='Zeta', title=f'Filler {i}', year=2000)
+        self.assertEqual(self.run_query('year!=2000'), ['a1.mp3', 'a3.mp3', 'b1.mp3', 'b2.mp3'])
+        self.assertEqual(self.run_query('artist:alpha and year!=2000'), ['a1.mp3', 'a3.mp3'])
+        self.assertEqual(self.run_query('title:intro and year!=2000'), ['a1.mp3'])
+        self.assertEqual(self.run_query('title:"long song" and year!=2000'), [])
+        self.assertEqual(self.run_query('artist:alpha and not year=2000'), ['a1.mp3', 'a3.mp3'])
+
+    def test_order_and_limit(self):
+        """Test ORDER BY with several keys, directions and LIMIT"""
+        self.assertEqual(self.run_query('order by added desc limit 2'), ['b2.mp3', 'b1.mp3'])
+        self.assertEqual(self.run_query('order by track, length desc'),
+                         ['a3.mp3', 'b1.mp3', 'a1.mp3', 'a2.mp3', 'b2.mp3'])
+        self.assertEqual(self.run_query('length>100 order by artist, album desc, track limit 3'),
+                         ['a3.mp3', 'a1.mp3', 'a2.mp3'])
+        self.assertEqual(self.run_query('limit 1'), ['a1.mp3'])
+
+    def test_relative_age(self):
+        """Test added<7d selects recently added tracks"""
+        self.lib.add('/m/new.mp3', title='New')
+        self.assertEqual(self.run_query('added<7d'), ['new.mp3'])
+        self.assertEqual(len(self.run_query('added>7d')), 5)
+
+    def test_errors(self):
+        """Test malformed queries raise QueryError"""
+        for text in ('artist:', 'mood:happy', 'length~3', 'order artist', '(epic', 'limit x', 'length>abc'):
+            with self.assertRaises(QueryError, msg=text):
+                compile_query(text, self.lib)
+
+    def test_live_updates(self):
+        """Test a smart playlist follows library changes"""
+        updates = []
+        smart = SmartPlaylist('Favourites', 'played>=5 order by played desc', self.lib, on_update=updates.append)
+        self.assertEqual([os.path.basename(p) for p in smart.paths], ['a3.mp3'])
+
+        self.lib.update('/m/b2.mp3', played=12)
+        self.lib.update('/m/a1.mp3', title='Renamed')  # no effect on results
+        self.assertEqual(len(updates), 1)
+        self.assertEqual([os.path.basename(p) for p in smart.paths], ['b2.mp3', 'a3.mp3'])
+
+        smart.close()
+        self.lib.update('/m/a1.mp3', played=50)
+        self.assertEqual(len(updates), 1)
+
+    def test_large_library_is_fast(self):
+        """Test indexed predicates stay in the milliseconds on 100k tracks"""
+        lib = Library()
+        with lib.batch():
+            for i in range(100000):
+                lib.add(f"/m/{i}.mp3", artist=f"Artist {i % 500}", length=60 + i % 600,
+                        played=i % 20, added=i)
+        query = compile_query('artist:"artist 7" and length>300 and played>5 order by added desc limit 20', lib)
+        query.evaluate(lib)  # builds the sorted views
+        start = time.perf_counter()
+        paths = query.evaluate(lib)
+        elapsed = time.perf_counter() - start
+        expected = [i for i in range(99999, -1, -1) if i % 500 == 7 and 60 + i % 600 > 300][:20]
+        self.assertEqual(paths, [f"/m/{i}.mp3" for i in expected])
+        self.assertLess(elapsed, 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the decode cache
+"""
+
+import unittest
+import os
+import wave
+import tempfile
+import sys
+import time
+import threading
+
+# Add src and benchmarks to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import pygame
+
+import libgen
+from jobs import JobExecutor
+from player import MusicPlayer
+from transcode import TranscodeCache
+
+
+def fake_decoder(calls, frames=1000, delay=0.0):
+    """Decoder writing a short silent WAV and recording its sources"""
+    def decode(src, dst, rate, channels):
+        calls.append(src)
+        time.sleep(delay)
+        with wave.open(dst, 'wb') as w:
+            w.setnchannels(channels)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(b'\0' * frames * channels * 2)
+    return decode
+
+
+class TestTranscodeCache(unittest.TestCase):
+
+    def setUp(self):
+        """Set up source tracks and an empty cache directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+        self.calls = []
+        self.sources = []
+        for i in range(4):
+            path = os.path.join(self.tmpdir.name, f"track{i}.m4a")
+            with open(path, 'wb') as f:
+                f.write(b'\0' * 64)
+            self.sources.append(path)
+
+    def test_needs_transcode(self):
+        """Test only unsupported containers and off-rate FLACs are decoded"""
+        cache = TranscodeCache(self.cache_dir, decoder=fake_decoder(self.calls))
+        hires = os.path.join(self.tmpdir.name, 'hires.flac')
+        cd = os.path.join(self.tmpdir.name, 'cd.flac')
+        mp3 = os.path.join(self.tmpdir.name, 'song.mp3')
+        tags = libgen.track_spec(0)[3]
+        libgen.write_flac(hires, 0.5, tags, sample_rate=96000)
+        libgen.write_flac(cd, 0.5, tags, sample_rate=44100)
+        libgen.write_mp3(mp3, 0.5, tags)
+
+        self.assertTrue(cache.needs_transcode(self.sources[0]))
+        self.assertTrue(cache.needs_transcode(hires))
+        self.assertFalse(cache.needs_transcode(cd))
+        self.assertFalse(cache.needs_transcode(mp3))
+        self.assertEqual(cache.resolve(mp3), mp3)
+
+    def test_resolve_decodes_once(self):
+        """Test a miss decodes synchronously and later plays hit the cache"""
+        cache = TranscodeCache(self.cache_dir, decoder=fake_decoder(self.calls))
+        first = cache.resolve(self.sources[0])
+        self.assertNotEqual(first, self.sources[0])
+        self.assertTrue(first.endswith('.wav'))
+        self.assertEqual(cache.resolve(self.sources[0]), first)
+        self.assertEqual(self.calls, [self.sources[0]])
+
+        # Index survives a restart; an edited source is decoded again
+        cache = TranscodeCache(self.cache_dir, decoder=fake_decoder(self.calls))
+        self.assertEqual(cache.lookup(self.sources[0]), first)
+        with open(self.sources[0], 'ab') as f:
+            f.write(b'edit')
+        self.assertIsNone(cache.lookup(self.sources[0]))
+
+    def test_running_and_failed_decodes_are_not_repeated(self):
+        """Test a miss waits for the decode already running and a failed decode is not retried"""
+        cache = TranscodeCache(self.cache_dir, decoder=fake_decoder(self.calls, delay=0.3))
+        background = threading.Thread(target=cache.transcode, args=(self.sources[0],))
+        background.start()
+        time.sleep(0.1)
+        self.assertTrue(cache.resolve(self.sources[0]).endswith('.wav'))
+        background.join()
+        self.assertEqual(self.calls, [self.sources[0]])
+        self.assertFalse(cache.needs_decode(self.sources[0]))
+
+        def broken(src, dst, rate, channels):
+            self.calls.append(src)
+            raise RuntimeError("corrupt")
+        cache.decoder = broken
+        self.assertTrue(cache.needs_decode(self.sources[1]))
+        self.assertEqual(cache.resolve(self.sources[1]), self.sources[1])
+        self.assertEqual(cache.resolve(self.sources[1]), self.sources[1])
+        self.assertIsNone(cache.ensure(self.sources[1]))
+        self.assertFalse(cache.needs_decode(self.sources[1]))
+        self.assertEqual(self.calls.count(self.sources[1]), 1)
+
+    def test_lru_quota(self):
+        """Test the least recently used entries are evicted beyond the quota"""
+        cache = TranscodeCache(self.cache_dir, decoder=fake_decoder(self.calls))
+        entry_size = os.path.getsize(cache.transcode(self.sources[0]))
+        cache.quota_bytes = entry_size * 2
+        cache.transcode(self.sources[1])
+        cache.lookup(self.sources[0])  # 1 is now least recently used
+        cache.transcode(self.sources[2])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.lookup(self.sources[0]))
+        self.assertIsNone(cache.lookup(self.sources[1]))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertLessEqual(cache.total_bytes, cache.quota_bytes)
+
+    def test_player_prefetches_upcoming(self):
+        """Test play() decodes upcoming tracks in the background"""
+        jobs = JobExecutor(pools={'cpu': 1})
+        self.addCleanup(jobs.shutdown, True)
+        cache = TranscodeCache(self.cache_dir, jobs=jobs, decoder=fake_decoder(self.calls))
+        player = MusicPlayer()
+        player.transcoder = cache
+        player.load_playlist(self.sources)
+        player.play(0)
+
+        for path in self.sources[1:]:
+            job = cache.ensure(path)
+            if job is not None:
+                self.assertTrue(job.wait(2))
+        self.assertEqual(sorted(self.calls), sorted(self.sources))
+        self.assertEqual(len(cache), 4)
+
+    def test_player_decodes_on_jobs(self):
+        """Test play() returns before a miss is decoded and starts the cached copy afterwards"""
+        driver = os.environ.get('SDL_AUDIODRIVER')
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        except pygame.error as e:
+            self.skipTest(f"dummy audio driver unavailable: {e}")
+        finally:
+            if driver is None:
+                os.environ.pop('SDL_AUDIODRIVER', None)
+            else:
+                os.environ['SDL_AUDIODRIVER'] = driver
+        self.addCleanup(pygame.mixer.quit)
+        jobs = JobExecutor(pools={'io': 1, 'cpu': 2})
+        self.addCleanup(jobs.shutdown, True)
+        cache = TranscodeCache(self.cache_dir, jobs=jobs, decoder=fake_decoder(self.calls, frames=44100, delay=0.3))
+        player = MusicPlayer()
+        player.transcoder = cache
+        player.jobs = jobs
+        self.addCleanup(player.stop)
+        player.load_playlist(self.sources)
+        # A prefetch of the track is already decoding when it is played
+        cache.ensure(self.sources[0])
+        time.sleep(0.05)
+
+        start = time.monotonic()
+        self.assertTrue(player.play(0))
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertIsNone(player._loaded_path)
+        deadline = time.time() + 5
+        while player._loaded_path is None and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(player._loaded_path, self.sources[0])
+        self.assertIsNotNone(player._pcm)
+        self.assertEqual(self.calls.count(self.sources[0]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
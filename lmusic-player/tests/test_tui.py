@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the terminal front-end (the parts that need no terminal)
+"""
+
+import unittest
+import os
+import sys
+import wave
+import tempfile
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tui import TerminalApp
+
+
+class TestTerminalApp(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a folder of short tracks"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        for name in ('Alpha.wav', 'Beta.wav', 'Alphabet.wav', 'Gamma.wav'):
+            with wave.open(os.path.join(self.tmpdir.name, name), 'wb') as w:
+                w.setnchannels(2)
+                w.setsampwidth(2)
+                w.setframerate(44100)
+                w.writeframes(b'\0' * 4 * 4410)
+        self.app = TerminalApp([self.tmpdir.name])
+        self.app.player.bookmarks = None
+
+    def test_search_narrows(self):
+        """Test the filter narrows as the query grows and resets when it shrinks"""
+        app = self.app
+        app._set_query('a')
+        self.assertEqual(len(app.matches), 4)
+        app._set_query('al')
+        names = sorted(app._name(i) for i in app.matches)
+        self.assertEqual(names, ['Alpha.wav', 'Alphabet.wav'])
+        app._set_query('alphab')
+        self.assertEqual([app._name(app._index(0))], ['Alphabet.wav'])
+        app._set_query('g')
+        self.assertEqual([app._name(i) for i in app.matches], ['Gamma.wav'])
+        app._set_query('')
+        self.assertIsNone(app.matches)
+        self.assertEqual(app._count(), 4)
+
+    def test_idle_loop_blocks(self):
+        """Test the loop sleeps without a timeout while nothing is playing"""
+        self.assertFalse(self.app.player.is_playing)
+        self.assertIsNone(self.app._timeout())
+        self.assertIsNone(self.app.player.next_event_in())
+
+
+if __name__ == '__main__':
+    unittest.main()
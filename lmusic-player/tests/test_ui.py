@@ -11,6 +11,7 @@ import unittest
 import tkinter as tk
 import sys
 import os
+import subprocess
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -36,6 +37,24 @@ class TestUtils(unittest.TestCase):
         self.assertFalse(is_audio_file('test.txt'))
         self.assertFalse(is_audio_file('test'))
 
+class TestPackageImport(unittest.TestCase):
+
+    def test_modern_ui_imports_as_package(self):
+        """Test the front-ends import through the src package as well as by bare name"""
+        root = os.path.join(os.path.dirname(__file__), '..')
+        result = subprocess.run([sys.executable, '-c', 'import src.modern_ui, src.ui'],
+                                cwd=root, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_modern_ui_shares_player_modules(self):
+        """Test the modern UI sees the same event classes and metrics registry as the player"""
+        root = os.path.join(os.path.dirname(__file__), '..')
+        code = ("import src.modern_ui as ui, events, metrics, player\n"
+                "assert ui.SongChanged is events.SongChanged is player.SongChanged\n"
+                "assert ui.metrics is metrics is player.metrics\n")
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
 class TestUIComponents(unittest.TestCase):
     
     def setUp(self):
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Unit tests for playlist undo/redo and the persistent sequence behind it
+"""
+
+import unittest
+import os
+import sys
+import random
+import tempfile
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from undo import PVector, UndoHistory
+from playlist import Playlist
+from player import MusicPlayer
+
+
+class TestPVector(unittest.TestCase):
+
+    def test_matches_list(self):
+        """Test random edits give the same result as on a plain list, leaving old versions intact"""
+        rng = random.Random(7)
+        expected = list(range(1000))
+        vector = PVector.from_iterable(expected)
+        versions = []
+        for step in range(600):
+            versions.append((vector, list(expected)))
+            op = rng.random()
+            if op < 0.4:
+                i = rng.randint(0, len(expected))
+                vector = vector.insert(i, -step)
+                expected.insert(i, -step)
+            elif op < 0.8 and expected:
+                i = rng.randrange(len(expected))
+                j = min(len(expected), i + rng.choice((1, 1, 3, 700)))
+                vector = vector.delete(i, j)
+                del expected[i:j]
+            else:
+                vector = vector.extend(range(step, step + rng.randint(0, 300)))
+                expected.extend(range(step, step + len(vector) - len(expected)))
+            self.assertEqual(len(vector), len(expected))
+        self.assertEqual(list(vector), expected)
+        if expected:
+            self.assertEqual(vector[len(expected) // 2], expected[len(expected) // 2])
+            self.assertEqual(vector[-1], expected[-1])
+        for old, contents in versions[::50]:
+            self.assertEqual(list(old), contents)
+
+    def test_edits_share_chunks(self):
+        """Test a small edit copies one chunk, not the list"""
+        base = PVector.from_iterable(range(100000))
+        edited = base.delete(500, 501).insert(70000, 'x')
+        shared = {id(c) for c in base._chunks} & {id(c) for c in edited._chunks}
+        self.assertGreaterEqual(len(shared), len(base._chunks) - 2)
+        self.assertEqual(len(edited), 100000)
+
+
+class TestPlayerUndo(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a folder of empty tracks"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.files = []
+        for i in range(5):
+            path = os.path.join(self.tmpdir.name, f'{i}.mp3')
+            open(path, 'wb').close()
+            self.files.append(path)
+        self.player = MusicPlayer()
+
+    def test_undo_redo_edits(self):
+        """Test clear, remove, move and load can be undone and redone in order"""
+        player = self.player
+        player.add_files(self.files)
+        player.move(0, 4)
+        player.remove_from_playlist(0)
+        player.clear_playlist()
+        self.assertEqual(player.playlist, [])
+
+        self.assertEqual(player.undo_edit(), 'Clear Playlist')
+        self.assertEqual(player.playlist, self.files[2:] + self.files[:1])
+        self.assertEqual(player.playlist.position(self.files[0]), 3)
+        self.assertEqual(player.undo_edit(), 'Remove')
+        self.assertEqual(player.undo_edit(), 'Move')
+        self.assertEqual(player.playlist, self.files)
+        self.assertEqual(player.redo_edit(), 'Move')
+        self.assertEqual(player.playlist, self.files[1:] + self.files[:1])
+
+        player.load_playlist(self.files[:2])
+        self.assertFalse(player.undo.can_redo)  # a new edit drops the redo branch
+        self.assertEqual(player.undo_edit(), 'Load Playlist')
+        self.assertEqual(player.playlist, self.files[1:] + self.files[:1])
+        self.assertIn(self.files[3], player.playlist)
+        self.assertEqual(player.undo_edit(), 'Move')
+        self.assertEqual(player.undo_edit(), 'Add Files')
+        self.assertEqual(player.playlist, [])
+        self.assertIsNone(player.undo_edit())
+
+    def test_history_limits(self):
+        """Test the step limit, no-op edits and edits made outside a step"""
+        player = self.player
+        player.undo = UndoHistory(limit=3)
+        player.playlist = Playlist(self.files)
+        for _ in range(5):
+            player.move(0, 1)
+        player.move(2, 2)
+        self.assertEqual(player.undo.undo_label(), 'Move')
+        self.assertEqual(sum(1 for _ in iter(player.undo_edit, None)), 3)
+
+        player.add_files(self.files[:1])
+        self.assertTrue(player.undo.can_undo)
+        # Direct edits (journal replay, session restore) cannot be undone and end the history
+        player.playlist.append(self.files[1])
+        self.assertFalse(player.undo.can_undo)
+
+
+if __name__ == '__main__':
+    unittest.main()